@@ -4,10 +4,13 @@
 	Licence : CeCILL-C
 '''
 
+from .mchdf5_telescope_batch_reader import MCHDF5TelescopeBatchReader
 try:
 	from .mchdf5eventsource import MCHDF5EventSource
 	from .mchdf5eventsource_V2 import MCHDF5EventSourceV2
 	from .mchdf5eventsource_V2Transpose import MCHDF5EventSourceV2Transpose
+	from .mchdf5eventsource_DL0 import MCHDF5DL0EventSource
+	from .mchdf5eventsource_R0 import MCHDF5R0EventSource
 	from .tools import *
 except:
 	pass
@@ -0,0 +1,255 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import glob
+import time
+import shutil
+import tempfile
+
+import argparse
+from functools import partial
+
+import tables
+from ctapipe_io_mchdf5.tools.chunk_utils import STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.parallel_telescope import get_telescope_names, TelescopeTask, iter_telescope_tasks
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2 import createTelescopeDl0, processTelescopeDl0, \
+	createOutputFileDl0, getFiltersDl0
+
+
+def getInputFileNames(listPattern):
+	'''
+	Get the input files from a list of file names or glob patterns
+	-----------------
+	Parameters:
+		listPattern : list of file names or glob patterns
+	Return:
+		list of the input file names (sorted per pattern, without duplicates)
+	'''
+	listFileName = list()
+	for pattern in listPattern:
+		listMatch = sorted(glob.glob(pattern))
+		if len(listMatch) == 0:
+			print("getInputFileNames : no file matches '{}'".format(pattern))
+		for fileName in listMatch:
+			if fileName not in listFileName:
+				listFileName.append(fileName)
+	return listFileName
+
+
+def getOutputFileName(outputDir, inputFileName):
+	'''
+	Get the name of the DL0 output file of an input file
+	-----------------
+	Parameters:
+		outputDir : output directory
+		inputFileName : name of the input file
+	Return:
+		name of the output file (outputDir/name-dl0_v2.h5)
+	'''
+	baseName = os.path.splitext(os.path.basename(inputFileName))[0]
+	return os.path.join(outputDir, baseName + "-dl0_v2.h5")
+
+
+def getTelescopeSize(telNode):
+	'''
+	Get the number of events and the size of the waveforms of a telescope
+	-----------------
+	Parameters:
+		telNode : telescope node
+	Return:
+		number of events, size in bytes of the uncompressed waveforms
+	'''
+	nbEvent, nbByte = 0, 0
+	for tableName in ["waveformHi", "waveformLo"]:
+		if tableName in telNode:
+			table = telNode._f_get_child(tableName)
+			nbEvent = max(nbEvent, table.nrows)
+			nbByte += table.nrows*table.rowsize
+	return nbEvent, nbByte
+
+
+class ProductionReport(object):
+	'''
+	Progress and throughput report of a DL0 production
+	'''
+
+	def __init__(self, nbTask, nbEventTotal, nbByteTotal):
+		'''
+		Constructor of the ProductionReport
+		Parameters:
+			nbTask : number of telescopes to be processed
+			nbEventTotal : total number of events of the telescopes
+			nbByteTotal : total size in bytes of the input waveforms
+		'''
+		self.nbTask = nbTask
+		self.nbEventTotal = nbEventTotal
+		self.nbByteTotal = nbByteTotal
+		self.nbTaskDone = 0
+		self.nbEvent = 0
+		self.nbByte = 0
+		self.nbByteOut = 0
+		self.nbFile = 0
+		self.startTime = time.perf_counter()
+
+	def get_elapsed_time(self):
+		'''
+		Get the elapsed time since the start of the production
+		Return:
+			elapsed time in seconds
+		'''
+		return max(time.perf_counter() - self.startTime, 1e-9)
+
+	def add_telescope(self, inputFileName, telName, nbEvent, nbByte, isProcessed):
+		'''
+		Report a telescope merged in its output file
+		Parameters:
+			inputFileName : name of the input file
+			telName : name of the telescope group (Tel_N)
+			nbEvent : number of events of the telescope
+			nbByte : size in bytes of the input waveforms of the telescope
+			isProcessed : True if the telescope was processed, False if it was skipped
+		'''
+		self.nbTaskDone += 1
+		self.nbEvent += nbEvent
+		self.nbByte += nbByte
+		elapsed = self.get_elapsed_time()
+		percent = 100.0*self.nbByte/self.nbByteTotal if self.nbByteTotal > 0 else 100.0*self.nbTaskDone/self.nbTask
+		print("[{}/{}] {} {} : {} {} events, {:.1f} % done, {:.1f} events/s, {:.2f} MB/s, {:.1f} s".format(
+			self.nbTaskDone, self.nbTask, os.path.basename(inputFileName), telName, "processed" if isProcessed else "skipped",
+			nbEvent, percent, self.nbEvent/elapsed, self.nbByte/elapsed/1e6, elapsed))
+
+	def add_file(self, outputFileName):
+		'''
+		Report a finished output file
+		Parameters:
+			outputFileName : name of the output file
+		'''
+		self.nbFile += 1
+		self.nbByteOut += os.path.getsize(outputFileName)
+
+	def print_summary(self):
+		'''
+		Print the summary of the production
+		'''
+		elapsed = self.get_elapsed_time()
+		print("DL0 production : {} files, {} telescopes, {} events in {:.1f} s ({:.1f} events/s, {:.2f} MB/s)".format(
+			self.nbFile, self.nbTaskDone, self.nbEvent, elapsed, self.nbEvent/elapsed, self.nbByte/elapsed/1e6))
+		if self.nbByteOut > 0:
+			print("DL0 production : {:.2f} MB of waveforms written in {:.2f} MB (ratio {:.2f})".format(
+				self.nbByte/1e6, self.nbByteOut/1e6, self.nbByte/self.nbByteOut))
+
+
+def tailcutDilationSelectionProductionDl0(listFileNameIn, outputDir, center, neighbours, min_number_picture_neighbors,
+										  dilation, compression_level, chunkshape=None, blockSizeInBytes=STREAM_BLOCK_SIZE,
+										  nbProcess=1, compressionPolicy=None):
+	'''
+	Select the pixel, with a tailcut/dilation method, of several run files
+	All the telescopes of all the files are processed by the same pool of processes, each one in a temporary file.
+	The telescopes are merged in their output file in the order of the input files and telescopes, so the output files do
+	not depend on the number of processes.
+	-----------------
+	Parameters:
+		listFileNameIn : list of the input hdf5 file names
+		outputDir : directory of the output files (name-dl0_v2.h5)
+		center : float - center threshold parameter
+		neighbours : float - neighbours threshold parameter
+		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
+		dilation : threshold to be used at the dilation step
+		compression_level : compression level to be used with zstd
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		nbProcess : number of processes used to process the telescopes in parallel
+		compressionPolicy : CompressionPolicy of the datasets (None to use getFiltersDl0 for all the datasets)
+	Return:
+		list of the output file names
+	'''
+	listFileNameOut = [getOutputFileName(outputDir, fileNameIn) for fileNameIn in listFileNameIn]
+	for fileNameIn, fileNameOut in zip(listFileNameIn, listFileNameOut):
+		if os.path.abspath(fileNameIn) == os.path.abspath(fileNameOut):
+			raise ValueError("tailcutDilationSelectionProductionDl0 : the output file '{}' is an input file".format(fileNameOut))
+	if len(set(listFileNameOut)) != len(listFileNameOut):
+		raise ValueError("tailcutDilationSelectionProductionDl0 : several input files have the same name")
+	os.makedirs(outputDir, exist_ok=True)
+
+	createTelescopeFunc = partial(createTelescopeDl0, chunkshape=chunkshape)
+	processTelescopeFunc = partial(processTelescopeDl0, center=center, neighbours=neighbours,
+								   min_number_picture_neighbors=min_number_picture_neighbors, dilation=dilation,
+								   blockSizeInBytes=blockSizeInBytes)
+	filters = getFiltersDl0(compression_level)
+	# Temporary files in the output directory, to stay on the same file system
+	tmpDir = tempfile.mkdtemp(prefix="mchdf5_tmp_", dir=outputDir)
+	try:
+		listFileTask = list()
+		listTask = list()
+		nbEventTotal, nbByteTotal = 0, 0
+		for fileIndex, fileNameIn in enumerate(listFileNameIn):
+			listTaskSize = list()
+			with tables.open_file(fileNameIn, "r") as fileIn:
+				for telName in get_telescope_names(fileIn, "/r1"):
+					nbEvent, nbByte = getTelescopeSize(fileIn.get_node("/r1", telName))
+					tmpFileName = os.path.join(tmpDir, "{}_{}.h5".format(fileIndex, telName))
+					task = TelescopeTask(fileNameIn, tmpFileName, filters, telName, createTelescopeFunc, processTelescopeFunc,
+										 telGroupName="/r1", outTelGroupName="/dl0", compressionPolicy=compressionPolicy)
+					listTask.append(task)
+					listTaskSize.append((nbEvent, nbByte))
+					nbEventTotal += nbEvent
+					nbByteTotal += nbByte
+			listFileTask.append(listTaskSize)
+
+		report = ProductionReport(len(listTask), nbEventTotal, nbByteTotal)
+		iterResult = iter_telescope_tasks(listTask, nbProcess)
+		for fileNameIn, fileNameOut, listTaskSize in zip(listFileNameIn, listFileNameOut, listFileTask):
+			with tables.open_file(fileNameIn, "r") as fileIn:
+				fileOut = createOutputFileDl0(fileNameOut, fileIn, compression_level, compressionPolicy=compressionPolicy)
+			try:
+				fileOut.create_group("/", "dl0", "Raw data waveform and integrated informations of the run")
+				for nbEvent, nbByte in listTaskSize:
+					task, tmpFileName = next(iterResult)
+					if tmpFileName is not None:
+						task.merge(fileOut)
+					report.add_telescope(fileNameIn, task.telName, nbEvent, nbByte, tmpFileName is not None)
+			finally:
+				fileOut.close()
+			report.add_file(fileNameOut)
+		iterResult.close()
+		report.print_summary()
+	finally:
+		shutil.rmtree(tmpDir, ignore_errors=True)
+	return listFileNameOut
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help="hdf5 r1 v2 input files or glob patterns (quoted)", required=True, nargs='+')
+	parser.add_argument('-o', '--output', help="output directory of the hdf5 r1 (as DL0) v2 files", required=True)
+	parser.add_argument('-c', '--center', help="Center threshold for he tailcut cleaning", required=True, type=float)
+	parser.add_argument('-n', '--neighbours', help="Neighbour threshold for he tailcut cleaning", required=True,
+						type=float)
+	parser.add_argument('-d', '--dilation', help="Number of rings of dilation", required=True, type=int)
+	parser.add_argument('-m', '--min_number_picture_neighbors',
+						help="Minimum number of neighbours to be consider around a pixel", required=True, type=int)
+	parser.add_argument('-z', '--compressionlevel', help="Compression level to be used (from 1 to 9). Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes of all the files in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
+
+	args = parser.parse_args()
+
+	listFileNameIn = getInputFileNames(args.input)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	tailcutDilationSelectionProductionDl0(listFileNameIn, args.output, args.center, args.neighbours,
+										  args.min_number_picture_neighbors, args.dilation, args.compressionlevel,
+										  chunkshape=chunkshape, blockSizeInBytes=args.blocksize*1024*1024,
+										  nbProcess=args.nbprocess, compressionPolicy=compressionPolicy)
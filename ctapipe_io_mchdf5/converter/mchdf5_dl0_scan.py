@@ -0,0 +1,356 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import csv
+import itertools
+
+import argparse
+
+import numpy as np
+import tables
+from ctapipe_io_mchdf5.tools.chunk_utils import iter_table_blocks, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.pixel_selection import get_camera_pixel_position, get_neighbour_matrix, \
+	get_telescope_calibration, integrate_waveform_block, tailcut_dilation_block
+
+# Number of events of a telescope cleaned at once by the scan
+SCAN_BLOCK_SIZE = 4096
+# Size in bytes of the index of a selected pixel and of the signal of a pixel in a DL0-V2 file
+DL0_PIXEL_INDEX_SIZE = 2
+DL0_SIGNAL_SIZE = 2
+# Size in bytes of the waveform offset of an event in a DL0-V2 file
+DL0_OFFSET_SIZE = 8
+
+
+class TelescopeSignal(object):
+	'''
+	Calibrated and integrated images of a telescope, used to evaluate the cleaning configurations
+	Attributes:
+	-----------
+		telName : name of the telescope group (Tel_N)
+		tabSignal : calibrated and integrated images (nbEvent, nbPixel), numpy array or array of the cache file
+		tabNeighbour : neighbour matrix of the camera (see get_neighbour_matrix)
+		nbSlice : number of slices of the waveforms
+		waveformItemSize : size in bytes of a sample of the waveforms
+	'''
+
+	def __init__(self, telName, tabSignal, tabNeighbour, nbSlice, waveformItemSize):
+		self.telName = telName
+		self.tabSignal = tabSignal
+		self.tabNeighbour = tabNeighbour
+		self.nbSlice = nbSlice
+		self.waveformItemSize = waveformItemSize
+
+	@property
+	def nb_event(self):
+		return self.tabSignal.shape[0]
+
+	@property
+	def nb_pixel(self):
+		return self.tabSignal.shape[1]
+
+
+def computeTelescopeSignal(telNodeIn, tabPixelX, tabPixelY, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Compute the calibrated and integrated images of a telescope, by blocks of events
+	-----------------
+	Parameters:
+		telNodeIn : input telescope node
+		tabPixelX : x position of the pixels of the camera
+		tabPixelY : y position of the pixels of the camera
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	Return:
+		TelescopeSignal of the telescope (in memory)
+	'''
+	tableHi = telNodeIn.waveformHi
+	nbSlice = int(telNodeIn.nbSlice.read())
+	nbPixel = int(telNodeIn.nbPixel.read())
+	tabPedestal, tabGain = get_telescope_calibration(telNodeIn)
+	tabSignal = np.empty((tableHi.nrows, nbPixel), dtype=np.float32)
+	for start, tabWaveformHi in iter_table_blocks(tableHi, "waveformHi", blockSizeInBytes=blockSizeInBytes):
+		tabSignal[start:start + tabWaveformHi.shape[0]] = integrate_waveform_block(tabWaveformHi, tabPedestal, tabGain)
+	return TelescopeSignal(telNodeIn._v_name, tabSignal, get_neighbour_matrix(tabPixelX, tabPixelY), nbSlice,
+						   tableHi.coldtypes["waveformHi"].base.itemsize)
+
+
+def computeFileSignal(fileIn, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Compute the calibrated and integrated images of all the telescopes of a file
+	-----------------
+	Parameters:
+		fileIn : input hdf5 file
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	Return:
+		list of TelescopeSignal (in memory)
+	'''
+	dicoPixelPosition = get_camera_pixel_position(fileIn, "/r1")
+	listTelSignal = list()
+	for telNodeIn in fileIn.walk_nodes("/r1", "Group"):
+		if telNodeIn._v_name not in dicoPixelPosition:
+			print("computeFileSignal : no camera geometry for the telescope", telNodeIn._v_name, ", skipped")
+			continue
+		try:
+			tabPixelX, tabPixelY = dicoPixelPosition[telNodeIn._v_name]
+			listTelSignal.append(computeTelescopeSignal(telNodeIn, tabPixelX, tabPixelY, blockSizeInBytes))
+		except tables.exceptions.NoSuchNodeError as e:
+			print("computeFileSignal : telescope", telNodeIn._v_name, "skipped :", e)
+	return listTelSignal
+
+
+def getInputFileInfo(fileNameIn):
+	'''
+	Get the informations used to check a cache file matches its input file
+	-----------------
+	Parameters:
+		fileNameIn : name of the input file
+	Return:
+		array of the size and the modification time (in ns) of the input file
+	'''
+	fileStat = os.stat(fileNameIn)
+	return np.array([fileStat.st_size, fileStat.st_mtime_ns], dtype=np.int64)
+
+
+def writeSignalCache(cacheFileName, listTelSignal, fileNameIn):
+	'''
+	Write the calibrated and integrated images in a cache file (/signal/Tel_N)
+	-----------------
+	Parameters:
+		cacheFileName : name of the cache file
+		listTelSignal : list of TelescopeSignal
+		fileNameIn : name of the input file of the images
+	'''
+	filters = tables.Filters(complevel=1, complib='blosc:zstd', shuffle=True)
+	with tables.open_file(cacheFileName, "w", title="DL0-scan-signal", filters=filters) as cacheFile:
+		cacheFile.create_array("/", "inputFileInfo", getInputFileInfo(fileNameIn), "size and modification time of the input file")
+		signalGroup = cacheFile.create_group("/", "signal", "Calibrated and integrated images of the telescopes")
+		for telSignal in listTelSignal:
+			telGroup = cacheFile.create_group(signalGroup, telSignal.telName)
+			cacheFile.create_carray(telGroup, "signal", obj=telSignal.tabSignal,
+									chunkshape=(min(SCAN_BLOCK_SIZE, max(1, telSignal.nb_event)), telSignal.nb_pixel))
+			cacheFile.create_array(telGroup, "tabNeighbour", telSignal.tabNeighbour)
+			cacheFile.create_array(telGroup, "nbSlice", np.uint64(telSignal.nbSlice))
+			cacheFile.create_array(telGroup, "waveformItemSize", np.uint64(telSignal.waveformItemSize))
+
+
+def readSignalCache(cacheFile, fileNameIn):
+	'''
+	Read the calibrated and integrated images of a cache file
+	-----------------
+	Parameters:
+		cacheFile : opened cache file
+		fileNameIn : name of the input file of the images
+	Return:
+		list of TelescopeSignal (the images are read by blocks from the cache file), None if the cache does not match the input file
+	'''
+	if cacheFile.title != "DL0-scan-signal" or not np.array_equal(cacheFile.root.inputFileInfo.read(),
+																   getInputFileInfo(fileNameIn)):
+		return None
+	listTelSignal = list()
+	for telGroup in cacheFile.iter_nodes("/signal", "Group"):
+		listTelSignal.append(TelescopeSignal(telGroup._v_name, telGroup.signal, telGroup.tabNeighbour.read(),
+											 int(telGroup.nbSlice.read()), int(telGroup.waveformItemSize.read())))
+	return listTelSignal
+
+
+class ConfigurationStatistic(object):
+	'''
+	Selection statistics of a cleaning configuration
+	Attributes:
+	-----------
+		center : float - center threshold parameter
+		neighbours : float - neighbours threshold parameter
+		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
+		dilation : number of rings of dilation
+		nbEvent : number of events (of all the telescopes)
+		nbPixel : number of pixels (of all the events)
+		nbSelectedPixel : number of selected pixels
+		nbEmptyEvent : number of events without selected pixel
+		r1Size : size in bytes of the waveforms of the R1 file
+		dl0Size : estimated size in bytes of the uncompressed DL0-V2 data
+	'''
+
+	def __init__(self, center, neighbours, min_number_picture_neighbors, dilation):
+		self.center = center
+		self.neighbours = neighbours
+		self.min_number_picture_neighbors = min_number_picture_neighbors
+		self.dilation = dilation
+		self.nbEvent = 0
+		self.nbPixel = 0
+		self.nbSelectedPixel = 0
+		self.nbEmptyEvent = 0
+		self.r1Size = 0
+		self.dl0Size = 0
+
+	def add_block(self, telSignal, tabMask):
+		'''
+		Add the selection of a block of events
+		Parameters:
+			telSignal : TelescopeSignal of the block
+			tabMask : mask of the selected pixels (nbEvent, nbPixel)
+		'''
+		nbEvent, nbPixel = tabMask.shape
+		tabNbSelected = tabMask.sum(axis=1)
+		nbSelected = int(tabNbSelected.sum())
+		self.nbEvent += nbEvent
+		self.nbPixel += nbEvent*nbPixel
+		self.nbSelectedPixel += nbSelected
+		self.nbEmptyEvent += int(np.count_nonzero(tabNbSelected == 0))
+		self.r1Size += nbEvent*nbPixel*telSignal.nbSlice*telSignal.waveformItemSize
+		self.dl0Size += nbSelected*(telSignal.nbSlice*telSignal.waveformItemSize + DL0_PIXEL_INDEX_SIZE) + \
+			nbEvent*(nbPixel*DL0_SIGNAL_SIZE + DL0_OFFSET_SIZE)
+
+	def get_row(self):
+		'''
+		Get the statistics as a dictionnary (one row of the report)
+		'''
+		return {"center": self.center, "neighbours": self.neighbours,
+				"min_number_picture_neighbors": self.min_number_picture_neighbors, "dilation": self.dilation,
+				"nb_event": self.nbEvent, "nb_selected_pixel": self.nbSelectedPixel,
+				"selected_fraction": self.nbSelectedPixel/max(1, self.nbPixel),
+				"mean_selected_pixel": self.nbSelectedPixel/max(1, self.nbEvent),
+				"empty_event_fraction": self.nbEmptyEvent/max(1, self.nbEvent),
+				"r1_size": self.r1Size, "dl0_size": self.dl0Size, "ratio": self.r1Size/max(1, self.dl0Size)}
+
+	def __str__(self):
+		return "Cleaning center = {}, neighbours = {}, min_number_picture_neighbors {}, dilation = {} : {:.2f} % of selected pixels ({:.1f} per event), {:.2f} % of empty events, estimated DL0 size {} bytes or {} MB (ratio {:.2f})".format(
+			self.center, self.neighbours, self.min_number_picture_neighbors, self.dilation,
+			100.0*self.nbSelectedPixel/max(1, self.nbPixel), self.nbSelectedPixel/max(1, self.nbEvent),
+			100.0*self.nbEmptyEvent/max(1, self.nbEvent), self.dl0Size, self.dl0Size/1000000, self.r1Size/max(1, self.dl0Size))
+
+
+def evaluateConfiguration(listTelSignal, center, neighbours, min_number_picture_neighbors, dilation,
+						  nbEventPerBlock=SCAN_BLOCK_SIZE):
+	'''
+	Evaluate a cleaning configuration on the cached images
+	-----------------
+	Parameters:
+		listTelSignal : list of TelescopeSignal
+		center : float - center threshold parameter
+		neighbours : float - neighbours threshold parameter
+		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
+		dilation : number of rings of dilation
+		nbEventPerBlock : number of events cleaned at once
+	Return:
+		ConfigurationStatistic of the configuration
+	'''
+	stat = ConfigurationStatistic(center, neighbours, min_number_picture_neighbors, dilation)
+	for telSignal in listTelSignal:
+		for start in range(0, telSignal.nb_event, nbEventPerBlock):
+			tabSignal = telSignal.tabSignal[start:start + nbEventPerBlock]
+			tabMask = tailcut_dilation_block(tabSignal, telSignal.tabNeighbour, center, neighbours,
+											 min_number_picture_neighbors, dilation)
+			stat.add_block(telSignal, tabMask)
+	return stat
+
+
+def scanConfigurationDl0(listTelSignal, listCenter, listNeighbours, listMinNumberPictureNeighbors, listDilation,
+						 nbEventPerBlock=SCAN_BLOCK_SIZE):
+	'''
+	Evaluate all the combinations of cleaning parameters on the cached images
+	-----------------
+	Parameters:
+		listTelSignal : list of TelescopeSignal
+		listCenter : list of center threshold parameters
+		listNeighbours : list of neighbours threshold parameters
+		listMinNumberPictureNeighbors : list of minimum number of neighbours to be around a pixel to keep it
+		listDilation : list of numbers of rings of dilation
+		nbEventPerBlock : number of events cleaned at once
+	Return:
+		list of ConfigurationStatistic (one per configuration)
+	'''
+	listStat = list()
+	for center, neighbours, minNeighbour, dilation in itertools.product(listCenter, listNeighbours,
+																		  listMinNumberPictureNeighbors, listDilation):
+		stat = evaluateConfiguration(listTelSignal, center, neighbours, minNeighbour, dilation, nbEventPerBlock)
+		print(stat)
+		listStat.append(stat)
+	return listStat
+
+
+def writeScanReport(reportFileName, listStat):
+	'''
+	Write the statistics of the configurations in a csv file
+	-----------------
+	Parameters:
+		reportFileName : name of the csv file
+		listStat : list of ConfigurationStatistic
+	'''
+	with open(reportFileName, "w", newline="") as reportFile:
+		listRow = [stat.get_row() for stat in listStat]
+		writer = csv.DictWriter(reportFile, fieldnames=list(ConfigurationStatistic(0, 0, 0, 0).get_row().keys()))
+		writer.writeheader()
+		writer.writerows(listRow)
+
+
+def scanRunFileDl0(fileNameIn, listCenter, listNeighbours, listMinNumberPictureNeighbors, listDilation,
+				   cacheFileName=None, reportFileName=None, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Evaluate cleaning configurations on a run file : the calibrated and integrated images are computed once
+	-----------------
+	Parameters:
+		fileNameIn : input hdf5 file name
+		listCenter : list of center threshold parameters
+		listNeighbours : list of neighbours threshold parameters
+		listMinNumberPictureNeighbors : list of minimum number of neighbours to be around a pixel to keep it
+		listDilation : list of numbers of rings of dilation
+		cacheFileName : name of the cache file of the images (None to keep them in memory). An existing cache file of the
+			same input file is reused
+		reportFileName : name of the csv report (None for no report)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	Return:
+		list of ConfigurationStatistic (one per configuration)
+	'''
+	cacheFile = None
+	listTelSignal = None
+	try:
+		if cacheFileName is not None and os.path.exists(cacheFileName):
+			cacheFile = tables.open_file(cacheFileName, "r")
+			listTelSignal = readSignalCache(cacheFile, fileNameIn)
+			if listTelSignal is None:
+				print("scanRunFileDl0 : the cache file '{}' does not match '{}', it is recomputed".format(cacheFileName,
+																										fileNameIn))
+				cacheFile.close()
+				cacheFile = None
+			else:
+				print("scanRunFileDl0 : images read from the cache file '{}'".format(cacheFileName))
+		if listTelSignal is None:
+			with tables.open_file(fileNameIn, "r") as fileIn:
+				listTelSignal = computeFileSignal(fileIn, blockSizeInBytes)
+			if cacheFileName is not None:
+				writeSignalCache(cacheFileName, listTelSignal, fileNameIn)
+				print("scanRunFileDl0 : images written in the cache file '{}'".format(cacheFileName))
+		listStat = scanConfigurationDl0(listTelSignal, listCenter, listNeighbours, listMinNumberPictureNeighbors,
+										listDilation)
+	finally:
+		if cacheFile is not None:
+			cacheFile.close()
+	if reportFileName is not None:
+		writeScanReport(reportFileName, listStat)
+	return listStat
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help="hdf5 r1 v2 input file", required=True)
+	parser.add_argument('-c', '--center', help="Center thresholds for he tailcut cleaning", required=True, type=float,
+						nargs='+')
+	parser.add_argument('-n', '--neighbours', help="Neighbour thresholds for he tailcut cleaning", required=True,
+						type=float, nargs='+')
+	parser.add_argument('-d', '--dilation', help="Numbers of rings of dilation", required=True, type=int, nargs='+')
+	parser.add_argument('-m', '--min_number_picture_neighbors',
+						help="Minimum numbers of neighbours to be consider around a pixel", required=True, type=int,
+						nargs='+')
+	parser.add_argument('-s', '--signalcache', help="cache file of the calibrated and integrated images (reused if it exists). Default : images kept in memory",
+						required=False, default=None)
+	parser.add_argument('-r', '--report', help="csv file of the statistics of the configurations", required=False,
+						default=None)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+
+	args = parser.parse_args()
+
+	scanRunFileDl0(args.input, args.center, args.neighbours, args.min_number_picture_neighbors, args.dilation,
+				   cacheFileName=args.signalcache, reportFileName=args.report, blockSizeInBytes=args.blocksize*1024*1024)
@@ -7,27 +7,261 @@
 	Licence : CeCILL-C
 """
 
+import copy
+import itertools
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
 import tables
 from ctapipe.io import event_source
 import argparse
 
 from ..tools.get_nb_tel import getNbTel
 from ..tools.r0_file import (create_file_structure,
-							 open_output_file)
-from ..tools.r0_utils import (append_event_telescope_data,
-							  flush_r0_tables)
+							 open_output_file,
+							 add_telescope_in_file_structure)
+from ..tools.r0_utils import flush_r0_tables
+from ..tools.compression_policy import parse_compression_policy, COMPRESSION_POLICY_HELP
+from ..tools.r0_writer import R0EventWriter, extract_r0_event_data
+from ..tools.event_pipeline import iter_extracted_events, PIPELINE_QUEUE_SIZE
+from ..tools.file_merge import merge_file, write_merged_event_index
 from ..tools.get_telescope_info import (get_telescope_info_from_event,
+										get_telescope_position,
+										update_telescope_info_from_event,
 										check_is_simulation_file)
-from ..tools.simulation_utils import (append_corsika_event,
-									  fill_simulation_header_info)
+from ..tools.simulation_utils import (get_corsika_event_row,
+									  append_corsika_row,
+									  fill_simulation_header_info,
+									  fill_simulation_header_info_from_header)
 from ..tools.instrument_utils import (fill_subarray_layout,
 									  fill_optic_description)
 
 
+class SimtelEventData(object):
+	"""
+	Data of a simtel event extracted by the decoding thread, to be written by the writing thread
+	Attributes:
+	-----------
+		eventData : R0EventData of the event (trigger and telescopes data)
+		dicoMcEvent : values of the row of the Corsika events table (None if it is not a simulation)
+		listNewTelId : list of the id of the telescopes seen for the first time in this event (single pass only)
+		mcHeader : copy of the simulation header (first event of a simulation in single pass only, None otherwise)
+		obsId : id of the observation of the event
+	"""
+
+	def __init__(self, eventData, dicoMcEvent=None, listNewTelId=(), mcHeader=None):
+		self.eventData = eventData
+		self.dicoMcEvent = dicoMcEvent
+		self.listNewTelId = listNewTelId
+		self.mcHeader = mcHeader
+		self.obsId = eventData.obsId
+
+
+class SimtelEventExtractor(object):
+	"""
+	Extract the data of the simtel events to be written (called in the decoding thread)
+	The event source reuses the same container for all the events, so everything needed by the writing thread is
+	extracted here. The telescope informations are updated here in single pass mode (they only read the event)
+	"""
+
+	def __init__(self, isSimulationMode, telInfo_from_evt=None, subarray=None, tabPosTel=None):
+		"""
+		Constructor of the SimtelEventExtractor
+		Parameters:
+			isSimulationMode : True to convert a simulation file, False for a zfits file
+			telInfo_from_evt : dictionnary of the telescope informations to be updated (None if they are already known)
+			subarray : subarray description of the input file (single pass only)
+			tabPosTel : tuple of the positions of the telescopes given by get_telescope_position (single pass only)
+		"""
+		self.isSimulationMode = isSimulationMode
+		self.telInfo_from_evt = telInfo_from_evt
+		self.subarray = subarray
+		self.tabPosTel = tabPosTel
+		self.isFirstEvent = True
+
+	def __call__(self, event):
+		"""
+		Extract the data of an event
+		Parameters:
+			event : current event
+		Return:
+			SimtelEventData of the event
+		"""
+		listNewTelId = []
+		if self.telInfo_from_evt is not None:
+			listNewTelId = update_telescope_info_from_event(self.telInfo_from_evt, self.subarray, event, self.tabPosTel)
+		dicoMcEvent, mcHeader = None, None
+		if self.isSimulationMode:
+			dicoMcEvent = get_corsika_event_row(event)
+			if self.isFirstEvent and self.telInfo_from_evt is not None:
+				mcHeader = copy.deepcopy(event.mcheader)
+		self.isFirstEvent = False
+		return SimtelEventData(extract_r0_event_data(event, self.isSimulationMode), dicoMcEvent, listNewTelId, mcHeader)
+
+
+def convert_single_pass(inputFileName, outputFileName, compressionLevel, isSimulationMode, max_event=None,
+						chunkshape=None, compressionPolicy=None, queueSize=PIPELINE_QUEUE_SIZE):
+	"""
+	Convert the simtel input file into a HDF5 r0 file by reading the input file only once
+	The telescope tables are created the first time a telescope has data in the event stream
+	and the simulation header is filled with the first event
+	The events are decoded in a separate thread while the previous ones are compressed and written
+	Parameters:
+		inputFileName : name of the simtel input file
+		outputFileName : name of the hdf5 r0 output file
+		compressionLevel : compression level for the output file [0 (No compression), 1 - 9]
+		isSimulationMode : True to convert a simulation file, False for a zfits file
+		max_event : maximum number of events to be converted (None to convert all the events)
+		chunkshape : number of rows per chunk of the event tables (None for an automatic chunkshape)
+		compressionPolicy : CompressionPolicy of the datasets (None to use compressionLevel for all the datasets)
+		queueSize : maximum number of events decoded in advance (0 to decode and write the events in the same thread)
+	"""
+	with event_source(inputFileName) as source:
+		nbTel = source.subarray.num_tels
+		print("Number of telescope : ", nbTel)
+
+		# Increase the number of nodes in cache if necessary (avoid warning about nodes reopening)
+		tables.parameters.NODE_CACHE_SLOTS = max(tables.parameters.NODE_CACHE_SLOTS, 3*nbTel + 20)
+
+		hfile = open_output_file(outputFileName, compressionLevel=compressionLevel, compressionPolicy=compressionPolicy)
+		telInfo_from_evt = dict()
+		print('Create file structure')
+		tableMcCorsikaEvent = create_file_structure(hfile, telInfo_from_evt, chunkshape=chunkshape)
+		print("Is simulation mode :", isSimulationMode)
+
+		tabPosTel = get_telescope_position(source.subarray)
+		writer = R0EventWriter(hfile, isSimulationMode)
+		extractor = SimtelEventExtractor(isSimulationMode, telInfo_from_evt, source.subarray, tabPosTel)
+		nb_event = 0
+		print("\n")
+		for simtelEvent in iter_extracted_events(itertools.islice(source, max_event), extractor, queueSize):
+			if simtelEvent.mcHeader is not None:
+				print('Fill the simulation header information')
+				fill_simulation_header_info_from_header(hfile, simtelEvent.mcHeader, simtelEvent.obsId)
+
+			for telId in simtelEvent.listNewTelId:
+				add_telescope_in_file_structure(hfile, telId, telInfo_from_evt[telId], chunkshape=chunkshape)
+
+			if simtelEvent.dicoMcEvent is not None:
+				append_corsika_row(tableMcCorsikaEvent, simtelEvent.dicoMcEvent)
+			writer.append_event_data(simtelEvent.eventData)
+			nb_event += 1
+			print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r{}".format(nb_event), end="")
+	print("\nFound", nb_event, "events")
+
+	print('Fill the subarray layout information')
+	fill_subarray_layout(hfile, telInfo_from_evt, nbTel)
+
+	check_is_simulation_file(telInfo_from_evt)
+
+	if isSimulationMode:
+		print('Fill the optic description of the telescopes')
+		fill_optic_description(hfile, telInfo_from_evt, nbTel)
+
+	print("Flushing tables")
+	writer.flush()
+	if isSimulationMode:
+		tableMcCorsikaEvent.flush()
+
+	flush_r0_tables(hfile)
+	hfile.close()
+	print('\nDone')
+
+
+class ShardConversionTask(object):
+	"""
+	Conversion of one simtel file into a r0 shard file, executed by the workers of convert_multiple_files
+	Attributes:
+	-----------
+		inputFileName : name of the simtel input file
+		shardFileName : name of the r0 shard file
+		kwargs : other parameters of convert_single_pass
+	"""
+
+	def __init__(self, inputFileName, shardFileName, **kwargs):
+		self.inputFileName = inputFileName
+		self.shardFileName = shardFileName
+		self.kwargs = kwargs
+
+	def __call__(self):
+		"""
+		Convert the input file into the shard file
+		Return:
+			name of the shard file
+		"""
+		convert_single_pass(self.inputFileName, self.shardFileName, **self.kwargs)
+		return self.shardFileName
+
+
+def _run_shard_task(task):
+	"""
+	Run a ShardConversionTask (for Pool.imap)
+	Parameters:
+		task : ShardConversionTask to be run
+	Return:
+		name of the shard file
+	"""
+	return task()
+
+
+def convert_multiple_files(listInputFileName, outputFileName, compressionLevel, isSimulationMode, nbProcess=1,
+						   max_event=None, chunkshape=None, compressionPolicy=None, queueSize=PIPELINE_QUEUE_SIZE):
+	"""
+	Convert several simtel input files into one HDF5 r0 file
+	Each input file is converted by a pool of processes into a shard file (single pass conversion), the shards are
+	merged in the output file by the main process in the order of the input files as soon as they are ready.
+	The rows of the events are appended, so the rows of the telescopes and the event index are rebased on the merged
+	file. The shards are written in a temporary directory next to the output file and removed once merged
+	Parameters:
+		listInputFileName : list of the names of the simtel input files
+		outputFileName : name of the hdf5 r0 output file
+		compressionLevel : compression level for the output file [0 (No compression), 1 - 9]
+		isSimulationMode : True to convert simulation files, False for zfits files
+		nbProcess : number of processes which convert the input files
+		max_event : maximum number of events to be converted per input file (None to convert all the events)
+		chunkshape : number of rows per chunk of the event tables (None for an automatic chunkshape)
+		compressionPolicy : CompressionPolicy of the datasets (None to use compressionLevel for all the datasets)
+		queueSize : maximum number of events decoded in advance by each conversion
+	"""
+	if len(listInputFileName) == 0:
+		raise ValueError("convert_multiple_files : no input file")
+	# Temporary files next to the output file, to stay on the same file system
+	tmpDir = tempfile.mkdtemp(prefix="mchdf5_tmp_", dir=os.path.dirname(os.path.abspath(outputFileName)))
+	outFile = None
+	pool = None
+	try:
+		listTask = [ShardConversionTask(inputFileName, os.path.join(tmpDir, "shard_{}.h5".format(i)),
+										compressionLevel=compressionLevel, isSimulationMode=isSimulationMode,
+										max_event=max_event, chunkshape=chunkshape, compressionPolicy=compressionPolicy,
+										queueSize=queueSize)
+					for i, inputFileName in enumerate(listInputFileName)]
+		if nbProcess <= 1 or len(listTask) == 1:
+			iterShardFileName = map(_run_shard_task, listTask)
+		else:
+			pool = Pool(min(nbProcess, len(listTask)))
+			iterShardFileName = pool.imap(_run_shard_task, listTask)
+		for task, shardFileName in zip(listTask, iterShardFileName):
+			with tables.open_file(shardFileName, "r") as shardFile:
+				if outFile is None:
+					outFile = tables.open_file(outputFileName, "w", title=shardFile.title)
+				merge_file(outFile, shardFile)
+			os.remove(shardFileName)
+			print("convert_multiple_files : file", task.inputFileName, "merged")
+		write_merged_event_index(outFile)
+	finally:
+		if pool is not None:
+			pool.terminate()
+		if outFile is not None:
+			outFile.close()
+		shutil.rmtree(tmpDir, ignore_errors=True)
+	print('\nDone')
+
+
 def main():
 	parser = argparse.ArgumentParser()
-	parser.add_argument('-i', '--input', help="simtel input file",
-						required=True)
+	parser.add_argument('-i', '--input', help="simtel input files (several files are converted in parallel and merged)",
+						required=True, nargs='+')
 	parser.add_argument('-o', '--output', help="hdf5 r0 output file",
 						required=True)
 	parser.add_argument('-m', '--max_event', help="maximum event to reconstruct",
@@ -38,9 +272,43 @@ def main():
 	parser.add_argument('-z', '--zfits',
 						help="To be used for a zfits convertion to HDF5",
 						required=False, type=bool, default=False)
+	parser.add_argument('-s', '--singlepass',
+						help="Read the input file only once (telescopes tables are created on the fly)",
+						required=False, action='store_true')
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the event tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
+	parser.add_argument('-q', '--queuesize',
+						help="maximum number of events decoded in advance by the decoding thread while the previous ones "
+							 "are written. Default = {} (0 : decode and write in the same thread)".format(PIPELINE_QUEUE_SIZE),
+						required=False, type=int, default=PIPELINE_QUEUE_SIZE)
+	parser.add_argument('--contiguous',
+						help="Store the waveforms of each telescope contiguously in the file (one chunk per telescope), "
+							 "to map them in memory. Only without compression (-c 0) and without -s",
+						required=False, action='store_true')
+	parser.add_argument('-j', '--nbprocess',
+						help="number of processes which convert the input files when several files are given. Default = 1",
+						required=False, type=int, default=1)
 	args = parser.parse_args()
 
-	inputFileName = args.input
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	if args.contiguous and (args.compression != 0 or compressionPolicy is not None or args.singlepass
+							or len(args.input) > 1):
+		# The number of events of each telescope has to be known, and a contiguous table is mapped only without filters
+		parser.error("--contiguous needs -c 0, no compression policy, one input file and the two pass conversion")
+	if len(args.input) > 1:
+		convert_multiple_files(args.input, args.output, args.compression, not args.zfits, nbProcess=args.nbprocess,
+							   max_event=args.max_event, chunkshape=chunkshape, compressionPolicy=compressionPolicy,
+							   queueSize=args.queuesize)
+		return
+	inputFileName = args.input[0]
+	if args.singlepass:
+		convert_single_pass(inputFileName, args.output, args.compression, not args.zfits, max_event=args.max_event,
+							chunkshape=chunkshape, compressionPolicy=compressionPolicy, queueSize=args.queuesize)
+		return
+
 	nbTel = getNbTel(inputFileName)
 	print("Number of telescope : ", nbTel)
 
@@ -49,10 +317,11 @@ def main():
 
 	telInfo_from_evt, nbEvent = get_telescope_info_from_event(inputFileName, nbTel)
 	print("Found", nbEvent, "events")
-	hfile = open_output_file(args.output, compressionLevel=args.compression)
+	hfile = open_output_file(args.output, compressionLevel=args.compression, compressionPolicy=compressionPolicy)
 
 	print('Create file structure')
-	tableMcCorsikaEvent = create_file_structure(hfile, telInfo_from_evt)
+	tableMcCorsikaEvent = create_file_structure(hfile, telInfo_from_evt, chunkshape=chunkshape,
+												contiguous=args.contiguous)
 
 	print('Fill the subarray layout information')
 	fill_subarray_layout(hfile, telInfo_from_evt, nbTel)
@@ -78,15 +347,16 @@ def main():
 	else:
 		max_event = nbEvent
 	print("\n")
-	for event in source:
-		if isSimulationMode:
-			append_corsika_event(tableMcCorsikaEvent, event)
-		append_event_telescope_data(hfile, event, isSimulationMode)
+	writer = R0EventWriter(hfile, isSimulationMode)
+	extractor = SimtelEventExtractor(isSimulationMode)
+	for simtelEvent in iter_extracted_events(itertools.islice(source, max_event), extractor, args.queuesize):
+		if simtelEvent.dicoMcEvent is not None:
+			append_corsika_row(tableMcCorsikaEvent, simtelEvent.dicoMcEvent)
+		writer.append_event_data(simtelEvent.eventData)
 		nb_event += 1
 		print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r{} / {}".format(nb_event, max_event), end="")
-		if nb_event >= max_event:
-			break
 	print("\nFlushing tables")
+	writer.flush()
 	if isSimulationMode:
 		tableMcCorsikaEvent.flush()
 
@@ -11,90 +11,56 @@ import argparse
 
 import numpy as np
 import tables
-import hipecta.hdf5_utils as hdu
-import hipecta.pixelselection as pixselec
-import hipecta.core as core
 from ctapipe_io_mchdf5.tools import copy_all_tel_without_waveform, create_event_tel_waveform
+from ctapipe_io_mchdf5.tools.chunk_utils import iter_table_blocks, append_table_block, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.pixel_selection import get_camera_pixel_position, get_telescope_selector
 
 
-def computeSelectionTailCutDilation(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center=4, neighbours=2,
-                                    min_number_picture_neighbors=2, dilationThreshold=0):
+def computeSelectionTailCutDilation(telNodeOut, telNodeIn, tabPixelX, tabPixelY, nbGain, center=4, neighbours=2,
+                                    min_number_picture_neighbors=2, dilationThreshold=0,
+                                    blockSizeInBytes=STREAM_BLOCK_SIZE):
     '''
-	Compute the true and false positive for the pixel selection
+	Select the pixels of the events of a telescope and store their waveforms (the other pixels are set to 0)
+	The events are calibrated, integrated, cleaned and dilated by blocks, and the waveforms of a block are appended at once
 	------------
 	Parameters:
 		telNodeOut : telescope node to be used
 		telNodeIn : telescope of input data to be used for the selection
-		tabFocalTel : table fo the focal tel of all telescopes
+		tabPixelX : x position of the pixels of the camera
+		tabPixelY : y position of the pixels of the camera
 		nbGain : number of gain recorded on the camera
 		center : float - center threshold parameter
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of selected neighbours of the current pixel
 		dilationThreshold : number of rows to be added around the selected pixel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
     telType = np.uint64(telNodeOut.telType.read())
     print("computeSelectionTailCutDilation : start telescope :", telNodeOut._v_name, " of type", telType, ", with",
           nbGain, "channels")
-    print("\tInitialise temporary reco")
-    reco_temporary = hdu.createTemporaryRecoR1V2(fileOut, telNodeOut, tabFocalTel, 0.1)
-    print("\tget waveform hi")
-    tabDataWaveformHi = telNodeIn.waveformHi.col("waveformHi")
+    selector = get_telescope_selector(telNodeIn, tabPixelX, tabPixelY, center, neighbours, min_number_picture_neighbors,
+                                      dilationThreshold)
     tableOutWaveforHi = telNodeOut.waveformHi
-    rowOutWaveformHi = tableOutWaveforHi.row
-
-    percet_counter = int(len(tabDataWaveformHi) / 100) + 1
+    nbEvent = telNodeIn.waveformHi.nrows
+    for start, tabWaveformHi in iter_table_blocks(telNodeIn.waveformHi, "waveformHi", blockSizeInBytes=blockSizeInBytes):
+        print("\r\t\t{} %".format(int(100 * start / nbEvent)), end="")
+        tabSignal, tabMask = selector.select_block(tabWaveformHi)
+        # The mask of the pixels is broadcast on the slices of the waveforms (event, slice, pixel)
+        tabMask = tabMask[:, np.newaxis, :]
+        append_table_block(tableOutWaveforHi, "waveformHi", tabWaveformHi * tabMask)
+        if nbGain > 1:
+            tabWaveformLo = telNodeIn.waveformLo.read(start, start + tabWaveformHi.shape[0], field="waveformLo")
+            append_table_block(telNodeOut.waveformLo, "waveformLo", tabWaveformLo * tabMask)
+    print("\r\t\t100 %")
+    tableOutWaveforHi.flush()
     if nbGain > 1:
-        print("\tget waveform lo")
-        tabDataWaveformLo = telNodeIn.waveformLo.col("waveformLo")
-        tableOutWaveforLo = telNodeOut.waveformLo
-        rowOutWaveformLo = tableOutWaveforLo.row
-
-        i = 0
-        for signalHi, signalLo in zip(tabDataWaveformHi, tabDataWaveformLo):
-            if i % percet_counter == 0:
-                print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r\t\t{} %".format(int(i/percet_counter)), end="")
-            tabCalibIntegrateSignal = core.fullCalibIntegration(signalHi, reco_temporary)
-            cleaned = hdu.tailcut_cleaning(telType, tabCalibIntegrateSignal, center, neighbours, False,
-                                           min_number_picture_neighbors)
-            maskSelection = hdu.dilation(telType, tabCalibIntegrateSignal, cleaned, dilationThreshold,
-                                         center / 3)  # center/3 From Lenka presentation about Intelligent cleaning
-
-            selectedWaveFormHi = pixselec.selectPixelWaveform(signalHi, maskSelection)
-            rowOutWaveformHi["waveformHi"] = selectedWaveFormHi
-            rowOutWaveformHi.append()
-
-            selectedWaveFormLo = pixselec.selectPixelWaveform(signalLo, maskSelection)
-            rowOutWaveformLo["waveformLo"] = selectedWaveFormLo
-            rowOutWaveformLo.append()
-            i += 1
-        print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r\t\t100 %")
-        print("\tcomputeSelectionTailCutDilation : hi flush telescope :", telNodeOut._v_name)
-        tableOutWaveforHi.flush()
-        tableOutWaveforLo.flush()
-    else:
-        i = 0
-        for signalHi in tabDataWaveformHi:
-            if i % percet_counter == 0:
-                print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r\t\t{} %".format(int(i/percet_counter)), end="")
-            tabCalibIntegrateSignal = core.fullCalibIntegration(signalHi, reco_temporary)
-            cleaned = hdu.tailcut_cleaning(telType, tabCalibIntegrateSignal, center, neighbours, False,
-                                           min_number_picture_neighbors)
-            maskSelection = hdu.dilation(telType, tabCalibIntegrateSignal, cleaned, dilationThreshold,
-                                         center / 3)  # center/3 From Lenka presentation about Intelligent cleaning
-
-            selectedWaveFormHi = pixselec.selectPixelWaveform(signalHi, maskSelection)
-            rowOutWaveformHi["waveformHi"] = selectedWaveFormHi
-            rowOutWaveformHi.append()
-            i += 1
-        print("\r\r\r\r\r\r\r\r\r\r\r\r\r\r\r\t\t100 %")
-        print("\tcomputeSelectionTailCutDilation : lo flush telescope :", telNodeOut._v_name)
-        tableOutWaveforHi.flush()
+        telNodeOut.waveformLo.flush()
 
     print("\tcomputeSelectionTailCutDilation : finish telescope :", telNodeOut._v_name)
 
 
-def tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabFocalTel, center, neighbours,
-                                min_number_picture_neighbors, dilation):
+def tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabPixelX, tabPixelY, center, neighbours,
+                                min_number_picture_neighbors, dilation, blockSizeInBytes=STREAM_BLOCK_SIZE):
     '''
 	Select the pixel, with a tailcut/dilation method, of the current telescope
 	-----------------
@@ -102,11 +68,13 @@ def tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabFocalTel, cen
 		fileOut : output hdf5 file
 		telNodeOut : output telescope node
 		telNodeIn : input telescope node
-		tabFocalTel : table of the focal lenght of all telescopes
+		tabPixelX : x position of the pixels of the camera
+		tabPixelY : y position of the pixels of the camera
 		center : float - center threshold parameter
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
     nbSlice = np.uint64(telNodeOut.nbSlice.read())
     nbPixel = np.uint64(telNodeOut.nbPixel.read())
@@ -115,12 +83,13 @@ def tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabFocalTel, cen
     nbGain = np.uint64(telNodeOut.nbGain.read())
     create_event_tel_waveform(fileOut, telNodeOut, nbGain, image_shape)
 
-    computeSelectionTailCutDilation(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center, neighbours,
-                                    min_number_picture_neighbors, dilation)
+    computeSelectionTailCutDilation(telNodeOut, telNodeIn, tabPixelX, tabPixelY, nbGain, center, neighbours,
+                                    min_number_picture_neighbors, dilation, blockSizeInBytes=blockSizeInBytes)
 
 
 
-def tailcutDilationSelectionAllTelescopes(fileOut, fileIn, center, neighbours, min_number_picture_neighbors, dilation):
+def tailcutDilationSelectionAllTelescopes(fileOut, fileIn, center, neighbours, min_number_picture_neighbors, dilation,
+                                          blockSizeInBytes=STREAM_BLOCK_SIZE):
     '''
 	Select the pixel, with a tailcut/dilation method, of the file
 	-----------------
@@ -131,19 +100,23 @@ def tailcutDilationSelectionAllTelescopes(fileOut, fileIn, center, neighbours, m
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
     print("tailcutDilationSelectionAllTelescopes : copy telescope data without waveform")
     copy_all_tel_without_waveform(fileOut, fileIn)
 
-    tabFocalTel = fileIn.root.instrument.subarray.telescope.optics.col("equivalent_focal_length")
+    dicoPixelPosition = get_camera_pixel_position(fileIn, "/r1")
 
     # fullTabTruePositive = np.empty(0)
     # fullTabFalsePositive = np.empty(0)
     print("tailcutDilationSelectionAllTelescopes : Make selection")
     for telNodeIn, telNodeOut in zip(fileIn.walk_nodes("/r1", "Group"), fileOut.walk_nodes("/r1", "Group")):
         try:
-            tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabFocalTel, center, neighbours,
-                                        min_number_picture_neighbors, dilation)
+            if telNodeIn._v_name not in dicoPixelPosition:
+                raise tables.exceptions.NoSuchNodeError("no camera geometry for the telescope '{}'".format(telNodeIn._v_name))
+            tabPixelX, tabPixelY = dicoPixelPosition[telNodeIn._v_name]
+            tailcutDilationSelectionTel(fileOut, telNodeOut, telNodeIn, tabPixelX, tabPixelY, center, neighbours,
+                                        min_number_picture_neighbors, dilation, blockSizeInBytes=blockSizeInBytes)
 
         # fullTabTruePositive = np.concatenate((fullTabTruePositive, tabTruePositive))
         # fullTabFalsePositive = np.concatenate((fullTabFalsePositive, tabFalsePositive))
@@ -179,7 +152,7 @@ def getFileSize(fileNameOut):
 
 
 def tailcutDilationSelectionRunFile(fileNameOut, fileNameIn, center, neighbours, min_number_picture_neighbors,
-                                    dilation, compression_level):
+                                    dilation, compression_level, blockSizeInBytes=STREAM_BLOCK_SIZE):
     '''
 	Select the pixel, with a tailcut/dilation method, of the run file
 	-----------------
@@ -191,6 +164,7 @@ def tailcutDilationSelectionRunFile(fileNameOut, fileNameIn, center, neighbours,
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
 		compression_level : compression level to be used with zstd
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
     fileIn = tables.open_file(fileNameIn, "r")
 
@@ -210,7 +184,8 @@ def tailcutDilationSelectionRunFile(fileNameOut, fileNameIn, center, neighbours,
         print("tailcutDilationSelectionRunFile : no simulation in the file '", fileNameIn, "'")
         pass
 
-    tailcutDilationSelectionAllTelescopes(fileOut, fileIn, center, neighbours, min_number_picture_neighbors, dilation)
+    tailcutDilationSelectionAllTelescopes(fileOut, fileIn, center, neighbours, min_number_picture_neighbors, dilation,
+                                          blockSizeInBytes=blockSizeInBytes)
 
     fileOut.close()
     fileIn.close()
@@ -233,6 +208,8 @@ def main():
                         help="Minimum number of neighbours to be consider around a pixel", required=True, type=int)
     parser.add_argument('-z', '--compressionlevel', help="Compression level to be used (from 1 to 9). Default=1",
                         required=False, type=int, default=1)
+    parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+                        required=False, type=int, default=64)
 
     args = parser.parse_args()
 
@@ -245,4 +222,4 @@ def main():
     compression_level = args.compressionlevel
 
     tailcutDilationSelectionRunFile(outputFileName, inputFileName, center, neighbours, min_number_picture_neighbors,
-                                    dilation, compression_level)
+                                    dilation, compression_level, blockSizeInBytes=args.blocksize*1024*1024)
@@ -8,82 +8,55 @@ import os
 import sys
 
 import argparse
+from functools import partial
 
 import numpy as np
 import tables
-import hipecta.hdf5_utils as hdu
-import hipecta.pixelselection as pixselec
-import hipecta.core as core
-from ctapipe_io_mchdf5.tools import copy_all_tel_without_waveform
+from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
 from ctapipe_io_mchdf5.tools.dl0_utils import create_dl0_table_tel
+from ctapipe_io_mchdf5.tools.chunk_utils import iter_table_blocks, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.pixel_selection import get_camera_pixel_position, get_telescope_selector, append_dl0_block
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, write_compression_policy, copy_node_policy, \
+	COMPRESSION_POLICY_HELP
 
 
-def computeSelectionTailCutDilationDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center = 4, neighbours = 2,
-									   min_number_picture_neighbors = 2, dilationThreshold=0):
+def computeSelectionTailCutDilationDl0(telNodeOut, telNodeIn, tabPixelX, tabPixelY, nbGain, center = 4, neighbours = 2,
+									   min_number_picture_neighbors = 2, dilationThreshold=0,
+									   blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
-	Compute the true and false positive for the pixel selection
+	Select the pixels of the events of a telescope and store their waveforms
+	The events are calibrated, integrated, cleaned and dilated by blocks, and the selected waveforms of a block are
+	appended at once
 	------------
 	Parameters:
 		telNodeOut : telescope node to be used
 		telNodeIn : telescope of input data to be used for the selection
-		tabFocalTel : table fo the focal tel of all telescopes
+		tabPixelX : x position of the pixels of the camera
+		tabPixelY : y position of the pixels of the camera
 		nbGain : number of gain recorded on the camera
 		center : float - center threshold parameter
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of selected neighbours of the current pixel
 		dilationThreshold : number of rows to be added around the selected pixel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
 	telType = np.uint64(telNodeOut.telType.read())
 	print("computeSelectionTailCutDilationDl0 : start telescope :", telNodeOut._v_name, " of type",telType,", with",nbGain,"channels")
-
-	print("\tInitialise temporary reco...", end="")
-	reco_temporary = hdu.createTemporaryRecoR1V2(fileOut, telNodeIn, tabFocalTel, 0.1)
-	print("done")
-	tabDataWaveformHi = telNodeIn.waveformHi.col("waveformHi")
-	
-	nbPixel = np.uint64(telNodeOut.nbPixel.read())
 	
-	offsetCounter = 0
-	if nbGain > 1:
-		#print("\tget waveform lo")
-		tabDataWaveformLo = telNodeIn.waveformLo.col("waveformLo")
-		
-		#Here, we have two gains, so, we have to choose. By default we keep only the high gain signal
-		tabHighGainSelection = np.ones(nbPixel, dtype=bool)
-		i=0
-		for signalHi, signalLo in zip(tabDataWaveformHi, tabDataWaveformLo):
-			#print("\tcomputeSelectionTailCutDilationDl0 : hi telescope :", telNodeOut._v_name,", event no",i)
-
-			tabCalibIntegrateSignal = core.fullCalibIntegration(signalHi, reco_temporary)
-			cleaned = hdu.tailcut_cleaning(telType, tabCalibIntegrateSignal, center, neighbours, False,
-										   min_number_picture_neighbors)
-			maskSelection = hdu.dilation(telType, tabCalibIntegrateSignal, cleaned, dilationThreshold, center/3)	#center/3 From Lenka presentation about Intelligent cleaning
-			
-			offsetCounter = pixselec.selectPixelWaveformDL0(telNodeOut, signalHi, tabCalibIntegrateSignal,
-															maskSelection, tabHighGainSelection, offsetCounter,
-															signaWaveformLo=signalLo)
-			i += 1
-	else:
-		#Here, we have only one gain, so we select it
-		tabHighGainSelection = np.ones(nbPixel, dtype=bool)
-		i=0
-		for signalHi in tabDataWaveformHi:
-			#print("\tcomputeSelectionTailCutDilationDl0 : lo telescope :", telNodeOut._v_name,", event no",i)
-			tabCalibIntegrateSignal = core.fullCalibIntegration(signalHi, reco_temporary)
-			cleaned = hdu.tailcut_cleaning(telType, tabCalibIntegrateSignal, center, neighbours, False,
-										   min_number_picture_neighbors)
-			maskSelection = hdu.dilation(telType, tabCalibIntegrateSignal, cleaned, dilationThreshold, center/3)	#center/3 From Lenka presentation about Intelligent cleaning
-			
-			offsetCounter = pixselec.selectPixelWaveformDL0(telNodeOut, signalHi, tabCalibIntegrateSignal,
-															maskSelection, tabHighGainSelection, offsetCounter)
-			i += 1
+	#Here, we can have two gains, so, we have to choose. By default we keep only the high gain signal
+	selector = get_telescope_selector(telNodeIn, tabPixelX, tabPixelY, center, neighbours, min_number_picture_neighbors,
+									  dilationThreshold)
+	for start, tabWaveformHi in iter_table_blocks(telNodeIn.waveformHi, "waveformHi", blockSizeInBytes=blockSizeInBytes):
+		tabSignal, tabMask = selector.select_block(tabWaveformHi)
+		append_dl0_block(telNodeOut, tabWaveformHi, tabSignal, tabMask)
 	
 	print("\tcomputeSelectionTailCutDilationDl0 : finish telescope :", telNodeOut._v_name)
 
 
 
-def tailcutDilationSelectionTelDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, center, neighbours,
-								   min_number_picture_neighbors, dilation, chunkshape=1):
+def tailcutDilationSelectionTelDl0(fileOut, telNodeOut, telNodeIn, tabPixelX, tabPixelY, center, neighbours,
+								   min_number_picture_neighbors, dilation, chunkshape=None, blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Select the pixel, with a tailcut/dilation method, of the current telescope
 	-----------------
@@ -91,26 +64,72 @@ def tailcutDilationSelectionTelDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel,
 		fileOut : output hdf5 file
 		telNodeOut : output telescope node
 		telNodeIn : input telescope node
-		tabFocalTel : table of the focal lenght of all telescopes
+		tabPixelX : x position of the pixels of the camera
+		tabPixelY : y position of the pixels of the camera
 		center : float - center threshold parameter
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
 	nbSlice = np.uint64(telNodeOut.nbSlice.read())
 	nbPixel = np.uint64(telNodeOut.nbPixel.read())
 	
 	nbGain = np.uint64(telNodeOut.nbGain.read())
 	
-	create_dl0_table_tel(fileOut, telNodeOut, nbGain, nbPixel, nbSlice, chunkshape=chunkshape)
+	create_dl0_table_tel(fileOut, telNodeOut, nbGain, nbPixel, nbSlice, chunkshape=chunkshape,
+						 expectedrows=telNodeIn.waveformHi.nrows)
 	
-	computeSelectionTailCutDilationDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, nbGain, center, neighbours,
-									   min_number_picture_neighbors, dilation)
+	computeSelectionTailCutDilationDl0(telNodeOut, telNodeIn, tabPixelX, tabPixelY, nbGain, center, neighbours,
+									   min_number_picture_neighbors, dilation, blockSizeInBytes=blockSizeInBytes)
 
 
 
-def tailcutDilationSelectionAllTelescopesDl0(fileOut, fileIn, center, neighbours, min_number_picture_neighbors, dilation):
+def createTelescopeDl0(outFile, telNodeIn, chunkshape=None):
+	'''
+	Create the DL0 telescope of an input telescope (copy of the telescope without waveform and empty DL0 tables)
+	-----------------
+	Parameters:
+		outFile : output hdf5 file (with a /dl0 group)
+		telNodeIn : input telescope node
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+	'''
+	telNodeOut = copy_telescope_without_waveform(outFile, telNodeIn, r1NodeName="dl0")
+	nbSlice = np.uint64(telNodeOut.nbSlice.read())
+	nbPixel = np.uint64(telNodeOut.nbPixel.read())
+	nbGain = np.uint64(telNodeOut.nbGain.read())
+	create_dl0_table_tel(outFile, telNodeOut, nbGain, nbPixel, nbSlice, chunkshape=chunkshape,
+						 expectedrows=telNodeIn.waveformHi.nrows)
+
+
+def processTelescopeDl0(outFile, telNodeOut, telNodeIn, center, neighbours, min_number_picture_neighbors, dilation,
+						blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Select the pixel, with a tailcut/dilation method, of a telescope created by createTelescopeDl0
+	The pixel positions of the camera are read from the input file
+	-----------------
+	Parameters:
+		outFile : output hdf5 file
+		telNodeOut : output telescope node
+		telNodeIn : input telescope node
+		center : float - center threshold parameter
+		neighbours : float - neighbours threshold parameter
+		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
+		dilation : threshold to be used at the dilation step
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	'''
+	dicoPixelPosition = get_camera_pixel_position(telNodeIn._v_file, telNodeIn._v_parent._v_pathname)
+	if telNodeIn._v_name not in dicoPixelPosition:
+		raise tables.exceptions.NoSuchNodeError("no camera geometry for the telescope '{}'".format(telNodeIn._v_name))
+	tabPixelX, tabPixelY = dicoPixelPosition[telNodeIn._v_name]
+	nbGain = np.uint64(telNodeOut.nbGain.read())
+	computeSelectionTailCutDilationDl0(telNodeOut, telNodeIn, tabPixelX, tabPixelY, nbGain, center, neighbours,
+									   min_number_picture_neighbors, dilation, blockSizeInBytes=blockSizeInBytes)
+
+
+def tailcutDilationSelectionAllTelescopesDl0(fileOut, fileIn, center, neighbours, min_number_picture_neighbors, dilation,
+											 chunkshape=None, blockSizeInBytes=STREAM_BLOCK_SIZE, nbProcess=1):
 	'''
 	Select the pixel, with a tailcut/dilation method, of the file
 	-----------------
@@ -121,35 +140,17 @@ def tailcutDilationSelectionAllTelescopesDl0(fileOut, fileIn, center, neighbours
 		neighbours : float - neighbours threshold parameter
 		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
 		dilation : threshold to be used at the dilation step
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		nbProcess : number of processes used to process the telescopes in parallel
 	'''
-	print("tailcutDilationSelectionAllTelescopesDl0 : copy telescope data without waveform")
-	copy_all_tel_without_waveform(fileOut, fileIn, r1NodeName="dl0",
-							  docR1Node="Raw data waveform and integrated informations of the run")
-	
-	tabFocalTel = fileIn.root.instrument.subarray.telescope.optics.col("equivalent_focal_length")
-	
-	#fullTabTruePositive = np.empty(0)
-	#fullTabFalsePositive = np.empty(0)
+	fileOut.create_group("/", "dl0", "Raw data waveform and integrated informations of the run")
 	print("tailcutDilationSelectionAllTelescopesDl0 : Make selection")
-	for telNodeIn, telNodeOut in zip(fileIn.walk_nodes("/r1", "Group"), fileOut.walk_nodes("/dl0", "Group")):
-		try:
-			tailcutDilationSelectionTelDl0(fileOut, telNodeOut, telNodeIn, tabFocalTel, center, neighbours,
-										   min_number_picture_neighbors, dilation)
-			
-			#fullTabTruePositive = np.concatenate((fullTabTruePositive, tabTruePositive))
-			#fullTabFalsePositive = np.concatenate((fullTabFalsePositive, tabFalsePositive))
-		except tables.exceptions.NoSuchNodeError as e:
-			exc_type, exc_obj, exc_tb = sys.exc_info()
-			fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-			print(e, exc_type, fname, exc_tb.tb_lineno)
-	
-	#print("Nb points :",len(fullTabTruePositive))
-	#plt.figure(figsize=(20,10))
-	#ax = pixselec.plotTrueFalsePositive(fullTabTruePositive, fullTabFalsePositive, bins=3)
-	
-	#ax.grid()
-	#plt.savefig("zstd9_TCDSelection_"+str(len(fullTabTruePositive))+"_pointsPerColor_cleaningTailcut_"+str(center)+"_"+str(neighbours)+"_"+str(min_number_picture_neighbors)+"_dilation_"+str(dilation)+".png")
-	#plt.clf()
+	process_all_telescopes(fileOut, fileIn, partial(createTelescopeDl0, chunkshape=chunkshape),
+						   partial(processTelescopeDl0, center=center, neighbours=neighbours,
+								   min_number_picture_neighbors=min_number_picture_neighbors, dilation=dilation,
+								   blockSizeInBytes=blockSizeInBytes),
+						   nbProcess=nbProcess, telGroupName="/r1", outTelGroupName="/dl0")
 
 
 def getFileSize(fileNameOut):
@@ -168,43 +169,77 @@ def getFileSize(fileNameOut):
 	return fileSize
 
 
-def tailcutDilationSelectionRunFileDl0(fileNameOut, fileNameIn, center, neighbours, min_number_picture_neighbors,
-										dilation, compression_level):
+def getFiltersDl0(compression_level):
 	'''
-	Select the pixel, with a tailcut/dilation method, of the run file
+	Get the filters of the DL0-V2 files
+	-----------------
+	Parameters:
+		compression_level : compression level to be used with zstd
+	Return:
+		tables.Filters of the DL0-V2 files
+	'''
+	return tables.Filters(complevel=compression_level, complib='blosc:zstd', shuffle=False, bitshuffle=True,
+						  fletcher32=False  #, least_significant_digit=2
+						  )
+
+
+def createOutputFileDl0(fileNameOut, fileIn, compression_level, compressionPolicy=None):
+	'''
+	Create a DL0-V2 output file with the instrument and simulation groups of the input file
 	-----------------
 	Parameters:
 		fileNameOut : output hdf5 file name
-		fileNameIn : input hdf5 file name
-		center : float - center threshold parameter
-		neighbours : float - neighbours threshold parameter
-		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
-		dilation : threshold to be used at the dilation step
+		fileIn : input hdf5 file
 		compression_level : compression level to be used with zstd
+		compressionPolicy : CompressionPolicy of the datasets, written in the file (None to use getFiltersDl0 for all the
+							datasets)
+	Return:
+		opened output file
 	'''
-	fileIn = tables.open_file(fileNameIn, "r")
-	
-	zstdFilter = tables.Filters(complevel=compression_level, complib='blosc:zstd', shuffle=False, bitshuffle=True,
-								fletcher32=False  #, least_significant_digit=2
-								)
-	fileOut = tables.open_file(fileNameOut, mode="w", filters=zstdFilter)
+	fileOut = tables.open_file(fileNameOut, mode="w", filters=getFiltersDl0(compression_level))
 	
 	fileOut.title = "DL0-V2"
+	if compressionPolicy is not None:
+		write_compression_policy(fileOut, compressionPolicy)
 	
 	#Copy the instrument and simulation groups
 	try:
-		fileOut.copy_node(fileIn.root.instrument, newparent=fileOut.root, recursive=True)
+		copy_node_policy(fileOut, fileIn.root.instrument, fileOut.root)
 	except tables.exceptions.NoSuchNodeError as e:
-		print("tailcutDilationSelectionRunFileDl0 : no instrument in the file '",fileNameIn,"'")
+		print("createOutputFileDl0 : no instrument in the file '",fileIn.filename,"'")
 		pass
 	try:
-		fileOut.copy_node(fileIn.root.simulation, newparent=fileOut.root, recursive=True)
+		copy_node_policy(fileOut, fileIn.root.simulation, fileOut.root)
 	except tables.exceptions.NoSuchNodeError as e:
-		print("tailcutDilationSelectionRunFileDl0 : no simulation in the file '",fileNameIn,"'")
+		print("createOutputFileDl0 : no simulation in the file '",fileIn.filename,"'")
 		pass
+	return fileOut
+
+
+def tailcutDilationSelectionRunFileDl0(fileNameOut, fileNameIn, center, neighbours, min_number_picture_neighbors,
+										dilation, compression_level, chunkshape=None, blockSizeInBytes=STREAM_BLOCK_SIZE, nbProcess=1,
+										compressionPolicy=None):
+	'''
+	Select the pixel, with a tailcut/dilation method, of the run file
+	-----------------
+	Parameters:
+		fileNameOut : output hdf5 file name
+		fileNameIn : input hdf5 file name
+		center : float - center threshold parameter
+		neighbours : float - neighbours threshold parameter
+		min_number_picture_neighbors : minimum number of neighbours to be around a pixel to keep it
+		dilation : threshold to be used at the dilation step
+		compression_level : compression level to be used with zstd
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		nbProcess : number of processes used to process the telescopes in parallel
+		compressionPolicy : CompressionPolicy of the datasets (None to use getFiltersDl0 for all the datasets)
+	'''
+	fileIn = tables.open_file(fileNameIn, "r")
+	fileOut = createOutputFileDl0(fileNameOut, fileIn, compression_level, compressionPolicy=compressionPolicy)
 	
 	tailcutDilationSelectionAllTelescopesDl0(fileOut, fileIn, center, neighbours, min_number_picture_neighbors,
-											 dilation)
+											 dilation, chunkshape=chunkshape, blockSizeInBytes=blockSizeInBytes, nbProcess=nbProcess)
 	
 	fileOut.close()
 	fileIn.close()
@@ -227,6 +262,14 @@ def main():
 						help="Minimum number of neighbours to be consider around a pixel", required=True, type=int)
 	parser.add_argument('-z', '--compressionlevel', help="Compression level to be used (from 1 to 9). Default = 1",
 						required=False, type=int, default=1)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
@@ -237,6 +280,10 @@ def main():
 	dilation = args.dilation
 	min_number_picture_neighbors = args.min_number_picture_neighbors
 	compression_level = args.compressionlevel
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
 	
 	tailcutDilationSelectionRunFileDl0(outputFileName, inputFileName, center, neighbours, min_number_picture_neighbors,
-									   dilation, compression_level)
+									   dilation, compression_level, chunkshape=chunkshape,
+									   blockSizeInBytes=args.blocksize*1024*1024, nbProcess=args.nbprocess,
+									   compressionPolicy=compressionPolicy)
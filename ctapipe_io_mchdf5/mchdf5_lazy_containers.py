@@ -0,0 +1,46 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from ctapipe.io.containers import R0CameraContainer, R1CameraContainer
+
+from .tools.lazy_waveform import TelescopeWaveformLoader, LazyWaveform, get_lazy_waveform
+
+__all__ = ['LazyR0CameraContainer', 'LazyR1CameraContainer', 'TelescopeWaveformLoader', 'set_lazy_tel_waveform']
+
+
+class LazyR0CameraContainer(R0CameraContainer):
+	'''
+	R0CameraContainer which reads its waveform on the first access
+	'''
+	container_prefix = R0CameraContainer.container_prefix
+	waveform = property(lambda self: get_lazy_waveform(self, R0CameraContainer.waveform),
+						R0CameraContainer.waveform.__set__, doc=R0CameraContainer.fields['waveform'].description)
+
+
+class LazyR1CameraContainer(R1CameraContainer):
+	'''
+	R1CameraContainer which reads its waveform on the first access
+	'''
+	container_prefix = R1CameraContainer.container_prefix
+	waveform = property(lambda self: get_lazy_waveform(self, R1CameraContainer.waveform),
+						R1CameraContainer.waveform.__set__, doc=R1CameraContainer.fields['waveform'].description)
+
+
+def set_lazy_tel_waveform(data, telId, hasR1, loadFunc, *args):
+	'''
+	Set the lazy r0 (and r1) containers of a telescope in an event
+	Parameters:
+	-----------
+		data : DataContainer of the event
+		telId : id of the telescope
+		hasR1 : True if the telescope has a r1 waveform
+		loadFunc : function which returns (r0 waveform, r1 waveform) of the telescope
+		args : arguments of loadFunc
+	'''
+	loader = TelescopeWaveformLoader(loadFunc, *args)
+	data.r0.tel[telId] = LazyR0CameraContainer(waveform=LazyWaveform(loader, 0))
+	if hasR1:
+		data.r1.tel[telId] = LazyR1CameraContainer(waveform=LazyWaveform(loader, 1))
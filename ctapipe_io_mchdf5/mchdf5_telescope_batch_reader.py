@@ -0,0 +1,311 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from .tools.r1_calibration import R1Calibrator
+
+__all__ = ['MCHDF5TelescopeBatchReader']
+
+# Titles of the files stored by (slice, pixel)
+SLICE_PIXEL_TITLES = ["R1-V2", "R0-V2"]
+# Titles of the files stored by (pixel, slice)
+PIXEL_SLICE_TITLES = ["R1-V2-PixelSlice"]
+
+
+class _TelescopeTables(object):
+	'''
+	Tables of a telescope used by the MCHDF5TelescopeBatchReader
+	Attributes:
+	-----------
+		tel_id : id of the telescope
+		tableHi : table of the high gain waveform
+		keyHi : name of the high gain column
+		tableLo : table of the low gain waveform (None if the camera has only one gain)
+		keyLo : name of the low gain column
+		tableEventId : table which contains the event id of each row
+		keyEventId : name of the event id column
+	'''
+
+	def __init__(self, tel_id, tableHi, keyHi, tableLo, keyLo, tableEventId, keyEventId):
+		self.tel_id = tel_id
+		self.tableHi = tableHi
+		self.keyHi = keyHi
+		self.tableLo = tableLo
+		self.keyLo = keyLo
+		self.tableEventId = tableEventId
+		self.keyEventId = keyEventId
+
+	@property
+	def nb_gain(self):
+		return 1 if self.tableLo is None else 2
+
+	@property
+	def nb_event(self):
+		return self.tableHi.nrows
+
+
+def _get_r1_telescopes(hfile):
+	'''
+	Get the tables of the telescopes of a r1 file (/r1/Tel_N)
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+	Return:
+	-------
+		list of _TelescopeTables
+	'''
+	listTel = list()
+	for telNode in hfile.walk_nodes('/r1', 'Group'):
+		try:
+			tel_id = int(telNode.telId.read())
+			tableHi = telNode.waveformHi
+			tableEventId = telNode.trigger
+		except tables.exceptions.NoSuchNodeError as e:
+			continue
+		tableLo = telNode.waveformLo if 'waveformLo' in telNode else None
+		listTel.append(_TelescopeTables(tel_id, tableHi, 'waveformHi', tableLo, 'waveformLo', tableEventId, 'event_id'))
+	return listTel
+
+
+def _get_r0_telescopes(hfile):
+	'''
+	Get the tables of the telescopes of a r0 file (/r0/event/telescope/waveform/tel_XXX)
+	Parameters:
+	-----------
+		hfile : HDF5 file to be used
+	Return:
+	-------
+		list of _TelescopeTables
+	'''
+	listTel = list()
+	for table in hfile.walk_nodes('/r0/event/telescope/waveform', 'Table'):
+		tel_id = int(table.name[len('tel_'):])
+		tableLo = table if 'waveformLo' in table.colnames else None
+		listTel.append(_TelescopeTables(tel_id, table, 'waveformHi', tableLo, 'waveformLo', table, 'event_id'))
+	return listTel
+
+
+class MCHDF5TelescopeBatchReader(object):
+	'''
+	Telescope-major reader of the MCHDF5 files (R0-V2, R1-V2 and R1-V2-PixelSlice)
+	Instead of building events, the reader yields batches of consecutive events of each telescope :
+		(tel_id, event_ids, waveform) with waveform of shape (n_events, n_gain, n_pixel, n_slice)
+	so vectorized algorithms can process the data straight from the per telescope tables.
+
+	>>> with MCHDF5TelescopeBatchReader("file.h5", batch_size=1000) as reader:
+	>>>     for tel_id, event_ids, waveform in reader:
+	>>>         process(tel_id, event_ids, waveform)
+
+	The calibrated waveforms (float32) are given by read_calibrated_batch or iter_telescope(tel_id, calibrate=True).
+	'''
+
+	def __init__(self, input_url, batch_size=1024, allowed_tels=None):
+		'''
+		Constructor of the MCHDF5TelescopeBatchReader
+		Parameters:
+		-----------
+			input_url : name of the file to be read (or already opened tables.File)
+			batch_size : maximum number of events of a batch
+			allowed_tels : set of the id of the telescopes to be read (None or empty for all the telescopes)
+		'''
+		if batch_size < 1:
+			raise ValueError("MCHDF5TelescopeBatchReader : batch_size must be positive, not {}".format(batch_size))
+		if isinstance(input_url, tables.File):
+			self.hfile = input_url
+			self.isFileOwner = False
+		else:
+			self.hfile = tables.open_file(input_url, "r")
+			self.isFileOwner = True
+		self.batch_size = batch_size
+
+		title = self.hfile.title
+		if title in PIXEL_SLICE_TITLES:
+			self.isSlicePixel = False
+		elif title in SLICE_PIXEL_TITLES:
+			self.isSlicePixel = True
+		else:
+			self.close()
+			raise ValueError("MCHDF5TelescopeBatchReader : unsupported file format '{}'".format(title))
+
+		self.isR0 = '/r0' in self.hfile
+		if self.isR0:
+			listTel = _get_r0_telescopes(self.hfile)
+		else:
+			listTel = _get_r1_telescopes(self.hfile)
+		if allowed_tels:
+			listTel = [tel for tel in listTel if tel.tel_id in allowed_tels]
+		self.dicoTel = {tel.tel_id: tel for tel in sorted(listTel, key=lambda tel: tel.tel_id)}
+		self.dicoCalibrator = dict()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def close(self):
+		'''
+		Close the file if it was opened by the reader
+		'''
+		if self.isFileOwner and self.hfile.isopen:
+			self.hfile.close()
+
+	@property
+	def tel_ids(self):
+		'''
+		Id of the telescopes read by the reader (sorted)
+		'''
+		return list(self.dicoTel.keys())
+
+	def get_nb_event(self, tel_id):
+		'''
+		Get the number of events of a telescope
+		Parameters:
+		-----------
+			tel_id : id of the telescope
+		Return:
+		-------
+			number of events of the telescope
+		'''
+		return self.dicoTel[tel_id].nb_event
+
+	def _read_channel(self, waveform, gain, table, key, start, stop):
+		'''
+		Read a channel of a batch in the waveform block
+		Parameters:
+		-----------
+			waveform : block to be filled (n_events, n_gain, n_pixel, n_slice)
+			gain : index of the gain to be filled
+			table : table to be read
+			key : name of the waveform column
+			start : first row to be read
+			stop : last row (excluded)
+		'''
+		channel = table.read(start, stop, field=key)
+		if self.isSlicePixel:
+			waveform[:, gain] = channel.swapaxes(1, 2)
+		else:
+			waveform[:, gain] = channel
+
+	def _get_shape_event(self, tel):
+		'''
+		Get the shape of the waveform of an event of a telescope
+		Parameters:
+		-----------
+			tel : _TelescopeTables of the telescope
+		Return:
+		-------
+			(n_gain, n_pixel, n_slice)
+		'''
+		shapeEntry = tel.tableHi.coldescrs[tel.keyHi].shape
+		if self.isSlicePixel:
+			nbSlice, nbPixel = shapeEntry
+		else:
+			nbPixel, nbSlice = shapeEntry
+		return tel.nb_gain, nbPixel, nbSlice
+
+	def read_batch(self, tel_id, start, stop, out=None):
+		'''
+		Read a batch of consecutive events of a telescope
+		Parameters:
+		-----------
+			tel_id : id of the telescope
+			start : first row to be read
+			stop : last row (excluded)
+			out : preallocated array to be filled (n_events >= stop - start, n_gain, n_pixel, n_slice), of any dtype
+		Return:
+		-------
+			event ids (n_events), waveform (n_events, n_gain, n_pixel, n_slice)
+		'''
+		tel = self.dicoTel[tel_id]
+		stop = min(stop, tel.nb_event)
+		start = min(start, stop)
+		event_ids = tel.tableEventId.read(start, stop, field=tel.keyEventId)
+		if out is None:
+			waveform = np.empty((stop - start,) + self._get_shape_event(tel), dtype=tel.tableHi.coldtypes[tel.keyHi].base)
+		else:
+			waveform = out[:stop - start]
+		self._read_channel(waveform, 0, tel.tableHi, tel.keyHi, start, stop)
+		if tel.tableLo is not None:
+			self._read_channel(waveform, 1, tel.tableLo, tel.keyLo, start, stop)
+		return event_ids, waveform
+
+	def get_calibrator(self, tel_id):
+		'''
+		Get the calibrator of a telescope (from the pedestal and the gain stored in the file)
+		Parameters:
+		-----------
+			tel_id : id of the telescope
+		Return:
+		-------
+			R1Calibrator of the telescope
+		'''
+		try:
+			return self.dicoCalibrator[tel_id]
+		except KeyError:
+			pass
+		tel = self.dicoTel[tel_id]
+		if self.isR0:
+			telName = 'tel_{0:0=3d}'.format(tel_id)
+			pedestal = self.hfile.get_node('/r0/monitoring/telescope/pedestal', telName).read()
+			gain = self.hfile.get_node('/r0/monitoring/telescope/gain', telName).read()
+		else:
+			telNode = tel.tableHi._v_parent
+			pedestal = telNode.pedestal.read()
+			gain = telNode.tabGain.read()
+		_, _, nbSlice = self._get_shape_event(tel)
+		calibrator = R1Calibrator(pedestal["pedestal"][0], gain, nbSlice)
+		self.dicoCalibrator[tel_id] = calibrator
+		return calibrator
+
+	def read_calibrated_batch(self, tel_id, start, stop, out=None):
+		'''
+		Read and calibrate a batch of consecutive events of a telescope in float32
+		The waveforms are read directly in the float32 block and calibrated in place
+		Parameters:
+		-----------
+			tel_id : id of the telescope
+			start : first row to be read
+			stop : last row (excluded)
+			out : preallocated float32 array to be filled (n_events >= stop - start, n_gain, n_pixel, n_slice)
+		Return:
+		-------
+			event ids (n_events), calibrated waveform float32 (n_events, n_gain, n_pixel, n_slice)
+		'''
+		if out is None:
+			tel = self.dicoTel[tel_id]
+			nbEvent = max(0, min(stop, tel.nb_event) - start)
+			out = np.empty((nbEvent,) + self._get_shape_event(tel), dtype=np.float32)
+		event_ids, waveform = self.read_batch(tel_id, start, stop, out=out)
+		self.get_calibrator(tel_id).calibrate(waveform, inplace=True)
+		return event_ids, waveform
+
+	def iter_telescope(self, tel_id, calibrate=False):
+		'''
+		Iterate over the batches of a telescope
+		Parameters:
+		-----------
+			tel_id : id of the telescope
+			calibrate : True to get calibrated float32 waveforms (the same buffer is reused for all the batches)
+		Return:
+		-------
+			generator of (tel_id, event_ids, waveform)
+		'''
+		nbEvent = self.get_nb_event(tel_id)
+		if calibrate:
+			buffer = np.empty((self.batch_size,) + self._get_shape_event(self.dicoTel[tel_id]), dtype=np.float32)
+		for start in range(0, nbEvent, self.batch_size):
+			if calibrate:
+				event_ids, waveform = self.read_calibrated_batch(tel_id, start, start + self.batch_size, out=buffer)
+			else:
+				event_ids, waveform = self.read_batch(tel_id, start, start + self.batch_size)
+			yield tel_id, event_ids, waveform
+
+	def __iter__(self):
+		for tel_id in self.tel_ids:
+			yield from self.iter_telescope(tel_id)
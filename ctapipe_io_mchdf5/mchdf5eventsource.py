@@ -15,36 +15,63 @@ from astropy.coordinates import Angle
 import numpy as np
 import tables
 
+from traitlets import Bool
+
+from .tools.event_index import get_event_index
+from .mchdf5_lazy_containers import set_lazy_tel_waveform
+
 __all__ = ['MCHDF5EventSource']
 HI_GAIN = 0
 LO_GAIN = 1
 
+def _get_tab_event_id(telNode):
+    '''
+    Get the id of the events stored in a telescope
+    Parameters:
+    -----------
+        telNode : telescope node
+    Return:
+    -------
+        table of event id (one per row of the telescope tables)
+    '''
+    return telNode.eventId.col("eventId")
+
+
+def _read_tel_waveform(telNode, event, pedestal, dc_to_pe):
+    '''
+    Read the raw and calibrated waveforms of a telescope for an event
+    Parameters:
+    -----------
+        telNode : telescope node
+        event : row of the event in the telescope tables
+        pedestal : pedestal of the telescope (sum over the slices)
+        dc_to_pe : gain of the telescope
+    Return:
+    -------
+        r0 waveform, r1 waveform
+    '''
+    matWaveform = telNode.waveform.read(event, event + 1)
+    matWaveform = matWaveform["waveform"]
+    
+    matSignalPS = matWaveform[0].swapaxes(1, 2)
+    _, _, n_samples = matSignalPS.shape
+    ped = pedestal[..., np.newaxis] / n_samples
+    gain = dc_to_pe[..., np.newaxis]
+    return matSignalPS, (matSignalPS - ped) * gain
+
+
 def _convert_per_events_to_per_telescope(hfile):
     '''
     Concert the telescope storage into a event storage
+    The event index stored in the file is used if there is one
     Parameters:
     -----------
         hfile : HDF5 file to be used
     Return:
     -------
-        dictionary which contains the events with the proper telescopes
+        EventIndex which contains the events with the proper telescopes
     '''
-    events=dict()
-    for telNode in hfile.walk_nodes('/Tel', 'Group'):
-        try:
-            tabEventId = telNode.eventId.read()
-            tabEventId = tabEventId["eventId"]
-            telescopeIndex = uint64(telNode.telIndex.read())
-            telescopeId = uint64(telNode.telId.read())
-            for i,eventId in enumerate(tabEventId):
-                try:
-                    events[eventId].append((telescopeId, telescopeIndex, i))
-                except KeyError:
-                    events[eventId] = [(telescopeId, telescopeIndex, i)]
-        except tables.exceptions.NoSuchNodeError as e:
-            #For the Tel dataset only
-            pass
-    return events
+    return get_event_index(hfile, '/Tel', _get_tab_event_id)
 
 
 class MCHDF5EventSource(EventSource):
@@ -65,6 +92,11 @@ class MCHDF5EventSource(EventSource):
     You can get the converter from simtel to hdf5 at : https://gitlab.in2p3.fr/CTA-LAPP/simtel2r1_hdf5.git
     """
 
+    lazy_waveform = Bool(
+        False,
+        help='Read the waveforms of a telescope only on the first access of r0.tel[tel_id].waveform or r1.tel[tel_id].waveform'
+    ).tag(config=True)
+
     def __init__(self, config=None, parent=None, **kwargs):
         super().__init__(config=config, parent=parent, **kwargs)
 
@@ -90,8 +122,8 @@ class MCHDF5EventSource(EventSource):
 
     def _generator(self):
         # HiPeData arranges data per telescope and not by event like simtel
-        # We need to first create a dictionary.
-        #   key -> EventId, value -> List of event from triggered telescopes
+        # We need to first get the event index (read from the file or built from the telescopes).
+        #   EventId -> telescopes ids, indices and rows of the triggered telescopes
         self.events = _convert_per_events_to_per_telescope(self.run)
 
         # the container is initialized once, and data is replaced within
@@ -124,14 +156,14 @@ class MCHDF5EventSource(EventSource):
         runHeader = self.run.root.RunHeader
         azimuth = runHeader.azimuth.read()
         
-        for event_id, event_list in self.events.items():
+        for event_id, tabTelId, tabTelIndex, tabTelRow in self.events:
             if counter == 0:
                 # subarray info is only available when an event is loaded,
                 # so load it on the first event.
                 data.inst.subarray = self._build_subarray_info(self.run)
 
             obs_id = 0
-            tels_with_data = set([info[0] for info in event_list])
+            tels_with_data = set(tabTelId.tolist())
             data.count = counter
             data.r0.obs_id = obs_id
             data.r0.event_id = event_id
@@ -181,20 +213,18 @@ class MCHDF5EventSource(EventSource):
             data.dl0.tel.clear()
             data.dl1.tel.clear()
 
-            for telescopeId, telescopeIndex, event in event_list:
+            for telescopeId, telescopeIndex, event in zip(tabTelId.tolist(), tabTelIndex.tolist(), tabTelRow.tolist()):
                 
                 telNode = self.run.get_node("/Tel", 'Tel_' + str(telescopeIndex))
+                pedestal = data.mc.tel[telescopeId].pedestal
+                dc_to_pe = data.mc.tel[telescopeId].dc_to_pe
+                if self.lazy_waveform:
+                    set_lazy_tel_waveform(data, telescopeId, True, _read_tel_waveform, telNode, event, pedestal, dc_to_pe)
+                    continue
                 
-                matWaveform = telNode.waveform.read(event, event + 1)
-                matWaveform = matWaveform["waveform"]
-                
-                matSignalPS = matWaveform[0].swapaxes(1, 2)
+                matSignalPS, matSignalR1 = _read_tel_waveform(telNode, event, pedestal, dc_to_pe)
                 data.r0.tel[telescopeId].waveform = matSignalPS
-
-                _, _, n_samples = matSignalPS.shape
-                ped = data.mc.tel[telescopeId].pedestal[..., np.newaxis] / n_samples
-                gain = data.mc.tel[telescopeId].dc_to_pe[..., np.newaxis]
-                data.r1.tel[telescopeId].waveform = (matSignalPS - ped) * gain
+                data.r1.tel[telescopeId].waveform = matSignalR1
 
                 #data.r0.tel[telescopeId].image= matSignalPS.sum(axis=2)
                 #data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
@@ -0,0 +1,248 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from ctapipe.io.eventsource import EventSource
+from ctapipe.io.containers import DataContainer
+from numpy import array, int16, uint64
+from ctapipe.instrument import TelescopeDescription, SubarrayDescription, OpticsDescription
+from ctapipe.instrument.camera import CameraGeometry
+from astropy import units as u
+from astropy.coordinates import Angle
+import numpy as np
+import tables
+
+from traitlets import Int, Bool
+
+from .tools.event_index import get_event_index, get_event_row
+from .tools.dl0_reader import DL0TelescopeReader, DL0_READER_BLOCK_SIZE
+
+__all__ = ['MCHDF5DL0EventSource']
+
+
+def _get_tab_event_id(telNode):
+	'''
+	Get the id of the events stored in a telescope
+	Parameters:
+	-----------
+		telNode : telescope node
+	Return:
+	-------
+		table of event id (one per row of the telescope tables)
+	'''
+	return telNode.trigger.col("event_id")
+
+
+class MCHDF5DL0EventSource(EventSource):
+	"""
+	EventSource for the DL0-V2 files of MCHDF5 (written by mchdf5_tailcut_dilation_dl0v2).
+	The telescopes store only the waveforms of the pixels selected by the tailcut/dilation cleaning.
+	The selected waveforms of blocks of events of each telescope are read at once and scattered in dense camera
+	arrays (n_pixels, n_samples) in dl0.tel[tel_id].waveform, the pixels which are not selected are set to 0
+	(or masked with masked_waveform). The calibrated and integrated signal of all the pixels is in dl1.tel[tel_id].image.
+	"""
+
+	dl0_block_size = Int(
+		DL0_READER_BLOCK_SIZE,
+		help='Number of events of a telescope read and scattered at once'
+	).tag(config=True)
+	copy_waveform = Bool(
+		True,
+		help='Copy the dense waveforms of each event, False to give views on the buffer of the block (no copy, but the '
+			 'waveforms of an event are overwritten when the next block is read)'
+	).tag(config=True)
+	masked_waveform = Bool(
+		False,
+		help='Store the waveforms as numpy masked arrays where the pixels which are not selected are masked'
+	).tag(config=True)
+
+	def __init__(self, config=None, parent=None, **kwargs):
+		super().__init__(config=config, parent=parent, **kwargs)
+
+		self.metadata['is_simulation'] = True
+
+		self.run = tables.open_file(self.input_url, "r")
+	
+	
+	@staticmethod
+	def is_compatible(file_path):
+		try:
+			hfile = tables.open_file(file_path, "r")
+			isCompatible = hfile.title == "DL0-V2"
+			hfile.close()
+			return isCompatible
+		except Exception:
+			return False
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		pass
+
+	
+	def _generator(self):
+		# The events are built from the event index of the /dl0 telescopes (one row per event in each telescope)
+		self.events = get_event_index(self.run, '/dl0', _get_tab_event_id)
+
+		# the container is initialized once, and data is replaced within
+		# it after each yield
+		counter = 0
+		data = DataContainer()
+		data.meta['origin'] = "mchdf5dl0v2"
+
+		data.meta['input_url'] = self.input_url
+		data.meta['max_events'] = self.max_events
+
+		'''
+		MC data are valid for the whole run
+		'''
+		data.mc.tel.clear()  # clear the previous telescopes
+		dicoTelReader = dict()
+		for telNode in self.run.walk_nodes('/dl0', 'Group'):
+			try:
+				tel_id = uint64(telNode.telId.read())
+				dicoTelReader[int(tel_id)] = DL0TelescopeReader(telNode, blockSize=self.dl0_block_size,
+																	copyWaveform=self.copy_waveform)
+				data.mc.tel[tel_id].dc_to_pe = telNode.tabGain.read()
+				
+				pedestal = telNode.pedestal.read()
+				pedestal = pedestal["pedestal"]
+				
+				data.mc.tel[tel_id].pedestal = pedestal[0]
+				data.mc.tel[tel_id].reference_pulse_shape = telNode.tabRefShape.read()
+			except tables.exceptions.NoSuchNodeError as e:
+				pass
+		
+		tabEvent = self.run.root.simulation.mc_event.read()
+		tabEventId = tabEvent["event_id"]
+		# Row of the simulated shower of each event, computed once for the whole run
+		tabEventRowSimu = get_event_row(tabEventId, self.events.tabEventId)
+		
+		azimuth = self.run.root.simulation.run_config.col("run_array_direction")[0]
+		
+		for eventRank, (event_id, tabTelId, tabTelIndex, tabTelRow) in enumerate(self.events):
+			if counter == 0:
+				# subarray info is only available when an event is loaded,
+				# so load it on the first event.
+				data.inst.subarray = self._build_subarray_info(self.run)
+
+			obs_id = 0
+			tels_with_data = set(tabTelId.tolist())
+			data.count = counter
+			data.r0.obs_id = obs_id
+			data.r0.event_id = event_id
+			data.r0.tels_with_data = tels_with_data
+			data.r1.obs_id = obs_id
+			data.r1.event_id = event_id
+			data.r1.tels_with_data = tels_with_data
+			data.dl0.obs_id = obs_id
+			data.dl0.event_id = event_id
+			data.dl0.tels_with_data = tels_with_data
+
+			# handle telescope filtering by taking the intersection of
+			# tels_with_data and allowed_tels
+			if len(self.allowed_tels) > 0:
+				selected = tels_with_data & self.allowed_tels
+				if len(selected) == 0:
+					continue  # skip event
+				data.r0.tels_with_data = selected
+				data.r1.tels_with_data = selected
+				data.dl0.tels_with_data = selected
+
+			data.trig.tels_with_trigger = array(list(tels_with_data), dtype=int16)
+			
+			rowSimu = tabEventRowSimu[eventRank]
+			indexSimu = slice(rowSimu, rowSimu + 1) if rowSimu >= 0 else slice(0, 0)
+			data.mc.energy = tabEvent["mc_energy"][indexSimu] * u.TeV
+			data.mc.alt = Angle(tabEvent["mc_alt"][indexSimu], u.rad)
+			data.mc.az = Angle(tabEvent["mc_az"][indexSimu], u.rad)
+			data.mc.core_x = tabEvent["mc_core_x"][indexSimu] * u.m
+			data.mc.core_y = tabEvent["mc_core_y"][indexSimu] * u.m
+			data.mc.h_first_int = tabEvent["mc_h_first_int"][indexSimu] * u.m
+			data.mc.x_max = tabEvent["mc_x_max"][indexSimu] * u.g / (u.cm**2)
+			data.mc.shower_primary_id = tabEvent["mc_shower_primary_id"][indexSimu]
+			
+			data.mcheader.run_array_direction = Angle(azimuth * u.rad)
+			
+			data.r0.tel.clear()
+			data.r1.tel.clear()
+			data.dl0.tel.clear()
+			data.dl1.tel.clear()
+
+			for telescopeId, event in zip(tabTelId.tolist(), tabTelRow.tolist()):
+				telReader = dicoTelReader[telescopeId]
+				# The selected waveforms of a block of events are scattered at once in dense (pixel, slice) arrays
+				waveform, tabSelected = telReader.get_dense_waveform(event)
+				if self.masked_waveform:
+					waveform = np.ma.masked_array(waveform, mask=np.broadcast_to(~tabSelected[:, np.newaxis], waveform.shape))
+				data.dl0.tel[telescopeId].waveform = waveform
+				data.dl1.tel[telescopeId].image = telReader.get_event(event)[2]
+				
+			yield data
+			counter += 1
+		return
+
+	def _build_subarray_info(self, run):
+		"""
+		constructs a SubarrayDescription object from the info in an
+		MCRun
+
+		Parameters
+		----------
+		run: MCRun object
+
+		Returns
+		-------
+		SubarrayDescription :
+			instrumental information
+		"""
+		subarray = SubarrayDescription("MonteCarloArray")
+		
+		tabFocalTel = run.root.instrument.subarray.telescope.optics.col("equivalent_focal_length")
+		tabPosTelX = run.root.instrument.subarray.layout.col("pos_x")
+		tabPosTelY = run.root.instrument.subarray.layout.col("pos_y")
+		tabPosTelZ = run.root.instrument.subarray.layout.col("pos_z")
+		
+		tabPoslXYZ = np.ascontiguousarray(np.vstack((tabPosTelX, tabPosTelY, tabPosTelZ)).T)
+		
+		'''
+		# Correspance HiPeData.Telscope.Type and camera name
+		# 0  LSTCam, 1 NectarCam, 2 FlashCam, 3 SCTCam,
+		# 4 ASTRICam, 5 DigiCam, 6 CHEC
+		'''
+		mapping_camera = {0: 'LSTCam', 1: 'NectarCam', 2: 'FlashCam',
+				3: 'SCTCam', 4: 'ASTRICam', 5: 'DigiCam',
+				6: 'CHEC'}
+		
+		mapping_telName = {0:'LST', 1:'MST', 2:'MST', 3:'MST', 4:'SST-ASTRI', 5:'SST-1M', 6:'SST-2M'}
+		
+		for telNode, camNode in zip(self.run.walk_nodes('/dl0', 'Group'), self.run.walk_nodes('/instrument/subarray/telescope/camera', 'Group')):
+			try:
+				telType = uint64(telNode.telType.read())
+				telIndex = uint64(telNode.telIndex.read())
+				telId = uint64(telNode.telId.read())
+				
+				cameraName = mapping_camera[telType]
+				telName = mapping_telName[telType]
+				camera = CameraGeometry.from_name(cameraName)
+				camera.cam_id = cameraName
+				
+				foclen = tabFocalTel[telIndex] * u.m
+				
+				tel_pos = tabPoslXYZ[telIndex] * u.m
+				
+				camera.pix_x = camNode.pix_x.read() * u.m
+				camera.pix_y = camNode.pix_y.read() * u.m
+				
+				optic = OpticsDescription.from_name(telName)
+				optic.equivalent_focal_length = foclen
+				telescope_description = TelescopeDescription(telName, telName, optics=optic, camera=camera)
+
+				#tel.optics.mirror_area = mirror_area
+				#tel.optics.num_mirror_tiles = num_tiles
+				subarray.tels[telId] = telescope_description
+				subarray.positions[telId] = tel_pos
+			except tables.exceptions.NoSuchNodeError as e:
+				pass
+
+		return subarray
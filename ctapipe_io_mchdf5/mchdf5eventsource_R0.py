@@ -0,0 +1,232 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from ctapipe.io.eventsource import EventSource
+from ctapipe.io.containers import DataContainer
+from numpy import array, int16
+from ctapipe.instrument import TelescopeDescription, SubarrayDescription, OpticsDescription
+from ctapipe.instrument.camera import CameraGeometry
+from astropy import units as u
+from astropy.coordinates import Angle
+import numpy as np
+import tables
+
+from traitlets import Int, Bool
+
+from .tools.event_index import get_run_event_row
+from .tools.waveform_reader import READER_BLOCK_SIZE, READER_MEMORY_BUDGET
+from .tools.r1_calibration import R1Calibrator, CalibratedWaveformReader, CALIBRATION_BLOCK_SIZE
+from .tools.r0_reader import R0WaveformBlockReader, read_r0_monitoring, read_r0_event_index
+from .tools.camera_tel_type import get_camera_name_from_type
+from .mchdf5_lazy_containers import set_lazy_tel_waveform
+
+__all__ = ['MCHDF5R0EventSource']
+
+
+class MCHDF5R0EventSource(EventSource):
+	"""
+	EventSource for the R0-V2 files of MCHDF5 (written by mchdf5_simtel2r0).
+	The events are built from the subarray trigger table (/r0/event/subarray/trigger and tels_with_trigger), in the
+	order of the trigger table. The waveforms of blocks of events of each telescope are read at once
+	(/r0/event/telescope/waveform/tel_XXX) and calibrated with the pedestal and the gain of the monitoring
+	(/r0/monitoring/telescope), which are read once for the whole run.
+	"""
+
+	prefetch_block_size = Int(
+		READER_BLOCK_SIZE,
+		help='Size in bytes of the blocks of waveform rows read at once in each telescope'
+	).tag(config=True)
+	prefetch_memory = Int(
+		READER_MEMORY_BUDGET,
+		help='Maximum size in bytes of the waveform blocks kept in memory'
+	).tag(config=True)
+	calibration_block_size = Int(
+		CALIBRATION_BLOCK_SIZE,
+		help='Number of events of a telescope calibrated at once'
+	).tag(config=True)
+	memory_map = Bool(
+		False,
+		help='Map the uncompressed waveform tables in memory (numpy.memmap) instead of reading them, the compressed tables are read'
+	).tag(config=True)
+	lazy_waveform = Bool(
+		False,
+		help='Read the waveforms of a telescope only on the first access of r0.tel[tel_id].waveform or r1.tel[tel_id].waveform'
+	).tag(config=True)
+
+	def __init__(self, config=None, parent=None, **kwargs):
+		super().__init__(config=config, parent=parent, **kwargs)
+
+		self.run = tables.open_file(self.input_url, "r")
+		self.metadata['is_simulation'] = "simulation" in self.run.root
+
+
+	@staticmethod
+	def is_compatible(file_path):
+		try:
+			hfile = tables.open_file(file_path, "r")
+			isCompatible = hfile.title == "R0-V2"
+			hfile.close()
+			return isCompatible
+		except Exception:
+			return False
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		pass
+
+
+	def _generator(self):
+		# The pedestal and the gain of the telescopes are read once for the whole run
+		self.monitoring = read_r0_monitoring(self.run)
+		dicoTelIndex = {telId: telMonitoring.telIndex for telId, telMonitoring in self.monitoring.items()}
+		# The events and the rows of their telescopes are given by the subarray trigger table
+		self.events = read_r0_event_index(self.run, dicoTelIndex)
+		tableTrigger = self.run.root.r0.event.subarray.trigger
+		tabObsId = tableTrigger.col("obs_id")
+
+		# the container is initialized once, and data is replaced within
+		# it after each yield
+		counter = 0
+		data = DataContainer()
+		data.meta['origin'] = "mchdf5r0v2"
+
+		data.meta['input_url'] = self.input_url
+		data.meta['max_events'] = self.max_events
+
+		'''
+		MC data are valid for the whole run
+		'''
+		data.mc.tel.clear()  # clear the previous telescopes
+		# The waveforms are read by blocks of rows of each telescope and served per event from memory
+		waveformReader = R0WaveformBlockReader(self.run, blockSizeInBytes=self.prefetch_block_size,
+											   memoryBudget=self.prefetch_memory, memoryMap=self.memory_map)
+		calibratedReader = CalibratedWaveformReader(waveformReader, isSlicePixel=True,
+													blockSize=self.calibration_block_size)
+		for tel_id, telMonitoring in self.monitoring.items():
+			if telMonitoring.pedestal is None or telMonitoring.gain is None:
+				continue
+			data.mc.tel[tel_id].dc_to_pe = telMonitoring.gain
+			data.mc.tel[tel_id].pedestal = telMonitoring.pedestal
+			calibratedReader.set_calibrator(tel_id, R1Calibrator(telMonitoring.pedestal, telMonitoring.gain,
+																 telMonitoring.nbSlice))
+
+		tabEvent = None
+		if self.metadata['is_simulation']:
+			tabEvent = self.run.root.simulation.event.subarray.shower.read()
+			# Row of the simulated shower of each event, computed once for the whole file (the event id are unique
+			# in a run only, a merged file has several runs)
+			tabEventRowSimu = get_run_event_row(tabEvent["obs_id"], tabEvent["event_id"], tabObsId, self.events.tabEventId)
+			azimuth = self.run.root.configuration.simulation.run.col("run_array_direction")[0]
+
+		for eventRank, (event_id, tabTelId, tabTelIndex, tabTelRow) in enumerate(self.events):
+			if counter == 0:
+				# subarray info is only available when an event is loaded,
+				# so load it on the first event.
+				data.inst.subarray = self._build_subarray_info(self.run)
+
+			obs_id = tabObsId[eventRank]
+			tels_with_data = set(tabTelId.tolist())
+			data.count = counter
+			data.r0.obs_id = obs_id
+			data.r0.event_id = event_id
+			data.r0.tels_with_data = tels_with_data
+			data.r1.obs_id = obs_id
+			data.r1.event_id = event_id
+			data.r1.tels_with_data = tels_with_data
+			data.dl0.obs_id = obs_id
+			data.dl0.event_id = event_id
+			data.dl0.tels_with_data = tels_with_data
+
+			# handle telescope filtering by taking the intersection of
+			# tels_with_data and allowed_tels
+			if len(self.allowed_tels) > 0:
+				selected = tels_with_data & self.allowed_tels
+				if len(selected) == 0:
+					continue  # skip event
+				data.r0.tels_with_data = selected
+				data.r1.tels_with_data = selected
+				data.dl0.tels_with_data = selected
+
+			data.trig.tels_with_trigger = array(list(tels_with_data), dtype=int16)
+
+			if tabEvent is not None:
+				rowSimu = tabEventRowSimu[eventRank]
+				indexSimu = slice(rowSimu, rowSimu + 1) if rowSimu >= 0 else slice(0, 0)
+				data.mc.energy = tabEvent["true_energy"][indexSimu] * u.TeV
+				data.mc.alt = Angle(tabEvent["true_alt"][indexSimu], u.rad)
+				data.mc.az = Angle(tabEvent["true_az"][indexSimu], u.rad)
+				data.mc.core_x = tabEvent["true_core_x"][indexSimu] * u.m
+				data.mc.core_y = tabEvent["true_core_y"][indexSimu] * u.m
+				data.mc.h_first_int = tabEvent["true_h_first_int"][indexSimu] * u.m
+				data.mc.x_max = tabEvent["true_x_max"][indexSimu] * u.g / (u.cm**2)
+				data.mc.shower_primary_id = tabEvent["true_shower_primary_id"][indexSimu]
+
+				data.mcheader.run_array_direction = Angle(azimuth * u.rad)
+
+			data.r0.tel.clear()
+			data.r1.tel.clear()
+			data.dl0.tel.clear()
+			data.dl1.tel.clear()
+
+			for telescopeId, event in zip(tabTelId.tolist(), tabTelRow.tolist()):
+				if self.lazy_waveform:
+					set_lazy_tel_waveform(data, telescopeId, calibratedReader.has_calibrator(telescopeId),
+										  calibratedReader.get_waveform, telescopeId, event)
+					continue
+				# The waveforms of a block of events are stacked (gain, pixel, slice) and calibrated at once in float32
+				waveformR0, waveformR1 = calibratedReader.get_waveform(telescopeId, event)
+				data.r0.tel[telescopeId].waveform = waveformR0
+				if waveformR1 is not None:
+					data.r1.tel[telescopeId].waveform = waveformR1
+
+			yield data
+			counter += 1
+		return
+
+	def _build_subarray_info(self, run):
+		"""
+		constructs a SubarrayDescription object from the info in the
+		/configuration/instrument group of the file
+
+		Parameters
+		----------
+		run: HDF5 file
+
+		Returns
+		-------
+		SubarrayDescription :
+			instrumental information
+		"""
+		subarray = SubarrayDescription("MonteCarloArray")
+		instrumentGroup = run.root.configuration.instrument
+
+		tabFocalTel = instrumentGroup.telescope.optics.col("equivalent_focal_length")
+		tabLayout = instrumentGroup.subarray.layout.read()
+		dicoTelPos = {int(row["tel_id"]): np.array([row["pos_x"], row["pos_y"], row["pos_z"]]) for row in tabLayout}
+
+		mapping_telName = {0:'LST', 1:'MST', 2:'MST', 3:'MST', 4:'SST-ASTRI', 5:'SST-1M', 6:'SST-2M'}
+
+		for telId, telMonitoring in self.monitoring.items():
+			try:
+				cameraName = get_camera_name_from_type(telMonitoring.telType)
+				telName = mapping_telName[telMonitoring.telType]
+				camera = CameraGeometry.from_name(cameraName)
+				camera.cam_id = cameraName
+
+				geometry = instrumentGroup.telescope.camera._f_get_child('geometry_' + cameraName)
+				camera.pix_x = geometry.col("pix_x") * u.m
+				camera.pix_y = geometry.col("pix_y") * u.m
+
+				optic = OpticsDescription.from_name(telName)
+				if telMonitoring.telIndex < tabFocalTel.shape[0]:
+					optic.equivalent_focal_length = tabFocalTel[telMonitoring.telIndex] * u.m
+				telescope_description = TelescopeDescription(telName, telName, optics=optic, camera=camera)
+
+				subarray.tels[telId] = telescope_description
+				subarray.positions[telId] = dicoTelPos.get(telId, np.zeros(3)) * u.m
+			except (KeyError, tables.exceptions.NoSuchNodeError) as e:
+				pass
+
+		return subarray
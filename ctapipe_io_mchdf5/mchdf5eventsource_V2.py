@@ -14,35 +14,45 @@ from astropy.coordinates import Angle
 import numpy as np
 import tables
 
+from traitlets import Int, Bool
+
+from .tools.event_index import get_event_index, get_event_row
+from .tools.waveform_reader import WaveformBlockReader, READER_BLOCK_SIZE, READER_MEMORY_BUDGET
+from .tools.r1_calibration import R1Calibrator, CalibratedWaveformReader, CALIBRATION_BLOCK_SIZE
+from .tools.injunction_table import get_channel_decoder
+from .mchdf5_lazy_containers import set_lazy_tel_waveform
+
 __all__ = ['MCHDF5EventSourceV2']
 HI_GAIN = 0
 LO_GAIN = 1
+# Titles of the files read by the MCHDF5EventSourceV2 (the sorted files are decoded with their injunction tables)
+COMPATIBLE_TITLES = ["R1-V2", "R1-V2-sortedSlicePixel", "R1-V2-sortedPixelSlice"]
 	
+def _get_tab_event_id(telNode):
+	'''
+	Get the id of the events stored in a telescope
+	Parameters:
+	-----------
+		telNode : telescope node
+	Return:
+	-------
+		table of event id (one per row of the telescope tables)
+	'''
+	return telNode.trigger.col("event_id")
+
+
 def _convert_per_events_to_per_telescope(hfile):
 	'''
 	Concert the telescope storage into a event storage
+	The event index stored in the file is used if there is one
 	Parameters:
 	-----------
 		hfile : HDF5 file to be used
 	Return:
 	-------
-		dictionary which contains the events with the proper telescopes
+		EventIndex which contains the events with the proper telescopes
 	'''
-	events=dict()
-	for telNode in hfile.walk_nodes('/r1', 'Group'):
-		try:
-			tabEventId = telNode.trigger.col("event_id")
-			telescopeIndex = uint64(telNode.telIndex.read())
-			telescopeId = uint64(telNode.telId.read())
-			for i,eventId in enumerate(tabEventId):
-				try:
-					events[eventId].append((telescopeId, telescopeIndex, i))
-				except KeyError:
-					events[eventId] = [(telescopeId, telescopeIndex, i)]
-		except tables.exceptions.NoSuchNodeError as e:
-			#For the r1 dataset only
-			pass
-	return events
+	return get_event_index(hfile, '/r1', _get_tab_event_id)
 
 
 class MCHDF5EventSourceV2(EventSource):
@@ -54,8 +64,35 @@ class MCHDF5EventSourceV2(EventSource):
 	It allows algorithms to take advantage of the latest SIMD
 	(Single input multiple data) operations included in modern processors,
 	for native vectorized optimization of analytical data processing.
+	The files sorted by the pixel sort programs (R1-V2-sortedSlicePixel and R1-V2-sortedPixelSlice) are also read,
+	the pixels are put back in their original order with the injunction tables stored in the file.
 	"""
 
+	prefetch_block_size = Int(
+		READER_BLOCK_SIZE,
+		help='Size in bytes of the blocks of waveform rows read at once in each telescope'
+	).tag(config=True)
+	prefetch_memory = Int(
+		READER_MEMORY_BUDGET,
+		help='Maximum size in bytes of the waveform blocks kept in memory'
+	).tag(config=True)
+	calibration_block_size = Int(
+		CALIBRATION_BLOCK_SIZE,
+		help='Number of events of a telescope calibrated at once'
+	).tag(config=True)
+	legacy_order_format = Int(
+		None,
+		allow_none=True,
+		help='Format of the orderHi/orderLo arrays of the sorted files written without orderFormat : 1 (pixel i stored at '
+			 'the position order[i], mchdf5_sigma_mean_sort and mchdf5_mean_sigma_sort) or 2 (position i stores the pixel '
+			 'order[i], mchdf5_range_sort, mchdf5_injtab_sort and mchdf5_mean_sigma_sort_slice_pixel). The files written '
+			 'without orderFormat are not read if it is not set (None)'
+	).tag(config=True)
+	lazy_waveform = Bool(
+		False,
+		help='Read the waveforms of a telescope only on the first access of r0.tel[tel_id].waveform or r1.tel[tel_id].waveform'
+	).tag(config=True)
+
 	def __init__(self, config=None, parent=None, **kwargs):
 		super().__init__(config=config, parent=parent, **kwargs)
 
@@ -69,7 +106,7 @@ class MCHDF5EventSourceV2(EventSource):
 	def is_compatible(file_path):
 		try:
 			hfile = tables.open_file(file_path, "r")
-			isCompatible = hfile.title == "R1-V2"
+			isCompatible = hfile.title in COMPATIBLE_TITLES
 			hfile.close()
 			return isCompatible
 		except Exception:
@@ -81,8 +118,8 @@ class MCHDF5EventSourceV2(EventSource):
 
 	def _generator(self):
 		# HiPeData arranges data per telescope and not by event like simtel
-		# We need to first create a dictionary.
-		#   key -> EventId, value -> List of event from triggered telescopes
+		# We need to first get the event index (read from the file or built from the telescopes).
+		#   EventId -> telescopes ids, indices and rows of the triggered telescopes
 		self.events = _convert_per_events_to_per_telescope(self.run)
 
 		# the container is initialized once, and data is replaced within
@@ -99,6 +136,12 @@ class MCHDF5EventSourceV2(EventSource):
 		MC data are valid for the whole run
 		'''
 		data.mc.tel.clear()  # clear the previous telescopes
+		# The waveforms are read by blocks of rows of each telescope and served per event from memory
+		waveformReader = WaveformBlockReader(self.run, "/r1", blockSizeInBytes=self.prefetch_block_size,
+											 memoryBudget=self.prefetch_memory)
+		isSlicePixel = self.run.title != "R1-V2-sortedPixelSlice"
+		calibratedReader = CalibratedWaveformReader(waveformReader, isSlicePixel=isSlicePixel,
+													blockSize=self.calibration_block_size)
 		for telNode in self.run.walk_nodes('/r1', 'Group'):
 			try:
 				tel_id = uint64(telNode.telId.read())
@@ -109,22 +152,31 @@ class MCHDF5EventSourceV2(EventSource):
 				
 				data.mc.tel[tel_id].pedestal = pedestal[0]
 				data.mc.tel[tel_id].reference_pulse_shape = telNode.tabRefShape.read()
+				nbSlice = int(telNode.nbSlice.read())
+				calibratedReader.set_calibrator(int(tel_id), R1Calibrator(pedestal[0], data.mc.tel[tel_id].dc_to_pe, nbSlice))
+				# Injunction tables of the sorted files
+				for gain, tableName in enumerate(["waveformHi", "waveformLo"]):
+					if tableName in telNode:
+						calibratedReader.set_decoder(int(tel_id), gain, get_channel_decoder(telNode, tableName,
+																									 self.legacy_order_format))
 			except tables.exceptions.NoSuchNodeError as e:
 				pass
 		
 		tabEvent = self.run.root.simulation.mc_event.read()
 		tabEventId = tabEvent["event_id"]
+		# Row of the simulated shower of each event, computed once for the whole run
+		tabEventRowSimu = get_event_row(tabEventId, self.events.tabEventId)
 		
 		azimuth = self.run.root.simulation.run_config.col("run_array_direction")[0]
 		
-		for event_id, event_list in self.events.items():
+		for eventRank, (event_id, tabTelId, tabTelIndex, tabTelRow) in enumerate(self.events):
 			if counter == 0:
 				# subarray info is only available when an event is loaded,
 				# so load it on the first event.
 				data.inst.subarray = self._build_subarray_info(self.run)
 
 			obs_id = 0
-			tels_with_data = set([info[0] for info in event_list])
+			tels_with_data = set(tabTelId.tolist())
 			data.count = counter
 			data.r0.obs_id = obs_id
 			data.r0.event_id = event_id
@@ -149,8 +201,8 @@ class MCHDF5EventSourceV2(EventSource):
 			#data.trig.tels_with_trigger = set(tels_with_data)
 			data.trig.tels_with_trigger = array(list(tels_with_data), dtype=int16)
 			
-			#TODO : replace this by an astropy join
-			indexSimu = np.where(tabEventId == event_id)
+			rowSimu = tabEventRowSimu[eventRank]
+			indexSimu = slice(rowSimu, rowSimu + 1) if rowSimu >= 0 else slice(0, 0)
 			'''
 			time_s, time_ns = file.get_central_event_gps_time()
 			data.trig.gps_time = Time(time_s * u.s, time_ns * u.ns, format='unix', scale='utc')
@@ -175,29 +227,17 @@ class MCHDF5EventSourceV2(EventSource):
 			data.dl0.tel.clear()
 			data.dl1.tel.clear()
 
-			for telescopeId, telescopeIndex, event in event_list:
+			for telescopeId, telescopeIndex, event in zip(tabTelId.tolist(), tabTelIndex.tolist(), tabTelRow.tolist()):
 				
-				telNode = self.run.get_node("/r1", 'Tel_' + str(telescopeId))
-				
-				matWaveform = telNode.waveformHi.read(event, event + 1)
-				matWaveform = matWaveform["waveformHi"][0]
-				matSignalPSHi = matWaveform.swapaxes(0, 1)
-				try:
-					waveformLo = telNode.waveformLo.read(event, event + 1)
-					waveformLo = waveformLo["waveformLo"][0]
-					
-					matSignalPSLo = waveformLo.swapaxes(0, 1)
-					tabHiLo = np.stack((matSignalPSHi, matSignalPSLo))
-					data.r0.tel[telescopeId].waveform = tabHiLo
-
-					_, _, n_samples = tabHiLo.shape
-					ped = data.mc.tel[telescopeId].pedestal[..., np.newaxis] / n_samples
-					gain = data.mc.tel[telescopeId].dc_to_pe[..., np.newaxis]
-					data.r1.tel[telescopeId].waveform = (tabHiLo - ped) * gain
-
-				except Exception as e:
-					print(e)
-					data.r0.tel[telescopeId].waveform = np.expand_dims(matSignalPSHi, axis=0)
+				if self.lazy_waveform:
+					set_lazy_tel_waveform(data, telescopeId, calibratedReader.has_calibrator(telescopeId),
+										  calibratedReader.get_waveform, telescopeId, event)
+					continue
+				# The waveforms of a block of events are stacked (gain, pixel, slice) and calibrated at once in float32
+				waveformR0, waveformR1 = calibratedReader.get_waveform(telescopeId, event)
+				data.r0.tel[telescopeId].waveform = waveformR0
+				if waveformR1 is not None:
+					data.r1.tel[telescopeId].waveform = waveformR1
 				
 				#data.r0.tel[telescopeId].image= matSignalPSHi.sum(axis=2)
 				#data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
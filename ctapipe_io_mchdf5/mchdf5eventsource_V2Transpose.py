@@ -14,35 +14,42 @@ from astropy.coordinates import Angle
 import numpy as np
 import tables
 
+from traitlets import Int, Bool
+
+from .tools.event_index import get_event_index, get_event_row
+from .tools.waveform_reader import WaveformBlockReader, READER_BLOCK_SIZE, READER_MEMORY_BUDGET
+from .tools.r1_calibration import CalibratedWaveformReader, CALIBRATION_BLOCK_SIZE
+from .mchdf5_lazy_containers import set_lazy_tel_waveform
+
 __all__ = ['MCHDF5EventSourceV2Transpose']
 HI_GAIN = 0
 LO_GAIN = 1
 	
+def _get_tab_event_id(telNode):
+	'''
+	Get the id of the events stored in a telescope
+	Parameters:
+	-----------
+		telNode : telescope node
+	Return:
+	-------
+		table of event id (one per row of the telescope tables)
+	'''
+	return telNode.trigger.col("event_id")
+
+
 def _convert_per_events_to_per_telescope(hfile):
 	'''
 	Concert the telescope storage into a event storage
+	The event index stored in the file is used if there is one
 	Parameters:
 	-----------
 		hfile : HDF5 file to be used
 	Return:
 	-------
-		dictionary which contains the events with the proper telescopes
+		EventIndex which contains the events with the proper telescopes
 	'''
-	events=dict()
-	for telNode in hfile.walk_nodes('/r1', 'Group'):
-		try:
-			tabEventId = telNode.trigger.col("event_id")
-			telescopeIndex = uint64(telNode.telIndex.read())
-			telescopeId = uint64(telNode.telId.read())
-			for i,eventId in enumerate(tabEventId):
-				try:
-					events[eventId].append((telescopeId, telescopeIndex, i))
-				except KeyError:
-					events[eventId] = [(telescopeId, telescopeIndex, i)]
-		except tables.exceptions.NoSuchNodeError as e:
-			#For the r1 dataset only
-			pass
-	return events
+	return get_event_index(hfile, '/r1', _get_tab_event_id)
 
 
 class MCHDF5EventSourceV2Transpose(EventSource):
@@ -56,6 +63,23 @@ class MCHDF5EventSourceV2Transpose(EventSource):
 	for native vectorized optimization of analytical data processing.
 	"""
 
+	prefetch_block_size = Int(
+		READER_BLOCK_SIZE,
+		help='Size in bytes of the blocks of waveform rows read at once in each telescope'
+	).tag(config=True)
+	prefetch_memory = Int(
+		READER_MEMORY_BUDGET,
+		help='Maximum size in bytes of the waveform blocks kept in memory'
+	).tag(config=True)
+	calibration_block_size = Int(
+		CALIBRATION_BLOCK_SIZE,
+		help='Number of events of a telescope gathered at once'
+	).tag(config=True)
+	lazy_waveform = Bool(
+		False,
+		help='Read the waveforms of a telescope only on the first access of r0.tel[tel_id].waveform'
+	).tag(config=True)
+
 	def __init__(self, config=None, parent=None, **kwargs):
 		super().__init__(config=config, parent=parent, **kwargs)
 
@@ -81,8 +105,8 @@ class MCHDF5EventSourceV2Transpose(EventSource):
 	
 	def _generator(self):
 		# HiPeData arranges data per telescope and not by event like simtel
-		# We need to first create a dictionary.
-		#   key -> EventId, value -> List of event from triggered telescopes
+		# We need to first get the event index (read from the file or built from the telescopes).
+		#   EventId -> telescopes ids, indices and rows of the triggered telescopes
 		self.events = _convert_per_events_to_per_telescope(self.run)
 
 		# the container is initialized once, and data is replaced within
@@ -114,17 +138,25 @@ class MCHDF5EventSourceV2Transpose(EventSource):
 		
 		tabEvent = self.run.root.simulation.mc_event.read()
 		tabEventId = tabEvent["event_id"]
+		# Row of the simulated shower of each event, computed once for the whole run
+		tabEventRowSimu = get_event_row(tabEventId, self.events.tabEventId)
 		
 		azimuth = self.run.root.simulation.run_config.col("run_array_direction")[0]
 		
-		for event_id, event_list in self.events.items():
+		# The waveforms are read by blocks of rows of each telescope and served per event from memory
+		waveformReader = WaveformBlockReader(self.run, "/r1", blockSizeInBytes=self.prefetch_block_size,
+											 memoryBudget=self.prefetch_memory)
+		calibratedReader = CalibratedWaveformReader(waveformReader, isSlicePixel=False,
+													blockSize=self.calibration_block_size)
+		
+		for eventRank, (event_id, tabTelId, tabTelIndex, tabTelRow) in enumerate(self.events):
 			if counter == 0:
 				# subarray info is only available when an event is loaded,
 				# so load it on the first event.
 				data.inst.subarray = self._build_subarray_info(self.run)
 
 			obs_id = 0
-			tels_with_data = set([info[0] for info in event_list])
+			tels_with_data = set(tabTelId.tolist())
 			data.count = counter
 			data.r0.obs_id = obs_id
 			data.r0.event_id = event_id
@@ -149,8 +181,8 @@ class MCHDF5EventSourceV2Transpose(EventSource):
 			#data.trig.tels_with_trigger = set(tels_with_data)
 			data.trig.tels_with_trigger = array(list(tels_with_data), dtype=int16)
 			
-			#TODO : replace this by an astropy join
-			indexSimu = np.where(tabEventId == event_id)
+			rowSimu = tabEventRowSimu[eventRank]
+			indexSimu = slice(rowSimu, rowSimu + 1) if rowSimu >= 0 else slice(0, 0)
 			'''
 			time_s, time_ns = file.get_central_event_gps_time()
 			data.trig.gps_time = Time(time_s * u.s, time_ns * u.ns, format='unix', scale='utc')
@@ -175,23 +207,14 @@ class MCHDF5EventSourceV2Transpose(EventSource):
 			data.dl0.tel.clear()
 			data.dl1.tel.clear()
 
-			for telescopeId, telescopeIndex, event in event_list:
-				
-				telNode = self.run.get_node("/r1", 'Tel_' + str(telescopeId))
+			for telescopeId, telescopeIndex, event in zip(tabTelId.tolist(), tabTelIndex.tolist(), tabTelRow.tolist()):
 				
-				matWaveform = telNode.waveformHi.read(event, event + 1)
-				matWaveform = matWaveform["waveformHi"][0]
-				matSignalPSHi = matWaveform
-				try:
-					waveformLo = telNode.waveformLo.read(event, event + 1)
-					waveformLo = waveformLo["waveformLo"][0]
-					
-					matSignalPSLo = waveformLo
-					tabHiLo = np.stack((matSignalPSHi, matSignalPSLo))
-					data.r0.tel[telescopeId].waveform = tabHiLo
-				except Exception as e:
-					print(e)
-					data.r0.tel[telescopeId].waveform = np.expand_dims(matSignalPSHi, axis=0)
+				if self.lazy_waveform:
+					set_lazy_tel_waveform(data, telescopeId, False, calibratedReader.get_waveform, telescopeId, event)
+					continue
+				# The waveforms of a block of events are stacked (gain, pixel, slice) at once
+				waveformR0, _ = calibratedReader.get_waveform(telescopeId, event)
+				data.r0.tel[telescopeId].waveform = waveformR0
 				
 				#data.r0.tel[telescopeId].image= matSignalPSHi.sum(axis=2)
 				#data.r0.tel[telescopeId].num_trig_pix = file.get_num_trig_pixels(telescopeId)
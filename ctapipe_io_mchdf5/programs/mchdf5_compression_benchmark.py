@@ -0,0 +1,327 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import csv
+import json
+import time
+import shutil
+import tempfile
+import itertools
+
+import argparse
+from functools import partial
+
+import tables
+from ctapipe_io_mchdf5.tools.chunk_utils import iter_table_blocks, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.compression_policy import CompressionPolicy, COMPRESSION_DEFAULT, parse_filters, format_filters
+from ctapipe_io_mchdf5.programs import mchdf5_store_by_pixel_or_slice, mchdf5_multiple_sort
+from ctapipe_io_mchdf5.programs.mchdf5_min_selection import processMinSelection
+from ctapipe_io_mchdf5.programs.mchdf5_slice_selection import processSliceSelectionFile
+
+# Codecs of the benchmark by default
+DEFAULT_CODECS = ["none", "zlib:1", "blosc:lz4:1:shuffle", "blosc:zstd:1", "blosc:zstd:1:bitshuffle", "blosc:zstd:5:bitshuffle"]
+
+
+def getLayoutFunctions(nbEventPerInjTab=0, nbEventPerMin=100, sliceRange=None):
+	'''
+	Get the functions which write the layouts of a R1 file
+	-----------------
+	Parameters:
+		nbEventPerInjTab : number of events per injunction table of the pixel sorts (0 for all the events)
+		nbEventPerMin : number of events used to compute a minimum of the minimum selection
+		sliceRange : (first slice, last slice excluded) of the slice selection (None for no slice selection)
+	Return:
+		dictionnary of function(inputFileName, outputFileName, chunkshape, compressionPolicy, blockSizeInBytes) by
+		name of layout
+	'''
+	dicoLayout = dict()
+	for orderMode in range(6):
+		dicoLayout[mchdf5_store_by_pixel_or_slice.getTitleForOrderMode(orderMode)] = partial(
+			_writeOrderLayout, orderMode=orderMode)
+	for strMode in ["RANGE", "MEAN", "SIGMA", "MIN", "MAX"]:
+		dicoLayout["sort_" + strMode] = partial(_writeSortLayout,
+												selectionMode=mchdf5_multiple_sort.convertStringToSelectionMode(strMode),
+												nbEventPerInjTab=nbEventPerInjTab)
+	dicoLayout["min"] = partial(_writeMinLayout, nbEventPerMin=nbEventPerMin)
+	if sliceRange is not None:
+		dicoLayout["slice_{}_{}".format(*sliceRange)] = partial(_writeSliceLayout, firstSliceIndex=sliceRange[0],
+															   lastSliceIndex=sliceRange[1])
+	return dicoLayout
+
+
+def _writeOrderLayout(inputFileName, outputFileName, chunkshape, compressionPolicy, blockSizeInBytes, orderMode):
+	mchdf5_store_by_pixel_or_slice.sortPixelFile(inputFileName, outputFileName, orderMode, blockSizeInBytes=blockSizeInBytes,
+												 compressionPolicy=compressionPolicy, chunkshape=chunkshape)
+
+
+def _writeSortLayout(inputFileName, outputFileName, chunkshape, compressionPolicy, blockSizeInBytes, selectionMode,
+					 nbEventPerInjTab):
+	mchdf5_multiple_sort.sortPixelFile(inputFileName, outputFileName, True, selectionMode, nbEventPerInjTab,
+									   chunkshape=chunkshape, blockSizeInBytes=blockSizeInBytes,
+									   compressionPolicy=compressionPolicy)
+
+
+def _writeMinLayout(inputFileName, outputFileName, chunkshape, compressionPolicy, blockSizeInBytes, nbEventPerMin):
+	processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape=chunkshape,
+						blockSizeInBytes=blockSizeInBytes, compressionPolicy=compressionPolicy)
+
+
+def _writeSliceLayout(inputFileName, outputFileName, chunkshape, compressionPolicy, blockSizeInBytes, firstSliceIndex,
+					  lastSliceIndex):
+	processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex, chunkshape=chunkshape,
+							  blockSizeInBytes=blockSizeInBytes, compressionPolicy=compressionPolicy)
+
+
+def getTelescopeTables(hfile, telGroupName="/r1"):
+	'''
+	Get the tables of the telescopes of a file (waveforms, minimums, injunction tables, ...)
+	-----------------
+	Parameters:
+		hfile : HDF5 file to be used
+		telGroupName : name of the group which contains the telescopes groups
+	Return:
+		list of the tables
+	'''
+	return [table for table in hfile.walk_nodes(telGroupName, "Table")]
+
+
+def getWaveformSize(fileName, telGroupName="/r1"):
+	'''
+	Get the size of the uncompressed waveforms of a R1 file
+	-----------------
+	Parameters:
+		fileName : name of the file
+		telGroupName : name of the group which contains the telescopes groups
+	Return:
+		size in bytes of the waveformHi and waveformLo tables
+	'''
+	with tables.open_file(fileName, "r") as hfile:
+		return sum(table.nrows*table.rowsize for table in getTelescopeTables(hfile, telGroupName)
+				   if table._v_name in ["waveformHi", "waveformLo"])
+
+
+def readTelescopeTables(fileName, telGroupName="/r1", blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Read all the tables of the telescopes of a file by blocks of rows
+	-----------------
+	Parameters:
+		fileName : name of the file
+		telGroupName : name of the group which contains the telescopes groups
+		blockSizeInBytes : maximum size in bytes of the blocks of rows read at once
+	Return:
+		size in bytes of the tables in memory, size in bytes of the tables on disk
+	'''
+	sizeInMemory, sizeOnDisk = 0, 0
+	with tables.open_file(fileName, "r") as hfile:
+		for table in getTelescopeTables(hfile, telGroupName):
+			for _, block in iter_table_blocks(table, blockSizeInBytes=blockSizeInBytes):
+				sizeInMemory += block.nbytes
+			sizeOnDisk += table.size_on_disk
+	return sizeInMemory, sizeOnDisk
+
+
+class BenchmarkResult(object):
+	'''
+	Result of a layout written with a codec and a chunkshape
+	Attributes:
+	-----------
+		layout : name of the layout
+		codec : filters of the layout (as parsed by parse_filters)
+		chunkshape : number of rows per chunk (0 for an automatic chunkshape)
+		r1Size : size in bytes of the uncompressed waveforms of the input file
+		writeTime : time to write the layout in seconds
+		readTime : time to read all the tables of the telescopes in seconds
+		sizeInMemory : size in bytes of the uncompressed tables of the telescopes
+		sizeOnDisk : size in bytes of the compressed tables of the telescopes
+		fileSize : size in bytes of the file
+	'''
+
+	def __init__(self, layout, codec, chunkshape, r1Size):
+		self.layout = layout
+		self.codec = codec
+		self.chunkshape = chunkshape
+		self.r1Size = r1Size
+		self.writeTime = 0.0
+		self.readTime = 0.0
+		self.sizeInMemory = 0
+		self.sizeOnDisk = 0
+		self.fileSize = 0
+
+	def get_row(self):
+		'''
+		Get the result as a dictionnary (one row of the report)
+		'''
+		return {"layout": self.layout, "codec": self.codec, "chunkshape": int(self.chunkshape),
+				"write_time": float(self.writeTime), "read_time": float(self.readTime),
+				"write_mb_per_s": float(self.r1Size/max(1e-9, self.writeTime)/1e6),
+				"read_mb_per_s": float(self.sizeInMemory/max(1e-9, self.readTime)/1e6),
+				"r1_size": int(self.r1Size), "size_in_memory": int(self.sizeInMemory), "size_on_disk": int(self.sizeOnDisk),
+				"file_size": int(self.fileSize), "ratio": float(self.r1Size/max(1, self.sizeOnDisk))}
+
+	def __str__(self):
+		return "Layout {}, codec {}, chunkshape {} : write {:.3f} s, read {:.3f} s ({:.2f} MB/s), {} bytes on disk (ratio {:.2f})".format(
+			self.layout, self.codec, self.chunkshape, self.writeTime, self.readTime,
+			self.sizeInMemory/max(1e-9, self.readTime)/1e6, self.sizeOnDisk, self.r1Size/max(1, self.sizeOnDisk))
+
+
+def readBenchmarkFile(result, fileName, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Read all the tables of the telescopes of a file and complete its result
+	-----------------
+	Parameters:
+		result : BenchmarkResult of the file
+		fileName : name of the file
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	'''
+	startTime = time.perf_counter()
+	result.sizeInMemory, result.sizeOnDisk = readTelescopeTables(fileName, blockSizeInBytes=blockSizeInBytes)
+	result.readTime = time.perf_counter() - startTime
+	result.fileSize = os.path.getsize(fileName)
+
+
+def benchmarkInputFile(inputFileName, r1Size, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Read the input file, as reference of the layouts
+	-----------------
+	Parameters:
+		inputFileName : name of the R1 input file
+		r1Size : size in bytes of the uncompressed waveforms of the input file
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	Return:
+		BenchmarkResult of the input file (layout input, codec of the file)
+	'''
+	with tables.open_file(inputFileName, "r") as hfile:
+		codec = format_filters(hfile.filters)
+	result = BenchmarkResult("input", codec, 0, r1Size)
+	readBenchmarkFile(result, inputFileName, blockSizeInBytes)
+	return result
+
+
+def benchmarkConfiguration(inputFileName, outputFileName, layout, layoutFunc, codec, chunkshape, r1Size,
+						   blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Write a layout with a codec and a chunkshape and read it back
+	-----------------
+	Parameters:
+		inputFileName : name of the R1 input file
+		outputFileName : name of the file of the layout
+		layout : name of the layout
+		layoutFunc : function which writes the layout (see getLayoutFunctions)
+		codec : filters of the layout (as parsed by parse_filters), used for all the datasets of the file
+		chunkshape : number of rows per chunk (0 for an automatic chunkshape)
+		r1Size : size in bytes of the uncompressed waveforms of the input file
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	Return:
+		BenchmarkResult of the configuration
+	'''
+	result = BenchmarkResult(layout, codec, chunkshape, r1Size)
+	compressionPolicy = CompressionPolicy({COMPRESSION_DEFAULT: parse_filters(codec)})
+	startTime = time.perf_counter()
+	layoutFunc(inputFileName, outputFileName, chunkshape if chunkshape > 0 else None, compressionPolicy,
+			   blockSizeInBytes)
+	result.writeTime = time.perf_counter() - startTime
+	readBenchmarkFile(result, outputFileName, blockSizeInBytes)
+	return result
+
+
+def writeBenchmarkReport(reportFileName, listResult):
+	'''
+	Write the results of the benchmark in a csv file, or in a json file if the name ends with .json
+	-----------------
+	Parameters:
+		reportFileName : name of the report file
+		listResult : list of BenchmarkResult
+	'''
+	listRow = [result.get_row() for result in listResult]
+	with open(reportFileName, "w", newline="") as reportFile:
+		if reportFileName.endswith(".json"):
+			json.dump(listRow, reportFile, indent=1)
+		else:
+			writer = csv.DictWriter(reportFile, fieldnames=list(BenchmarkResult("", "", 0, 0).get_row().keys()))
+			writer.writeheader()
+			writer.writerows(listRow)
+
+
+def compressionBenchmark(inputFileName, listLayout=None, listCodec=DEFAULT_CODECS, listChunkshape=[0],
+						 nbEventPerInjTab=0, nbEventPerMin=100, sliceRange=None, reportFileName=None, outputDir=None,
+						 blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Write and read every combination of layout, codec and chunkshape of a R1 file
+	-----------------
+	Parameters:
+		inputFileName : name of the R1 input file
+		listLayout : list of the names of the layouts (see getLayoutFunctions, None for all the layouts)
+		listCodec : list of filters (as parsed by parse_filters)
+		listChunkshape : list of numbers of rows per chunk (0 for an automatic chunkshape)
+		nbEventPerInjTab : number of events per injunction table of the pixel sorts (0 for all the events)
+		nbEventPerMin : number of events used to compute a minimum of the minimum selection
+		sliceRange : (first slice, last slice excluded) of the slice selection (None for no slice selection)
+		reportFileName : name of the csv or json report (None for no report)
+		outputDir : directory of the files of the layouts, which are kept (None for a temporary directory)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+	Return:
+		list of BenchmarkResult (one per configuration)
+	'''
+	dicoLayout = getLayoutFunctions(nbEventPerInjTab, nbEventPerMin, sliceRange)
+	if listLayout is None:
+		listLayout = list(dicoLayout.keys())
+	for layout in listLayout:
+		if layout not in dicoLayout:
+			raise ValueError("compressionBenchmark : unknown layout '{}', expected one of {}".format(layout,
+																									 list(dicoLayout.keys())))
+	# Check the codecs before the first write
+	listCodec = [format_filters(parse_filters(codec)) for codec in listCodec]
+
+	r1Size = getWaveformSize(inputFileName)
+	listResult = [benchmarkInputFile(inputFileName, r1Size, blockSizeInBytes)]
+	print(listResult[0])
+	workDir = outputDir if outputDir is not None else tempfile.mkdtemp(prefix="mchdf5_benchmark_")
+	os.makedirs(workDir, exist_ok=True)
+	try:
+		for layout, codec, chunkshape in itertools.product(listLayout, listCodec, listChunkshape):
+			outputFileName = os.path.join(workDir, "{}_{}_{}.h5".format(layout, codec.replace(":", "-"), chunkshape))
+			result = benchmarkConfiguration(inputFileName, outputFileName, layout, dicoLayout[layout], codec, chunkshape,
+											r1Size, blockSizeInBytes)
+			print(result)
+			listResult.append(result)
+			if outputDir is None:
+				os.remove(outputFileName)
+	finally:
+		if outputDir is None:
+			shutil.rmtree(workDir, ignore_errors=True)
+	if reportFileName is not None:
+		writeBenchmarkReport(reportFileName, listResult)
+	return listResult
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help="hdf5 r1 v2 input file", required=True)
+	parser.add_argument('-l', '--layout', help="layouts to be evaluated (PES, PSE, EPS, ESP, SEP, SPE, sort_RANGE, sort_MEAN, sort_SIGMA, sort_MIN, sort_MAX, min, slice_first_last). Default : all",
+						required=False, nargs='+', default=None)
+	parser.add_argument('-c', '--codec', help="codecs to be evaluated (none or complib[:level][:shuffle|:bitshuffle]). Default : " + " ".join(DEFAULT_CODECS),
+						required=False, nargs='+', default=DEFAULT_CODECS)
+	parser.add_argument('-k', '--chunkshape', help="numbers of rows per chunk to be evaluated (0 : automatic). Default = 0",
+						required=False, type=int, nargs='+', default=[0])
+	parser.add_argument('-n', '--nbeventperInjTab', help="number of events per injunction table of the pixel sorts (0 mean all the events). Default = 0",
+						required=False, type=int, default=0)
+	parser.add_argument('-m', '--nbeventpermin', help="number of events used to compute a minimum of the minimum selection. Default = 100",
+						required=False, type=int, default=100)
+	parser.add_argument('-s', '--slice', help="first and last (excluded) slices of the slice selection layout",
+						required=False, type=int, nargs=2, default=None)
+	parser.add_argument('-r', '--report', help="csv (or json if it ends with .json) file of the results", required=False,
+						default=None)
+	parser.add_argument('-o', '--output', help="directory where the files of the layouts are kept. Default : temporary files",
+						required=False, default=None)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+
+	args = parser.parse_args()
+
+	compressionBenchmark(args.input, listLayout=args.layout, listCodec=args.codec, listChunkshape=args.chunkshape,
+						 nbEventPerInjTab=args.nbeventperInjTab, nbEventPerMin=args.nbeventpermin, sliceRange=args.slice,
+						 reportFileName=args.report, outputDir=args.output, blockSizeInBytes=args.blocksize*1024*1024)
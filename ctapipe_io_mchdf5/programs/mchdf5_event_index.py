@@ -0,0 +1,65 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import tables
+import argparse
+
+from ctapipe_io_mchdf5.tools.event_index import create_event_index_from_tel_nodes, write_event_index
+
+
+def getTabEventIdV2(telNode):
+	'''
+	Get the id of the events stored in a telescope of a V2 file
+	Parameters:
+	-----------
+		telNode : telescope node
+	Return:
+	-------
+		table of event id
+	'''
+	return telNode.trigger.col("event_id")
+
+
+def getTabEventIdV1(telNode):
+	'''
+	Get the id of the events stored in a telescope of a V1 file
+	Parameters:
+	-----------
+		telNode : telescope node
+	Return:
+	-------
+		table of event id
+	'''
+	return telNode.eventId.col("eventId")
+
+
+def addEventIndexFile(fileName):
+	'''
+	Add the event index in a file (an existing index is replaced)
+	Parameters:
+	-----------
+		fileName : name of the file to be completed
+	'''
+	hfile = tables.open_file(fileName, "a")
+	if "r1" in hfile.root:
+		eventIndex = create_event_index_from_tel_nodes(hfile, "/r1", getTabEventIdV2)
+	else:
+		eventIndex = create_event_index_from_tel_nodes(hfile, "/Tel", getTabEventIdV1)
+	write_event_index(hfile, eventIndex)
+	print("addEventIndexFile : {} events, {} telescope events".format(len(eventIndex), len(eventIndex.tabTelId)))
+	hfile.close()
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help="hdf5 r1 file (v1 or v2) to be indexed", required=True)
+
+	args = parser.parse_args()
+	addEventIndexFile(args.input)
+
+
+if __name__ == '__main__':
+	main()
@@ -7,10 +7,16 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.chunk_utils import get_table_chunkshape
+from ctapipe_io_mchdf5.tools.compression_policy import get_node_filters, parse_compression_policy, write_compression_policy, \
+	copy_node_policy, COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.injunction_table import append_sorted_waveform, get_inverse_injunction_table, write_order_format
 
-def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=1):
+def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=None, expectedrows=None):
 	'''
 	Create the table to store the signal
 	Parameters:
@@ -19,67 +25,37 @@ def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 		nameWaveformHi : name of the table to store the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		expectedrows : expected number of events in the table (None if unknown)
 	'''
 	image_shape = (nbPixel, nbSlice)
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,), columns_dict_waveformHi)
-	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape)
+	chunkshape = get_table_chunkshape(description_waveformHi, chunkshape=chunkshape, expectedrows=expectedrows)
+	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape,
+					   filters=get_node_filters(hfile, cam_tel_group, nameWaveformHi))
 
 
-def create_telescope_sorted(outFile, telNode, chunkshape=1):
+def create_telescope_sorted(outFile, telNode, chunkshape=None):
 	'''
 	Create the telescope group and table
 	Parameters:
 	-----------
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
 	'''
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
 	
-	create_sorted_waveform_table(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	create_sorted_waveform_table(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape,
+								expectedrows=telNode.waveformHi.nrows)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		create_sorted_waveform_table(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape)
-
-
-def create_all_telescope_sorted(outFile, inFile, chunkshape=1):
-	'''
-	Create all the telescope ready for pixels sorting
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
-	'''
-	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
-	for telNode in inFile.walk_nodes("/r1", "Group"):
-		try:
-			create_telescope_sorted(outFile, telNode, chunkshape=chunkshape)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-
-def applyInjunctionTableOnMatrix(signalSelect, injunctionTable):
-	'''
-	Apply the injunction talbe on the input matrix
-	Parameters:
-		signalSelect : matrix of the signal (pixel, slice) to be used
-		injunctionTable : injunction table to be used
-	Return:
-		matrix with swaped rows according to the injunction table
-	'''
-	matOut = np.zeros(signalSelect.shape, dtype=signalSelect.dtype)
-	
-	for inputRow, rowIndex in zip(signalSelect, injunctionTable):
-		matOut[rowIndex][:] = inputRow[:]
-	
-	return matOut
+		create_sorted_waveform_table(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape,
+								expectedrows=telNode.waveformHi.nrows)
 
 
 def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPixel, tabInjName):
@@ -95,7 +71,6 @@ def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPix
 		tabInjName : name of the injunction table array
 	'''
 	waveformIn = waveformIn.col(keyWaveform)
-	waveformInSwap = waveformIn.swapaxes(1,2)
 	#Get mean and standard deviation
 	tabMean = np.mean(waveformIn, axis=(0, 1))
 	tabSigma = np.std(waveformIn, axis=(0, 1))
@@ -106,12 +81,11 @@ def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPix
 	matRes = np.sort(matMeanSigmaIndex.view('f8,f8,f8'), order=['f0', 'f1'], axis=0).view(np.float64)
 	injunctionTable = matRes[:,2].astype(np.uint64)
 	
-	outFile.create_array(telNodeOut, tabInjName, injunctionTable, "Injunction table to store the pixels order of a channel")
+	#The pixel i is stored at the position injunctionTable[i], so the stored order of the pixels is the inverse table
+	pixelOrder = get_inverse_injunction_table(injunctionTable).astype(np.uint64)
+	outFile.create_array(telNodeOut, tabInjName, pixelOrder, "Injunction table to store the pixels order of a channel")
 	
-	tabWaveformOut = waveformOut.row
-	for signalSelect in waveformInSwap:
-		tabWaveformOut[keyWaveform] = applyInjunctionTableOnMatrix(signalSelect, injunctionTable)
-		tabWaveformOut.append()
+	append_sorted_waveform(waveformOut, keyWaveform, waveformIn, pixelOrder, isStoreSlicePixel=False)
 	
 	waveformOut.flush()
 
@@ -126,6 +100,7 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn):
 		telNodeIn : input telescope
 	'''
 	nbPixel = np.uint64(telNodeIn.nbPixel.read())
+	write_order_format(outFile, telNodeOut)
 	sortChannel(outFile, telNodeOut, telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", nbPixel, "orderHi")
 	try:
 		sortChannel(outFile, telNodeOut, telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", nbPixel, "orderLo")
@@ -133,44 +108,35 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn):
 		print(e)
 
 
-def copySortedR1(outFile, inFile):
-	'''
-	Transpose all the telescopes data
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copySortedTelescope(outFile, telNodeOut, telNodeIn)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def sortPixelFile(inputFileName, outputFileName):
+def sortPixelFile(inputFileName, outputFileName, chunkshape=None, nbProcess=1, compressionPolicy=None):
 	'''
 	Sort the pixel inthe output file
 	Parameters:
 		inputFileName : input file to be sorted
 		outputFileName : sorted output file
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	
 	outFile.title = "R1-V2-sortedPixelSlice"
 	
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
-	create_all_telescope_sorted(outFile, inFile)
-	copySortedR1(outFile, inFile)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile, partial(create_telescope_sorted, chunkshape=chunkshape), copySortedTelescope,
+						   nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 
@@ -179,13 +145,21 @@ def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-i', '--input', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (sorted)", required=True)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
 	inputFileName = args.input
 	outputFileName = args.output
 	
-	sortPixelFile(inputFileName, outputFileName)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	sortPixelFile(inputFileName, outputFileName, chunkshape=chunkshape, nbProcess=args.nbprocess, compressionPolicy=compressionPolicy)
 
 
 
@@ -0,0 +1,45 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import os
+import time
+import argparse
+
+from ctapipe_io_mchdf5.tools.file_merge import merge_files
+
+
+def mergeFiles(outputFileName, listInputFileName, blockSizeInBytes):
+	'''
+	Merge several MCHDF5 files of the same layout (r0, r1 or dl0) into one file
+	Parameters:
+		outputFileName : name of the output file
+		listInputFileName : list of the files to be merged (in the order of their events in the output file)
+		blockSizeInBytes : expected size in bytes of the blocks of rows copied at once
+	'''
+	inputSize = sum(os.path.getsize(fileName) for fileName in listInputFileName)
+	timeStart = time.perf_counter()
+	merge_files(outputFileName, listInputFileName, blockSizeInBytes)
+	elapsedTime = time.perf_counter() - timeStart
+	print("mergeFiles : {} files merged in {:.3f} s ({:.1f} MB/s)".format(len(listInputFileName), elapsedTime,
+																		   inputSize/max(elapsedTime, 1e-9)/1e6))
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help="hdf5 files to be merged (same layout and instrument). The compressed chunks "
+						"of a file are copied as they are only while the merged tables end on a chunk (files whose number "
+						"of rows is a multiple of the chunkshape), otherwise the rows are compressed again",
+						required=True, nargs='+')
+	parser.add_argument('-o', '--output', help="hdf5 merged output file", required=True)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of rows copied at once. Default = 64",
+						required=False, type=int, default=64)
+
+	args = parser.parse_args()
+	mergeFiles(args.output, args.input, args.blocksize*1024*1024)
+
+
+if __name__ == '__main__':
+	main()
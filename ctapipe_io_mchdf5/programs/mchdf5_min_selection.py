@@ -7,29 +7,47 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
-from ctapipe_io_mchdf5.tools.min_selection_utils import create_all_telescope_min_selected
+from ctapipe_io_mchdf5.tools.min_selection_utils import create_telescope_min_selection_node
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, write_compression_policy, copy_node_policy, \
+	COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.chunk_utils import get_table_block_size, iter_table_blocks, append_table_block, STREAM_BLOCK_SIZE
 
 
-def processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, tabWaveformPart):
+def processMinSelectionChannelBlock(tableWaveformMin, keyWaveformMin, tableMin, keyMin, tabWaveformPart, nbEventPerMin):
 	'''
 	Get the minimum and waveform without minimum and append them in the output tables (block par block function)
+	Parameters:
+		tableWaveformMin : table of waveform substracted by their minimum values
+		keyWaveformMin : key to get the data into the tableWaveformMin table
+		tableMin : table of the minimum values of the waveform
+		keyMin : key to get the data into the tableMin table
+		tabWaveformPart : block of waveforms (event, slice, pixel) which starts at the beginning of a group of nbEventPerMin events
+		nbEventPerMin : number of events to be used to compute one minimum
 	'''
-	tabPixelMin = tabWaveformPart.min(axis=(0,1))
-	
-	tabSubtractWaveformMin = tabWaveformPart - tabPixelMin
-	
-	tabMin[keyMin] = tabPixelMin
-	tabMin.append()
-	
-	for subtractedSignal in tabSubtractWaveformMin:
-		tabWaveformMin[keyWaveformMin] = subtractedSignal
-		tabWaveformMin.append()
-
-
-def processMinSelectionChannel(tableWaveformMin, keyWaveformMin, tableMin, keyMin, waveformInput, keyWaveform, nbEventPerMin):
+	nbEvent, nbSlice, nbPixel = tabWaveformPart.shape
+	nbGroup = nbEvent // nbEventPerMin
+	nbEventFull = nbGroup*nbEventPerMin
+	if nbGroup > 0:
+		tabGroup = tabWaveformPart[:nbEventFull].reshape(nbGroup, nbEventPerMin, nbSlice, nbPixel)
+		tabPixelMin = tabGroup.min(axis=(1, 2))
+		append_table_block(tableMin, keyMin, tabPixelMin)
+		append_table_block(tableWaveformMin, keyWaveformMin, (tabGroup - tabPixelMin[:, np.newaxis, np.newaxis, :]).reshape(nbEventFull, nbSlice, nbPixel))
+	if nbEventFull < nbEvent:
+		# Last events of the channel
+		tabLast = tabWaveformPart[nbEventFull:]
+		tabPixelMin = tabLast.min(axis=(0, 1))
+		append_table_block(tableMin, keyMin, tabPixelMin[np.newaxis])
+		append_table_block(tableWaveformMin, keyWaveformMin, tabLast - tabPixelMin)
+
+
+def processMinSelectionChannel(tableWaveformMin, keyWaveformMin, tableMin, keyMin, waveformInput, keyWaveform, nbEventPerMin,
+							   blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Process the minimum pixel split on a channel
+	The channel is read by blocks of complete groups of nbEventPerMin events (at least one group per block)
 	Parameters:
 		tableWaveformMin : table of waveform substracted by their minimum values
 		keyWaveformMin : key to get the data into the tableWaveformMin table
@@ -37,74 +55,48 @@ def processMinSelectionChannel(tableWaveformMin, keyWaveformMin, tableMin, keyMi
 		keyMin : key to get the data into the tableMin table
 		waveformInput : input waveform signal table for a channel
 		keyWaveform : key to access the data into the waveformInput channel
+		nbEventPerMin : number of events to be used to compute one minimum
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
-	waveformHi = waveformInput.read()
-	waveformHi = waveformHi[keyWaveform]
-	
-	nbEvent = waveformHi.shape[0]
-	
+	nbEvent = waveformInput.nrows
 	if nbEvent == 0:
 		return
-	elif nbEvent >= nbEventPerMin:
-		nbMinStep = int(nbEvent/nbEventPerMin)
-		lastPosition = nbMinStep*nbEventPerMin
-		lastminValue = nbEvent - lastPosition
-		lastPosition -= 1
-		_nbEventPerMin = nbEventPerMin
-	else:
-		nbMinStep = 1
-		lastminValue = 0
-		_nbEventPerMin = nbEvent
-	
-	tabWaveformMin = tableWaveformMin.row
-	tabMin = tableMin.row
+	nbEventPerMin = max(1, min(nbEventPerMin, nbEvent))
+	nbGroupPerBlock = max(1, get_table_block_size(waveformInput, blockSizeInBytes) // nbEventPerMin)
+	nbRowPerBlock = nbGroupPerBlock*nbEventPerMin
 	print("\n")
-	for i in range(0, nbMinStep):
-		processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, waveformHi[i:i + _nbEventPerMin])
-		print("\r\r\r\r\r\r\r\r\r\r\r\r",i,"/",nbMinStep, end="")
+	for start, waveformBlock in iter_table_blocks(waveformInput, keyWaveform, nbRowPerBlock=nbRowPerBlock):
+		processMinSelectionChannelBlock(tableWaveformMin, keyWaveformMin, tableMin, keyMin, waveformBlock, nbEventPerMin)
+		print("\r\r\r\r\r\r\r\r\r\r\r\r",start + len(waveformBlock),"/",nbEvent, end="")
 	
-	if lastminValue != 0:
-		processMinSelectionChannelBlock(tabWaveformMin, keyWaveformMin, tabMin, keyMin, waveformHi[lastPosition:-1])
 	tableWaveformMin.flush()
 	tableMin.flush()
 	print("\nDone for",keyWaveformMin)
 
 
-def processMinSelectionTelescope(telNodeOut, telNodeIn, nbEventPerMin):
+def processMinSelectionTelescope(outFile, telNodeOut, telNodeIn, nbEventPerMin, blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Split the signal in minimum values and signal without minimum values
 	Parameters:
 	-----------
+		outFile : output file
 		telNodeOut : telescope from output file
 		telNodeIn : telescope from input file
 		nbEventPerMin : number of events to be used to compute one minimum
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
 	#Get the minimum with numpy min function
-	processMinSelectionChannel(telNodeOut.waveformHi, "waveformHi", telNodeOut.minHi, "minHi", telNodeIn.waveformHi, "waveformHi", nbEventPerMin)
+	processMinSelectionChannel(telNodeOut.waveformHi, "waveformHi", telNodeOut.minHi, "minHi", telNodeIn.waveformHi, "waveformHi", nbEventPerMin,
+							   blockSizeInBytes=blockSizeInBytes)
 	
 	try:
-		processMinSelectionChannel(telNodeOut.waveformLo, "waveformLo", telNodeOut.minLo, "minLo", telNodeIn.waveformLo, "waveformLo", nbEventPerMin)
+		processMinSelectionChannel(telNodeOut.waveformLo, "waveformLo", telNodeOut.minLo, "minLo", telNodeIn.waveformLo, "waveformLo", nbEventPerMin,
+								   blockSizeInBytes=blockSizeInBytes)
 	except Exception as e:
 		pass
 
 
-def processMinSelectionAllTelescope(outFile, inFile, nbEventPerMin):
-	'''
-	Split the signal in minimum values and signal without minimum values for all telescopes
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		nbEventPerMin : number of events to be used to compute one minimum
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			processMinSelectionTelescope(telNodeOut, telNodeIn, nbEventPerMin)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape=1):
+def processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape=None, nbProcess=1, blockSizeInBytes=STREAM_BLOCK_SIZE, compressionPolicy=None):
 	'''
 	Process the minimum selection
 	Parameters:
@@ -112,23 +104,29 @@ def processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape
 		inputFileName : name of the input file
 		outputFileName : name of the output file
 		nbEventPerMin : number of events to be used to compute one minimum
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	outFile.title = inFile.title
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
 	
-	create_all_telescope_min_selected(outFile, inFile, nbEventPerMin, chunkshape=chunkshape)
-	processMinSelectionAllTelescope(outFile, inFile, nbEventPerMin)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile, partial(create_telescope_min_selection_node, chunkshape=chunkshape),
+						   partial(processMinSelectionTelescope, nbEventPerMin=nbEventPerMin, blockSizeInBytes=blockSizeInBytes), nbProcess=nbProcess)
 	
 	inFile.close()
 	outFile.close()
@@ -142,12 +140,22 @@ def main():
 						required=True)
 	parser.add_argument('-n', '--nbeventpermin', help="Number of event to be used to compute the minimum",
 						required=True, type=int)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	args = parser.parse_args()
 
 	inputFileName = args.input
 	outputFileName = args.output
 	nbEventPerMin = args.nbeventpermin
-	processMinSelection(inputFileName, outputFileName, nbEventPerMin)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	processMinSelection(inputFileName, outputFileName, nbEventPerMin, chunkshape=chunkshape, nbProcess=args.nbprocess, blockSizeInBytes=args.blocksize*1024*1024, compressionPolicy=compressionPolicy)
 
 
 
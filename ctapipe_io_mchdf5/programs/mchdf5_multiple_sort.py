@@ -7,8 +7,14 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
-from ctapipe_io_mchdf5.tools.copy_sort import create_all_telescope_sorted
+from ctapipe_io_mchdf5.tools.copy_sort import create_telescope_sorted
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.chunk_utils import get_table_chunkshape, get_table_block_size, iter_table_blocks, append_table_block, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.compression_policy import get_node_filters, parse_compression_policy, write_compression_policy, \
+	copy_node_policy, COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.injunction_table import apply_injunction_table
 
 MODE_RANGE = 0
 MODE_MEAN = 1
@@ -40,28 +46,6 @@ def convertStringToSelectionMode(inputStr):
 
 
 
-def applyInjunctionTableOnMatrix(signalSelect, injunctionTable):
-	'''
-	Apply the injunction talbe on the input matrix
-	Parameters:
-		signalSelect : matrix of the signal (pixel, slice) to be used
-		injunctionTable : injunction table to be used
-	Return:
-		matrix with swaped rows according to the injunction table
-	'''
-	matOut = np.zeros(signalSelect.shape, dtype=signalSelect.dtype)
-	
-	#Encode
-	for i, rowIndex in enumerate(injunctionTable):
-		matOut[i][:] = signalSelect[rowIndex][:]
-	
-	#Decode
-	#for inputRow, rowIndex in zip(signalSelect, injunctionTable):
-		#matOut[rowIndex][:] = inputRow[:]
-	
-	return matOut
-
-
 def getSelectionMean(waveformIn, tabIndex):
 	'''
 	Create the injunction table with mean mode
@@ -136,6 +120,78 @@ def getSelectionSigma(waveformIn, tabIndex):
 	return injunctionTable
 
 
+class PixelStatistic(object):
+	'''
+	Statistics of the pixels accumulated block by block (for the groups of events which do not fit in a block)
+	The mean and the variance are merged with the pairwise formula of Chan et al.
+	'''
+	
+	def __init__(self, nbPixel):
+		'''
+		Constructor of the PixelStatistic
+		Parameters:
+			nbPixel : number of pixels of the camera
+		'''
+		self.nbValue = 0
+		self.tabMin = np.full(nbPixel, np.inf)
+		self.tabMax = np.full(nbPixel, -np.inf)
+		self.tabMean = np.zeros(nbPixel)
+		self.tabM2 = np.zeros(nbPixel)
+	
+	def add_block(self, waveformIn):
+		'''
+		Add a block of events to the statistics
+		Parameters:
+			waveformIn : block of signal (event, slice, pixel)
+		'''
+		nbValueBlock = waveformIn.shape[0]*waveformIn.shape[1]
+		if nbValueBlock == 0:
+			return
+		np.minimum(self.tabMin, np.min(waveformIn, axis=(0, 1)), out=self.tabMin)
+		np.maximum(self.tabMax, np.max(waveformIn, axis=(0, 1)), out=self.tabMax)
+		tabMeanBlock = np.mean(waveformIn, axis=(0, 1), dtype=np.float64)
+		tabM2Block = np.sum((waveformIn - tabMeanBlock)**2, axis=(0, 1))
+		nbValue = self.nbValue + nbValueBlock
+		tabDelta = tabMeanBlock - self.tabMean
+		self.tabMean += tabDelta*(nbValueBlock/nbValue)
+		self.tabM2 += tabM2Block + tabDelta**2*(self.nbValue*nbValueBlock/nbValue)
+		self.nbValue = nbValue
+	
+	def get_value(self, selectionMode):
+		'''
+		Get the value of the pixels used to sort them
+		Parameters:
+			selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE, MIN, MAX)
+		Return:
+			value of each pixel
+		'''
+		if selectionMode == MODE_MEAN:
+			return self.tabMean
+		elif selectionMode == MODE_MIN:
+			return self.tabMin
+		elif selectionMode == MODE_RANGE:
+			return self.tabMax - self.tabMin
+		elif selectionMode == MODE_SIGMA:
+			return np.sqrt(self.tabM2/self.nbValue)
+		elif selectionMode == MODE_MAX:
+			return self.tabMax
+		else:
+			return None
+
+
+def getInjunctionTableFromValue(tabValue, tabIndex):
+	'''
+	Create the injunction table which sorts the pixels by increasing value
+	Parameters:
+		tabValue : value of each pixel
+		tabIndex : table of the index of the pixels
+	'''
+	matValueIndex = np.ascontiguousarray(np.stack((tabValue, tabIndex)).T)
+	matRes = np.sort(matValueIndex.view('f8,f8'), order=['f0'], axis=0).view(np.float64)
+	injunctionTable = matRes[:,1].astype(np.uint64)
+	return injunctionTable
+
+
 def getInjunctionTableFromData(waveformIn, tabIndex, selectionMode):
 	'''
 	Create the injunction table by respect to the selected mode
@@ -158,40 +214,115 @@ def getInjunctionTableFromData(waveformIn, tabIndex, selectionMode):
 		return tabIndex
 
 
-def sortChannelBlock(rowWaveformOut, waveformIn, keyWaveform, tabIndex, isStoreSlicePixel, selectionMode, rowInjTab):
+def getGroupEventIdRange(tabEventId, firstEvent, lastEvent):
+	'''
+	Get the event ids of the first and last events of a group of events
+	Parameters:
+		tabEventId : event id of each row of the channel (None to use the row indices)
+		firstEvent : first event of the group
+		lastEvent : last event of the group (excluded)
+	Return:
+		event id of the first event and event id of the last event of the group (included)
+	'''
+	if tabEventId is None:
+		return firstEvent, lastEvent - 1
+	return tabEventId[firstEvent], tabEventId[lastEvent - 1]
+
+
+def appendInjunctionTable(rowInjTab, injunctionTable, firstEventId, lastEventId):
+	'''
+	Append an injunction table in the table of the injunction tables
+	Parameters:
+		rowInjTab : row of the table of the injunction tables
+		injunctionTable : injunction table to be appended
+		firstEventId : event id of the first event sorted with the injunction table
+		lastEventId : event id of the last event sorted with the injunction table (included)
+	'''
+	rowInjTab["first_event_id"] = firstEventId
+	rowInjTab["last_event_id"] = lastEventId
+	rowInjTab["tabinj"] = injunctionTable
+	rowInjTab.append()
+
+
+def applyInjunctionTableOnBlock(waveformOut, waveformIn, keyWaveform, injunctionTable, isStoreSlicePixel, tabSortedBlock):
+	'''
+	Apply an injunction table on a block of events and append the result
+	Parameters:
+		waveformOut : table of the sorted signal
+		waveformIn : signal to be sorted (event, slice, pixel)
+		keyWaveform : name of the desired column in tables waveformOut and waveformIn)
+		injunctionTable : injunction table to be used
+		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
+		tabSortedBlock : preallocated block (event, slice, pixel) with at least as many events as waveformIn
+	'''
+	tabSorted = apply_injunction_table(waveformIn, injunctionTable, axis=2, out=tabSortedBlock[:waveformIn.shape[0]])
+	if not isStoreSlicePixel:
+		tabSorted = tabSorted.swapaxes(1, 2)
+	append_table_block(waveformOut, keyWaveform, tabSorted)
+
+
+def sortChannelBlock(waveformOut, waveformIn, keyWaveform, tabIndex, isStoreSlicePixel, selectionMode, rowInjTab, tabSortedBlock,
+					 firstEventId, lastEventId):
 	'''
 	Sort a block of a channel
 	Parameters:
-		rowWaveformOut : row to append the sorted signal
+		waveformOut : table of the sorted signal
 		waveformIn : signal to be selected
 		keyWaveform : name of the desired column in tables waveformOut and waveformIn)
 		tabIndex : table of the index of the pixels
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
-		tableInjTab : table of the injunction tables
+		rowInjTab : row of the table of the injunction tables
+		tabSortedBlock : preallocated block (event, slice, pixel) with at least as many events as waveformIn
+		firstEventId : event id of the first event of the block
+		lastEventId : event id of the last event of the block (included)
 	'''
-	waveformInSwap = waveformIn.swapaxes(1,2)
 	injunctionTable = getInjunctionTableFromData(waveformIn, tabIndex, selectionMode)
-	
-	#TODO : put the right valuesfor first and last event id
-	rowInjTab["first_event_id"] = 0
-	rowInjTab["last_event_id"] = 0
-	rowInjTab["tabinj"] = injunctionTable
-	rowInjTab.append()
-	
-	for signalSelect in waveformInSwap:
-		tabTmp = applyInjunctionTableOnMatrix(signalSelect, injunctionTable)
-		if isStoreSlicePixel:
-			tabTmp = tabTmp.swapaxes(0, 1)
-		
-		rowWaveformOut[keyWaveform] = tabTmp
-		rowWaveformOut.append()
+	appendInjunctionTable(rowInjTab, injunctionTable, firstEventId, lastEventId)
+	applyInjunctionTableOnBlock(waveformOut, waveformIn, keyWaveform, injunctionTable, isStoreSlicePixel, tabSortedBlock)
+
+
+def sortChannelLargeGroup(waveformOut, waveformIn, keyWaveform, tabIndex, isStoreSlicePixel, selectionMode, rowInjTab,
+						  firstEvent, lastEvent, nbRowPerBlock, tabSortedBlock, tabEventId=None):
+	'''
+	Sort a group of events which does not fit in a block : the statistics of the pixels are accumulated block by block,
+	then the group is read again to apply the injunction table
+	Parameters:
+		waveformOut : table of the sorted signal
+		waveformIn : table of the signal to be selected
+		keyWaveform : name of the desired column in tables waveformOut and waveformIn)
+		tabIndex : table of the index of the pixels
+		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
+		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
+		rowInjTab : row of the table of the injunction tables
+		firstEvent : first event of the group
+		lastEvent : last event of the group (excluded)
+		nbRowPerBlock : number of events read at once
+		tabSortedBlock : preallocated block (event, slice, pixel) of nbRowPerBlock events
+		tabEventId : event id of each row of the channel (None to use the row indices)
+	'''
+	pixelStat = PixelStatistic(tabIndex.shape[0])
+	for start, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, nbRowPerBlock=nbRowPerBlock,
+												  firstRow=firstEvent, lastRow=lastEvent):
+		pixelStat.add_block(waveformBlock)
+	tabValue = pixelStat.get_value(selectionMode)
+	if tabValue is None:
+		injunctionTable = tabIndex
+	else:
+		injunctionTable = getInjunctionTableFromValue(tabValue, tabIndex)
+	firstEventId, lastEventId = getGroupEventIdRange(tabEventId, firstEvent, lastEvent)
+	appendInjunctionTable(rowInjTab, injunctionTable, firstEventId, lastEventId)
+	for start, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, nbRowPerBlock=nbRowPerBlock,
+												  firstRow=firstEvent, lastRow=lastEvent):
+		applyInjunctionTableOnBlock(waveformOut, waveformBlock, keyWaveform, injunctionTable, isStoreSlicePixel, tabSortedBlock)
 
 
 def sortChannel(waveformOut, waveformIn, keyWaveform, nbPixel, tabInjName,
-		isStoreSlicePixel, selectionMode, nbEventPerInjTab, tableInjTab):
+		isStoreSlicePixel, selectionMode, nbEventPerInjTab, tableInjTab, blockSizeInBytes=STREAM_BLOCK_SIZE, tabEventId=None):
 	'''
 	Transpose all the telescopes channels (waveformHi and waveformLo)
+	The channel is read by blocks of events : a block contains complete groups of nbEventPerInjTab events
+	when they fit in blockSizeInBytes, otherwise each group is read twice (statistics, then sort)
 	Parameters:
 	-----------
 		waveformOut : signal selected
@@ -203,30 +334,40 @@ def sortChannel(waveformOut, waveformIn, keyWaveform, nbPixel, tabInjName,
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
 		nbEventPerInjTab : number of event to be treated with the same injunction table
 		tableInjTab : table of the injunction tables
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		tabEventId : event id of each row of the channel, stored in the injunction tables (None to use the row indices)
 	'''
-	waveformIn = waveformIn.col(keyWaveform)
-	rowWaveformOut = waveformOut.row
 	rowInjTab = tableInjTab.row
 	#Index of the pixels
 	tabIndex = np.arange(0, nbPixel)
+	nbEvent = waveformIn.nrows
+	if nbEvent == 0:
+		return
 	if nbEventPerInjTab == 0:
-		sortChannelBlock(rowWaveformOut, waveformIn, keyWaveform, tabIndex, isStoreSlicePixel, selectionMode, rowInjTab)
+		nbEventPerInjTab = nbEvent
+	nbRowPerBlock = get_table_block_size(waveformIn, blockSizeInBytes)
+	if nbEventPerInjTab <= nbRowPerBlock:
+		nbRowPerBlock -= nbRowPerBlock % nbEventPerInjTab
+	#Output block reused for all the blocks of the channel
+	tabSortedBlock = np.empty((min(nbRowPerBlock, nbEvent),) + waveformIn.coldescrs[keyWaveform].shape,
+							  dtype=waveformIn.coldtypes[keyWaveform].base)
+	if nbEventPerInjTab <= nbRowPerBlock:
+		for start, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, nbRowPerBlock=nbRowPerBlock):
+			for i in range(0, waveformBlock.shape[0], nbEventPerInjTab):
+				firstEventId, lastEventId = getGroupEventIdRange(tabEventId, start + i,
+																 start + min(i + nbEventPerInjTab, waveformBlock.shape[0]))
+				sortChannelBlock(waveformOut, waveformBlock[i:i + nbEventPerInjTab], keyWaveform, tabIndex,
+								 isStoreSlicePixel, selectionMode, rowInjTab, tabSortedBlock, firstEventId, lastEventId)
 	else:
-		nbEvent = waveformIn.shape[0]
-		nbBlock = int(nbEvent/nbEventPerInjTab)
-		lastBlockEventIndex = nbEventPerInjTab*nbBlock - 1
-		sizeLastBlock = nbEvent - nbEventPerInjTab*nbBlock
-		for i in range(0, nbBlock):
-			sortChannelBlock(rowWaveformOut, waveformIn[i*nbEventPerInjTab:(i+1)*nbEventPerInjTab],
-					keyWaveform, tabIndex, isStoreSlicePixel, selectionMode, rowInjTab)
-		if sizeLastBlock != 0:
-			sortChannelBlock(rowWaveformOut, waveformIn[lastBlockEventIndex:-1],
-					keyWaveform, tabIndex, isStoreSlicePixel, selectionMode, rowInjTab)
+		for firstEvent in range(0, nbEvent, nbEventPerInjTab):
+			sortChannelLargeGroup(waveformOut, waveformIn, keyWaveform, tabIndex, isStoreSlicePixel, selectionMode,
+								  rowInjTab, firstEvent, min(firstEvent + nbEventPerInjTab, nbEvent), nbRowPerBlock,
+								  tabSortedBlock, tabEventId=tabEventId)
 	tableInjTab.flush()
 	waveformOut.flush()
 
 
-def createInjunctionTabTable(hfile, cam_tel_group, nameTable, nbPixel, chunkshape=1):
+def createInjunctionTabTable(hfile, cam_tel_group, nameTable, nbPixel, chunkshape=None):
 	'''
 	Create the table to store the signal
 	Parameters:
@@ -234,7 +375,7 @@ def createInjunctionTabTable(hfile, cam_tel_group, nameTable, nbPixel, chunkshap
 		cam_tel_group : telescope group in which to put the tables
 		nameTable : name of the table to store the injunction tables
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the injunction tables (None for an automatic chunkshape)
 	Return:
 		Created table
 	'''
@@ -243,10 +384,13 @@ def createInjunctionTabTable(hfile, cam_tel_group, nameTable, nbPixel, chunkshap
 				"tabinj": tables.UInt16Col(shape=nbPixel)}
 	
 	description_tabInj = type('description columns_dict_tabInj', (tables.IsDescription,), columns_dict_tabInj)
-	return hfile.create_table(cam_tel_group, nameTable, description_tabInj, "Injunction tables of the signal", chunkshape=chunkshape)
+	chunkshape = get_table_chunkshape(description_tabInj, chunkshape=chunkshape)
+	return hfile.create_table(cam_tel_group, nameTable, description_tabInj, "Injunction tables of the signal", chunkshape=chunkshape,
+							  filters=get_node_filters(hfile, cam_tel_group, nameTable))
 
 
-def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel, selectionMode, nbEventPerInjTab):
+def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel, selectionMode, nbEventPerInjTab,
+						blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Transpose the telescope data
 	Parameters:
@@ -257,40 +401,28 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel, selec
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
 		nbEventPerInjTab : number of event to be treated with the same injunction table
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
 	nbPixel = np.uint64(telNodeIn.nbPixel.read())
+	#Event ids stored in the injunction tables to find the injunction table of an event
+	tabEventId = telNodeIn.trigger.col("event_id") if "trigger" in telNodeIn else None
+	outFile.create_array(telNodeOut, "nbEventPerInjTab", np.uint64(nbEventPerInjTab), "Number of events per injunction table (0 for all the events)")
 	tableInjTabHi = createInjunctionTabTable(outFile, telNodeOut, "injunctionHi", nbPixel)
 	sortChannel(telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", nbPixel, "orderHi",
-			isStoreSlicePixel, selectionMode, nbEventPerInjTab, tableInjTabHi)
+			isStoreSlicePixel, selectionMode, nbEventPerInjTab, tableInjTabHi, blockSizeInBytes=blockSizeInBytes,
+			tabEventId=tabEventId)
 	tableInjTabHi.flush()
 	try:
 		tableInjTabLo = createInjunctionTabTable(outFile, telNodeOut, "injunctionLo", nbPixel)
 		sortChannel(telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", nbPixel, "orderLo",
-				isStoreSlicePixel, selectionMode, nbEventPerInjTab, tableInjTabLo)
+				isStoreSlicePixel, selectionMode, nbEventPerInjTab, tableInjTabLo, blockSizeInBytes=blockSizeInBytes,
+				tabEventId=tabEventId)
 		tableInjTabLo.flush()
 	except Exception as e:
 		print(e)
 
 
-def copySortedR1(outFile, inFile, isStoreSlicePixel, selectionMode, nbEventPerInjTab):
-	'''
-	Transpose all the telescopes data
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
-		nbEventPerInjTab : number of event to be treated with the same injunction table
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel, selectionMode, nbEventPerInjTab)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, selectionMode, nbEventPerInjTab):
+def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, selectionMode, nbEventPerInjTab, chunkshape=None, nbProcess=1, blockSizeInBytes=STREAM_BLOCK_SIZE, compressionPolicy=None):
 	'''
 	Sort the pixel inthe output file
 	Parameters:
@@ -299,9 +431,15 @@ def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, selectionMod
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
 		nbEventPerInjTab : number of event to be treated with the same injunction table
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	
 	if isStoreSlicePixel:
 		outFile.title = "R1-V2-sortedSlicePixel"
@@ -310,15 +448,18 @@ def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, selectionMod
 	
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
-	create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel)
-	copySortedR1(outFile, inFile, isStoreSlicePixel, selectionMode, nbEventPerInjTab)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile,
+						   partial(create_telescope_sorted, isStoreSlicePixel=isStoreSlicePixel, chunkshape=chunkshape),
+						   partial(copySortedTelescope, isStoreSlicePixel=isStoreSlicePixel, selectionMode=selectionMode,
+								   nbEventPerInjTab=nbEventPerInjTab, blockSizeInBytes=blockSizeInBytes), nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 
@@ -330,6 +471,14 @@ def main():
 	parser.add_argument('-r', '--order', help="order to store data. slicepixel : (slice, pixel) default, or pixelslice (pixel, slice)", required=False)
 	parser.add_argument('-n', '--nbeventperInjTab', help="number of events per injunction table (0 mean all the events)", required=True, type=int)
 	parser.add_argument('-m', '--selectionmode', help="mode of the pixels selection (RANGE, MEAN, SIGMA, MIN, MAX)", required=True)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
@@ -344,7 +493,9 @@ def main():
 	selectionMode = convertStringToSelectionMode(args.selectionmode)
 	nbEventPerInjTab = args.nbeventperInjTab
 	
-	sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, selectionMode, nbEventPerInjTab)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, selectionMode, nbEventPerInjTab, chunkshape=chunkshape, nbProcess=args.nbprocess, blockSizeInBytes=args.blocksize*1024*1024, compressionPolicy=compressionPolicy)
 
 
 
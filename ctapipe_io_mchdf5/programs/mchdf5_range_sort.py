@@ -7,8 +7,13 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
-from ctapipe_io_mchdf5.tools.copy_sort import create_all_telescope_sorted
+from ctapipe_io_mchdf5.tools.copy_sort import create_telescope_sorted
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, write_compression_policy, copy_node_policy, \
+	COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.injunction_table import append_sorted_waveform, write_order_format
 
 
 def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPixel, tabInjName, isStoreSlicePixel):
@@ -25,7 +30,6 @@ def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPix
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 	'''
 	waveformIn = waveformIn.col(keyWaveform)
-	waveformInSwap = waveformIn.swapaxes(1,2)
 	#Get mean and standard deviation
 	tabMin = np.min(waveformIn, axis=(0, 1))
 	tabMax = np.max(waveformIn, axis=(0, 1))
@@ -40,14 +44,7 @@ def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPix
 	
 	outFile.create_array(telNodeOut, tabInjName, injunctionTable, "Injunction table to store the pixels order of a channel")
 	
-	tabWaveformOut = waveformOut.row
-	for signalSelect in waveformInSwap:
-		tabTmp = signalSelect[injunctionTable]
-		if isStoreSlicePixel:
-			tabTmp = tabTmp.swapaxes(0, 1)
-		
-		tabWaveformOut[keyWaveform] = tabTmp
-		tabWaveformOut.append()
+	append_sorted_waveform(waveformOut, keyWaveform, waveformIn, injunctionTable, isStoreSlicePixel=isStoreSlicePixel)
 	
 	waveformOut.flush()
 
@@ -63,6 +60,7 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel):
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 	'''
 	nbPixel = np.uint64(telNodeIn.nbPixel.read())
+	write_order_format(outFile, telNodeOut)
 	sortChannel(outFile, telNodeOut, telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", nbPixel, "orderHi", isStoreSlicePixel)
 	try:
 		sortChannel(outFile, telNodeOut, telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", nbPixel, "orderLo", isStoreSlicePixel)
@@ -70,32 +68,21 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel):
 		print(e)
 
 
-def copySortedR1(outFile, inFile, isStoreSlicePixel):
-	'''
-	Transpose all the telescopes data
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel):
+def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, chunkshape=None, nbProcess=1, compressionPolicy=None):
 	'''
 	Sort the pixel inthe output file
 	Parameters:
 		inputFileName : input file to be sorted
 		outputFileName : sorted output file
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	
 	if isStoreSlicePixel:
 		outFile.title = "R1-V2-sortedSlicePixel"
@@ -104,15 +91,17 @@ def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel):
 	
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
-	create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel)
-	copySortedR1(outFile, inFile, isStoreSlicePixel)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile,
+						   partial(create_telescope_sorted, isStoreSlicePixel=isStoreSlicePixel, chunkshape=chunkshape),
+						   partial(copySortedTelescope, isStoreSlicePixel=isStoreSlicePixel), nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 
@@ -123,6 +112,12 @@ def main():
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (sorted)", required=True)
 	parser.add_argument('-p', '--pixelslice', help="store data by (pixel, slice)", required=False)
 	parser.add_argument('-s', '--slicepixel', help="store data by (slice, pixel) default", required=False)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
@@ -135,7 +130,9 @@ def main():
 	if args.slicepixel != None:
 		isStoreSlicePixel = True
 	
-	sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, chunkshape=chunkshape, nbProcess=args.nbprocess, compressionPolicy=compressionPolicy)
 
 
 
@@ -7,25 +7,13 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
-from ctapipe_io_mchdf5.tools.copy_sort import create_all_telescope_sorted
-
-
-def applyInjunctionTableOnMatrix(signalSelect, injunctionTable):
-	'''
-	Apply the injunction talbe on the input matrix
-	Parameters:
-		signalSelect : matrix of the signal (pixel, slice) to be used
-		injunctionTable : injunction table to be used
-	Return:
-		matrix with swaped rows according to the injunction table
-	'''
-	matOut = np.zeros(signalSelect.shape, dtype=signalSelect.dtype)
-	
-	for inputRow, rowIndex in zip(signalSelect, injunctionTable):
-		matOut[rowIndex][:] = inputRow[:]
-	
-	return matOut
+from ctapipe_io_mchdf5.tools.copy_sort import create_telescope_sorted
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, write_compression_policy, copy_node_policy, \
+	COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.injunction_table import append_sorted_waveform, get_inverse_injunction_table, write_order_format
 
 
 def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPixel, tabInjName, isStoreSlicePixel):
@@ -42,7 +30,6 @@ def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPix
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 	'''
 	waveformIn = waveformIn.col(keyWaveform)
-	waveformInSwap = waveformIn.swapaxes(1,2)
 	#Get mean and standard deviation
 	tabMean = np.mean(waveformIn, axis=(0, 1))
 	tabSigma = np.std(waveformIn, axis=(0, 1))
@@ -53,16 +40,11 @@ def sortChannel(outFile, telNodeOut, waveformOut, waveformIn, keyWaveform, nbPix
 	matRes = np.sort(matMeanSigmaIndex.view('f8,f8,f8'), order=['f0', 'f1'], axis=0).view(np.float64)
 	injunctionTable = matRes[:,2].astype(np.uint64)
 	
-	outFile.create_array(telNodeOut, tabInjName, injunctionTable, "Injunction table to store the pixels order of a channel")
+	#The pixel i is stored at the position injunctionTable[i], so the stored order of the pixels is the inverse table
+	pixelOrder = get_inverse_injunction_table(injunctionTable).astype(np.uint64)
+	outFile.create_array(telNodeOut, tabInjName, pixelOrder, "Injunction table to store the pixels order of a channel")
 	
-	tabWaveformOut = waveformOut.row
-	for signalSelect in waveformInSwap:
-		tabTmp = applyInjunctionTableOnMatrix(signalSelect, injunctionTable)
-		if isStoreSlicePixel:
-			tabTmp = tabTmp.swapaxes(0, 1)
-		
-		tabWaveformOut[keyWaveform] = tabTmp
-		tabWaveformOut.append()
+	append_sorted_waveform(waveformOut, keyWaveform, waveformIn, pixelOrder, isStoreSlicePixel=isStoreSlicePixel)
 	
 	waveformOut.flush()
 
@@ -78,6 +60,7 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel):
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
 	'''
 	nbPixel = np.uint64(telNodeIn.nbPixel.read())
+	write_order_format(outFile, telNodeOut)
 	sortChannel(outFile, telNodeOut, telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", nbPixel, "orderHi", isStoreSlicePixel)
 	try:
 		sortChannel(outFile, telNodeOut, telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", nbPixel, "orderLo", isStoreSlicePixel)
@@ -85,32 +68,21 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel):
 		print(e)
 
 
-def copySortedR1(outFile, inFile, isStoreSlicePixel):
-	'''
-	Transpose all the telescopes data
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copySortedTelescope(outFile, telNodeOut, telNodeIn, isStoreSlicePixel)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel):
+def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, chunkshape=None, nbProcess=1, compressionPolicy=None):
 	'''
 	Sort the pixel inthe output file
 	Parameters:
 		inputFileName : input file to be sorted
 		outputFileName : sorted output file
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	
 	if isStoreSlicePixel:
 		outFile.title = "R1-V2-sortedSlicePixel"
@@ -119,15 +91,17 @@ def sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel):
 	
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
-	create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel)
-	copySortedR1(outFile, inFile, isStoreSlicePixel)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile,
+						   partial(create_telescope_sorted, isStoreSlicePixel=isStoreSlicePixel, chunkshape=chunkshape),
+						   partial(copySortedTelescope, isStoreSlicePixel=isStoreSlicePixel), nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 
@@ -138,6 +112,12 @@ def main():
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (sorted)", required=True)
 	parser.add_argument('-p', '--pixelslice', help="store data by (pixel, slice)", required=False)
 	parser.add_argument('-s', '--slicepixel', help="store data by (slice, pixel) default", required=False)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
@@ -150,7 +130,9 @@ def main():
 	if args.slicepixel != None:
 		isStoreSlicePixel = True
 	
-	sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	sortPixelFile(inputFileName, outputFileName, isStoreSlicePixel, chunkshape=chunkshape, nbProcess=args.nbprocess, compressionPolicy=compressionPolicy)
 
 
 
@@ -8,10 +8,15 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.chunk_utils import get_table_chunkshape, iter_table_blocks, append_table_block, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.compression_policy import get_node_filters, parse_compression_policy, write_compression_policy, \
+	copy_node_policy, COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
 
-def createMWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=1):
+def createMWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=None, expectedrows=None):
 	'''
 	Create the table to store the signal without the minimum value and it minimum in an other table
 	Parameters:
@@ -20,15 +25,18 @@ def createMWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel,
 		nameWaveformHi : name of the table to store the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		expectedrows : expected number of events in the table (None if unknown)
 	'''
 	image_shape = (nbSlice, nbPixel)
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,), columns_dict_waveformHi)
-	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape)
+	chunkshape = get_table_chunkshape(description_waveformHi, chunkshape=chunkshape, expectedrows=expectedrows)
+	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape,
+					   filters=get_node_filters(hfile, cam_tel_group, nameWaveformHi))
 
 
-def createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=1):
+def createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=None):
 	'''
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -37,39 +45,24 @@ def createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=1):
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
 		nbSlice : number of slices to be expected
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
 	'''
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	
-	createMWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	createMWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape,
+								expectedrows=telNode.waveformHi.nrows)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		createMWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape)
+		createMWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape,
+								expectedrows=telNode.waveformHi.nrows)
 
 
-def create_all_telescope_min_selected(outFile, inFile, nbSlice, chunkshape=1):
-	'''
-	Create all the telescope with the minimum selection
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		nbSlice : number of slices to be expected
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
-	'''
-	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
-	for telNode in inFile.walk_nodes("/r1", "Group"):
-		try:
-			createTelescopeSliceSelectionNode(outFile, telNode, nbSlice, chunkshape=chunkshape)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def selectSliceChannel(waveformOut, waveformIn, keyWaveform, firstSliceIndex, lastSliceIndex):
+def selectSliceChannel(waveformOut, waveformIn, keyWaveform, firstSliceIndex, lastSliceIndex, blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Select the slices on tables
+	The channel is read and written by blocks of events
 	Parameters:
 	-----------
 		waveformOut : signal selected
@@ -77,57 +70,34 @@ def selectSliceChannel(waveformOut, waveformIn, keyWaveform, firstSliceIndex, la
 		keyWaveform : name of the desired column in tables waveformOut and waveformIn)
 		firstSliceIndex : Index of the first slice to be selected
 		lastSliceIndex : Index of the last slice no to be selected
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
-	waveformIn = waveformIn.read()
-	waveformIn = waveformIn[keyWaveform]
-	
-	waveformSelect = waveformIn[:, firstSliceIndex:lastSliceIndex, :]
-	
-	tabWaveformOut = waveformOut.row
-	for signalSelect in waveformSelect:
-		tabWaveformOut[keyWaveform] = signalSelect
-		tabWaveformOut.append()
+	for _, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, blockSizeInBytes):
+		append_table_block(waveformOut, keyWaveform, waveformBlock[:, firstSliceIndex:lastSliceIndex, :])
 	
 	waveformOut.flush()
 
 
-def copySelectedSlicesTelescope(telNodeOut, telNodeIn, firstSliceIndex, lastSliceIndex):
+def copySelectedSlicesTelescope(outFile, telNodeOut, telNodeIn, firstSliceIndex, lastSliceIndex, blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Create all the telescope with the minimum selection
 	Parameters:
 	-----------
+		outFile : output file
 		telNodeOut : output telescope
 		telNodeIn : input telescope
 		firstSliceIndex : Index of the first slice to be selected
 		lastSliceIndex : Index of the last slice no to be selected
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
-	selectSliceChannel(telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", firstSliceIndex, lastSliceIndex)
+	selectSliceChannel(telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", firstSliceIndex, lastSliceIndex, blockSizeInBytes)
 	try:
-		selectSliceChannel(telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", firstSliceIndex, lastSliceIndex)
+		selectSliceChannel(telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", firstSliceIndex, lastSliceIndex, blockSizeInBytes)
 	except Exception as e:
 		print(e)
 
 
-def copySelectedSlicesR1(outFile, inFile, firstSliceIndex, lastSliceIndex):
-	'''
-	Create all the telescope with the minimum selection
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		firstSliceIndex : Index of the first slice to be selected
-		lastSliceIndex : Index of the last slice no to be selected
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copySelectedSlicesTelescope(telNodeOut, telNodeIn, firstSliceIndex, lastSliceIndex)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-	
-	
-
-
-def processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex, chunkshape=1):
+def processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex, chunkshape=None, nbProcess=1, blockSizeInBytes=STREAM_BLOCK_SIZE, compressionPolicy=None):
 	'''
 	Do the slice selection on the input file and create the output file
 	Parameters:
@@ -136,24 +106,31 @@ def processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, la
 		outputFileName : name of the output file
 		firstSliceIndex : Index of the first slice to be selected
 		lastSliceIndex : Index of the last slice no to be selected
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	outFile.title = inFile.title
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
 	
 	nbSlice = lastSliceIndex - firstSliceIndex
-	create_all_telescope_min_selected(outFile, inFile, nbSlice, chunkshape=chunkshape)
-	copySelectedSlicesR1(outFile, inFile, firstSliceIndex, lastSliceIndex)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile, partial(createTelescopeSliceSelectionNode, nbSlice=nbSlice, chunkshape=chunkshape),
+						   partial(copySelectedSlicesTelescope, firstSliceIndex=firstSliceIndex, lastSliceIndex=lastSliceIndex,
+								   blockSizeInBytes=blockSizeInBytes), nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 
@@ -164,6 +141,14 @@ def main():
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-f', '--first', help="Index of the first slice to be selected", required=True, type=int)
 	parser.add_argument('-l', '--last', help="Index of the first last no to be selected", required=True, type=int)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
@@ -172,7 +157,9 @@ def main():
 	firstSliceIndex = args.first
 	lastSliceIndex = args.last
 	
-	processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	processSliceSelectionFile(inputFileName, outputFileName, firstSliceIndex, lastSliceIndex, chunkshape=chunkshape, nbProcess=args.nbprocess, blockSizeInBytes=args.blocksize*1024*1024, compressionPolicy=compressionPolicy)
 
 
 
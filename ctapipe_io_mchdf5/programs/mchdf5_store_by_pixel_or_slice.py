@@ -4,12 +4,20 @@
 	Licence : CeCILL-C
 '''
 
+import os
+import tempfile
+import warnings
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
-from ctapipe_io_mchdf5.tools.telescope_copy import copy_all_tel_without_waveform
+from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, write_compression_policy, copy_node_policy, \
+	COMPRESSION_POLICY_HELP
 from ctapipe_io_mchdf5.tools.copy_sort import create_sorted_waveform_table_shape
+from ctapipe_io_mchdf5.tools.chunk_utils import iter_table_blocks, append_table_block, STREAM_BLOCK_SIZE, CHUNK_TARGET_SIZE
 
 MODE_PES = 0
 MODE_PSE = 1
@@ -103,9 +111,72 @@ def getWaveformSwappedFromOrder(waveformESP, orderMode):
 		return waveformPSE.swapaxes(0, 1)
 
 
-def orderSwapChannel(outFile, telNodeOut, waveformIn, keyWaveform, selectionMode):
+def getAxesFromOrder(orderMode):
+	'''
+	Get the axes of the tensor by event, slice, pixel in the order of the stored tensor
+	Parameters:
+		orderMode : order in which to store the output table (PES, PSE, EPS, ESP, SEP, SPE)
+	Return:
+		axes of the event, slice, pixel tensor (0 : event, 1 : slice, 2 : pixel) in the order of the stored tensor
+	'''
+	tabAxes = [(2, 0, 1), (2, 1, 0), (0, 2, 1), (0, 1, 2), (1, 0, 2), (1, 2, 0)]
+	return tabAxes[orderMode]
+
+
+def transposeChannelByOutputRow(waveformOut, waveformIn, keyWaveform, tabAxes, scratchFileName,
+								blockSizeInBytes=STREAM_BLOCK_SIZE):
+	'''
+	Transpose a channel whose output rows are pixels or slices (PES, PSE, SEP, SPE) in two passes
+	The first pass reads the channel by blocks of events and writes it in a scratch file by (output row, event, other
+	axis), chunked along the events. The second pass reads the scratch file by groups of output rows, so the input
+	channel is read only once
+	Parameters:
+	-----------
+		waveformOut : output table (one row per pixel or slice)
+		waveformIn : input table (event, slice, pixel)
+		keyWaveform : name of the column of the waveforms
+		tabAxes : axes of the event, slice, pixel tensor in the order of the stored tensor (see getAxesFromOrder)
+		scratchFileName : name of the temporary file used by the transposition
+		blockSizeInBytes : maximum size in bytes of the blocks of values read at once
+	'''
+	nbEvent = waveformIn.nrows
+	nbSlice, nbPixel = waveformIn.coldescrs[keyWaveform].shape
+	shapeESP = (nbEvent, nbSlice, nbPixel)
+	dtype = waveformIn.coldtypes[keyWaveform].base
+	outputAxis = tabAxes[0]
+	otherAxis = 3 - outputAxis
+	nbOutputRow, nbOther = shapeESP[outputAxis], shapeESP[otherAxis]
+	sizeOutputRow = nbEvent*nbOther*dtype.itemsize
+	if sizeOutputRow > blockSizeInBytes:
+		warnings.warn("transposeChannelByOutputRow : an output row of {} takes {} bytes, more than the block size of {} "
+					  "bytes".format(waveformOut._v_pathname, sizeOutputRow, blockSizeInBytes))
+	if nbEvent == 0:
+		return
+	# Blocks of events made of whole chunks of the scratch array
+	nbEventPerBlock = max(1, int(blockSizeInBytes // max(1, waveformIn.rowsize)))
+	nbEventPerChunk = max(1, min(nbEvent, nbEventPerBlock, int(CHUNK_TARGET_SIZE // max(1, nbOther*dtype.itemsize))))
+	nbEventPerBlock = max(1, nbEventPerBlock // nbEventPerChunk)*nbEventPerChunk
+	with tables.open_file(scratchFileName, "w") as scratchFile:
+		scratch = scratchFile.create_carray(scratchFile.root, "scratch", tables.Atom.from_dtype(dtype),
+											shape=(nbOutputRow, nbEvent, nbOther), chunkshape=(1, nbEventPerChunk, nbOther))
+		for start, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, nbRowPerBlock=nbEventPerBlock):
+			scratch[:, start:start + waveformBlock.shape[0], :] = waveformBlock.transpose(outputAxis, 0, otherAxis)
+		nbOutputRowPerGroup = max(1, int(blockSizeInBytes // max(1, sizeOutputRow)))
+		for firstOutputRow in range(0, nbOutputRow, nbOutputRowPerGroup):
+			tabGroup = scratch[firstOutputRow:min(firstOutputRow + nbOutputRowPerGroup, nbOutputRow)]
+			if tabAxes[1] != 0:
+				#The events are the last axis of the output rows
+				tabGroup = tabGroup.swapaxes(1, 2)
+			append_table_block(waveformOut, keyWaveform, tabGroup)
+
+
+def orderSwapChannel(outFile, telNodeOut, waveformIn, keyWaveform, selectionMode, blockSizeInBytes=STREAM_BLOCK_SIZE,
+					 chunkshape=None):
 	'''
 	Transpose all the telescopes channels (waveformHi and waveformLo)
+	The channel is read by blocks of events. When the rows of the output table are not events (PES, PSE, SEP, SPE),
+	each row contains all the events, so the channel is transposed in two passes through a scratch file next to the
+	output file (see transposeChannelByOutputRow)
 	Parameters:
 	-----------
 		outFile : output file
@@ -113,25 +184,34 @@ def orderSwapChannel(outFile, telNodeOut, waveformIn, keyWaveform, selectionMode
 		waveformIn : signal to be selected
 		keyWaveform : name of the desired column in tables waveformIn
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		chunkshape : number of rows per chunk of the output table (None for an automatic chunkshape)
 	'''
-	waveformIn = waveformIn.col(keyWaveform)
+	nbEvent = waveformIn.nrows
+	nbSlice, nbPixel = waveformIn.coldescrs[keyWaveform].shape
+	shapeStoredData = getShapeFromOrder(nbEvent, nbSlice, nbPixel, selectionMode)
 	
-	shapeStoredData = getShapeFromOrder(waveformIn.shape[0], waveformIn.shape[1], waveformIn.shape[2], selectionMode)
+	waveformOut = create_sorted_waveform_table_shape(outFile, telNodeOut, keyWaveform, shapeStoredData, chunkshape=chunkshape)
 	
-	waveformOut = create_sorted_waveform_table_shape(outFile, telNodeOut, keyWaveform, shapeStoredData)
-	rowWaveformOut = waveformOut.row
-	
-	swappedWaveform = getWaveformSwappedFromOrder(waveformIn, selectionMode)
-	
-	for tableEntry in swappedWaveform:
-		rowWaveformOut[keyWaveform] = tableEntry
-		rowWaveformOut.append()
+	tabAxes = getAxesFromOrder(selectionMode)
+	if tabAxes[0] == 0:
+		for start, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, blockSizeInBytes):
+			append_table_block(waveformOut, keyWaveform, getWaveformSwappedFromOrder(waveformBlock, selectionMode))
+	else:
+		# Temporary file next to the output file, to stay on the same file system
+		scratchFd, scratchFileName = tempfile.mkstemp(prefix="mchdf5_tmp_", suffix=".h5",
+													  dir=os.path.dirname(os.path.abspath(outFile.filename)))
+		os.close(scratchFd)
+		try:
+			transposeChannelByOutputRow(waveformOut, waveformIn, keyWaveform, tabAxes, scratchFileName, blockSizeInBytes)
+		finally:
+			os.remove(scratchFileName)
 	
 	waveformOut.flush()
 
 
 
-def copySortedTelescope(outFile, telNodeOut, telNodeIn, selectionMode):
+def copySortedTelescope(outFile, telNodeOut, telNodeIn, selectionMode, blockSizeInBytes=STREAM_BLOCK_SIZE, chunkshape=None):
 	'''
 	Transpose the telescope data
 	Parameters:
@@ -140,54 +220,51 @@ def copySortedTelescope(outFile, telNodeOut, telNodeIn, selectionMode):
 		telNodeOut : output telescope
 		telNodeIn : input telescope
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		chunkshape : number of rows per chunk of the output tables (None for an automatic chunkshape)
 	'''
-	orderSwapChannel(outFile, telNodeOut, telNodeIn.waveformHi, "waveformHi", selectionMode)
+	orderSwapChannel(outFile, telNodeOut, telNodeIn.waveformHi, "waveformHi", selectionMode, blockSizeInBytes=blockSizeInBytes,
+					 chunkshape=chunkshape)
 	try:
-		orderSwapChannel(outFile, telNodeOut, telNodeIn.waveformLo, "waveformLo", selectionMode)
+		orderSwapChannel(outFile, telNodeOut, telNodeIn.waveformLo, "waveformLo", selectionMode, blockSizeInBytes=blockSizeInBytes,
+						 chunkshape=chunkshape)
 	except Exception as e:
 		print(e)
 
 
-def copySortedR1(outFile, inFile, selectionMode):
-	'''
-	Transpose all the telescopes data
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
-	'''
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copySortedTelescope(outFile, telNodeOut, telNodeIn, selectionMode)
-		except tables.exceptions.NoSuchNodeError as e:
-			pass
-
-
-def sortPixelFile(inputFileName, outputFileName, selectionMode):
+def sortPixelFile(inputFileName, outputFileName, selectionMode, nbProcess=1, blockSizeInBytes=STREAM_BLOCK_SIZE, compressionPolicy=None,
+				  chunkshape=None):
 	'''
 	Sort the pixel inthe output file
 	Parameters:
 		inputFileName : input file to be sorted
 		outputFileName : sorted output file
 		selectionMode : selection mode for pixel order (MEAN, SIGMA, RANGE)
+		nbProcess : number of processes used to process the telescopes in parallel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
+		chunkshape : number of rows per chunk of the waveform tables (None for an automatic chunkshape)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	
 	outFile.title = "R1-V2-" + getTitleForOrderMode(selectionMode)
 	
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
-	copy_all_tel_without_waveform(outFile, inFile)
-	copySortedR1(outFile, inFile, selectionMode)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile, copy_telescope_without_waveform,
+						   partial(copySortedTelescope, selectionMode=selectionMode, blockSizeInBytes=blockSizeInBytes,
+								   chunkshape=chunkshape), nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 
@@ -197,6 +274,14 @@ def main():
 	parser.add_argument('-i', '--input', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (sorted)", required=True)
 	parser.add_argument('-r', '--order', help="order to store data. PES, PSE, EPS, ESP, SEP, SPE", required=True)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
@@ -205,7 +290,10 @@ def main():
 	
 	selectionMode = convertStringToOrderMode(args.order)
 	
-	sortPixelFile(inputFileName, outputFileName, selectionMode)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	sortPixelFile(inputFileName, outputFileName, selectionMode, nbProcess=args.nbprocess, blockSizeInBytes=args.blocksize*1024*1024, compressionPolicy=compressionPolicy,
+				  chunkshape=chunkshape)
 
 
 
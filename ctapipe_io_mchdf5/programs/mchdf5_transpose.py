@@ -7,11 +7,16 @@
 import tables
 import numpy as np
 import argparse
+from functools import partial
 
 from ctapipe_io_mchdf5.tools.telescope_copy import copy_telescope_without_waveform
+from ctapipe_io_mchdf5.tools.chunk_utils import get_table_chunkshape, iter_table_blocks, append_table_block, STREAM_BLOCK_SIZE
+from ctapipe_io_mchdf5.tools.compression_policy import get_node_filters, parse_compression_policy, write_compression_policy, \
+	copy_node_policy, COMPRESSION_POLICY_HELP
+from ctapipe_io_mchdf5.tools.parallel_telescope import process_all_telescopes
 
 
-def createTransposedWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=1):
+def createTransposedWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, chunkshape=None, expectedrows=None):
 	'''
 	Create the table to store the signal without the minimum value and it minimum in an other table
 	Parameters:
@@ -20,15 +25,18 @@ def createTransposedWaveformTable(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 		nameWaveformHi : name of the table to store the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		expectedrows : expected number of events in the table (None if unknown)
 	'''
 	image_shape = (nbPixel, nbSlice)
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,), columns_dict_waveformHi)
-	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape)
+	chunkshape = get_table_chunkshape(description_waveformHi, chunkshape=chunkshape, expectedrows=expectedrows)
+	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal", chunkshape=chunkshape,
+					   filters=get_node_filters(hfile, cam_tel_group, nameWaveformHi))
 
 
-def createTelescopeTransposed(outFile, telNode, chunkshape=1):
+def createTelescopeTransposed(outFile, telNode, chunkshape=None):
 	'''
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -36,111 +44,86 @@ def createTelescopeTransposed(outFile, telNode, chunkshape=1):
 	-----------
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
 	'''
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	print("createTelescopeTransposed : base of telescope copied")
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
 	
-	createTransposedWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	createTransposedWaveformTable(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, chunkshape=chunkshape,
+								expectedrows=telNode.waveformHi.nrows)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		createTransposedWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape)
+		createTransposedWaveformTable(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, chunkshape=chunkshape,
+								expectedrows=telNode.waveformHi.nrows)
 
 
-def createAllTelescopeTransposed(outFile, inFile, chunkshape=1):
-	'''
-	Create all the telescope with the minimum selection
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
-	'''
-	print("createAllTelescopeTransposed : create r1 group")
-	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
-	for telNode in inFile.walk_nodes("/r1", "Group"):
-		try:
-			createTelescopeTransposed(outFile, telNode, chunkshape=chunkshape)
-		except tables.exceptions.NoSuchNodeError as e:
-			print("createAllTelescopeTransposed : error ",e)
-
-
-def transposeChannel(waveformOut, waveformIn, keyWaveform):
+def transposeChannel(waveformOut, waveformIn, keyWaveform, blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Transpose all the telescopes channels (waveformHi and waveformLo)
+	The channel is read and written by blocks of events
 	Parameters:
 	-----------
 		waveformOut : signal selected
 		waveformIn : signal to be selected
 		keyWaveform : name of the desired column in tables waveformOut and waveformIn)
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
-	waveformIn = waveformIn.col(keyWaveform)
-	
-	tabWaveformOut = waveformOut.row
-	for signalSelect in waveformIn:
-		tabWaveformOut[keyWaveform] = signalSelect.swapaxes(0, 1)
-		tabWaveformOut.append()
+	for _, waveformBlock in iter_table_blocks(waveformIn, keyWaveform, blockSizeInBytes):
+		append_table_block(waveformOut, keyWaveform, waveformBlock.swapaxes(1, 2))
 	
 	waveformOut.flush()
 
 
-def copyTransposedTelescope(telNodeOut, telNodeIn):
+def copyTransposedTelescope(outFile, telNodeOut, telNodeIn, blockSizeInBytes=STREAM_BLOCK_SIZE):
 	'''
 	Transpose the telescope data
 	Parameters:
 	-----------
+		outFile : output file
 		telNodeOut : output telescope
 		telNodeIn : input telescope
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
 	'''
 	print("copyTransposedTelescope : telNodeOut :", telNodeOut)
-	transposeChannel(telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi")
+	transposeChannel(telNodeOut.waveformHi, telNodeIn.waveformHi, "waveformHi", blockSizeInBytes)
 	try:
-		transposeChannel(telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo")
+		transposeChannel(telNodeOut.waveformLo, telNodeIn.waveformLo, "waveformLo", blockSizeInBytes)
 	except tables.exceptions.NoSuchNodeError as e:
 		print("copyTransposedTelescope : error :",e)
 
 
-def copyTransposedR1(outFile, inFile):
-	'''
-	Transpose all the telescopes data
-	Parameters:
-	-----------
-		outFile : output file
-		inFile : input file
-	'''
-	print("copyTransposedR1 : begin")
-	for telNodeIn, telNodeOut in zip(inFile.walk_nodes("/r1", "Group"), outFile.walk_nodes("/r1", "Group")):
-		try:
-			copyTransposedTelescope(telNodeOut, telNodeIn)
-		except tables.exceptions.NoSuchNodeError as e:
-			print("copyTransposedR1 : error :",e)
-
-
-def transposeFile(inputFileName, outputFileName):
+def transposeFile(inputFileName, outputFileName, chunkshape=None, nbProcess=1, blockSizeInBytes=STREAM_BLOCK_SIZE, compressionPolicy=None):
 	'''
 	Tranpose the input file into the output file
 	Parameters:
 		inputFileName : input file to be transposed
 		outputFileName : transposed output file
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		nbProcess : number of processes used to process the telescopes in parallel
+		blockSizeInBytes : maximum size in bytes of the blocks of events read at once
+		compressionPolicy : CompressionPolicy of the output file (None to keep the compression of the input file)
 	'''
 	inFile = tables.open_file(inputFileName, "r")
 	outFile = tables.open_file(outputFileName, "w", filters=inFile.filters)
+	if compressionPolicy is not None:
+		write_compression_policy(outFile, compressionPolicy)
 	
 	outFile.title = "R1-V2-PixelSlice"
 	
 	#Copy the instrument and simulation groups
 	try:
-		outFile.copy_node(inFile.root.instrument, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.instrument, outFile.root)
 	except:
 		pass
 	try:
-		outFile.copy_node(inFile.root.simulation, newparent=outFile.root, recursive=True)
+		copy_node_policy(outFile, inFile.root.simulation, outFile.root)
 	except:
 		pass
-	createAllTelescopeTransposed(outFile, inFile)
-	copyTransposedR1(outFile, inFile)
+	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
+	process_all_telescopes(outFile, inFile, partial(createTelescopeTransposed, chunkshape=chunkshape),
+						   partial(copyTransposedTelescope, blockSizeInBytes=blockSizeInBytes), nbProcess=nbProcess)
 	inFile.close()
 	outFile.close()
 	
@@ -150,13 +133,23 @@ def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-i', '--input', help="hdf5 r1 v2 output file", required=True)
 	parser.add_argument('-o', '--output', help="hdf5 r1 v2 output file (tranposed)", required=True)
+	parser.add_argument('-k', '--chunkshape',
+						help="number of rows per chunk of the waveform tables. Default = 0 (automatic, chunks of about 1 MB)",
+						required=False, type=int, default=0)
+	parser.add_argument('-b', '--blocksize', help="maximum size in MB of the blocks of events read at once. Default = 64",
+						required=False, type=int, default=64)
+	parser.add_argument('-j', '--nbprocess', help="number of processes used to process the telescopes in parallel. Default = 1",
+						required=False, type=int, default=1)
+	parser.add_argument('--compressionpolicy', help=COMPRESSION_POLICY_HELP, required=False, default=None)
 	
 	args = parser.parse_args()
 
 	inputFileName = args.input
 	outputFileName = args.output
 	
-	transposeFile(inputFileName, outputFileName)
+	chunkshape = args.chunkshape if args.chunkshape > 0 else None
+	compressionPolicy = parse_compression_policy(args.compressionpolicy) if args.compressionpolicy else None
+	transposeFile(inputFileName, outputFileName, chunkshape=chunkshape, nbProcess=args.nbprocess, blockSizeInBytes=args.blocksize*1024*1024, compressionPolicy=compressionPolicy)
 
 
 
@@ -0,0 +1,217 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+
+	Read throughput of the event sources on synthetic files, run with :
+		pytest ctapipe_io_mchdf5/tests/test_benchmark_event_sources.py --benchmark-only
+	The size of the files is set with the environment variables MCHDF5_BENCHMARK_NB_EVENT, MCHDF5_BENCHMARK_NB_TEL,
+	MCHDF5_BENCHMARK_NB_SLICE and MCHDF5_BENCHMARK_NB_GAIN
+'''
+
+import os
+import numpy as np
+import pytest
+import tables
+
+pytest.importorskip("ctapipe")
+pytest.importorskip("pytest_benchmark")
+
+from ctapipe_io_mchdf5.programs.mchdf5_transpose import transposeFile
+
+NB_EVENT = int(os.environ.get("MCHDF5_BENCHMARK_NB_EVENT", 200))
+NB_TEL = int(os.environ.get("MCHDF5_BENCHMARK_NB_TEL", 4))
+NB_SLICE = int(os.environ.get("MCHDF5_BENCHMARK_NB_SLICE", 30))
+NB_GAIN = int(os.environ.get("MCHDF5_BENCHMARK_NB_GAIN", 2))
+# Number of pixels of the LSTCam (telType 0), the camera geometry of the event sources
+NB_PIXEL = 1855
+# Fraction of the events which trigger a telescope
+TRIGGER_FRACTION = 0.5
+
+
+def get_tab_trigger(nbEvent, nbTel, seed=20):
+	'''
+	Get the events which trigger each telescope (at least one telescope per event)
+	Return:
+		matrix of bool (nbTel, nbEvent)
+	'''
+	matTrigger = np.random.default_rng(seed).random((nbTel, nbEvent)) < TRIGGER_FRACTION
+	matTrigger[0, ~matTrigger.any(axis=0)] = True
+	return matTrigger
+
+
+def get_tab_waveform(nbEvent, nbGain, nbSlice, nbPixel, seed):
+	'''
+	Get random waveforms (poisson noise around a pedestal of 300)
+	'''
+	return np.random.default_rng(seed).poisson(300, size=(nbEvent, nbGain, nbSlice, nbPixel)).astype(np.uint16)
+
+
+def create_benchmark_file_v1(fileName, nbEvent=NB_EVENT, nbTel=NB_TEL, nbSlice=NB_SLICE, nbGain=NB_GAIN):
+	'''
+	Create a synthetic file for the MCHDF5EventSource (RunHeader, Corsika and Tel groups)
+	'''
+	matTrigger = get_tab_trigger(nbEvent, nbTel)
+	with tables.open_file(fileName, "w") as hfile:
+		runHeader = hfile.create_group("/", "RunHeader")
+		hfile.create_array(runHeader, "azimuth", np.float32(0.0))
+		for name, value in [("tabFocalTel", 28.0), ("tabPosTelX", 1.0), ("tabPosTelY", 2.0), ("tabPosTelZ", 3.0)]:
+			hfile.create_array(runHeader, name, np.full(nbTel, value, dtype=np.float32))
+		corsika = hfile.create_group("/", "Corsika")
+		tabCorsikaEvent = hfile.create_table(corsika, "tabCorsikaEvent", {
+			"eventId": tables.UInt64Col(), "energy": tables.Float32Col(), "alt": tables.Float32Col(),
+			"az": tables.Float32Col(), "coreX": tables.Float32Col(), "coreY": tables.Float32Col(),
+			"h_first_int": tables.Float32Col(), "xmax": tables.Float32Col(), "showerPrimaryId": tables.UInt32Col()})
+		tabRow = np.zeros(nbEvent, dtype=tabCorsikaEvent.dtype)
+		tabRow["eventId"] = np.arange(nbEvent)
+		tabCorsikaEvent.append(tabRow)
+		telGroup = hfile.create_group("/", "Tel")
+		for telIndex in range(nbTel):
+			telNode = hfile.create_group(telGroup, "Tel_" + str(telIndex))
+			for name, value in [("telId", telIndex + 1), ("telIndex", telIndex), ("telType", 0)]:
+				hfile.create_array(telNode, name, np.uint64(value))
+			hfile.create_array(telNode, "tabGain", np.full((nbGain, NB_PIXEL), 0.5, dtype=np.float32))
+			hfile.create_array(telNode, "tabPed", np.full((nbGain, NB_PIXEL), 300.0*nbSlice, dtype=np.float32))
+			hfile.create_array(telNode, "tabRefShape", np.ones((nbGain, nbSlice), dtype=np.float32))
+			hfile.create_array(telNode, "tabPixelX", np.linspace(-1.0, 1.0, NB_PIXEL, dtype=np.float32))
+			hfile.create_array(telNode, "tabPixelY", np.linspace(-1.0, 1.0, NB_PIXEL, dtype=np.float32))
+			tabEventId = np.flatnonzero(matTrigger[telIndex])
+			eventId = hfile.create_table(telNode, "eventId", {"eventId": tables.UInt64Col()})
+			eventId.append(np.array(tabEventId, dtype=eventId.dtype))
+			waveform = hfile.create_table(telNode, "waveform",
+										  {"waveform": tables.UInt16Col(shape=(nbGain, nbSlice, NB_PIXEL))})
+			for start in range(0, len(tabEventId), 100):
+				nbRow = min(100, len(tabEventId) - start)
+				tabRow = np.zeros(nbRow, dtype=waveform.dtype)
+				tabRow["waveform"] = get_tab_waveform(nbRow, nbGain, nbSlice, NB_PIXEL, telIndex*nbEvent + start)
+				waveform.append(tabRow)
+
+
+def create_benchmark_file_v2(fileName, nbEvent=NB_EVENT, nbTel=NB_TEL, nbSlice=NB_SLICE, nbGain=NB_GAIN):
+	'''
+	Create a synthetic R1-V2 file for the MCHDF5EventSourceV2
+	'''
+	matTrigger = get_tab_trigger(nbEvent, nbTel)
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		telescopeGroup = hfile.create_group("/instrument/subarray/telescope", "camera", createparents=True)
+		optics = hfile.create_table("/instrument/subarray/telescope", "optics",
+									{"equivalent_focal_length": tables.Float32Col()})
+		optics.append(np.full(nbTel, 28.0, dtype=optics.dtype))
+		layout = hfile.create_table("/instrument/subarray", "layout", {"pos_x": tables.Float32Col(),
+																	   "pos_y": tables.Float32Col(),
+																	   "pos_z": tables.Float32Col()})
+		layout.append(np.ones(nbTel, dtype=layout.dtype))
+		simulationGroup = hfile.create_group("/", "simulation")
+		mcEvent = hfile.create_table(simulationGroup, "mc_event", {
+			"event_id": tables.UInt64Col(), "mc_energy": tables.Float32Col(), "mc_alt": tables.Float32Col(),
+			"mc_az": tables.Float32Col(), "mc_core_x": tables.Float32Col(), "mc_core_y": tables.Float32Col(),
+			"mc_h_first_int": tables.Float32Col(), "mc_x_max": tables.Float32Col(),
+			"mc_shower_primary_id": tables.UInt32Col()})
+		tabRow = np.zeros(nbEvent, dtype=mcEvent.dtype)
+		tabRow["event_id"] = np.arange(nbEvent)
+		mcEvent.append(tabRow)
+		runConfig = hfile.create_table(simulationGroup, "run_config", {"run_array_direction": tables.Float32Col(shape=(2,))})
+		runConfig.append(np.zeros(1, dtype=runConfig.dtype))
+		r1Group = hfile.create_group("/", "r1")
+		for telIndex in range(nbTel):
+			telId = telIndex + 1
+			camNode = hfile.create_group(telescopeGroup, "Cam_" + str(telId))
+			hfile.create_array(camNode, "pix_x", np.linspace(-1.0, 1.0, NB_PIXEL, dtype=np.float32))
+			hfile.create_array(camNode, "pix_y", np.linspace(-1.0, 1.0, NB_PIXEL, dtype=np.float32))
+			telNode = hfile.create_group(r1Group, "Tel_" + str(telId))
+			for name, value in [("nbPixel", NB_PIXEL), ("nbSlice", nbSlice), ("nbGain", nbGain), ("telIndex", telIndex),
+								("telType", 0), ("telId", telId)]:
+				hfile.create_array(telNode, name, np.uint64(value))
+			hfile.create_array(telNode, "tabGain", np.full((nbGain, NB_PIXEL), 0.5, dtype=np.float32))
+			hfile.create_array(telNode, "tabRefShape", np.ones((nbGain, nbSlice), dtype=np.float32))
+			pedestal = hfile.create_table(telNode, "pedestal", {"pedestal": tables.Float32Col(shape=(nbGain, NB_PIXEL))})
+			tabPedestal = np.zeros(1, dtype=pedestal.dtype)
+			tabPedestal["pedestal"] = 300.0*nbSlice
+			pedestal.append(tabPedestal)
+			tabEventId = np.flatnonzero(matTrigger[telIndex])
+			trigger = hfile.create_table(telNode, "trigger", {"event_id": tables.UInt64Col()})
+			trigger.append(np.array(tabEventId, dtype=trigger.dtype))
+			listTable = [hfile.create_table(telNode, name, {name: tables.UInt16Col(shape=(nbSlice, NB_PIXEL))})
+						 for name in ["waveformHi", "waveformLo"][:nbGain]]
+			for start in range(0, len(tabEventId), 100):
+				nbRow = min(100, len(tabEventId) - start)
+				tabWaveform = get_tab_waveform(nbRow, nbGain, nbSlice, NB_PIXEL, telIndex*nbEvent + start)
+				for gain, table in enumerate(listTable):
+					tabRow = np.zeros(nbRow, dtype=table.dtype)
+					tabRow[table.name] = tabWaveform[:, gain]
+					table.append(tabRow)
+
+
+def get_waveform_size(fileName):
+	'''
+	Get the size in bytes of the uncompressed waveforms of a file
+	'''
+	with tables.open_file(fileName, "r") as hfile:
+		return sum(table.nrows*table.rowsize for table in hfile.walk_nodes("/", "Table")
+				   if table.name.startswith("waveform"))
+
+
+@pytest.fixture(scope="module")
+def benchmark_files(tmp_path_factory):
+	'''
+	Synthetic files of the event sources, created once for all the benchmarks
+	'''
+	from ctapipe_io_mchdf5 import MCHDF5EventSource, MCHDF5EventSourceV2, MCHDF5EventSourceV2Transpose
+
+	tmpDir = tmp_path_factory.mktemp("benchmark")
+	fileNameV1, fileNameV2, fileNameTranspose = [str(tmpDir / name) for name in ["v1.h5", "v2.h5", "v2_transpose.h5"]]
+	create_benchmark_file_v1(fileNameV1)
+	create_benchmark_file_v2(fileNameV2)
+	transposeFile(fileNameV2, fileNameTranspose)
+	return {"MCHDF5EventSource": (MCHDF5EventSource, fileNameV1),
+			"MCHDF5EventSourceV2": (MCHDF5EventSourceV2, fileNameV2),
+			"MCHDF5EventSourceV2Transpose": (MCHDF5EventSourceV2Transpose, fileNameTranspose)}
+
+
+def read_all_events(sourceClass, fileName):
+	'''
+	Read all the events of a file and access the waveforms of all their telescopes
+	Return:
+		number of events
+	'''
+	source = sourceClass(input_url=fileName)
+	nbEvent = 0
+	for event in source:
+		for telId in event.r0.tels_with_data:
+			event.r0.tel[telId].waveform
+		nbEvent += 1
+	source.run.close()
+	return nbEvent
+
+
+def read_first_event(sourceClass, fileName):
+	'''
+	Open a file and read its first event
+	'''
+	source = sourceClass(input_url=fileName)
+	event = next(iter(source))
+	for telId in event.r0.tels_with_data:
+		event.r0.tel[telId].waveform
+	source.run.close()
+
+
+SOURCE_NAMES = ["MCHDF5EventSource", "MCHDF5EventSourceV2", "MCHDF5EventSourceV2Transpose"]
+
+
+@pytest.mark.parametrize("sourceName", SOURCE_NAMES)
+def test_benchmark_read_throughput(benchmark, benchmark_files, sourceName):
+	sourceClass, fileName = benchmark_files[sourceName]
+	assert sourceClass.is_compatible(fileName)
+	nbEvent = benchmark.pedantic(read_all_events, args=(sourceClass, fileName), rounds=3, iterations=1,
+								 warmup_rounds=1)
+	assert nbEvent == NB_EVENT
+	meanTime = benchmark.stats.stats.mean
+	benchmark.extra_info["nb_event"] = nbEvent
+	benchmark.extra_info["events_per_s"] = nbEvent/meanTime
+	benchmark.extra_info["mb_per_s"] = get_waveform_size(fileName)/meanTime/1e6
+
+
+@pytest.mark.parametrize("sourceName", SOURCE_NAMES)
+def test_benchmark_time_to_first_event(benchmark, benchmark_files, sourceName):
+	sourceClass, fileName = benchmark_files[sourceName]
+	benchmark.pedantic(read_first_event, args=(sourceClass, fileName), rounds=5, iterations=1, warmup_rounds=1)
@@ -0,0 +1,75 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.chunk_utils import get_chunkshape, get_table_chunkshape, CHUNK_TARGET_SIZE, \
+	CONTIGUOUS_CHUNK_SIZE
+from ctapipe_io_mchdf5.tools.r0_utils import create_r0_dataset, create_event_tel_waveform
+from ctapipe_io_mchdf5.tools.r0_reader import get_r0_table_name
+from ctapipe_io_mchdf5.tools.copy_sort import create_sorted_waveform_table
+
+
+def test_get_chunkshape():
+	assert get_chunkshape(100) == (CHUNK_TARGET_SIZE//100,)
+	assert get_chunkshape(100, chunkshape=0) == (CHUNK_TARGET_SIZE//100,)
+	assert get_chunkshape(100, chunkshape=7) == (7,)
+	assert get_chunkshape(100, chunkshape=(3,)) == (3,)
+	assert get_chunkshape(100, expectedrows=12) == (12,)
+	assert get_chunkshape(100, expectedrows=0) == (CHUNK_TARGET_SIZE//100,)
+	assert get_chunkshape(100, targetChunkSize=1000) == (10,)
+	# A row bigger than the target size is stored in its own chunk
+	assert get_chunkshape(2*CHUNK_TARGET_SIZE) == (1,)
+
+
+def test_get_table_chunkshape():
+	description = {"event_id": tables.UInt64Col(), "waveformHi": tables.UInt16Col(shape=(5, 3))}
+	assert get_table_chunkshape(description) == (CHUNK_TARGET_SIZE//38,)
+	assert get_table_chunkshape(description, chunkshape=5, expectedrows=2) == (5,)
+	assert get_table_chunkshape(description, expectedrows=2) == (2,)
+
+
+@pytest.mark.parametrize("chunkshape, expectedrows, contiguous, chunkshapeRef", [
+	(None, None, False, (CHUNK_TARGET_SIZE//68,)),
+	(None, 40, False, (40,)),
+	(None, 100000, False, (CHUNK_TARGET_SIZE//68,)),
+	(7, 100000, False, (7,)),
+	# The contiguous tables keep all the expected rows in one chunk
+	(7, 100000, True, (100000,)),
+	(None, CONTIGUOUS_CHUNK_SIZE, True, (CONTIGUOUS_CHUNK_SIZE//68,)),
+	# Without expected number of rows, the contiguous option uses the chunkshape
+	(7, None, True, (7,)),
+])
+def test_r0_table_chunkshape(tmp_path, chunkshape, expectedrows, contiguous, chunkshapeRef):
+	with tables.open_file(str(tmp_path / "r0.h5"), "w") as hfile:
+		create_r0_dataset(hfile, dict(), chunkshape=chunkshape)
+		create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, 2, (5, 3), 1, chunkshape=chunkshape,
+								  expectedrows=expectedrows, contiguous=contiguous)
+		table = hfile.get_node(hfile.root.r0.event.telescope.waveform, get_r0_table_name(1))
+		assert table.rowsize == 68
+		assert table.chunkshape == chunkshapeRef
+		tableTrigger = hfile.root.r0.event.subarray.trigger
+		if chunkshape is None:
+			assert tableTrigger.chunkshape == (CHUNK_TARGET_SIZE//tableTrigger.rowsize,)
+		else:
+			assert tableTrigger.chunkshape == (chunkshape,)
+
+
+@pytest.mark.parametrize("isStoreSlicePixel", [True, False])
+@pytest.mark.parametrize("chunkshape, expectedrows, chunkshapeRef", [
+	(None, None, (CHUNK_TARGET_SIZE//30,)),
+	(None, 40, (40,)),
+	(0, 40, (40,)),
+	(7, 40, (7,)),
+])
+def test_r1_table_chunkshape(tmp_path, isStoreSlicePixel, chunkshape, expectedrows, chunkshapeRef):
+	with tables.open_file(str(tmp_path / "r1.h5"), "w") as hfile:
+		telNode = hfile.create_group("/", "Tel_1")
+		create_sorted_waveform_table(hfile, telNode, "waveformHi", 5, 3, isStoreSlicePixel, chunkshape=chunkshape,
+									 expectedrows=expectedrows)
+		assert telNode.waveformHi.rowsize == 30
+		assert telNode.waveformHi.chunkshape == chunkshapeRef
@@ -0,0 +1,51 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import csv
+import json
+import pytest
+
+from ctapipe_io_mchdf5.programs.mchdf5_compression_benchmark import compressionBenchmark, getWaveformSize
+from ctapipe_io_mchdf5.tests.test_parallel_telescope import create_r1_file
+
+LIST_LAYOUT = ["ESP", "SEP", "sort_MEAN", "min", "slice_1_3"]
+LIST_CODEC = ["none", "blosc:zstd:1:bitshuffle"]
+
+
+@pytest.mark.parametrize("reportName", ["benchmark.csv", "benchmark.json"])
+def test_compression_benchmark(tmp_path, reportName):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1, 2], 7, 4, 3)
+	reportFileName = str(tmp_path / reportName)
+	listResult = compressionBenchmark(inputFileName, listLayout=LIST_LAYOUT, listCodec=LIST_CODEC, listChunkshape=[0, 2],
+									  nbEventPerMin=3, sliceRange=(1, 3), reportFileName=reportFileName,
+									  outputDir=str(tmp_path / "layouts"))
+	assert len(listResult) == 1 + len(LIST_LAYOUT)*len(LIST_CODEC)*2
+	assert listResult[0].layout == "input"
+	r1Size = getWaveformSize(inputFileName)
+	assert r1Size == 2*7*4*3*2
+	for result in listResult[1:]:
+		assert result.sizeOnDisk > 0 and result.fileSize > 0
+	# The ESP layout contains the same waveforms as the input file
+	resultESP = [result for result in listResult if result.layout == "ESP" and result.codec == "none"]
+	assert all(result.sizeInMemory >= r1Size for result in resultESP)
+	with open(reportFileName) as reportFile:
+		if reportName.endswith(".json"):
+			listRow = json.load(reportFile)
+		else:
+			listRow = list(csv.DictReader(reportFile))
+	assert len(listRow) == len(listResult)
+	assert [row["layout"] for row in listRow] == [result.layout for result in listResult]
+	assert (tmp_path / "layouts" / "ESP_none_2.h5").exists()
+
+
+def test_compression_benchmark_unknown_layout(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], 3, 4, 3)
+	with pytest.raises(ValueError):
+		compressionBenchmark(inputFileName, listLayout=["XYZ"])
+	with pytest.raises(ValueError):
+		compressionBenchmark(inputFileName, listLayout=["ESP"], listCodec=["gzip"])
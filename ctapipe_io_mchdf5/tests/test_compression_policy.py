@@ -0,0 +1,82 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.compression_policy import parse_compression_policy, read_compression_policy, \
+	get_node_category
+from ctapipe_io_mchdf5.programs.mchdf5_transpose import transposeFile
+from ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2 import tailcutDilationSelectionRunFileDl0
+from ctapipe_io_mchdf5.converter.mchdf5_dl0_production import tailcutDilationSelectionProductionDl0
+from ctapipe_io_mchdf5.tests.test_parallel_telescope import create_r1_file
+from ctapipe_io_mchdf5.tests.test_pixel_selection import create_r1_selection_file, get_grid_position
+
+POLICY = "waveform=blosc:zstd:5:bitshuffle,simulation=blosc:lz4,monitoring=none"
+
+
+def test_parse_compression_policy():
+	policy = parse_compression_policy(POLICY)
+	assert str(policy) == "waveform=blosc:zstd:5:bitshuffle,simulation=blosc:lz4:1,monitoring=none"
+	assert str(parse_compression_policy(str(policy))) == str(policy)
+	assert policy.get_filters("/r1/Tel_1/waveformHi").bitshuffle
+	assert policy.get_filters("/r0/monitoring/telescope/pedestal/tel_001").complevel == 0
+	assert policy.get_filters("/r1/Tel_1/trigger") is None
+	assert get_node_category("/configuration/simulation/run") == "simulation"
+	assert get_node_category("/dl0/Tel_1/pixelWaveform") == "waveform"
+	for strPolicy in ["waveform=gzip:1", "waveform=blosc:zstd:12", "trigger=zlib", "waveform"]:
+		with pytest.raises(ValueError):
+			parse_compression_policy(strPolicy)
+
+
+@pytest.mark.parametrize("nbProcess", [1, 2])
+def test_compression_policy_transpose(tmp_path, nbProcess):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1, 2], 7, 4, 3)
+	outputFileName = str(tmp_path / "transposed.h5")
+	transposeFile(inputFileName, outputFileName, nbProcess=nbProcess, compressionPolicy=parse_compression_policy(POLICY))
+	with tables.open_file(outputFileName) as hfile:
+		assert str(read_compression_policy(hfile)) == str(parse_compression_policy(POLICY))
+		for telNode in hfile.iter_nodes("/r1", "Group"):
+			assert telNode.waveformHi.filters.complib == "blosc:zstd"
+			assert telNode.waveformHi.filters.complevel == 5 and telNode.waveformHi.filters.bitshuffle
+			assert telNode.pedestal.filters.complevel == 0
+			# Not in the policy : the filters of the file
+			assert telNode.trigger.filters == hfile.filters
+
+
+def test_compression_policy_dl0(tmp_path):
+	tabPixelX, tabPixelY = get_grid_position(4, 3)
+	tabWaveform = np.random.default_rng(18).integers(0, 20, size=(5, 3, 12)).astype(np.uint16)
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_selection_file(inputFileName, tabWaveform, tabPixelX, tabPixelY)
+	outputFileName = str(tmp_path / "dl0.h5")
+	tailcutDilationSelectionRunFileDl0(outputFileName, inputFileName, 4, 2, 1, 1, 1,
+									   compressionPolicy=parse_compression_policy("waveform=blosc:lz4:3,default=none"))
+	with tables.open_file(outputFileName) as hfile:
+		telNode = hfile.root.dl0.Tel_1
+		for node in [telNode.waveform, telNode.pixelWaveform]:
+			assert node.filters.complib == "blosc:lz4" and node.filters.complevel == 3
+		assert telNode.signal.filters.complevel == 0
+		assert hfile.root.instrument.subarray.telescope.camera.Cam_1.pix_x.filters.complevel == 0
+
+
+@pytest.mark.parametrize("nbProcess", [1, 2])
+def test_compression_policy_dl0_production(tmp_path, nbProcess):
+	tabPixelX, tabPixelY = get_grid_position(4, 3)
+	tabWaveform = np.random.default_rng(18).integers(0, 20, size=(5, 3, 12)).astype(np.uint16)
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_selection_file(inputFileName, tabWaveform, tabPixelX, tabPixelY, listTelId=[1, 2])
+	policy = parse_compression_policy("waveform=blosc:lz4:3,default=none")
+	listOutputFileName = tailcutDilationSelectionProductionDl0([inputFileName], str(tmp_path / "dl0"), 4, 2, 1, 1, 1,
+															   nbProcess=nbProcess, compressionPolicy=policy)
+	with tables.open_file(listOutputFileName[0]) as hfile:
+		assert str(read_compression_policy(hfile)) == str(policy)
+		for telNode in hfile.iter_nodes("/dl0", "Group"):
+			for node in [telNode.waveform, telNode.pixelWaveform]:
+				assert node.filters.complib == "blosc:lz4" and node.filters.complevel == 3
+			assert telNode.signal.filters.complevel == 0
@@ -0,0 +1,53 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.converter.mchdf5_dl0_production import tailcutDilationSelectionProductionDl0, getInputFileNames
+from ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2 import tailcutDilationSelectionRunFileDl0
+from ctapipe_io_mchdf5.tests.test_pixel_selection import create_r1_selection_file, get_grid_position
+
+
+def assert_same_dl0_file(fileNameA, fileNameB):
+	'''
+	Check two DL0-V2 files have the same telescopes and selected waveforms
+	'''
+	with tables.open_file(fileNameA, "r") as fileA, tables.open_file(fileNameB, "r") as fileB:
+		assert fileA.title == fileB.title == "DL0-V2"
+		listTelA = [telNode._v_name for telNode in fileA.iter_nodes("/dl0", "Group")]
+		assert listTelA == [telNode._v_name for telNode in fileB.iter_nodes("/dl0", "Group")]
+		for telName in listTelA:
+			telNodeA, telNodeB = fileA.get_node("/dl0", telName), fileB.get_node("/dl0", telName)
+			assert np.all(telNodeA.waveform.col("waveform") == telNodeB.waveform.col("waveform"))
+			assert np.all(telNodeA.signal.read() == telNodeB.signal.read())
+			assert [list(row) for row in telNodeA.pixelWaveform.read()] == [list(row) for row in telNodeB.pixelWaveform.read()]
+
+
+def test_dl0_production(tmp_path):
+	nbX, nbY, nbEvent, nbSlice = 5, 4, 12, 3
+	tabPixelX, tabPixelY = get_grid_position(nbX, nbY)
+	rng = np.random.default_rng(17)
+	listInputFileName = list()
+	for fileIndex in range(3):
+		tabWaveform = rng.integers(0, 3, size=(nbEvent, nbSlice, nbX*nbY)).astype(np.uint16)
+		tabWaveform[:, :, 6 + fileIndex:9 + fileIndex] += 10
+		inputFileName = str(tmp_path / "run_{}.h5".format(fileIndex))
+		create_r1_selection_file(inputFileName, tabWaveform, tabPixelX, tabPixelY, listTelId=[1, 2, 4])
+		tailcutDilationSelectionRunFileDl0(str(tmp_path / "ref_{}.h5".format(fileIndex)), inputFileName, 4, 2, 1, 1, 1)
+		listInputFileName.append(inputFileName)
+
+	listInputFileName = getInputFileNames([str(tmp_path / "run_*.h5"), listInputFileName[0]])
+	assert listInputFileName == [str(tmp_path / "run_{}.h5".format(i)) for i in range(3)]
+	listSerial = tailcutDilationSelectionProductionDl0(listInputFileName, str(tmp_path / "serial"), 4, 2, 1, 1, 1)
+	listParallel = tailcutDilationSelectionProductionDl0(listInputFileName, str(tmp_path / "parallel"), 4, 2, 1, 1, 1,
+														 nbProcess=3)
+	for fileIndex, (serialFileName, parallelFileName) in enumerate(zip(listSerial, listParallel)):
+		assert parallelFileName == str(tmp_path / "parallel" / "run_{}-dl0_v2.h5".format(fileIndex))
+		assert_same_dl0_file(serialFileName, str(tmp_path / "ref_{}.h5".format(fileIndex)))
+		assert_same_dl0_file(parallelFileName, serialFileName)
+	# The temporary files are removed
+	assert sorted(p.name for p in (tmp_path / "parallel").iterdir()) == ["run_{}-dl0_v2.h5".format(i) for i in range(3)]
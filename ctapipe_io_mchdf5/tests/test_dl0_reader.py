@@ -0,0 +1,94 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.dl0_reader import DL0TelescopeReader, scatter_dense_waveform
+
+
+def create_dl0_file(fileName, tabSelected, tabDense, tabSignal, isWaveformOffset=True):
+	'''
+	Create a DL0-V2 file with one telescope (same layout as dl0_utils.create_dl0_table_tel)
+	Parameters:
+	-----------
+		fileName : name of the file to be created
+		tabSelected : mask of the selected pixels (nbEvent, nbPixel)
+		tabDense : dense waveforms (nbEvent, nbPixel, nbSlice)
+		tabSignal : integrated signal (nbEvent, nbPixel)
+		isWaveformOffset : True to write the rows of the events in the waveform table, False to keep them to 0 (old files)
+	'''
+	nbEvent, nbPixel, nbSlice = tabDense.shape
+	with tables.open_file(fileName, "w", title="DL0-V2") as hfile:
+		telNode = hfile.create_group(hfile.create_group("/", "dl0"), "Tel_1")
+		hfile.create_array(telNode, "nbPixel", np.uint64(nbPixel))
+		hfile.create_array(telNode, "nbSlice", np.uint64(nbSlice))
+		pixelWaveform = hfile.create_vlarray(telNode, "pixelWaveform", tables.UInt16Atom(shape=()))
+		tableWaveform = hfile.create_table(telNode, "waveform", {"waveform": tables.UInt16Col(shape=nbSlice)}, chunkshape=(3,))
+		tableSignal = hfile.create_table(telNode, "signal", {"signal": tables.Int16Col(shape=nbPixel),
+															 "waveformoffset": tables.UInt64Col(shape=())})
+		for i in range(nbEvent):
+			tabPixel = np.flatnonzero(tabSelected[i]).astype(np.uint16)
+			pixelWaveform.append(tabPixel)
+			tabRow = np.zeros(tabPixel.shape[0], dtype=tableWaveform.dtype)
+			tabRow["waveform"] = tabDense[i, tabPixel]
+			tableWaveform.append(tabRow)
+			tabRowSignal = np.zeros(1, dtype=tableSignal.dtype)
+			tabRowSignal["signal"] = tabSignal[i]
+			if isWaveformOffset:
+				tabRowSignal["waveformoffset"] = tableWaveform.nrows - tabPixel.shape[0]
+			tableSignal.append(tabRowSignal)
+
+
+@pytest.mark.parametrize("offsetMode", ["valid", "zero", "corrupted"])
+def test_dl0_telescope_reader(tmp_path, offsetMode):
+	nbEvent, nbPixel, nbSlice = 23, 7, 5
+	rng = np.random.default_rng(14)
+	tabSelected = rng.random((nbEvent, nbPixel)) < 0.4
+	tabSelected[3] = False
+	tabDense = rng.integers(1, 1000, size=(nbEvent, nbPixel, nbSlice)).astype(np.uint16)
+	tabDense[~tabSelected] = 0
+	tabSignal = rng.integers(-100, 100, size=(nbEvent, nbPixel)).astype(np.int16)
+	fileName = str(tmp_path / "dl0.h5")
+	create_dl0_file(fileName, tabSelected, tabDense, tabSignal, isWaveformOffset=offsetMode != "zero")
+	if offsetMode == "corrupted":
+		# Only the events of the middle of the file have wrong offsets
+		with tables.open_file(fileName, "a") as hfile:
+			hfile.root.dl0.Tel_1.signal.modify_column(10, 12, column=[0, 0], colname="waveformoffset")
+
+	with tables.open_file(fileName, "r") as hfile:
+		reader = DL0TelescopeReader(hfile.root.dl0.Tel_1, blockSize=4)
+		assert reader.nb_event == nbEvent
+		# The pixelWaveform vlarray is scanned at the opening only for the files without valid offsets
+		assert (reader.tabOffset is None) == (offsetMode != "zero")
+		for row in list(range(nbEvent)) + [17, 2, 22]:
+			tabPixel, tabWaveform, signal, tabPixelLo = reader.get_event(row)
+			assert np.all(tabPixel == np.flatnonzero(tabSelected[row]))
+			assert np.all(tabWaveform == tabDense[row, tabSelected[row]])
+			assert np.all(signal == tabSignal[row])
+			assert tabPixelLo is None
+			waveform, mask = reader.get_dense_waveform(row)
+			assert np.all(waveform == tabDense[row])
+			assert np.all(mask == tabSelected[row])
+		# The kept dense waveforms are not overwritten by the next blocks
+		listDense = [reader.get_dense_waveform(row) for row in range(nbEvent)]
+		for row, (waveform, mask) in enumerate(listDense):
+			assert np.all(waveform == tabDense[row])
+			assert np.all(mask == tabSelected[row])
+		assert (reader.tabOffset is None) == (offsetMode == "valid")
+
+
+def test_scatter_dense_waveform():
+	tabPixel = np.array([1, 0, 2, 1], dtype=np.uint16)
+	tabOffset = np.array([0, 1, 1, 4])
+	tabWaveform = np.arange(8, dtype=np.uint16).reshape(4, 2)
+	tabDense, tabSelected = scatter_dense_waveform(tabPixel, tabOffset, tabWaveform, 3)
+	assert tabDense.shape == (3, 3, 2)
+	assert np.all(tabDense[0] == [[0, 0], [0, 1], [0, 0]])
+	assert np.all(tabDense[1] == 0)
+	assert np.all(tabDense[2] == [[2, 3], [6, 7], [4, 5]])
+	assert np.all(tabSelected == [[False, True, False], [False, False, False], [True, True, True]])
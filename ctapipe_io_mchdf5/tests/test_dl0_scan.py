@@ -0,0 +1,47 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.converter.mchdf5_dl0_scan import scanRunFileDl0
+from ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2 import tailcutDilationSelectionRunFileDl0
+from ctapipe_io_mchdf5.tests.test_pixel_selection import create_r1_selection_file, get_grid_position
+
+
+def test_dl0_scan(tmp_path):
+	nbX, nbY, nbEvent, nbSlice = 6, 5, 25, 4
+	tabPixelX, tabPixelY = get_grid_position(nbX, nbY)
+	rng = np.random.default_rng(18)
+	tabWaveform = rng.integers(0, 4, size=(nbEvent, nbSlice, nbX*nbY)).astype(np.uint16)
+	tabWaveform[:, :, 7:10] += 8
+	tabWaveform[::3, :, 20:23] += 4
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_selection_file(inputFileName, tabWaveform, tabPixelX, tabPixelY, listTelId=[1, 3])
+
+	listCenter, listNeighbours, listMinNeighbour, listDilation = [4, 6], [2], [1, 2], [0, 1]
+	cacheFileName = str(tmp_path / "signal.h5")
+	reportFileName = str(tmp_path / "report.csv")
+	listStatMemory = scanRunFileDl0(inputFileName, listCenter, listNeighbours, listMinNeighbour, listDilation)
+	listStatWrite = scanRunFileDl0(inputFileName, listCenter, listNeighbours, listMinNeighbour, listDilation,
+								   cacheFileName=cacheFileName)
+	listStatRead = scanRunFileDl0(inputFileName, listCenter, listNeighbours, listMinNeighbour, listDilation,
+								  cacheFileName=cacheFileName, reportFileName=reportFileName)
+	assert len(listStatMemory) == 8
+	for statMemory, statWrite, statRead in zip(listStatMemory, listStatWrite, listStatRead):
+		assert statMemory.get_row() == statWrite.get_row() == statRead.get_row()
+	with open(reportFileName) as reportFile:
+		assert len(reportFile.read().splitlines()) == 9
+
+	# The scan selects the same pixels as the DL0 conversion
+	for stat in listStatMemory:
+		assert stat.nbEvent == 2*nbEvent
+		outputFileName = str(tmp_path / "dl0.h5")
+		tailcutDilationSelectionRunFileDl0(outputFileName, inputFileName, stat.center, stat.neighbours,
+										   stat.min_number_picture_neighbors, stat.dilation, 1)
+		with tables.open_file(outputFileName, "r") as hfile:
+			nbSelected = sum(telNode.waveform.nrows for telNode in hfile.iter_nodes("/dl0", "Group"))
+		assert stat.nbSelectedPixel == nbSelected
@@ -0,0 +1,47 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.event_index import create_event_index, write_event_index, read_event_index, get_event_row, \
+	get_run_event_row
+
+
+def test_create_event_index():
+	eventIndex = create_event_index([[3, 5, 7], [5, 9], [1, 3]], [1, 2, 10], [0, 1, 9])
+	assert len(eventIndex) == 5
+	assert eventIndex.tabEventId.tolist() == [1, 3, 5, 7, 9]
+	assert eventIndex.tabOffset.tolist() == [0, 1, 3, 5, 6, 7]
+	event_id, tabTelId, tabTelIndex, tabTelRow = eventIndex.get_event(2)
+	assert event_id == 5
+	assert tabTelId.tolist() == [1, 2]
+	assert tabTelIndex.tolist() == [0, 1]
+	assert tabTelRow.tolist() == [1, 0]
+
+
+def test_write_read_event_index(tmp_path):
+	eventIndex = create_event_index([[3, 5, 7], [5, 9]], [1, 2], [0, 1])
+	fileName = str(tmp_path / "event_index.h5")
+	with tables.open_file(fileName, "w") as hfile:
+		assert read_event_index(hfile) is None
+		write_event_index(hfile, eventIndex)
+	with tables.open_file(fileName, "r") as hfile:
+		eventIndexRead = read_event_index(hfile)
+	for tabRef, tabRead in zip(eventIndex.get_event(1), eventIndexRead.get_event(1)):
+		assert np.all(tabRef == tabRead)
+	assert np.all(eventIndex.tabTelRow == eventIndexRead.tabTelRow)
+
+
+def test_get_event_row():
+	tabEventRow = get_event_row(np.array([12, 3, 7, 5], dtype=np.uint64), [3, 4, 5, 12, 13])
+	assert tabEventRow.tolist() == [1, -1, 3, 0, -1]
+
+
+def test_get_run_event_row():
+	# Same event id in two runs of a merged file
+	tabRow = get_run_event_row([1, 1, 2, 2, 2], [10, 11, 11, 10, 12], [2, 1, 1, 2, 3, 2], [10, 11, 12, 11, 10, 12])
+	assert tabRow.tolist() == [3, 1, -1, 2, -1, 4]
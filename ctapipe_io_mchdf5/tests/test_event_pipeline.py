@@ -0,0 +1,98 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import threading
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.event_pipeline import EventPipeline, iter_extracted_events
+from ctapipe_io_mchdf5.tools.r0_utils import create_r0_dataset, create_event_tel_waveform
+from ctapipe_io_mchdf5.tools.r0_writer import R0EventWriter, R0EventData
+from ctapipe_io_mchdf5.tools.r0_reader import read_r0_event_index, get_r0_table_name
+
+
+class ReusedContainerSource(object):
+	'''
+	Source which reuses the same container for all the events, as the simtel event source
+	'''
+
+	def __init__(self, nbEvent, failAt=None):
+		self.nbEvent = nbEvent
+		self.failAt = failAt
+		self.nbDecoded = 0
+
+	def __iter__(self):
+		container = {"event_id": -1, "waveform": None}
+		for i in range(self.nbEvent):
+			if i == self.failAt:
+				raise RuntimeError("corrupted event {}".format(i))
+			container["event_id"] = i
+			container["waveform"] = np.full((1, 3, 2), i, dtype=np.uint16)
+			self.nbDecoded += 1
+			yield container
+
+
+def extract_event(container):
+	return container["event_id"], container["waveform"]
+
+
+@pytest.mark.parametrize("queueSize", [0, 1, 4])
+def test_pipeline_order(queueSize):
+	listEvent = list(iter_extracted_events(ReusedContainerSource(50), extract_event, queueSize))
+	assert [eventId for eventId, _ in listEvent] == list(range(50))
+	for eventId, waveform in listEvent:
+		assert np.all(waveform == eventId)
+
+
+def test_pipeline_error_and_early_stop():
+	with pytest.raises(RuntimeError, match="corrupted event 3"):
+		for _ in EventPipeline(ReusedContainerSource(10, failAt=3), extract_event, 2):
+			pass
+
+	source = ReusedContainerSource(1000)
+	for eventId, _ in EventPipeline(source, extract_event, 2):
+		if eventId == 5:
+			break
+	# The producer is stopped and does not decode the whole source
+	assert source.nbDecoded < 20
+	assert not any(thread.name == "EventPipeline" for thread in threading.enumerate())
+
+	with pytest.raises(ValueError):
+		EventPipeline(source, extract_event, 0)
+
+
+def test_pipeline_r0_writer(tmp_path):
+	fileName = str(tmp_path / "r0.h5")
+	nbPixel, nbSlice = 3, 2
+	listTabTelId = [[1, 2], [2], [1], [1, 2]]
+	with tables.open_file(fileName, "w", title="R0-V2") as hfile:
+		create_r0_dataset(hfile, dict())
+		for telId in [1, 2]:
+			create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, 1, (nbSlice, nbPixel), telId)
+			hfile.create_table(hfile.root.r0.event.telescope.photo_electron_image, get_r0_table_name(telId),
+							   {"event_id": tables.UInt64Col(), "photo_electron_image": tables.Float32Col(shape=nbPixel)})
+
+		def extract(eventIndex):
+			tabTelId = listTabTelId[eventIndex]
+			listWaveform = [np.full((1, nbPixel, nbSlice), 10*eventIndex + telId, dtype=np.uint16) for telId in tabTelId]
+			return R0EventData(eventIndex + 1, 7, float(eventIndex), 32, tabTelId, listWaveform, [None]*len(tabTelId))
+
+		writer = R0EventWriter(hfile, True, blockSize=2)
+		for eventData in iter_extracted_events(range(len(listTabTelId)), extract, 2):
+			writer.append_event_data(eventData)
+		writer.flush()
+
+	with tables.open_file(fileName, "r") as hfile:
+		assert hfile.root.r0.event.subarray.trigger.col("event_id").tolist() == [1, 2, 3, 4]
+		eventIndex = read_r0_event_index(hfile)
+		for eventRank, (eventId, tabTelId, _, tabTelRow) in enumerate(eventIndex):
+			assert tabTelId.tolist() == listTabTelId[eventRank]
+			for telId, row in zip(tabTelId.tolist(), tabTelRow.tolist()):
+				tableWaveform = hfile.get_node("/r0/event/telescope/waveform", get_r0_table_name(telId))
+				assert tableWaveform[row]["event_id"] == eventId
+				assert np.all(tableWaveform[row]["waveformHi"] == 10*eventRank + telId)
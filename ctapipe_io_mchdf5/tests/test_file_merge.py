@@ -0,0 +1,177 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools import file_merge
+from ctapipe_io_mchdf5.tools.file_merge import merge_files, can_copy_raw_chunks
+from ctapipe_io_mchdf5.tools.r0_reader import read_r0_monitoring, R0WaveformBlockReader, get_r0_table_name
+from ctapipe_io_mchdf5.tools.event_index import read_event_index
+from ctapipe_io_mchdf5.tools.instrument_utils import create_instrument_dataset, fill_subarray_layout, fill_optic_description
+from ctapipe_io_mchdf5.tools import get_telescope_info as telinfo
+from ctapipe_io_mchdf5.tests.test_r0_reader import create_r0_file
+from ctapipe_io_mchdf5.tests.test_parallel_telescope import create_r1_file
+
+
+def test_merge_r0_files(tmp_path):
+	listFileName = [str(tmp_path / "shard_0.h5"), str(tmp_path / "shard_1.h5")]
+	listListTabTelId = [[[1, 4], [4], [1]], [[4], [7, 4], [7]]]
+	listDicoWaveform = [create_r0_file(listFileName[0], listListTabTelId[0], {1: 2, 4: 2}, 5, 3),
+						create_r0_file(listFileName[1], listListTabTelId[1], {4: 2, 7: 2}, 5, 3)]
+	# The waveforms of the telescope 4 of the second file differ from the first file (same random seed)
+	with tables.open_file(listFileName[1], "a") as hfile:
+		tableWaveform = hfile.get_node("/r0/event/telescope/waveform", get_r0_table_name(4))
+		tableWaveform.modify_column(column=tableWaveform.col("waveformHi") + 1000, colname="waveformHi")
+	listDicoWaveform[1][4][:, 0] += 1000
+
+	outputFileName = str(tmp_path / "merged.h5")
+	merge_files(outputFileName, listFileName)
+
+	with tables.open_file(outputFileName, "r") as hfile:
+		assert hfile.title == "R0-V2"
+		assert sorted(read_r0_monitoring(hfile).keys()) == [1, 4, 7]
+		assert hfile.root.r0.monitoring.telescope.information._f_get_child(get_r0_table_name(4)).nrows == 1
+		assert hfile.root.r0.event.subarray.trigger.col("event_id").tolist() == [1, 11, 21, 1, 11, 21]
+
+		eventIndex = read_event_index(hfile)
+		listTabTelId = listListTabTelId[0] + listListTabTelId[1]
+		assert len(eventIndex) == len(listTabTelId)
+		waveformReader = R0WaveformBlockReader(hfile)
+		for (_, tabTelId, _, tabTelRow), tabTelIdRef in zip(eventIndex, listTabTelId):
+			assert tabTelId.tolist() == tabTelIdRef
+			for telId, row in zip(tabTelId.tolist(), tabTelRow.tolist()):
+				# Row of the event in the telescope tables of its shard
+				nbRowFirst = listDicoWaveform[0][telId].shape[0] if telId in listDicoWaveform[0] else 0
+				fileIndex = 0 if row < nbRowFirst else 1
+				waveformRef = listDicoWaveform[fileIndex][telId][row - fileIndex*nbRowFirst]
+				waveform = waveformReader.get_waveform(telId, row)
+				np.testing.assert_array_equal(waveform, waveformRef[0].swapaxes(0, 1))
+
+
+def create_tel_info(telId):
+	'''
+	Create the informations of a telescope used by the layout and the optics of the instrument
+	'''
+	telInfo = [None]*(telinfo.TELINFO_TIME_FIRST_EV + 1)
+	for index, value in [(telinfo.TELINFO_TELTYPE, 0), (telinfo.TELINFO_TELPOSX, 10.0*telId),
+						 (telinfo.TELINFO_TELPOSY, -5.0*telId), (telinfo.TELINFO_TELPOSZ, 2.0),
+						 (telinfo.TELINFO_TEL_NAME, "LST"), (telinfo.TELINFO_NBMIRROR, 1),
+						 (telinfo.TELINFO_MIRRORAREA, 386.0), (telinfo.TELINFO_NBMIRRORTILES, 198),
+						 (telinfo.TELINFO_FOCLEN, 28.0), (telinfo.TEL_INFOR_CAMERA_ROTATION, 0.0),
+						 (telinfo.TEL_INFOR_PIX_ROTATION, 0.1)]:
+		telInfo[index] = value
+	return telInfo
+
+
+def test_merge_r0_instrument_of_different_telescopes(tmp_path):
+	# Single pass shards : only the telescopes which have data are described in the layout and the optics
+	nbTel = 7
+	listFileName = [str(tmp_path / "shard_0.h5"), str(tmp_path / "shard_1.h5")]
+	listDicoNbGain = [{1: 1, 4: 1}, {4: 1, 7: 1}]
+	for fileName, dicoNbGain in zip(listFileName, listDicoNbGain):
+		create_r0_file(fileName, [list(dicoNbGain.keys())], dicoNbGain, 5, 3)
+		with tables.open_file(fileName, "a") as hfile:
+			telInfo_from_evt = {telId: create_tel_info(telId) for telId in dicoNbGain}
+			create_instrument_dataset(hfile, dict())
+			fill_subarray_layout(hfile, telInfo_from_evt, nbTel)
+			fill_optic_description(hfile, telInfo_from_evt, nbTel)
+
+	outputFileName = str(tmp_path / "merged.h5")
+	merge_files(outputFileName, listFileName)
+	with tables.open_file(outputFileName, "r") as hfile:
+		tabLayout = hfile.root.configuration.instrument.subarray.layout.read()
+		assert tabLayout["tel_id"].tolist() == list(range(1, nbTel + 1))
+		assert [telId for telId, name in zip(tabLayout["tel_id"], tabLayout["name"]) if name == b"LST"] == [1, 4, 7]
+		assert tabLayout["pos_x"].tolist() == [10.0, 0.0, 0.0, 40.0, 0.0, 0.0, 70.0]
+		tabOptic = hfile.root.configuration.instrument.telescope.optics.read()
+		assert tabOptic["equivalent_focal_length"].tolist() == [28.0, 1.0, 1.0, 28.0, 1.0, 1.0, 28.0]
+
+	# A telescope described differently in two files
+	with tables.open_file(listFileName[1], "a") as hfile:
+		hfile.root.configuration.instrument.subarray.layout.modify_column(3, 4, column=[99.0], colname="pos_x")
+	with pytest.raises(ValueError, match="layout"):
+		merge_files(outputFileName, listFileName)
+
+
+@pytest.mark.parametrize("nbEvent", [8, 7])
+def test_merge_r1_files(tmp_path, nbEvent):
+	# With 8 events the output tables end on a chunk and the raw chunks are copied
+	nbSlice, nbPixel = 4, 3
+	listFileName = [str(tmp_path / "r1_{}.h5".format(i)) for i in range(3)]
+	for fileName in listFileName:
+		create_r1_file(fileName, [1, 2], nbEvent, nbSlice, nbPixel, chunkshape=4)
+	with tables.open_file(listFileName[0], "r") as hfile1, tables.open_file(listFileName[1], "r") as hfile2:
+		assert can_copy_raw_chunks(hfile1.root.r1.Tel_1.waveformHi, hfile2.root.r1.Tel_1.waveformHi) == (nbEvent == 8)
+
+	outputFileName = str(tmp_path / "merged.h5")
+	merge_files(outputFileName, listFileName)
+	with tables.open_file(listFileName[0], "r") as inFile, tables.open_file(outputFileName, "r") as outFile:
+		assert outFile.title == "R1-V2"
+		for telId in [1, 2]:
+			telNodeIn = inFile.get_node("/r1", "Tel_{}".format(telId))
+			telNodeOut = outFile.get_node("/r1", "Tel_{}".format(telId))
+			assert telNodeOut.pedestal.nrows == 1
+			assert telNodeOut.trigger.col("event_id").tolist() == list(range(nbEvent))*3
+			tabWaveformIn = telNodeIn.waveformHi.col("waveformHi")
+			np.testing.assert_array_equal(telNodeOut.waveformHi.col("waveformHi"), np.concatenate([tabWaveformIn]*3))
+		# The files have the same event id, their events are not mixed
+		eventIndex = read_event_index(outFile)
+		assert len(eventIndex) == 3*nbEvent
+		for i, (eventId, tabTelId, _, tabTelRow) in enumerate(eventIndex):
+			assert eventId == i % nbEvent
+			assert tabTelId.tolist() == [1, 2]
+			assert tabTelRow.tolist() == [i, i]
+
+
+@pytest.mark.parametrize("nbEvent, nbRawFileRef", [(1024, 4), (1000, 1)])
+def test_merge_raw_chunks_alignment(tmp_path, monkeypatch, nbEvent, nbRawFileRef):
+	# The raw chunks of a file are copied only if the merged tables end on a chunk
+	listRawCopy = list()
+	appendRawChunks = file_merge.append_raw_chunks
+	def append_raw_chunks(outLeaf, inLeaf):
+		listRawCopy.append(inLeaf._v_file.filename)
+		appendRawChunks(outLeaf, inLeaf)
+	monkeypatch.setattr(file_merge, "append_raw_chunks", append_raw_chunks)
+	listFileName = [str(tmp_path / "r1_{}.h5".format(i)) for i in range(4)]
+	for fileName in listFileName:
+		create_r1_file(fileName, [1], nbEvent, 4, 3, chunkshape=64)
+	outputFileName = str(tmp_path / "merged.h5")
+	merge_files(outputFileName, listFileName)
+	assert sorted(set(listRawCopy)) == listFileName[:nbRawFileRef]
+	with tables.open_file(listFileName[0], "r") as inFile, tables.open_file(outputFileName, "r") as outFile:
+		np.testing.assert_array_equal(outFile.root.r1.Tel_1.waveformHi.col("waveformHi"),
+									  np.concatenate([inFile.root.r1.Tel_1.waveformHi.col("waveformHi")]*4))
+
+
+def test_merge_dl0_offset_and_instrument(tmp_path):
+	listFileName = [str(tmp_path / "dl0_{}.h5".format(i)) for i in range(2)]
+	listNbWaveform = [5, 3]
+	for fileName, nbWaveform in zip(listFileName, listNbWaveform):
+		with tables.open_file(fileName, "w", title="DL0-V2") as hfile:
+			hfile.create_array("/instrument/subarray", "layout", np.arange(3), createparents=True)
+			telNode = hfile.create_group("/dl0", "Tel_1", createparents=True)
+			hfile.create_array(telNode, "nbPixel", np.uint64(2))
+			waveform = hfile.create_table(telNode, "waveform", {"waveform": tables.UInt16Col(shape=2)})
+			waveform.append(np.zeros(nbWaveform, dtype=waveform.dtype))
+			signal = hfile.create_table(telNode, "signal", {"signal": tables.Int16Col(shape=2),
+															"waveformoffset": tables.UInt64Col()})
+			tabSignal = np.zeros(2, dtype=signal.dtype)
+			tabSignal["waveformoffset"] = [0, 2]
+			signal.append(tabSignal)
+
+	outputFileName = str(tmp_path / "merged.h5")
+	merge_files(outputFileName, listFileName)
+	with tables.open_file(outputFileName, "r") as hfile:
+		assert hfile.root.dl0.Tel_1.waveform.nrows == 8
+		# The offsets of the second file are shifted by the waveforms of the first file
+		assert hfile.root.dl0.Tel_1.signal.col("waveformoffset").tolist() == [0, 2, 5, 7]
+
+	with tables.open_file(listFileName[1], "a") as hfile:
+		hfile.root.instrument.subarray.layout[1] = 10
+	with pytest.raises(ValueError, match="layout"):
+		merge_files(outputFileName, listFileName)
@@ -0,0 +1,112 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+from functools import partial
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.programs import mchdf5_multiple_sort, mchdf5_sigma_mean_sort, mchdf5_range_sort
+from ctapipe_io_mchdf5.tools.injunction_table import get_inverse_injunction_table, apply_injunction_table, \
+	apply_inverse_injunction_table, get_channel_decoder, read_order_format, ORDER_FORMAT_NODE, ORDER_FORMAT_GATHER, \
+	ORDER_FORMAT_SCATTER
+from ctapipe_io_mchdf5.tools.r1_calibration import CalibratedWaveformReader
+from ctapipe_io_mchdf5.tools.waveform_reader import WaveformBlockReader
+from ctapipe_io_mchdf5.tests.test_parallel_telescope import create_r1_file
+
+
+def test_injunction_table():
+	injunctionTable = np.array([3, 0, 4, 1, 2], dtype=np.uint16)
+	assert get_inverse_injunction_table(injunctionTable).tolist() == [1, 3, 4, 0, 2]
+	waveform = np.arange(2*3*5, dtype=np.uint16).reshape(2, 3, 5)
+	tabSorted = np.empty_like(waveform)
+	apply_injunction_table(waveform, injunctionTable, axis=2, out=tabSorted)
+	for i, pixel in enumerate(injunctionTable):
+		assert np.all(tabSorted[:, :, i] == waveform[:, :, pixel])
+	assert np.all(apply_inverse_injunction_table(tabSorted, injunctionTable, axis=2) == waveform)
+
+
+def test_decode_sorted_file(tmp_path):
+	nbEvent, nbSlice, nbPixel = 7, 4, 5
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], nbEvent, nbSlice, nbPixel)
+	waveform = np.random.default_rng(42).integers(0, 1000, (nbEvent, nbSlice, nbPixel)).astype(np.uint16)
+	with tables.open_file(inputFileName, "a") as hfile:
+		hfile.root.r1.Tel_1.waveformHi.modify_column(colname="waveformHi", column=waveform)
+	listSortFunc = [(partial(mchdf5_multiple_sort.sortPixelFile, isStoreSlicePixel=isStoreSlicePixel,
+							 selectionMode=mchdf5_multiple_sort.MODE_MEAN, nbEventPerInjTab=3), isStoreSlicePixel)
+					for isStoreSlicePixel in [True, False]]
+	listSortFunc.append((partial(mchdf5_sigma_mean_sort.sortPixelFile, isStoreSlicePixel=True), True))
+	for sortFunc, isStoreSlicePixel in listSortFunc:
+		outputFileName = str(tmp_path / "sorted.h5")
+		sortFunc(inputFileName, outputFileName)
+		with tables.open_file(outputFileName) as hfile:
+			telNode = hfile.root.r1.Tel_1
+			reader = CalibratedWaveformReader(WaveformBlockReader(hfile), isSlicePixel=isStoreSlicePixel, blockSize=2)
+			reader.set_decoder(1, 0, get_channel_decoder(telNode, "waveformHi"))
+			for row in range(nbEvent):
+				waveformR0, waveformR1 = reader.get_waveform(1, row)
+				assert waveformR1 is None
+				assert np.all(waveformR0[0] == waveform[row].T)
+
+
+def create_sorted_file(tmp_path, nbEvent, nbSlice, nbPixel, sortFunc):
+	'''
+	Sort a r1 file with random waveforms
+	Return:
+		name of the sorted file, waveforms of the telescope 1 (nbEvent, nbSlice, nbPixel)
+	'''
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], nbEvent, nbSlice, nbPixel)
+	waveform = np.random.default_rng(42).integers(0, 1000, (nbEvent, nbSlice, nbPixel)).astype(np.uint16)
+	with tables.open_file(inputFileName, "a") as hfile:
+		hfile.root.r1.Tel_1.waveformHi.modify_column(colname="waveformHi", column=waveform)
+	outputFileName = str(tmp_path / "sorted.h5")
+	sortFunc(inputFileName, outputFileName)
+	return outputFileName, waveform
+
+
+def test_decode_order_format(tmp_path):
+	nbEvent, nbSlice, nbPixel = 5, 4, 6
+	outputFileName, waveform = create_sorted_file(tmp_path, nbEvent, nbSlice, nbPixel,
+												  partial(mchdf5_sigma_mean_sort.sortPixelFile, isStoreSlicePixel=True))
+	with tables.open_file(outputFileName, "a") as hfile:
+		telNode = hfile.root.r1.Tel_1
+		assert read_order_format(telNode) == ORDER_FORMAT_GATHER
+		tabSorted = telNode.waveformHi.col("waveformHi")
+		decoder = get_channel_decoder(telNode, "waveformHi")
+		decoder.decode(tabSorted, 0, axis=2)
+		assert np.all(tabSorted == waveform)
+
+		# Layout of the files written before orderFormat : the pixel i is stored at the position orderHi[i]
+		pixelOrder = telNode.orderHi.read()
+		assert np.any(get_inverse_injunction_table(pixelOrder) != pixelOrder)
+		hfile.remove_node(telNode, "orderHi")
+		hfile.remove_node(telNode, ORDER_FORMAT_NODE)
+		hfile.create_array(telNode, "orderHi", get_inverse_injunction_table(pixelOrder).astype(np.uint64))
+		# The format of these files has to be given
+		with pytest.raises(ValueError, match=ORDER_FORMAT_NODE):
+			read_order_format(telNode)
+		with pytest.raises(ValueError, match=ORDER_FORMAT_NODE):
+			get_channel_decoder(telNode, "waveformHi")
+		assert read_order_format(telNode, ORDER_FORMAT_SCATTER) == ORDER_FORMAT_SCATTER
+		tabSorted = telNode.waveformHi.col("waveformHi")
+		get_channel_decoder(telNode, "waveformHi", defaultOrderFormat=ORDER_FORMAT_SCATTER).decode(tabSorted, 0, axis=2)
+		assert np.all(tabSorted == waveform)
+
+
+def test_decode_legacy_gather_order(tmp_path):
+	# The order arrays of mchdf5_range_sort were already stored as gather tables before orderFormat
+	nbEvent, nbSlice, nbPixel = 5, 4, 6
+	outputFileName, waveform = create_sorted_file(tmp_path, nbEvent, nbSlice, nbPixel,
+												  partial(mchdf5_range_sort.sortPixelFile, isStoreSlicePixel=True))
+	with tables.open_file(outputFileName, "a") as hfile:
+		telNode = hfile.root.r1.Tel_1
+		hfile.remove_node(telNode, ORDER_FORMAT_NODE)
+		tabSorted = telNode.waveformHi.col("waveformHi")
+		get_channel_decoder(telNode, "waveformHi", defaultOrderFormat=ORDER_FORMAT_GATHER).decode(tabSorted, 0, axis=2)
+		assert np.all(tabSorted == waveform)
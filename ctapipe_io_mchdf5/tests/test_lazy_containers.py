@@ -0,0 +1,113 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.lazy_waveform import TelescopeWaveformLoader, LazyWaveform, get_lazy_waveform
+from ctapipe_io_mchdf5.tests.test_r1_calibration import create_waveform_file
+
+
+class CameraContainer(object):
+	'''
+	Camera container with a slot waveform, as the ctapipe containers
+	'''
+	__slots__ = ("waveform",)
+
+	def __init__(self, waveform):
+		self.waveform = waveform
+
+
+class LazyCameraContainer(CameraContainer):
+	'''
+	CameraContainer which reads its waveform on the first access, as LazyR0CameraContainer
+	'''
+	__slots__ = ()
+	waveform = property(lambda self: get_lazy_waveform(self, CameraContainer.waveform), CameraContainer.waveform.__set__)
+
+
+class WaveformFileLoader(object):
+	'''
+	Read the waveforms of an event in the waveformHi and waveformLo tables of a file and count the reads
+	'''
+
+	def __init__(self, telNode):
+		self.telNode = telNode
+		self.listRead = list()
+
+	def __call__(self, row):
+		self.listRead.append(row)
+		return self.telNode.waveformHi[row]["waveformHi"], self.telNode.waveformLo[row]["waveformLo"].astype(np.float32)
+
+
+def test_telescope_waveform_loader(tmp_path):
+	fileName = str(tmp_path / "waveform.h5")
+	tabWaveform = np.arange(5*4*3, dtype=np.uint16).reshape(5, 4, 3)
+	create_waveform_file(fileName, tabWaveform)
+	with tables.open_file(fileName, "r") as hfile:
+		fileLoader = WaveformFileLoader(hfile.root.r1.Tel_1)
+		listLoader = [TelescopeWaveformLoader(fileLoader, row) for row in range(5)]
+		assert fileLoader.listRead == []
+		# The two waveforms of an event are read at once, only once
+		for row in [3, 1, 3]:
+			waveformR0, waveformR1 = listLoader[row].get_waveforms()
+			assert np.all(waveformR0 == tabWaveform[row])
+			assert np.all(waveformR1 == tabWaveform[row] + 100)
+			assert waveformR1.dtype == np.float32
+			assert listLoader[row].get_waveforms()[0] is waveformR0
+		assert fileLoader.listRead == [3, 1]
+		# The loader does not keep the file node after the read
+		assert listLoader[1].loadFunc is None and listLoader[1].args is None
+		assert listLoader[0].loadFunc is fileLoader
+
+
+def test_lazy_waveform_cached(tmp_path):
+	fileName = str(tmp_path / "waveform.h5")
+	tabWaveform = np.arange(5*4*3, dtype=np.uint16).reshape(5, 4, 3)
+	create_waveform_file(fileName, tabWaveform)
+	with tables.open_file(fileName, "r") as hfile:
+		fileLoader = WaveformFileLoader(hfile.root.r1.Tel_1)
+		loader = TelescopeWaveformLoader(fileLoader, 2)
+		containerR0 = LazyCameraContainer(LazyWaveform(loader, 0))
+		containerR1 = LazyCameraContainer(LazyWaveform(loader, 1))
+		assert isinstance(CameraContainer.waveform.__get__(containerR0), LazyWaveform)
+		assert fileLoader.listRead == []
+
+		waveformR1 = containerR1.waveform
+		assert np.all(waveformR1 == tabWaveform[2] + 100)
+		assert fileLoader.listRead == [2]
+		# The read waveform replaces the placeholder in the container
+		assert CameraContainer.waveform.__get__(containerR1) is waveformR1
+		assert containerR1.waveform is waveformR1
+		assert np.all(containerR0.waveform == tabWaveform[2])
+		assert containerR0.waveform is CameraContainer.waveform.__get__(containerR0)
+		assert fileLoader.listRead == [2]
+
+		# A waveform set by the user is not replaced
+		containerR0.waveform = np.zeros(3)
+		assert np.all(containerR0.waveform == 0.0)
+		assert fileLoader.listRead == [2]
+
+
+def test_lazy_tel_waveform():
+	pytest.importorskip("ctapipe")
+	from ctapipe.io.containers import DataContainer
+	from ctapipe_io_mchdf5.mchdf5_lazy_containers import set_lazy_tel_waveform
+
+	listCall = list()
+	def loadWaveform(telId):
+		listCall.append(telId)
+		return np.ones((2, 3, 4)), np.zeros((2, 3, 4), dtype=np.float32)
+
+	data = DataContainer()
+	set_lazy_tel_waveform(data, 1, True, loadWaveform, 1)
+	set_lazy_tel_waveform(data, 2, False, loadWaveform, 2)
+	assert listCall == []
+	assert data.r1.tel[1].waveform.dtype == np.float32
+	assert data.r0.tel[1].waveform.shape == (2, 3, 4)
+	assert listCall == [1]
+	assert 2 not in data.r1.tel
@@ -0,0 +1,85 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.r0_utils import create_r0_dataset, create_event_tel_waveform
+from ctapipe_io_mchdf5.tools.r0_reader import R0WaveformBlockReader, get_r0_table_name
+from ctapipe_io_mchdf5.tools.r0_writer import TelescopeWriter
+from ctapipe_io_mchdf5.tools.memmap_reader import get_table_memmap, TableMemmap
+from ctapipe_io_mchdf5.tools.chunk_utils import get_table_block_size
+
+
+def create_waveform_file(fileName, nbEvent, nbSlice, nbPixel, contiguous=False, chunkshape=None, filters=None):
+	'''
+	Create a R0-V2 file with the waveform table of the telescope 1 (2 gains), written by blocks of 3 events
+	Return:
+		waveforms of the events (nbEvent, nbGain, nbPixel, nbSlice)
+	'''
+	tabWaveform = np.random.default_rng(42).integers(0, 4000, size=(nbEvent, 2, nbPixel, nbSlice)).astype(np.uint16)
+	with tables.open_file(fileName, "w", title="R0-V2", filters=filters) as hfile:
+		create_r0_dataset(hfile, dict())
+		create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, 2, (nbSlice, nbPixel), 1,
+								  chunkshape=chunkshape, expectedrows=nbEvent, contiguous=contiguous)
+		tablePe = hfile.create_table(hfile.root.r0.event.telescope.photo_electron_image, get_r0_table_name(1),
+									 {"event_id": tables.UInt64Col(), "photo_electron_image": tables.Float32Col(shape=nbPixel)})
+		tableWaveform = hfile.get_node("/r0/event/telescope/waveform", get_r0_table_name(1))
+		telWriter = TelescopeWriter(tableWaveform, tablePe, blockSize=3)
+		for i in range(nbEvent):
+			telWriter.append(tabWaveform[i], None, i)
+		telWriter.flush()
+	return tabWaveform
+
+
+@pytest.mark.parametrize("contiguous, chunkshape", [(True, None), (False, 4)])
+def test_memmap_uncompressed(tmp_path, contiguous, chunkshape):
+	fileName = str(tmp_path / "r0.h5")
+	nbEvent, nbSlice, nbPixel = 10, 5, 7
+	tabWaveform = create_waveform_file(fileName, nbEvent, nbSlice, nbPixel, contiguous=contiguous, chunkshape=chunkshape)
+	with tables.open_file(fileName, "r") as hfile:
+		table = hfile.get_node("/r0/event/telescope/waveform", get_r0_table_name(1))
+		if contiguous:
+			assert table.chunkshape[0] == nbEvent
+			# The blocks of the uncompressed tables are not bigger than the asked size
+			assert get_table_block_size(table, 2*table.rowsize) == 2
+		tableMemmap = get_table_memmap(table)
+		# The chunks of a single table are consecutive in the file
+		assert len(tableMemmap.listBlock) == 1
+		assert isinstance(tableMemmap.listBlock[0], np.memmap)
+		tabRowMemmap = np.concatenate(tableMemmap.listBlock)
+		np.testing.assert_array_equal(tabRowMemmap, table.read())
+
+		waveformReader = R0WaveformBlockReader(hfile, memoryMap=True)
+		for i in range(nbEvent):
+			for gain, tableName in enumerate(["waveformHi", "waveformLo"]):
+				waveform = waveformReader.get_waveform(1, i, tableName)
+				np.testing.assert_array_equal(waveform, tabWaveform[i, gain].swapaxes(0, 1))
+		# No copy in the cache
+		assert waveformReader.cacheSize == 0
+
+
+def test_table_memmap_segments():
+	# Chunks which are not consecutive in the file give one block per chunk
+	tabRow = np.arange(10)
+	tableMemmap = TableMemmap([(0, tabRow[:8]), (8, tabRow[8:])], 4)
+	assert tableMemmap.blockSize == 4
+	assert [block.tolist() for block in tableMemmap.listBlock] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_memmap_compressed(tmp_path):
+	fileName = str(tmp_path / "r0.h5")
+	nbEvent, nbSlice, nbPixel = 10, 5, 7
+	tabWaveform = create_waveform_file(fileName, nbEvent, nbSlice, nbPixel, chunkshape=4,
+									   filters=tables.Filters(complevel=1, complib="blosc:zstd"))
+	with tables.open_file(fileName, "r") as hfile:
+		table = hfile.get_node("/r0/event/telescope/waveform", get_r0_table_name(1))
+		assert get_table_memmap(table) is None
+		# The compressed tables are read by blocks
+		waveformReader = R0WaveformBlockReader(hfile, memoryMap=True)
+		np.testing.assert_array_equal(waveformReader.get_waveform(1, 9, "waveformLo"), tabWaveform[9, 1].swapaxes(0, 1))
+		assert waveformReader.cacheSize > 0
@@ -0,0 +1,82 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.programs.mchdf5_transpose import transposeFile
+from ctapipe_io_mchdf5.tools import file_merge
+
+
+def create_r1_file(fileName, listTelId, nbEvent, nbSlice, nbPixel, chunkshape=None):
+	'''
+	Create a small R1-V2 file with some telescopes (chunkshape : number of rows per chunk of the waveform tables)
+	'''
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		r1Group = hfile.create_group("/", "r1")
+		for telId in listTelId:
+			telNode = hfile.create_group(r1Group, "Tel_" + str(telId))
+			for name, value in [("nbPixel", nbPixel), ("nbSlice", nbSlice), ("nbGain", 1), ("telIndex", telId - 1),
+								("telType", 0), ("telId", telId)]:
+				hfile.create_array(telNode, name, np.uint64(value))
+			trigger = hfile.create_table(telNode, "trigger", {"event_id": tables.UInt64Col()})
+			trigger.append(np.array(np.arange(nbEvent), dtype=trigger.dtype))
+			pedestal = hfile.create_table(telNode, "pedestal", {"pedestal": tables.Float32Col(shape=(1, nbPixel))})
+			pedestal.append(np.zeros(1, dtype=pedestal.dtype))
+			table = hfile.create_table(telNode, "waveformHi", {"waveformHi": tables.UInt16Col(shape=(nbSlice, nbPixel))},
+									  chunkshape=chunkshape)
+			tabRow = np.zeros(nbEvent, dtype=table.dtype)
+			tabRow["waveformHi"] = np.arange(nbEvent*nbSlice*nbPixel).reshape(nbEvent, nbSlice, nbPixel) + telId
+			table.append(tabRow)
+
+
+def test_parallel_transpose(tmp_path):
+	nbEvent, nbSlice, nbPixel = 7, 4, 3
+	listTelId = [1, 2, 5]
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, listTelId, nbEvent, nbSlice, nbPixel)
+	transposeFile(inputFileName, str(tmp_path / "serial.h5"))
+	transposeFile(inputFileName, str(tmp_path / "parallel.h5"), nbProcess=2)
+
+	with tables.open_file(str(tmp_path / "serial.h5")) as serialFile, \
+			tables.open_file(str(tmp_path / "parallel.h5")) as parallelFile:
+		assert parallelFile.title == "R1-V2-PixelSlice"
+		for telId in listTelId:
+			telNodeSerial = serialFile.get_node("/r1", "Tel_" + str(telId))
+			telNodeParallel = parallelFile.get_node("/r1", "Tel_" + str(telId))
+			waveform = telNodeParallel.waveformHi.col("waveformHi")
+			assert waveform.shape == (nbEvent, nbPixel, nbSlice)
+			assert np.all(waveform == telNodeSerial.waveformHi.col("waveformHi"))
+			assert np.all(telNodeParallel.trigger.col("event_id") == np.arange(nbEvent))
+	assert sorted(p.name for p in tmp_path.iterdir()) == ["parallel.h5", "r1.h5", "serial.h5"]
+
+
+def test_parallel_merge_raw_chunks(tmp_path, monkeypatch):
+	# The telescopes of the temporary files are merged without compressing them again
+	listRawCopy = list()
+	appendRawChunks = file_merge.append_raw_chunks
+	def append_raw_chunks(outLeaf, inLeaf):
+		listRawCopy.append(outLeaf._v_pathname)
+		appendRawChunks(outLeaf, inLeaf)
+	monkeypatch.setattr(file_merge, "append_raw_chunks", append_raw_chunks)
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1, 2], 7, 4, 3)
+	with tables.open_file(inputFileName, "a") as hfile:
+		hfile.filters = tables.Filters(complevel=5, complib="blosc:zstd")
+	transposeFile(inputFileName, str(tmp_path / "serial.h5"))
+	transposeFile(inputFileName, str(tmp_path / "parallel.h5"), nbProcess=2)
+	for telId in [1, 2]:
+		assert "/r1/Tel_{}/waveformHi".format(telId) in listRawCopy
+		assert "/r1/Tel_{}/trigger".format(telId) in listRawCopy
+	with tables.open_file(str(tmp_path / "serial.h5")) as serialFile, \
+			tables.open_file(str(tmp_path / "parallel.h5")) as parallelFile:
+		for telNodeSerial in serialFile.iter_nodes("/r1", "Group"):
+			telNodeParallel = parallelFile.get_node("/r1", telNodeSerial._v_name)
+			assert sorted(telNodeParallel._v_children) == sorted(telNodeSerial._v_children)
+			assert telNodeParallel.waveformHi.filters == telNodeSerial.waveformHi.filters
+			assert telNodeParallel.waveformHi.chunkshape == telNodeSerial.waveformHi.chunkshape
+			assert np.all(telNodeParallel.waveformHi.read() == telNodeSerial.waveformHi.read())
+			assert np.all(telNodeParallel.nbPixel.read() == telNodeSerial.nbPixel.read())
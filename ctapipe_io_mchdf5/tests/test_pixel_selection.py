@@ -0,0 +1,171 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.pixel_selection import get_neighbour_matrix, tailcut_cleaning_block, dilation_block
+from ctapipe_io_mchdf5.tools.dl0_reader import DL0TelescopeReader, get_vlarray_offset
+from ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2 import tailcutDilationSelectionRunFileDl0
+
+
+def get_grid_position(nbX, nbY):
+	'''
+	Get the position of the pixels of a square camera of nbX*nbY pixels
+	'''
+	tabPixelX, tabPixelY = np.meshgrid(np.arange(nbX, dtype=np.float32), np.arange(nbY, dtype=np.float32))
+	return tabPixelX.ravel(), tabPixelY.ravel()
+
+
+def create_r1_selection_file(fileName, tabWaveform, tabPixelX, tabPixelY, listTelId=[1]):
+	'''
+	Create a R1-V2 file with the camera geometry, the pedestal (4) and the gain (0.5) used by the pixel selection
+	(same waveforms (event, slice, pixel) for all the telescopes)
+	'''
+	nbEvent, nbSlice, nbPixel = tabWaveform.shape
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		r1Group = hfile.create_group("/", "r1")
+		for telId in listTelId:
+			telNode = hfile.create_group(r1Group, "Tel_" + str(telId))
+			for name, value in [("nbPixel", nbPixel), ("nbSlice", nbSlice), ("nbGain", 1), ("telIndex", telId - 1),
+								("telType", 0), ("telId", telId)]:
+				hfile.create_array(telNode, name, np.uint64(value))
+			hfile.create_array(telNode, "tabGain", np.full((1, nbPixel), 0.5, dtype=np.float32))
+			trigger = hfile.create_table(telNode, "trigger", {"event_id": tables.UInt64Col()})
+			trigger.append(np.array(np.arange(nbEvent), dtype=trigger.dtype))
+			pedestal = hfile.create_table(telNode, "pedestal", {"pedestal": tables.Float32Col(shape=(1, nbPixel))})
+			tabPedestal = np.zeros(1, dtype=pedestal.dtype)
+			tabPedestal["pedestal"] = 4.0
+			pedestal.append(tabPedestal)
+			table = hfile.create_table(telNode, "waveformHi", {"waveformHi": tables.UInt16Col(shape=(nbSlice, nbPixel))},
+									   chunkshape=(1,))
+			tabRow = np.zeros(nbEvent, dtype=table.dtype)
+			tabRow["waveformHi"] = tabWaveform
+			table.append(tabRow)
+			camNode = hfile.create_group("/instrument/subarray/telescope/camera", "Cam_" + str(telId), createparents=True)
+			hfile.create_array(camNode, "pix_x", tabPixelX)
+			hfile.create_array(camNode, "pix_y", tabPixelY)
+
+
+def tailcut_dilation_reference(image, listNeighbour, center, neighbours, minNeighbour, nbRing):
+	'''
+	Tailcut cleaning and dilation of one image, pixel by pixel
+	'''
+	nbPixel = image.shape[0]
+	abovePicture = image >= center
+	inPicture = np.array([abovePicture[i] and abovePicture[listNeighbour[i]].sum() >= minNeighbour for i in range(nbPixel)])
+	aboveBoundary = image >= neighbours
+	mask = np.array([(aboveBoundary[i] and inPicture[listNeighbour[i]].any())
+					 or (inPicture[i] and aboveBoundary[listNeighbour[i]].any()) for i in range(nbPixel)])
+	for ring in range(nbRing):
+		mask = mask | np.array([image[i] >= center/3 and mask[listNeighbour[i]].any() for i in range(nbPixel)])
+	return mask
+
+
+def test_neighbour_matrix():
+	tabNeighbour = get_neighbour_matrix(*get_grid_position(4, 3))
+	assert tabNeighbour.shape == (12, 4)
+	assert list(tabNeighbour[0]) == [1, 4, 12, 12]
+	assert list(tabNeighbour[5]) == [1, 4, 6, 9]
+
+
+def get_hexagonal_position(nbRing):
+	'''
+	Get the position of the pixels of a hexagonal camera of nbRing rings around the central pixel
+	'''
+	listPosition = [(q + r/2.0, r*np.sqrt(3.0)/2.0) for q in range(-nbRing, nbRing + 1)
+					for r in range(max(-nbRing, -q - nbRing), min(nbRing, -q + nbRing) + 1)]
+	tabPosition = np.array(listPosition, dtype=np.float32)
+	return tabPosition[:, 0], tabPosition[:, 1]
+
+
+def get_neighbour_reference(tabPixelX, tabPixelY, radius):
+	'''
+	Neighbours of each pixel computed with all the distances : distance less than radius times the closest distance
+	'''
+	tabPixelX = np.asarray(tabPixelX, dtype=np.float64)
+	tabPixelY = np.asarray(tabPixelY, dtype=np.float64)
+	tabDist = np.hypot(tabPixelX[:, np.newaxis] - tabPixelX, tabPixelY[:, np.newaxis] - tabPixelY)
+	np.fill_diagonal(tabDist, np.inf)
+	minDist = tabDist.min()
+	return [set(np.flatnonzero(row < radius*minDist).tolist()) for row in tabDist]
+
+
+def get_neighbour_set(tabNeighbour):
+	'''
+	Neighbours of each pixel of a neighbour matrix, without the padding
+	'''
+	return [set(row[row < tabNeighbour.shape[0]].tolist()) for row in tabNeighbour]
+
+
+@pytest.mark.parametrize("camera, nbNeighbour", [("hexagonal", 6), ("square", 4)])
+def test_neighbour_matrix_reference(camera, nbNeighbour):
+	tabPixelX, tabPixelY = get_hexagonal_position(5) if camera == "hexagonal" else get_grid_position(9, 7)
+	tabNeighbour = get_neighbour_matrix(tabPixelX, tabPixelY)
+	assert tabNeighbour.shape[1] == nbNeighbour
+	# Same neighbours as ctapipe : no pixel of the second ring of a hexagonal camera, no diagonal of a square camera
+	listNeighbour = get_neighbour_set(tabNeighbour)
+	assert listNeighbour == get_neighbour_reference(tabPixelX, tabPixelY, 1.4)
+
+
+@pytest.mark.parametrize("cameraName", ["LSTCam", "NectarCam", "CHEC"])
+def test_neighbour_matrix_ctapipe(cameraName):
+	camera = pytest.importorskip("ctapipe.instrument.camera")
+	try:
+		geom = camera.CameraGeometry.from_name(cameraName)
+	except Exception as e:
+		pytest.skip("no geometry of the camera {} : {}".format(cameraName, e))
+	tabNeighbour = get_neighbour_matrix(geom.pix_x.value, geom.pix_y.value)
+	listNeighbourRef = [set(np.flatnonzero(row).tolist()) for row in np.asarray(geom.neighbor_matrix)]
+	assert get_neighbour_set(tabNeighbour) == listNeighbourRef
+
+
+def test_tailcut_dilation_block():
+	nbX, nbY, nbEvent = 6, 5, 40
+	tabNeighbour = get_neighbour_matrix(*get_grid_position(nbX, nbY))
+	listNeighbour = [row[row < nbX*nbY] for row in tabNeighbour]
+	tabImage = np.random.default_rng(15).exponential(2.0, size=(nbEvent, nbX*nbY)).astype(np.float32)
+	tabMask = dilation_block(tabImage, tailcut_cleaning_block(tabImage, tabNeighbour, 4, 2, False, 2), tabNeighbour, 2, 4/3)
+	for image, mask in zip(tabImage, tabMask):
+		assert np.all(mask == tailcut_dilation_reference(image, listNeighbour, 4, 2, 2, 2))
+
+
+def test_tailcut_dilation_dl0v2(tmp_path):
+	nbX, nbY, nbEvent, nbSlice = 6, 5, 30, 4
+	nbPixel = nbX*nbY
+	tabPixelX, tabPixelY = get_grid_position(nbX, nbY)
+	rng = np.random.default_rng(16)
+	tabWaveform = rng.integers(0, 3, size=(nbEvent, nbSlice, nbPixel)).astype(np.uint16)
+	tabWaveform[:, :, 7:10] += 10
+	tabWaveform[:, :, 13:15] += 5
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_selection_file(inputFileName, tabWaveform, tabPixelX, tabPixelY)
+
+	outputFileName = str(tmp_path / "dl0.h5")
+	# Blocks of 7 events
+	tailcutDilationSelectionRunFileDl0(outputFileName, inputFileName, 4, 2, 1, 1, 1,
+									   blockSizeInBytes=7*nbSlice*nbPixel*2)
+
+	tabSignal = (tabWaveform.sum(axis=1) - 4.0)*0.5
+	tabNeighbour = get_neighbour_matrix(tabPixelX, tabPixelY)
+	listNeighbour = [row[row < nbPixel] for row in tabNeighbour]
+	with tables.open_file(outputFileName, "r") as hfile:
+		assert hfile.title == "DL0-V2"
+		reader = DL0TelescopeReader(hfile.root.dl0.Tel_1)
+		assert reader.nb_event == nbEvent
+		# The waveformoffset column is valid, the pixelWaveform vlarray is not scanned
+		assert reader.tabOffset is None
+		tabOffset = get_vlarray_offset(hfile.root.dl0.Tel_1.pixelWaveform)
+		assert 0 < tabOffset[-1] < nbEvent*nbPixel
+		tabWaveformOffset = hfile.root.dl0.Tel_1.signal.col("waveformoffset")
+		assert np.all(tabWaveformOffset == tabOffset[:-1])
+		for i in range(nbEvent):
+			mask = tailcut_dilation_reference(tabSignal[i], listNeighbour, 4, 2, 1, 1)
+			tabPixel, waveform, signal, _ = reader.get_event(i)
+			assert np.all(tabPixel == np.flatnonzero(mask))
+			assert np.all(waveform == tabWaveform[i].T[mask])
+			assert np.all(signal == np.rint(tabSignal[i]))
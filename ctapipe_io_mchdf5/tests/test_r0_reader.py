@@ -0,0 +1,90 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.r0_utils import create_r0_dataset, create_event_tel_waveform, create_table_pedestal, \
+	TelescopeInformation
+from ctapipe_io_mchdf5.tools.r0_reader import read_r0_event_index, read_r0_monitoring, R0WaveformBlockReader, \
+	get_r0_table_name
+from ctapipe_io_mchdf5.tools.r1_calibration import R1Calibrator, CalibratedWaveformReader
+
+
+def create_r0_file(fileName, listTabTelId, dicoNbGain, nbSlice, nbPixel):
+	'''
+	Create a small R0-V2 file, the telescopes listTabTelId[i] have data for the event i (event id 10*i + 1)
+	Return:
+		dictionnary of the waveforms (nbEvent, nbGain, nbPixel, nbSlice) of each telescope
+	'''
+	dicoWaveform = dict()
+	with tables.open_file(fileName, "w", title="R0-V2") as hfile:
+		create_r0_dataset(hfile, dict())
+		monitoringGroup = hfile.root.r0.monitoring.telescope
+		for telId, nbGain in dicoNbGain.items():
+			create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, nbGain, (nbSlice, nbPixel), telId)
+			tablePedestal = create_table_pedestal(hfile, monitoringGroup.pedestal, nbGain, nbPixel, telId)
+			tabPedestal = np.zeros(1, dtype=tablePedestal.dtype)
+			tabPedestal["pedestal"] = 10.0*nbSlice
+			tablePedestal.append(tabPedestal)
+			hfile.create_array(monitoringGroup.gain, get_r0_table_name(telId), np.full((nbGain, nbPixel), 0.5, dtype=np.float32))
+			tableInfo = hfile.create_table(monitoringGroup.information, get_r0_table_name(telId), TelescopeInformation)
+			tabInfo = np.zeros(1, dtype=tableInfo.dtype)
+			for name, value in [("tel_id", telId), ("tel_index", telId + 10), ("nb_pixel", nbPixel), ("nb_gain", nbGain),
+								("nb_slice", nbSlice)]:
+				tabInfo[name] = value
+			tableInfo.append(tabInfo)
+			nbEvent = sum(telId in tabTelId for tabTelId in listTabTelId)
+			dicoWaveform[telId] = np.random.default_rng(telId).integers(0, 100, size=(nbEvent, nbGain, nbPixel, nbSlice)).astype(np.uint16)
+		dicoRow = {telId: 0 for telId in dicoNbGain}
+		subarrayGroup = hfile.root.r0.event.subarray
+		for eventIndex, tabTelId in enumerate(listTabTelId):
+			eventId = 10*eventIndex + 1
+			tabTrigger = np.zeros(1, dtype=subarrayGroup.trigger.dtype)
+			tabTrigger["event_id"] = eventId
+			subarrayGroup.trigger.append(tabTrigger)
+			subarrayGroup.tels_with_trigger.append(tabTelId)
+			for telId in tabTelId:
+				tableWaveform = hfile.get_node(hfile.root.r0.event.telescope.waveform, get_r0_table_name(telId))
+				tabRow = np.zeros(1, dtype=tableWaveform.dtype)
+				tabRow["event_id"] = eventId
+				waveform = dicoWaveform[telId][dicoRow[telId]]
+				tabRow["waveformHi"] = waveform[0].swapaxes(0, 1)
+				if waveform.shape[0] > 1:
+					tabRow["waveformLo"] = waveform[1].swapaxes(0, 1)
+				tableWaveform.append(tabRow)
+				dicoRow[telId] += 1
+	return dicoWaveform
+
+
+def test_read_r0_file(tmp_path):
+	fileName = str(tmp_path / "r0.h5")
+	listTabTelId = [[1, 4], [4], [1], [], [4, 1], [1]]
+	dicoWaveform = create_r0_file(fileName, listTabTelId, {1: 2, 4: 1}, 5, 3)
+	with tables.open_file(fileName, "r") as hfile:
+		dicoMonitoring = read_r0_monitoring(hfile)
+		assert sorted(dicoMonitoring.keys()) == [1, 4]
+		assert dicoMonitoring[1].nbGain == 2 and dicoMonitoring[4].nbGain == 1
+		assert dicoMonitoring[4].telIndex == 14 and dicoMonitoring[1].nbSlice == 5
+		np.testing.assert_allclose(dicoMonitoring[1].pedestal, np.full((2, 3), 50.0))
+
+		eventIndex = read_r0_event_index(hfile, {telId: telMonitoring.telIndex for telId, telMonitoring in dicoMonitoring.items()},
+										 blockSize=4)
+		assert eventIndex.tabEventId.tolist() == [1, 11, 21, 31, 41, 51]
+		_, tabTelId, tabTelIndex, tabTelRow = eventIndex.get_event(4)
+		assert tabTelId.tolist() == [4, 1] and tabTelIndex.tolist() == [14, 11] and tabTelRow.tolist() == [2, 2]
+		assert len(eventIndex.get_event(3)[1]) == 0
+
+		# Small blocks to read the channels over several blocks
+		waveformReader = R0WaveformBlockReader(hfile, blockSizeInBytes=1)
+		calibratedReader = CalibratedWaveformReader(waveformReader, blockSize=2)
+		for telId, telMonitoring in dicoMonitoring.items():
+			calibratedReader.set_calibrator(telId, R1Calibrator(telMonitoring.pedestal, telMonitoring.gain, telMonitoring.nbSlice))
+		for event_id, tabTelId, tabTelIndex, tabTelRow in eventIndex:
+			for telId, row in zip(tabTelId.tolist(), tabTelRow.tolist()):
+				waveformR0, waveformR1 = calibratedReader.get_waveform(telId, row)
+				np.testing.assert_array_equal(waveformR0, dicoWaveform[telId][row])
+				np.testing.assert_allclose(waveformR1, (dicoWaveform[telId][row] - 10.0)*0.5)
@@ -0,0 +1,138 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.r0_utils import create_r0_dataset, create_event_tel_waveform, \
+	append_waveform_in_telescope, append_photo_electron_image_in_telescope
+from ctapipe_io_mchdf5.tools.r0_writer import TelescopeWriter, R0EventData, R0EventWriter
+from ctapipe_io_mchdf5.tools.r0_reader import get_r0_table_name
+from ctapipe_io_mchdf5.tools.event_index import read_event_index
+
+
+def create_r0_writer_file(hfile, dicoNbGain, nbSlice, nbPixel):
+	'''
+	Create the r0 dataset and the empty waveform and photo electron image tables of the telescopes
+	'''
+	create_r0_dataset(hfile, dict())
+	for telId, nbGain in dicoNbGain.items():
+		create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, nbGain, (nbSlice, nbPixel), telId)
+		hfile.create_table(hfile.root.r0.event.telescope.photo_electron_image, get_r0_table_name(telId),
+						   {"event_id": tables.UInt64Col(), "photo_electron_image": tables.Float32Col(shape=nbPixel)})
+
+
+def get_r0_tables(hfile, telId):
+	'''
+	Get the waveform and photo electron image tables of a telescope
+	'''
+	return hfile.get_node("/r0/event/telescope/waveform", get_r0_table_name(telId)), \
+		hfile.get_node("/r0/event/telescope/photo_electron_image", get_r0_table_name(telId))
+
+
+def get_waveform(nbEvent, nbGain, nbSlice, nbPixel, seed):
+	'''
+	Get random waveforms (nbEvent, nbGain, nbPixel, slice) and photo electron images (nbEvent, nbPixel)
+	'''
+	rng = np.random.default_rng(seed)
+	tabWaveform = rng.integers(0, 1000, size=(nbEvent, nbGain, nbPixel, nbSlice)).astype(np.uint16)
+	tabPeImage = rng.random((nbEvent, nbPixel)).astype(np.float32)
+	return tabWaveform, tabPeImage
+
+
+@pytest.mark.parametrize("nbGain", [1, 2])
+def test_telescope_writer_buffer(tmp_path, nbGain):
+	# Two full buffers and a partial one
+	nbEvent, nbSlice, nbPixel, blockSize = 11, 5, 3, 4
+	tabWaveform, tabPeImage = get_waveform(nbEvent, nbGain, nbSlice, nbPixel, nbGain)
+	tabEventId = 10*np.arange(nbEvent) + 1
+	with tables.open_file(str(tmp_path / "buffered.h5"), "w") as bufferedFile, \
+			tables.open_file(str(tmp_path / "unbuffered.h5"), "w") as unbufferedFile:
+		for hfile in [bufferedFile, unbufferedFile]:
+			create_r0_writer_file(hfile, {1: nbGain}, nbSlice, nbPixel)
+		tableWf, tablePe = get_r0_tables(bufferedFile, 1)
+		tableWfRef, tablePeRef = get_r0_tables(unbufferedFile, 1)
+		telWriter = TelescopeWriter(tableWf, tablePe, blockSize)
+		# The writer copies the waveform in its buffer, the input can be reused for the next event
+		waveform = np.empty_like(tabWaveform[0])
+		for i in range(nbEvent):
+			waveform[:] = tabWaveform[i]
+			# The events without simulation have an empty photo electron image
+			peImage = tabPeImage[i] if i % 3 != 0 else None
+			telWriter.append(waveform, peImage, tabEventId[i])
+			append_waveform_in_telescope(tableWfRef, waveform, tabEventId[i])
+			append_photo_electron_image_in_telescope(tablePeRef, peImage if peImage is not None else 0.0, tabEventId[i])
+			# Only the complete buffers are written before the flush
+			assert tableWf.nrows == ((i + 1)//blockSize)*blockSize
+		telWriter.flush()
+		tableWfRef.flush()
+		tablePeRef.flush()
+
+		assert tableWf.nrows == nbEvent and tablePe.nrows == nbEvent
+		assert telWriter.listEventId == tabEventId.tolist()
+		for table, tableRef in [(tableWf, tableWfRef), (tablePe, tablePeRef)]:
+			tabRow, tabRowRef = table.read(), tableRef.read()
+			for name in tableRef.colnames:
+				assert np.all(tabRow[name] == tabRowRef[name])
+		assert np.all(tableWf.col("event_id") == tabEventId)
+		assert np.all(tableWf.col("waveformHi") == tabWaveform[:, 0].swapaxes(1, 2))
+		if nbGain > 1:
+			assert np.all(tableWf.col("waveformLo") == tabWaveform[:, 1].swapaxes(1, 2))
+
+
+def write_r0_events(fileName, listTabTelId, dicoWaveform, blockSize):
+	'''
+	Write the events with a R0EventWriter, the telescopes listTabTelId[i] have data for the event i (event id 10*i + 1)
+	'''
+	dicoRow = {telId: 0 for telId in dicoWaveform}
+	with tables.open_file(fileName, "w") as hfile:
+		create_r0_writer_file(hfile, {telId: tabWaveform.shape[1] for telId, (tabWaveform, _) in dicoWaveform.items()},
+							  5, 3)
+		eventWriter = R0EventWriter(hfile, True, blockSize=blockSize)
+		for eventIndex, tabTelId in enumerate(listTabTelId):
+			listWaveform, listPeImage = list(), list()
+			for telId in tabTelId:
+				tabWaveform, tabPeImage = dicoWaveform[telId]
+				listWaveform.append(tabWaveform[dicoRow[telId]])
+				listPeImage.append(tabPeImage[dicoRow[telId]])
+				dicoRow[telId] += 1
+			eventWriter.append_event_data(R0EventData(10*eventIndex + 1, 7, 1.5*eventIndex, eventIndex % 2, tabTelId,
+													  listWaveform, listPeImage))
+		eventWriter.flush()
+
+
+def test_r0_event_writer_buffer(tmp_path):
+	listTabTelId = [[1, 4], [4], [1], [], [4, 1], [1], [1, 4], [4], [1]]
+	dicoWaveform = {1: get_waveform(6, 2, 5, 3, 1), 4: get_waveform(5, 1, 5, 3, 4)}
+	# Buffers of 2 events (partial final buffers) and the unbuffered path (each event written at once)
+	write_r0_events(str(tmp_path / "buffered.h5"), listTabTelId, dicoWaveform, 2)
+	write_r0_events(str(tmp_path / "unbuffered.h5"), listTabTelId, dicoWaveform, 1)
+	nbEvent = len(listTabTelId)
+	with tables.open_file(str(tmp_path / "buffered.h5")) as bufferedFile, \
+			tables.open_file(str(tmp_path / "unbuffered.h5")) as unbufferedFile:
+		tableTrigger = bufferedFile.root.r0.event.subarray.trigger
+		assert tableTrigger.nrows == nbEvent
+		assert np.all(tableTrigger.col("event_id") == 10*np.arange(nbEvent) + 1)
+		assert np.all(tableTrigger.col("time") == 1.5*np.arange(nbEvent))
+		assert np.all(tableTrigger.col("event_type") == np.arange(nbEvent) % 2)
+		assert np.all(tableTrigger.read() == unbufferedFile.root.r0.event.subarray.trigger.read())
+		listTelWithTrigger = bufferedFile.root.r0.event.subarray.tels_with_trigger.read()
+		assert [tabTelId.tolist() for tabTelId in listTelWithTrigger] == listTabTelId
+		for telId, (tabWaveform, tabPeImage) in dicoWaveform.items():
+			tableWf, tablePe = get_r0_tables(bufferedFile, telId)
+			tableWfRef, tablePeRef = get_r0_tables(unbufferedFile, telId)
+			tabEventId = [10*i + 1 for i, tabTelId in enumerate(listTabTelId) if telId in tabTelId]
+			assert tableWf.nrows == tabWaveform.shape[0] and tablePe.nrows == tabWaveform.shape[0]
+			assert tableWf.col("event_id").tolist() == tabEventId
+			assert np.all(tableWf.col("waveformHi") == tabWaveform[:, 0].swapaxes(1, 2))
+			assert np.all(tablePe.col("photo_electron_image") == tabPeImage)
+			for table, tableRef in [(tableWf, tableWfRef), (tablePe, tablePeRef)]:
+				assert np.all(table.read() == tableRef.read())
+		eventIndex = read_event_index(bufferedFile)
+		assert eventIndex.tabEventId.tolist() == [10*i + 1 for i, tabTelId in enumerate(listTabTelId) if len(tabTelId) != 0]
+		_, tabTelId, _, tabTelRow = eventIndex.get_event(3)
+		assert sorted(zip(tabTelId.tolist(), tabTelRow.tolist())) == [(1, 2), (4, 2)]
@@ -0,0 +1,93 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.tools.r1_calibration import R1Calibrator, CalibratedWaveformReader
+from ctapipe_io_mchdf5.tools.waveform_reader import WaveformBlockReader
+
+
+def test_r1_calibrator():
+	nbSlice = 4
+	pedestal = np.array([[4.0, 8.0], [12.0, 16.0]])
+	gain = np.array([[1.0, 2.0], [0.5, 0.25]])
+	waveform = np.arange(3*2*2*nbSlice, dtype=np.uint16).reshape(3, 2, 2, nbSlice)
+	tabRef = (waveform - pedestal[..., np.newaxis]/nbSlice) * gain[..., np.newaxis]
+
+	calibrator = R1Calibrator(pedestal, gain, nbSlice)
+	tabCalib = calibrator.calibrate(waveform)
+	assert tabCalib.dtype == np.float32
+	assert np.allclose(tabCalib, tabRef)
+	# The buffer is reused for smaller blocks
+	assert np.shares_memory(calibrator.calibrate(waveform[:2]), tabCalib)
+	assert np.allclose(calibrator.calibrate(waveform[0, :1]), tabRef[0, :1])
+
+	waveformFloat = waveform.astype(np.float32)
+	assert calibrator.calibrate(waveformFloat, inplace=True) is waveformFloat
+	assert np.allclose(waveformFloat, tabRef)
+	with pytest.raises(ValueError):
+		calibrator.calibrate(waveform, inplace=True)
+
+
+def create_waveform_file(fileName, tabWaveform):
+	'''
+	Create a r1 file with the telescope 1 (waveformHi = tabWaveform, waveformLo = tabWaveform + 100)
+	'''
+	nbEvent, nbSlice, nbPixel = tabWaveform.shape
+	with tables.open_file(fileName, "w") as hfile:
+		telNode = hfile.create_group(hfile.create_group("/", "r1"), "Tel_1")
+		for name, tabChannel in [("waveformHi", tabWaveform), ("waveformLo", tabWaveform + 100)]:
+			table = hfile.create_table(telNode, name, {name: tables.UInt16Col(shape=(nbSlice, nbPixel))})
+			tabRow = np.zeros(nbEvent, dtype=table.dtype)
+			tabRow[name] = tabChannel
+			table.append(tabRow)
+
+
+def test_calibrated_waveform_reader(tmp_path):
+	nbEvent, nbSlice, nbPixel = 11, 4, 3
+	tabWaveform = np.arange(nbEvent*nbSlice*nbPixel, dtype=np.uint16).reshape(nbEvent, nbSlice, nbPixel)
+	fileName = str(tmp_path / "waveform.h5")
+	create_waveform_file(fileName, tabWaveform)
+
+	pedestal = np.full((2, nbPixel), 2.0*nbSlice)
+	gain = np.full((2, nbPixel), 3.0)
+	with tables.open_file(fileName, "r") as hfile:
+		# Blocks of 3 rows in the file and of 4 events in the calibration
+		reader = WaveformBlockReader(hfile, blockSizeInBytes=3*nbSlice*nbPixel*2)
+		calibratedReader = CalibratedWaveformReader(reader, blockSize=4)
+		calibratedReader.set_calibrator(1, R1Calibrator(pedestal, gain, nbSlice))
+		for row in list(range(nbEvent)) + [2, 10]:
+			waveformR0, waveformR1 = calibratedReader.get_waveform(1, row)
+			tabRef = np.stack((tabWaveform[row].T, tabWaveform[row].T + 100))
+			assert np.all(waveformR0 == tabRef)
+			assert np.allclose(waveformR1, (tabRef - 2.0)*3.0)
+
+
+@pytest.mark.parametrize("copyWaveform", [True, False])
+def test_calibrated_waveform_reader_kept_events(tmp_path, copyWaveform):
+	nbEvent, nbSlice, nbPixel = 11, 4, 3
+	tabWaveform = np.arange(nbEvent*nbSlice*nbPixel, dtype=np.uint16).reshape(nbEvent, nbSlice, nbPixel)
+	fileName = str(tmp_path / "waveform.h5")
+	create_waveform_file(fileName, tabWaveform)
+
+	pedestal = np.full((2, nbPixel), 2.0*nbSlice)
+	gain = np.full((2, nbPixel), 3.0)
+	with tables.open_file(fileName, "r") as hfile:
+		calibratedReader = CalibratedWaveformReader(WaveformBlockReader(hfile), blockSize=4, copyWaveform=copyWaveform)
+		calibratedReader.set_calibrator(1, R1Calibrator(pedestal, gain, nbSlice))
+		# All the events are kept, as list(source) does
+		listWaveform = [calibratedReader.get_waveform(1, row) for row in range(nbEvent)]
+	listIsSame = list()
+	for row, (waveformR0, waveformR1) in enumerate(listWaveform):
+		tabRef = np.stack((tabWaveform[row].T, tabWaveform[row].T + 100))
+		listIsSame.append(np.array_equal(waveformR0, tabRef) and np.allclose(waveformR1, (tabRef - 2.0)*3.0))
+	if copyWaveform:
+		assert all(listIsSame)
+	else:
+		# The views on the buffers of the first blocks are overwritten by the next blocks
+		assert not all(listIsSame)
@@ -0,0 +1,116 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import pytest
+import tables
+
+from ctapipe_io_mchdf5.programs import mchdf5_multiple_sort, mchdf5_store_by_pixel_or_slice
+from ctapipe_io_mchdf5.programs.mchdf5_min_selection import processMinSelection
+from ctapipe_io_mchdf5.programs.mchdf5_transpose import transposeFile
+from ctapipe_io_mchdf5.tests.test_parallel_telescope import create_r1_file
+
+# Blocks of one or two events
+SMALL_BLOCK_SIZE = 50
+
+
+def read_waveform(fileName, telId=1):
+	with tables.open_file(fileName) as hfile:
+		return hfile.get_node("/r1", "Tel_" + str(telId)).waveformHi.col("waveformHi")
+
+
+def test_streaming_transpose(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], 7, 4, 3, chunkshape=1)
+	transposeFile(inputFileName, str(tmp_path / "transposed.h5"), blockSizeInBytes=SMALL_BLOCK_SIZE)
+	assert np.all(read_waveform(str(tmp_path / "transposed.h5")) == read_waveform(inputFileName).swapaxes(1, 2))
+
+
+def test_streaming_min_selection(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], 7, 4, 3, chunkshape=1)
+	processMinSelection(inputFileName, str(tmp_path / "min.h5"), 3, blockSizeInBytes=SMALL_BLOCK_SIZE)
+	waveform = read_waveform(inputFileName)
+	with tables.open_file(str(tmp_path / "min.h5")) as hfile:
+		telNode = hfile.root.r1.Tel_1
+		tabMin = telNode.minHi.col("minHi")
+		waveformMin = telNode.waveformHi.col("waveformHi")
+	assert tabMin.shape[0] == 3
+	assert waveformMin.shape[0] == 7
+	for i, first in enumerate(range(0, 7, 3)):
+		tabRefMin = waveform[first:first + 3].min(axis=(0, 1))
+		assert np.all(tabMin[i] == tabRefMin)
+		assert np.all(waveformMin[first:first + 3] == waveform[first:first + 3] - tabRefMin)
+
+
+def test_streaming_multiple_sort(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], 7, 4, 3, chunkshape=1)
+	tabEventId = 100 + 3*np.arange(7)
+	with tables.open_file(inputFileName, "a") as hfile:
+		hfile.root.r1.Tel_1.trigger.modify_column(column=tabEventId, colname="event_id")
+	for mode in [mchdf5_multiple_sort.MODE_MEAN, mchdf5_multiple_sort.MODE_SIGMA, mchdf5_multiple_sort.MODE_RANGE]:
+		# Groups bigger than the blocks (two passes) and groups which fit in the blocks (one pass)
+		mchdf5_multiple_sort.sortPixelFile(inputFileName, str(tmp_path / "small.h5"), True, mode, 4,
+										  blockSizeInBytes=SMALL_BLOCK_SIZE)
+		mchdf5_multiple_sort.sortPixelFile(inputFileName, str(tmp_path / "large.h5"), True, mode, 4)
+		assert np.all(read_waveform(str(tmp_path / "small.h5")) == read_waveform(str(tmp_path / "large.h5")))
+		with tables.open_file(str(tmp_path / "small.h5")) as smallFile, \
+				tables.open_file(str(tmp_path / "large.h5")) as largeFile:
+			tabInjSmall = smallFile.root.r1.Tel_1.injunctionHi.col("tabinj")
+			assert tabInjSmall.shape[0] == 2
+			assert np.all(tabInjSmall == largeFile.root.r1.Tel_1.injunctionHi.col("tabinj"))
+			for injTab in [smallFile.root.r1.Tel_1.injunctionHi, largeFile.root.r1.Tel_1.injunctionHi]:
+				assert np.all(injTab.col("first_event_id") == [100, 112])
+				assert np.all(injTab.col("last_event_id") == [109, 118])
+	waveform = read_waveform(inputFileName)
+	waveformSorted = read_waveform(str(tmp_path / "small.h5"))
+	assert waveformSorted.shape[0] == 7
+	assert np.all(np.sort(waveformSorted, axis=2) == np.sort(waveform, axis=2))
+
+
+@pytest.mark.filterwarnings("ignore:transposeChannelByOutputRow")
+def test_streaming_store_by_pixel_or_slice(tmp_path):
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], 7, 4, 3, chunkshape=1)
+	waveform = read_waveform(inputFileName)
+	for orderMode in range(6):
+		outputFileName = str(tmp_path / (mchdf5_store_by_pixel_or_slice.getTitleForOrderMode(orderMode) + ".h5"))
+		mchdf5_store_by_pixel_or_slice.sortPixelFile(inputFileName, outputFileName, orderMode,
+													 blockSizeInBytes=SMALL_BLOCK_SIZE)
+		tabRef = mchdf5_store_by_pixel_or_slice.getWaveformSwappedFromOrder(waveform, orderMode)
+		assert np.all(read_waveform(outputFileName) == tabRef)
+
+
+@pytest.mark.parametrize("orderName", ["PES", "PSE", "SEP", "SPE"])
+def test_store_by_pixel_or_slice_read_once(tmp_path, monkeypatch, orderName):
+	nbEvent, nbSlice, nbPixel = 13, 4, 5
+	inputFileName = str(tmp_path / "r1.h5")
+	create_r1_file(inputFileName, [1], nbEvent, nbSlice, nbPixel, chunkshape=2)
+	waveform = read_waveform(inputFileName)
+	listNbRowRead = list()
+	iterTableBlocks = mchdf5_store_by_pixel_or_slice.iter_table_blocks
+
+	def iterTableBlocksCount(table, *args, **kwargs):
+		for start, block in iterTableBlocks(table, *args, **kwargs):
+			listNbRowRead.append(block.shape[0])
+			yield start, block
+
+	monkeypatch.setattr(mchdf5_store_by_pixel_or_slice, "iter_table_blocks", iterTableBlocksCount)
+	orderMode = mchdf5_store_by_pixel_or_slice.convertStringToOrderMode(orderName)
+	outputFileName = str(tmp_path / "ordered.h5")
+	# Blocks of 2 events, smaller than an output row
+	blockSizeInBytes = 2*nbSlice*nbPixel*2
+	with pytest.warns(UserWarning, match="more than the block size"):
+		mchdf5_store_by_pixel_or_slice.sortPixelFile(inputFileName, outputFileName, orderMode,
+													 blockSizeInBytes=blockSizeInBytes)
+	# The channel is read once, whatever the number of output rows
+	assert sum(listNbRowRead) == nbEvent
+	assert max(listNbRowRead) == 2
+	tabRef = mchdf5_store_by_pixel_or_slice.getWaveformSwappedFromOrder(waveform, orderMode)
+	assert np.all(read_waveform(outputFileName) == tabRef)
+	# The scratch file is removed
+	assert sorted(p.name for p in tmp_path.iterdir()) == ["ordered.h5", "r1.h5"]
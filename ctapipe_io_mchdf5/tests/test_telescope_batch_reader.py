@@ -0,0 +1,67 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5 import MCHDF5TelescopeBatchReader
+
+
+def create_r1_file(fileName, tabWaveformHi, tabWaveformLo, tabEventId, telId=1):
+	'''
+	Create a small R1-V2 file with one telescope
+	'''
+	nbSlice, nbPixel = tabWaveformHi.shape[1:]
+	with tables.open_file(fileName, "w", title="R1-V2") as hfile:
+		r1Group = hfile.create_group("/", "r1")
+		telNode = hfile.create_group(r1Group, "Tel_" + str(telId))
+		hfile.create_array(telNode, "telId", np.uint64(telId))
+		trigger = hfile.create_table(telNode, "trigger", {"event_id": tables.UInt64Col()})
+		trigger.append(np.array(tabEventId, dtype=trigger.dtype))
+		for name, tabWaveform in [("waveformHi", tabWaveformHi), ("waveformLo", tabWaveformLo)]:
+			table = hfile.create_table(telNode, name, {name: tables.UInt16Col(shape=(nbSlice, nbPixel))})
+			tabRow = np.zeros(len(tabWaveform), dtype=table.dtype)
+			tabRow[name] = tabWaveform
+			table.append(tabRow)
+		tabPedestal = np.full((2, nbPixel), 10.0*nbSlice, dtype=np.float32)
+		pedestal = hfile.create_table(telNode, "pedestal", {"pedestal": tables.Float32Col(shape=(2, nbPixel))})
+		pedestal.append(np.array([(tabPedestal,)], dtype=pedestal.dtype))
+		hfile.create_array(telNode, "tabGain", np.full((2, nbPixel), 0.5, dtype=np.float32))
+
+
+def test_telescope_batch_reader(tmp_path):
+	nbEvent, nbSlice, nbPixel = 10, 5, 3
+	tabWaveformHi = np.arange(nbEvent*nbSlice*nbPixel, dtype=np.uint16).reshape(nbEvent, nbSlice, nbPixel)
+	tabWaveformLo = tabWaveformHi + 1000
+	tabEventId = np.arange(nbEvent) * 10 + 3
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName, tabWaveformHi, tabWaveformLo, tabEventId)
+
+	with MCHDF5TelescopeBatchReader(fileName, batch_size=4) as reader:
+		assert reader.tel_ids == [1]
+		listBatch = list(reader)
+	assert [len(event_ids) for _, event_ids, _ in listBatch] == [4, 4, 2]
+	event_ids = np.concatenate([batch[1] for batch in listBatch])
+	waveform = np.concatenate([batch[2] for batch in listBatch])
+	assert np.all(event_ids == tabEventId)
+	assert waveform.shape == (nbEvent, 2, nbPixel, nbSlice)
+	assert np.all(waveform[:, 0] == tabWaveformHi.swapaxes(1, 2))
+	assert np.all(waveform[:, 1] == tabWaveformLo.swapaxes(1, 2))
+
+
+def test_telescope_batch_reader_calibrated(tmp_path):
+	nbEvent, nbSlice, nbPixel = 10, 5, 3
+	tabWaveformHi = np.arange(nbEvent*nbSlice*nbPixel, dtype=np.uint16).reshape(nbEvent, nbSlice, nbPixel) + 10
+	tabWaveformLo = tabWaveformHi + 1000
+	fileName = str(tmp_path / "r1.h5")
+	create_r1_file(fileName, tabWaveformHi, tabWaveformLo, np.arange(nbEvent))
+
+	with MCHDF5TelescopeBatchReader(fileName, batch_size=4) as reader:
+		_, waveformRef = reader.read_batch(1, 0, nbEvent)
+		listWaveform = [waveform.copy() for _, _, waveform in reader.iter_telescope(1, calibrate=True)]
+	waveform = np.concatenate(listWaveform)
+	assert waveform.dtype == np.float32
+	assert np.allclose(waveform, (waveformRef - 10.0)*0.5)
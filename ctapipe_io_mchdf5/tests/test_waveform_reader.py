@@ -0,0 +1,32 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+import numpy as np
+import tables
+
+from ctapipe_io_mchdf5.tools.waveform_reader import WaveformBlockReader
+
+
+def test_waveform_block_reader(tmp_path):
+	nbEvent, nbSlice, nbPixel = 50, 4, 3
+	tabWaveform = np.arange(nbEvent*nbSlice*nbPixel, dtype=np.uint16).reshape(nbEvent, nbSlice, nbPixel)
+	fileName = str(tmp_path / "waveform.h5")
+	with tables.open_file(fileName, "w") as hfile:
+		telNode = hfile.create_group(hfile.create_group("/", "r1"), "Tel_1")
+		description = {"waveformHi": tables.UInt16Col(shape=(nbSlice, nbPixel))}
+		table = hfile.create_table(telNode, "waveformHi", description, chunkshape=(4,))
+		tabRow = np.zeros(nbEvent, dtype=table.dtype)
+		tabRow["waveformHi"] = tabWaveform
+		table.append(tabRow)
+
+	with tables.open_file(fileName, "r") as hfile:
+		# Blocks of 8 rows and a memory budget of 2 blocks
+		blockSize = 8*nbSlice*nbPixel*2
+		reader = WaveformBlockReader(hfile, blockSizeInBytes=blockSize, memoryBudget=2*blockSize)
+		for row in list(range(nbEvent)) + [3, 49, 0]:
+			assert np.all(reader.get_waveform(1, row) == tabWaveform[row])
+		assert len(reader.cacheBlock) <= 2
+		assert reader.cacheSize <= 2*blockSize
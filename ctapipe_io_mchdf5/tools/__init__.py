@@ -5,8 +5,22 @@
 '''
 
 from .telescope_copy import copy_all_tel_without_waveform
+from .chunk_utils import *
+from .event_index import *
+from .waveform_reader import *
+from .r1_calibration import *
+from .injunction_table import *
+from .dl0_reader import *
+from .pixel_selection import *
+from .compression_policy import *
+from .r0_reader import *
+from .event_pipeline import *
+from .file_merge import *
+from .memmap_reader import *
+from .lazy_waveform import *
 try:
 	from .r0_utils import *
+	from .r0_writer import *
 	from .r0_file import *
 	from .dl0_utils import *
 	from .simulation_utils import *
@@ -14,7 +28,7 @@ except:
 	pass
 
 # TODO telescope_copy functions need to be upgrated to r0 model
-def copyTelIntrSimuNode(fileOut, fileIn, r1NodeName="r1", docR1Node="Raw data waveform informations of the run", chunkshape=1):
+def copyTelIntrSimuNode(fileOut, fileIn, r1NodeName="r1", docR1Node="Raw data waveform informations of the run", chunkshape=None):
 	'''
 	Create all the telescopes without the waveform
 	Parameters:
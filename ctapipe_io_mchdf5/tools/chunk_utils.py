@@ -0,0 +1,108 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+import tables
+
+# Expected size in bytes of a chunk of the tables (big enough to amortise the B-tree and compression calls,
+# small enough to keep the access to a single event cheap)
+CHUNK_TARGET_SIZE = 1024*1024
+# Default maximum size in bytes of the blocks of rows read at once by the streaming programs
+STREAM_BLOCK_SIZE = 64*1024*1024
+# Maximum size in bytes of the single chunk of a contiguous table (the HDF5 chunks are limited to 4 GB)
+CONTIGUOUS_CHUNK_SIZE = 2*1024*1024*1024
+
+
+def get_chunkshape(rowSize, chunkshape=None, expectedrows=None, targetChunkSize=CHUNK_TARGET_SIZE):
+	"""
+	Get the chunkshape of a table by respect to the size of its rows
+	Parameters:
+		rowSize : size of a row of the table in bytes
+		chunkshape : chunkshape asked by the user (None or 0 for an automatic chunkshape)
+		expectedrows : expected number of rows in the table (None or 0 if unknown)
+		targetChunkSize : expected size of a chunk in bytes
+	Return:
+		chunkshape of the table (as a tuple)
+	"""
+	if chunkshape is not None:
+		if isinstance(chunkshape, tuple):
+			return chunkshape
+		if chunkshape > 0:
+			return (int(chunkshape),)
+	nbRowPerChunk = max(1, int(targetChunkSize // max(1, rowSize)))
+	if expectedrows is not None and expectedrows > 0:
+		nbRowPerChunk = min(nbRowPerChunk, int(expectedrows))
+	return (nbRowPerChunk,)
+
+
+def get_table_chunkshape(description, chunkshape=None, expectedrows=None, targetChunkSize=CHUNK_TARGET_SIZE):
+	"""
+	Get the chunkshape of a table from its description
+	Parameters:
+		description : description of the table (tables.IsDescription or dictionnary of columns)
+		chunkshape : chunkshape asked by the user (None or 0 for an automatic chunkshape)
+		expectedrows : expected number of rows in the table (None or 0 if unknown)
+		targetChunkSize : expected size of a chunk in bytes
+	Return:
+		chunkshape of the table (as a tuple)
+	"""
+	rowSize = tables.dtype_from_descr(description).itemsize
+	return get_chunkshape(rowSize, chunkshape=chunkshape, expectedrows=expectedrows, targetChunkSize=targetChunkSize)
+
+
+def get_table_block_size(table, blockSizeInBytes):
+	"""
+	Get the number of rows of a block of the table to be read or written at once
+	The number of rows is a multiple of the chunkshape of the table, so a block covers complete chunks (except for the
+	uncompressed tables whose chunks are bigger than a block)
+	Parameters:
+		table : table to be used
+		blockSizeInBytes : expected size of a block in bytes
+	Return:
+		number of rows of a block
+	"""
+	nbRowPerChunk = max(1, int(table.chunkshape[0]))
+	if nbRowPerChunk*table.rowsize > blockSizeInBytes and table.filters.complevel == 0:
+		# The uncompressed chunks are read and written partially without cost (contiguous tables)
+		return max(1, int(blockSizeInBytes // table.rowsize))
+	nbChunk = max(1, blockSizeInBytes // (nbRowPerChunk*table.rowsize))
+	return int(nbChunk*nbRowPerChunk)
+
+
+def iter_table_blocks(table, field=None, blockSizeInBytes=STREAM_BLOCK_SIZE, nbRowPerBlock=None, firstRow=0, lastRow=None):
+	"""
+	Iterate over a table by blocks of consecutive rows, so the whole table is never loaded in memory
+	Parameters:
+		table : table to be read
+		field : name of the column to be read (None for all the columns)
+		blockSizeInBytes : maximum size in bytes of a block (used if nbRowPerBlock is None)
+		nbRowPerBlock : number of rows of a block (None to get it from blockSizeInBytes)
+		firstRow : first row to be read
+		lastRow : last row to be read (excluded, None for the end of the table)
+	Return:
+		generator of (first row of the block, block)
+	"""
+	if nbRowPerBlock is None:
+		nbRowPerBlock = get_table_block_size(table, blockSizeInBytes)
+	nbRowPerBlock = max(1, int(nbRowPerBlock))
+	nbRow = table.nrows if lastRow is None else min(lastRow, table.nrows)
+	for start in range(firstRow, nbRow, nbRowPerBlock):
+		yield start, table.read(start, min(start + nbRowPerBlock, nbRow), field=field)
+
+
+def append_table_block(table, field, block):
+	"""
+	Append a block of values of a column at the end of a table of one column
+	Parameters:
+		table : table to be completed
+		field : name of the column
+		block : values to be appended (one entry per row)
+	"""
+	if len(block) == 0:
+		return
+	tabRow = np.empty(len(block), dtype=table.dtype)
+	tabRow[field] = block
+	table.append(tabRow)
@@ -0,0 +1,224 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import fnmatch
+import tables
+import numpy as np
+
+# Name of the array which contains the compression policy at the root of the file
+COMPRESSION_POLICY_NODE = "compression_policy"
+
+# Category of the nodes which do not match any other category
+COMPRESSION_DEFAULT = "default"
+
+# Categories of datasets and patterns of the path of their nodes (the first matching category is used)
+COMPRESSION_CATEGORY_PATTERN = [
+	("waveform", ["*/waveform*", "*/pixelWaveform", "*/pixelLo"]),
+	("simulation", ["/simulation*", "/configuration/simulation*", "*/photo_electron_image*"]),
+	("monitoring", ["/r0/monitoring*", "*/pedestal", "*/tabGain"]),
+	("instrument", ["/instrument*", "/configuration*"]),
+]
+
+# All the categories of a compression policy
+COMPRESSION_CATEGORIES = [category for category, _ in COMPRESSION_CATEGORY_PATTERN] + [COMPRESSION_DEFAULT]
+
+# Help of the compression policy option of the programs
+COMPRESSION_POLICY_HELP = "compression of each category of datasets ({}), " \
+						  "ex : 'waveform=blosc:zstd:5:bitshuffle,monitoring=none,simulation=blosc:lz4:1'. " \
+						  "The categories which are not given keep the compression of the file".format(", ".join(COMPRESSION_CATEGORIES))
+
+
+def parse_filters(strFilters):
+	"""
+	Parse the filters of a category
+	Parameters:
+		strFilters : 'none' or 'complib[:level][:shuffle|:bitshuffle|:noshuffle]' (ex : 'blosc:zstd:5:bitshuffle')
+	Return:
+		corresponding tables.Filters (without shuffle if it is not given, level 1 by default)
+	"""
+	listToken = strFilters.strip().lower().split(":")
+	if listToken == ["none"]:
+		return tables.Filters(complevel=0)
+	complib = listToken.pop(0)
+	if complib in ["blosc", "blosc2"] and len(listToken) > 0 and not listToken[0].isdigit() and \
+			listToken[0] not in ["shuffle", "bitshuffle", "noshuffle"]:
+		complib += ":" + listToken.pop(0)
+	if complib not in tables.filters.all_complibs:
+		raise ValueError("parse_filters : unknown compression library '{}' in '{}'".format(complib, strFilters))
+	complevel, shuffle, bitshuffle = 1, False, False
+	for token in listToken:
+		if token.isdigit():
+			complevel = int(token)
+		elif token in ["shuffle", "bitshuffle", "noshuffle"]:
+			shuffle, bitshuffle = token == "shuffle", token == "bitshuffle"
+		else:
+			raise ValueError("parse_filters : unknown option '{}' in '{}'".format(token, strFilters))
+	if not 0 <= complevel <= 9:
+		raise ValueError("parse_filters : compression level {} not in [0, 9] in '{}'".format(complevel, strFilters))
+	return tables.Filters(complevel=complevel, complib=complib, shuffle=shuffle, bitshuffle=bitshuffle, fletcher32=False)
+
+
+def format_filters(filters):
+	"""
+	Format filters as they are parsed by parse_filters
+	Parameters:
+		filters : tables.Filters to be formated
+	Return:
+		string of the filters
+	"""
+	if filters.complevel == 0:
+		return "none"
+	strFilters = "{}:{}".format(filters.complib, filters.complevel)
+	if filters.bitshuffle:
+		strFilters += ":bitshuffle"
+	elif filters.shuffle:
+		strFilters += ":shuffle"
+	return strFilters
+
+
+def get_node_category(nodePath):
+	"""
+	Get the category of a node
+	Parameters:
+		nodePath : path of the node in the file (ex : '/r1/Tel_1/waveformHi')
+	Return:
+		category of the node (COMPRESSION_DEFAULT if it does not match any pattern)
+	"""
+	for category, listPattern in COMPRESSION_CATEGORY_PATTERN:
+		for pattern in listPattern:
+			if fnmatch.fnmatchcase(nodePath, pattern):
+				return category
+	return COMPRESSION_DEFAULT
+
+
+class CompressionPolicy(object):
+	"""
+	Filters to be used for each category of datasets of a file
+	Attributes:
+	-----------
+		dicoFilters : dictionnary of the tables.Filters of the categories which are set
+	"""
+
+	def __init__(self, dicoFilters=None):
+		"""
+		Constructor of the CompressionPolicy
+		Parameters:
+			dicoFilters : dictionnary of the tables.Filters of the categories (the others are inherited)
+		"""
+		self.dicoFilters = dict()
+		if dicoFilters is not None:
+			for category, filters in dicoFilters.items():
+				self.set_filters(category, filters)
+
+	def set_filters(self, category, filters):
+		"""
+		Set the filters of a category
+		Parameters:
+			category : category of datasets (in COMPRESSION_CATEGORIES)
+			filters : tables.Filters of the category
+		"""
+		if category not in COMPRESSION_CATEGORIES:
+			raise ValueError("CompressionPolicy : unknown category '{}', expected one of {}".format(category,
+																									 COMPRESSION_CATEGORIES))
+		self.dicoFilters[category] = filters
+
+	def get_filters(self, nodePath):
+		"""
+		Get the filters of a node
+		Parameters:
+			nodePath : path of the node in the file
+		Return:
+			tables.Filters of the node, None if the policy does not set them (inherited from the parent group)
+		"""
+		return self.dicoFilters.get(get_node_category(nodePath), self.dicoFilters.get(COMPRESSION_DEFAULT))
+
+	def __str__(self):
+		return ",".join("{}={}".format(category, format_filters(self.dicoFilters[category]))
+						for category in COMPRESSION_CATEGORIES if category in self.dicoFilters)
+
+
+def parse_compression_policy(strPolicy):
+	"""
+	Parse a compression policy
+	Parameters:
+		strPolicy : list of category=filters separated by comma
+					(ex : 'waveform=blosc:zstd:5:bitshuffle,monitoring=none,simulation=blosc:lz4:1')
+	Return:
+		CompressionPolicy
+	"""
+	policy = CompressionPolicy()
+	for strCategory in strPolicy.split(","):
+		if strCategory.strip() == "":
+			continue
+		if "=" not in strCategory:
+			raise ValueError("parse_compression_policy : expect category=filters, not '{}'".format(strCategory))
+		category, strFilters = strCategory.split("=", 1)
+		policy.set_filters(category.strip().lower(), parse_filters(strFilters))
+	return policy
+
+
+def write_compression_policy(hfile, policy):
+	"""
+	Write the compression policy in the file (an existing policy is replaced)
+	The nodes created after with get_node_filters use the filters of the policy
+	Parameters:
+		hfile : HDF5 file to be used
+		policy : CompressionPolicy to be written
+	"""
+	if COMPRESSION_POLICY_NODE in hfile.root:
+		hfile.remove_node(hfile.root, COMPRESSION_POLICY_NODE)
+	hfile.create_array(hfile.root, COMPRESSION_POLICY_NODE, np.bytes_(str(policy)),
+					   'Compression policy of the datasets of the file')
+
+
+def read_compression_policy(hfile):
+	"""
+	Read the compression policy of the file
+	Parameters:
+		hfile : HDF5 file to be used
+	Return:
+		CompressionPolicy or None if the file has no compression policy
+	"""
+	try:
+		strPolicy = np.asarray(hfile.get_node(hfile.root, COMPRESSION_POLICY_NODE).read()).item()
+	except tables.exceptions.NoSuchNodeError as e:
+		return None
+	return parse_compression_policy(strPolicy.decode())
+
+
+def get_node_filters(hfile, where, name):
+	"""
+	Get the filters of a node to be created in the file with respect to its compression policy
+	Parameters:
+		hfile : HDF5 file to be used
+		where : parent group (node or path) of the node
+		name : name of the node
+	Return:
+		tables.Filters of the node, None if the file has no policy for it (inherited from the parent group, or from the
+		source node for a copy)
+	"""
+	policy = read_compression_policy(hfile)
+	if policy is None:
+		return None
+	parentPath = where._v_pathname if isinstance(where, tables.Node) else where
+	return policy.get_filters(parentPath.rstrip("/") + "/" + name)
+
+
+def copy_node_policy(hfile, node, newparent, **kwargs):
+	"""
+	Copy a node (recursively for a group) with the filters of the compression policy of the file
+	Parameters:
+		hfile : HDF5 file to be used
+		node : node to be copied
+		newparent : destination group (node or path)
+		kwargs : other parameters of copy_node
+	Return:
+		copied node
+	"""
+	filters = get_node_filters(hfile, newparent, node._v_name)
+	if filters is not None:
+		kwargs["filters"] = filters
+	return hfile.copy_node(node, newparent=newparent, recursive=True, **kwargs)
@@ -8,10 +8,12 @@ import tables
 import numpy as np
 
 from .telescope_copy import copy_telescope_without_waveform
+from .chunk_utils import get_table_chunkshape
+from .compression_policy import get_node_filters
 
 
 def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice, nbPixel, isStoreSlicePixel,
-								 chunkshape=1):
+								 chunkshape=None, expectedrows=None):
 	"""
 	Create the table to store the signal
 	Parameters:
@@ -21,7 +23,8 @@ def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		expectedrows : expected number of events in the table (None if unknown)
 	"""
 	image_shape = (nbPixel, nbSlice)
 	if isStoreSlicePixel:
@@ -29,50 +32,54 @@ def create_sorted_waveform_table(hfile, cam_tel_group, nameWaveformHi, nbSlice,
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,),
 								  columns_dict_waveformHi)
+	chunkshape = get_table_chunkshape(description_waveformHi, chunkshape=chunkshape, expectedrows=expectedrows)
 	hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
-					   chunkshape=chunkshape)
+					   chunkshape=chunkshape,
+					   filters=get_node_filters(hfile, cam_tel_group, nameWaveformHi))
 
 
-def create_telescope_sorted(outFile, telNode, isStoreSlicePixel, chunkshape=1):
+def create_telescope_sorted(outFile, telNode, isStoreSlicePixel, chunkshape=None):
 	"""
 	Create the telescope group and table
 	Parameters:
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
 	"""
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
+	nbEvent = telNode.waveformHi.nrows
 
 	create_sorted_waveform_table(outFile, cam_tel_group, "waveformHi", nbSlice, nbPixel, isStoreSlicePixel,
-								 chunkshape=chunkshape)
+								 chunkshape=chunkshape, expectedrows=nbEvent)
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
 		create_sorted_waveform_table(outFile, cam_tel_group, "waveformLo", nbSlice, nbPixel, isStoreSlicePixel,
-									 chunkshape=chunkshape)
+									 chunkshape=chunkshape, expectedrows=nbEvent)
 
 
-def create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel, chunkshape=1):
+def create_all_telescope_sorted(outFile, inFile, isStoreSlicePixel, chunkshape=None):
 	"""
 	Create all the telescope ready for pixels sorting
 	Parameters:
 		outFile : output file
 		inFile : input file
 		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
 	"""
-	outFile.create_group("/", 'r0', 'Raw data waveform information of the run')
-	for telNode in inFile.walk_nodes("/r0", "Group"):
+	outFile.create_group("/", 'r1', 'Raw data waveform information of the run')
+	for telNode in inFile.walk_nodes("/r1", "Group"):
 		try:
 			create_telescope_sorted(outFile, telNode, isStoreSlicePixel, chunkshape=chunkshape)
 		except tables.exceptions.NoSuchNodeError as e:
 			pass
 
 
-def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dataEntryShape, chunkshape=1):
+def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dataEntryShape, chunkshape=None,
+									   expectedrows=None):
 	"""
 	Create the table to store the signal
 	Parameters:
@@ -80,19 +87,15 @@ def create_sorted_waveform_table_shape(hfile, cam_tel_group, nameWaveformHi, dat
 		cam_tel_group : telescope group in which to put the tables
 		nameWaveformHi : name of the table to store the waveform
 		dataEntryShape : shape of the entries to be stored
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform (None for an automatic chunkshape)
+		expectedrows : expected number of entries in the table (None if unknown)
 	Return:
 		create table
 	"""
 	columns_dict_waveformHi  = {nameWaveformHi: tables.UInt16Col(shape=dataEntryShape)}
 	description_waveformHi = type('description columns_dict_waveformHi', (tables.IsDescription,),
 								  columns_dict_waveformHi)
+	chunkshape = get_table_chunkshape(description_waveformHi, chunkshape=chunkshape, expectedrows=expectedrows)
 	return hfile.create_table(cam_tel_group, nameWaveformHi, description_waveformHi, "Table of waveform of the signal",
-							  chunkshape=chunkshape)
-
-
-
-
-
-
-
+							  chunkshape=chunkshape,
+							  filters=get_node_filters(hfile, cam_tel_group, nameWaveformHi))
@@ -0,0 +1,260 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+
+# Number of events of a telescope read at once by the DL0TelescopeReader
+DL0_READER_BLOCK_SIZE = 256
+
+
+def read_vlarray_block(vlarray, start, stop):
+	"""
+	Read consecutive rows of a vlarray in one call and concatenate them
+	Parameters:
+		vlarray : vlarray to be read
+		start : first row to be read
+		stop : last row (excluded)
+	Return:
+		concatenated values of the rows, offset of the first value of each row (with one more element for the end of the last row)
+	"""
+	listRow = vlarray.read(start, stop)
+	tabOffset = np.zeros(len(listRow) + 1, dtype=np.int64)
+	np.cumsum([row.shape[0] for row in listRow], out=tabOffset[1:])
+	if len(listRow) == 0:
+		return np.zeros(0, dtype=vlarray.atom.dtype), tabOffset
+	return np.concatenate(listRow), tabOffset
+
+
+def get_vlarray_offset(vlarray, blockSize=DL0_READER_BLOCK_SIZE*16):
+	"""
+	Get the offset of the first value of each row of a vlarray in the concatenation of all its rows
+	Parameters:
+		vlarray : vlarray to be used
+		blockSize : number of rows read at once
+	Return:
+		offset of each row (with one more element for the end of the last row)
+	"""
+	nbRow = vlarray.nrows
+	tabOffset = np.zeros(nbRow + 1, dtype=np.int64)
+	for start in range(0, nbRow, blockSize):
+		stop = min(start + blockSize, nbRow)
+		_, tabBlockOffset = read_vlarray_block(vlarray, start, stop)
+		tabOffset[start + 1:stop + 1] = tabOffset[start] + tabBlockOffset[1:]
+	return tabOffset
+
+
+def is_valid_waveform_offset(telNode):
+	"""
+	Say if the waveformoffset column of the signal table of a DL0-V2 telescope gives the rows of the events in the
+	waveform table (absolute rows, written by pixel_selection.append_dl0_block and shifted by file_merge)
+	Only the first and last events are checked, the other events are checked block by block by the DL0TelescopeReader
+	Parameters:
+		telNode : telescope node (/dl0/Tel_N)
+	Return:
+		True if the column can be used, False if the offsets have to be computed from the pixelWaveform vlarray
+	"""
+	tableSignal = telNode.signal
+	nbEvent = telNode.pixelWaveform.nrows
+	if "waveformoffset" not in tableSignal.colnames or tableSignal.nrows != nbEvent:
+		return False
+	if nbEvent == 0:
+		return True
+	tabWaveformOffset = tableSignal.read(field="waveformoffset", start=0, stop=1)
+	lastWaveformOffset = tableSignal.read(field="waveformoffset", start=nbEvent - 1, stop=nbEvent)
+	nbLastPixel = telNode.pixelWaveform[nbEvent - 1].shape[0]
+	return int(tabWaveformOffset[0]) == 0 and int(lastWaveformOffset[0]) + nbLastPixel == telNode.waveform.nrows
+
+
+def scatter_dense_waveform(tabPixel, tabOffset, tabWaveform, nbPixel, out=None, fill_value=0):
+	"""
+	Scatter the waveforms of the selected pixels of a block of events in a dense block
+	Parameters:
+		tabPixel : concatenated index of the selected pixels of the events
+		tabOffset : offset of the first selected pixel of each event (nbEvent + 1)
+		tabWaveform : concatenated waveforms of the selected pixels (nbSelectedPixel, nbSlice)
+		nbPixel : number of pixels of the camera
+		out : preallocated dense block (nbEvent, nbPixel, nbSlice), None to allocate it
+		fill_value : value of the pixels which are not selected
+	Return:
+		dense block of waveforms (nbEvent, nbPixel, nbSlice), mask of the selected pixels (nbEvent, nbPixel)
+	"""
+	nbEvent = tabOffset.shape[0] - 1
+	if out is None:
+		out = np.empty((nbEvent, nbPixel) + tabWaveform.shape[1:], dtype=tabWaveform.dtype)
+	out.fill(fill_value)
+	tabEvent = np.repeat(np.arange(nbEvent), np.diff(tabOffset))
+	out[tabEvent, tabPixel] = tabWaveform
+	tabSelected = np.zeros((nbEvent, nbPixel), dtype=bool)
+	tabSelected[tabEvent, tabPixel] = True
+	return out, tabSelected
+
+
+class DL0Block(object):
+	"""
+	Block of consecutive events of a telescope of a DL0-V2 file
+	Attributes:
+	-----------
+		firstRow : first row of the block in the telescope tables
+		nbRow : number of events of the block
+		tabPixel : concatenated index of the pixels recorded with their waveform
+		tabOffset : offset of the first recorded pixel of each event in tabPixel and tabWaveform (nbRow + 1)
+		tabWaveform : waveforms of the recorded pixels (nbSelectedPixel, nbSlice)
+		tabSignal : calibrated and integrated signal of all the pixels (nbRow, nbPixel)
+		tabPixelLo : concatenated index of the pixels in low gain mode (None for the cameras with one gain)
+		tabOffsetLo : offset of the first pixel in low gain mode of each event (None for the cameras with one gain)
+		tabDense : dense waveforms of the events (nbRow, nbPixel, nbSlice), computed on demand
+		tabSelected : mask of the recorded pixels (nbRow, nbPixel), computed on demand
+	"""
+
+	def __init__(self, firstRow, tabPixel, tabOffset, tabWaveform, tabSignal, tabPixelLo=None, tabOffsetLo=None):
+		self.firstRow = firstRow
+		self.nbRow = tabOffset.shape[0] - 1
+		self.tabPixel = tabPixel
+		self.tabOffset = tabOffset
+		self.tabWaveform = tabWaveform
+		self.tabSignal = tabSignal
+		self.tabPixelLo = tabPixelLo
+		self.tabOffsetLo = tabOffsetLo
+		self.tabDense = None
+		self.tabSelected = None
+
+
+class DL0TelescopeReader(object):
+	"""
+	Reader of the pixel selected waveforms of a telescope of a DL0-V2 file (/dl0/Tel_N)
+	A telescope stores per event the index of the recorded pixels (pixelWaveform vlarray), the index of the pixels in low
+	gain mode (pixelLo vlarray), one row per recorded pixel in the waveform table and the integrated signal of all the
+	pixels (signal table). The rows of the waveforms of each event are given by the waveformoffset column of the signal
+	table, read block by block, so the waveforms of a block of events are read in one call. For the files whose
+	waveformoffset column is not valid (not written or not shifted by a merge), the offsets are computed once from the
+	number of recorded pixels of all the events.
+	"""
+
+	def __init__(self, telNode, blockSize=DL0_READER_BLOCK_SIZE, copyWaveform=True):
+		"""
+		Constructor of the DL0TelescopeReader
+		Parameters:
+			telNode : telescope node (/dl0/Tel_N)
+			blockSize : number of events read at once
+			copyWaveform : True to return copies of the dense waveforms, False to return views on the reused buffer (no
+						   copy, but the waveforms of an event are overwritten by the next block)
+		"""
+		self.telNode = telNode
+		self.blockSize = max(1, blockSize)
+		self.copyWaveform = copyWaveform
+		self.nbPixel = int(telNode.nbPixel.read())
+		self.nbSlice = int(telNode.nbSlice.read())
+		self.hasLowGain = "pixelLo" in telNode
+		self.nbEvent = telNode.pixelWaveform.nrows
+		# Offsets of all the events computed from the pixelWaveform vlarray, only if the waveformoffset column is not valid
+		self.tabOffset = None
+		if not is_valid_waveform_offset(telNode):
+			self.tabOffset = get_vlarray_offset(telNode.pixelWaveform)
+		self.block = None
+		self.tabDenseBuffer = None
+
+	@property
+	def nb_event(self):
+		"""
+		Number of events of the telescope
+		"""
+		return self.nbEvent
+
+	def _get_waveform_rows(self, start, stop, tabOffset, tabWaveformOffset):
+		"""
+		Get the rows of the waveforms of a block of events in the waveform table
+		Parameters:
+			start : first row of the block
+			stop : last row of the block (excluded)
+			tabOffset : offset of the first recorded pixel of each event of the block (stop - start + 1)
+			tabWaveformOffset : waveformoffset column of the events start to stop (included if stop is an event)
+		Return:
+			first row, last row (excluded)
+		"""
+		if self.tabOffset is None:
+			first = int(tabWaveformOffset[0]) if start < self.nbEvent else self.telNode.waveform.nrows
+			last = int(tabWaveformOffset[stop - start]) if stop < self.nbEvent else self.telNode.waveform.nrows
+			tabBlockOffset = tabWaveformOffset[:stop - start].astype(np.int64) - first
+			if last - first == tabOffset[-1] and np.array_equal(tabBlockOffset, tabOffset[:-1]):
+				return first, last
+			# The waveformoffset column does not match the pixels of the events
+			self.tabOffset = get_vlarray_offset(self.telNode.pixelWaveform)
+		return int(self.tabOffset[start]), int(self.tabOffset[stop])
+
+	def read_block(self, start, stop):
+		"""
+		Read a block of consecutive events
+		Parameters:
+			start : first row to be read
+			stop : last row (excluded)
+		Return:
+			DL0Block
+		"""
+		stop = min(stop, self.nb_event)
+		start = min(start, stop)
+		tabPixel, tabOffset = read_vlarray_block(self.telNode.pixelWaveform, start, stop)
+		# The next event gives the end of the waveforms of the block
+		tabRowSignal = self.telNode.signal.read(start, min(stop + 1, self.nbEvent))
+		tabSignal = tabRowSignal["signal"][:stop - start]
+		first, last = self._get_waveform_rows(start, stop, tabOffset, tabRowSignal["waveformoffset"]
+											  if self.tabOffset is None else None)
+		tabWaveform = self.telNode.waveform.read(first, last, field="waveform")
+		tabPixelLo, tabOffsetLo = None, None
+		if self.hasLowGain:
+			tabPixelLo, tabOffsetLo = read_vlarray_block(self.telNode.pixelLo, start, stop)
+		return DL0Block(start, tabPixel, tabOffset, tabWaveform, tabSignal, tabPixelLo, tabOffsetLo)
+
+	def _get_block(self, row):
+		"""
+		Get the block which contains a row (the next block is read if needed)
+		Parameters:
+			row : row of the event
+		Return:
+			DL0Block
+		"""
+		block = self.block
+		if block is None or row < block.firstRow or row >= block.firstRow + block.nbRow:
+			block = self.read_block(row, row + self.blockSize)
+			self.block = block
+		return block
+
+	def get_event(self, row):
+		"""
+		Get the sparse data of an event
+		Parameters:
+			row : row of the event in the telescope tables
+		Return:
+			index of the recorded pixels, waveforms of the recorded pixels (nbSelectedPixel, nbSlice), integrated signal
+			(nbPixel), index of the pixels in low gain mode (None for the cameras with one gain)
+		"""
+		block = self._get_block(row)
+		i = row - block.firstRow
+		first, last = block.tabOffset[i], block.tabOffset[i + 1]
+		tabPixelLo = None
+		if block.tabPixelLo is not None:
+			tabPixelLo = block.tabPixelLo[block.tabOffsetLo[i]:block.tabOffsetLo[i + 1]]
+		return block.tabPixel[first:last], block.tabWaveform[first:last], block.tabSignal[i], tabPixelLo
+
+	def get_dense_waveform(self, row):
+		"""
+		Get the dense waveform of an event, the pixels which are not recorded are set to 0
+		The dense waveforms of a block are scattered at once in a reused buffer, the returned arrays are copied from it
+		(views on it if copyWaveform is False)
+		Parameters:
+			row : row of the event in the telescope tables
+		Return:
+			waveform (nbPixel, nbSlice), mask of the recorded pixels (nbPixel)
+		"""
+		block = self._get_block(row)
+		if block.tabDense is None:
+			if self.tabDenseBuffer is None:
+				self.tabDenseBuffer = np.empty((self.blockSize, self.nbPixel, self.nbSlice), dtype=block.tabWaveform.dtype)
+			block.tabDense, block.tabSelected = scatter_dense_waveform(block.tabPixel, block.tabOffset, block.tabWaveform,
+																	   self.nbPixel, out=self.tabDenseBuffer[:block.nbRow])
+		i = row - block.firstRow
+		if self.copyWaveform:
+			return block.tabDense[i].copy(), block.tabSelected[i].copy()
+		return block.tabDense[i], block.tabSelected[i]
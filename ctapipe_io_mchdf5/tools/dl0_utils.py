@@ -9,9 +9,11 @@ import tables
 import numpy as np
 
 from .r0_utils import create_mon_tel_pointing, TELINFO_NBGAIN, TELINFO_NBPIXEL, TELINFO_NBSLICE
+from .chunk_utils import get_table_chunkshape
+from .compression_policy import get_node_filters
 
 
-def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1):
+def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=None, expectedrows=None):
 	"""
 	Create the waveform tables into the given telescope node
 	Parameters:
@@ -20,11 +22,14 @@ def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1)
 		nbGain : number of gains of the camera
 		nbPixel : number of pixels
 		nbSlice : number of slices
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		expectedrows : expected number of events of the telescope (None if unknown)
 	"""
 	if nbGain > 1:
-		pixelLo = hfile.create_vlarray(telNode, "pixelLo", tables.UInt16Atom(shape=()), "table of the index of the pixels which are in low gain mode",)
-	pixelWaveform = hfile.create_vlarray(telNode, "pixelWaveform", tables.UInt16Atom(shape=()), "table of the index of the pixels recorded with the waveform",)
+		pixelLo = hfile.create_vlarray(telNode, "pixelLo", tables.UInt16Atom(shape=()), "table of the index of the pixels which are in low gain mode",
+									   filters=get_node_filters(hfile, telNode, "pixelLo"))
+	pixelWaveform = hfile.create_vlarray(telNode, "pixelWaveform", tables.UInt16Atom(shape=()), "table of the index of the pixels recorded with the waveform",
+										 filters=get_node_filters(hfile, telNode, "pixelWaveform"))
 
 	#columns_dict_waveformoffset  = {"waveformoffset": tables.UInt64Col(shape=())}
 	#description_waveformoffset = type('description columns_dict_waveformoffset', (tables.IsDescription,), columns_dict_waveformoffset)
@@ -32,7 +37,10 @@ def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1)
 	
 	columns_dict_waveform  = {"waveform": tables.UInt16Col(shape=nbSlice)}
 	description_waveform = type('description columns_dict_waveform', (tables.IsDescription,), columns_dict_waveform)
-	hfile.create_table(telNode, 'waveform', description_waveform, "Table of waveform of the pixel with waveform", chunkshape=chunkshape)
+	# The waveform table stores one row per selected pixel, so its number of rows is not known
+	hfile.create_table(telNode, 'waveform', description_waveform, "Table of waveform of the pixel with waveform",
+					   chunkshape=get_table_chunkshape(description_waveform, chunkshape=chunkshape),
+					   filters=get_node_filters(hfile, telNode, "waveform"))
 	
 	columns_dict_signal  = {
 				#"signal": tables.Float32Col(shape=(nbPixel)),
@@ -40,10 +48,12 @@ def create_dl0_table_tel(hfile, telNode, nbGain, nbPixel, nbSlice, chunkshape=1)
 				"waveformoffset": tables.UInt64Col(shape=())
 			 }
 	description_signal = type('description columns_dict_signal', (tables.IsDescription,), columns_dict_signal)
-	hfile.create_table(telNode, 'signal', description_signal, "Calibrated and integrated signal", chunkshape=chunkshape)
+	hfile.create_table(telNode, 'signal', description_signal, "Calibrated and integrated signal",
+					   chunkshape=get_table_chunkshape(description_signal, chunkshape=chunkshape, expectedrows=expectedrows),
+					   filters=get_node_filters(hfile, telNode, "signal"))
 
 
-def create_dl0_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
+def create_dl0_tel_group_and_table(hfile, telId, telInfo, chunkshape=None):
 	"""
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -52,7 +62,7 @@ def create_dl0_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
 		hfile : HDF5 file to be used
 		telId : id of the telescope
 		telInfo : table of some informations related to the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
 	"""
 	cam_tel_group = create_mon_tel_pointing(hfile, telId, telInfo, chunkshape=chunkshape)
 	
@@ -0,0 +1,270 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import tables
+import numpy as np
+
+# Name of the group which contains the event index at the root of the file
+EVENT_INDEX_NODE = "event_index"
+
+
+class EventIndex(object):
+	"""
+	Index of the telescopes which have data for each event (CSR storage)
+	The telescopes of the event i are described by the entries [offset[i], offset[i + 1]) of
+	tabTelId, tabTelIndex and tabTelRow
+	Attributes:
+	-----------
+		tabEventId : id of the events (sorted by increasing id, by merged file for the index of a merged file)
+		tabOffset : offset of the first telescope of each event (with one more element for the end of the last event)
+		tabTelId : id of the telescopes
+		tabTelIndex : index of the telescopes
+		tabTelRow : row of the event in the tables of the telescope
+	"""
+
+	def __init__(self, tabEventId, tabOffset, tabTelId, tabTelIndex, tabTelRow):
+		"""
+		Constructor of the EventIndex
+		Parameters:
+			tabEventId : id of the events
+			tabOffset : offset of the first telescope of each event
+			tabTelId : id of the telescopes
+			tabTelIndex : index of the telescopes
+			tabTelRow : row of the event in the tables of the telescope
+		"""
+		self.tabEventId = np.asarray(tabEventId, dtype=np.uint64)
+		self.tabOffset = np.asarray(tabOffset, dtype=np.uint64)
+		self.tabTelId = np.asarray(tabTelId, dtype=np.uint64)
+		self.tabTelIndex = np.asarray(tabTelIndex, dtype=np.uint64)
+		self.tabTelRow = np.asarray(tabTelRow, dtype=np.uint64)
+
+	def __len__(self):
+		return self.tabEventId.shape[0]
+
+	def get_event(self, i):
+		"""
+		Get the telescopes of an event
+		Parameters:
+			i : index of the event in the index
+		Return:
+			id of the event, tables of id, index and row of the telescopes which have data for this event
+		"""
+		first = int(self.tabOffset[i])
+		last = int(self.tabOffset[i + 1])
+		return self.tabEventId[i], self.tabTelId[first:last], self.tabTelIndex[first:last], self.tabTelRow[first:last]
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self.get_event(i)
+
+
+def create_event_index(listTabEventId, listTelId, listTelIndex):
+	"""
+	Create the event index from the event id of each telescope
+	Parameters:
+		listTabEventId : list of the tables of event id of the telescopes (one entry per row of the telescope tables)
+		listTelId : list of the id of the telescopes
+		listTelIndex : list of the index of the telescopes
+	Return:
+		EventIndex
+	"""
+	if len(listTabEventId) == 0:
+		return EventIndex(np.zeros(0), np.zeros(1), np.zeros(0), np.zeros(0), np.zeros(0))
+	tabNbRow = [len(tabEventId) for tabEventId in listTabEventId]
+	tabEventId = np.concatenate([np.asarray(tabEventId, dtype=np.uint64) for tabEventId in listTabEventId])
+	tabTelId = np.repeat(np.asarray(listTelId, dtype=np.uint64), tabNbRow)
+	tabTelIndex = np.repeat(np.asarray(listTelIndex, dtype=np.uint64), tabNbRow)
+	tabTelRow = np.concatenate([np.arange(nbRow, dtype=np.uint64) for nbRow in tabNbRow])
+
+	# The stable sort keeps the order of the telescopes inside an event
+	tabOrder = np.argsort(tabEventId, kind='stable')
+	tabEventId = tabEventId[tabOrder]
+	tabUniqueEventId, tabNbTelPerEvent = np.unique(tabEventId, return_counts=True)
+	tabOffset = np.zeros(len(tabUniqueEventId) + 1, dtype=np.uint64)
+	np.cumsum(tabNbTelPerEvent, out=tabOffset[1:])
+	return EventIndex(tabUniqueEventId, tabOffset, tabTelId[tabOrder], tabTelIndex[tabOrder], tabTelRow[tabOrder])
+
+
+def create_event_index_from_trigger(tabEventId, tabTelId, tabOffset, dicoTelIndex=None):
+	"""
+	Create the event index from the telescopes which have data for each event, in the order of the events
+	The rows of a telescope are in the order of its events (the row of a telescope is its number of previous events)
+	Parameters:
+		tabEventId : id of the events (one per row of the subarray trigger table)
+		tabTelId : concatenated id of the telescopes which have data for each event
+		tabOffset : offset of the first telescope of each event in tabTelId (with one more element for the end of the
+					last event), as given by read_vlarray_block
+		dicoTelIndex : index of each telescope id (telId - 1 if None or if the telescope is not in the dictionnary)
+	Return:
+		EventIndex (in the order of the events of tabEventId)
+	"""
+	if len(tabEventId) + 1 != len(tabOffset):
+		raise ValueError("create_event_index_from_trigger : {} events but {} offsets".format(len(tabEventId),
+																							  len(tabOffset)))
+	tabTelId = np.asarray(tabTelId, dtype=np.uint64)
+	nbEntry = tabTelId.shape[0]
+	# Rank of each entry among the entries of its telescope (the stable sort keeps the order of the events)
+	tabOrder = np.argsort(tabTelId, kind='stable')
+	tabSortedTelId = tabTelId[tabOrder]
+	isFirst = np.ones(nbEntry, dtype=bool)
+	isFirst[1:] = tabSortedTelId[1:] != tabSortedTelId[:-1]
+	tabFirst = np.flatnonzero(isFirst)
+	tabFirstOfEntry = np.repeat(tabFirst, np.diff(np.append(tabFirst, nbEntry)))
+	tabTelRow = np.empty(nbEntry, dtype=np.uint64)
+	tabTelRow[tabOrder] = np.arange(nbEntry) - tabFirstOfEntry
+
+	tabUniqueTelId, tabInverse = np.unique(tabTelId, return_inverse=True)
+	if dicoTelIndex is None:
+		dicoTelIndex = dict()
+	tabUniqueTelIndex = np.array([dicoTelIndex.get(int(telId), int(telId) - 1) for telId in tabUniqueTelId],
+								 dtype=np.uint64)
+	return EventIndex(tabEventId, tabOffset, tabTelId, tabUniqueTelIndex[tabInverse.ravel()], tabTelRow)
+
+
+def concatenate_event_index(listEventIndex):
+	"""
+	Concatenate the event index of several files, the events of each index are kept (even if an other index has the
+	same event id) and are put after the events of the previous index
+	Parameters:
+		listEventIndex : list of EventIndex (with the rows of the telescopes in the merged tables)
+	Return:
+		EventIndex
+	"""
+	if len(listEventIndex) == 0:
+		return EventIndex(np.zeros(0), np.zeros(1), np.zeros(0), np.zeros(0), np.zeros(0))
+	listTabOffset = list()
+	nbEntry = 0
+	for eventIndex in listEventIndex:
+		listTabOffset.append(eventIndex.tabOffset[:-1] + np.uint64(nbEntry))
+		nbEntry += len(eventIndex.tabTelId)
+	listTabOffset.append(np.array([nbEntry], dtype=np.uint64))
+	return EventIndex(np.concatenate([eventIndex.tabEventId for eventIndex in listEventIndex]),
+					  np.concatenate(listTabOffset),
+					  np.concatenate([eventIndex.tabTelId for eventIndex in listEventIndex]),
+					  np.concatenate([eventIndex.tabTelIndex for eventIndex in listEventIndex]),
+					  np.concatenate([eventIndex.tabTelRow for eventIndex in listEventIndex]))
+
+
+def get_event_row(tabEventIdRef, tabEventId):
+	"""
+	Get the rows of a table which correspond to some event id (with a sorted index of the table instead of a search per event)
+	Parameters:
+		tabEventIdRef : event id of each row of the table (mc_event for example)
+		tabEventId : event id to be searched
+	Return:
+		table of the row of each event id of tabEventId in tabEventIdRef (-1 if the event is not in tabEventIdRef)
+	"""
+	tabEventIdRef = np.asarray(tabEventIdRef)
+	tabEventId = np.asarray(tabEventId, dtype=tabEventIdRef.dtype)
+	if tabEventIdRef.shape[0] == 0:
+		return np.full(tabEventId.shape[0], -1, dtype=np.int64)
+	tabOrder = np.argsort(tabEventIdRef, kind='stable')
+	tabSortedEventId = tabEventIdRef[tabOrder]
+	tabPos = np.searchsorted(tabSortedEventId, tabEventId)
+	np.minimum(tabPos, tabSortedEventId.shape[0] - 1, out=tabPos)
+	isFound = tabSortedEventId[tabPos] == tabEventId
+	return np.where(isFound, tabOrder[tabPos], -1).astype(np.int64)
+
+
+def get_run_event_row(tabObsIdRef, tabEventIdRef, tabObsId, tabEventId):
+	"""
+	Get the rows of a table which correspond to some events of several runs (the event id are unique in a run only,
+	a merged file has the events of several runs)
+	Parameters:
+		tabObsIdRef : observation id of each row of the table
+		tabEventIdRef : event id of each row of the table
+		tabObsId : observation id of the events to be searched
+		tabEventId : event id to be searched
+	Return:
+		table of the row of each event in the table (-1 if the event is not in the table)
+	"""
+	tabObsIdRef = np.asarray(tabObsIdRef)
+	tabObsId = np.asarray(tabObsId)
+	tabEventIdRef = np.asarray(tabEventIdRef)
+	tabEventId = np.asarray(tabEventId)
+	tabRow = np.full(tabEventId.shape[0], -1, dtype=np.int64)
+	for obsId in np.unique(tabObsId):
+		tabRowRefRun = np.flatnonzero(tabObsIdRef == obsId)
+		if tabRowRefRun.shape[0] == 0:
+			continue
+		isEventRun = tabObsId == obsId
+		tabRowRun = get_event_row(tabEventIdRef[tabRowRefRun], tabEventId[isEventRun])
+		tabRow[isEventRun] = np.where(tabRowRun >= 0, tabRowRefRun[np.maximum(tabRowRun, 0)], -1)
+	return tabRow
+
+
+def create_event_index_from_tel_nodes(hfile, telGroupName, getTabEventId):
+	"""
+	Create the event index of a file which stores a group per telescope
+	Parameters:
+		hfile : HDF5 file to be used
+		telGroupName : name of the group which contains the telescopes groups ('/r1' or '/Tel')
+		getTabEventId : function which returns the table of event id of a telescope node
+	Return:
+		EventIndex
+	"""
+	listTabEventId, listTelId, listTelIndex = list(), list(), list()
+	for telNode in hfile.walk_nodes(telGroupName, 'Group'):
+		try:
+			tabEventId = getTabEventId(telNode)
+			telIndex = np.uint64(telNode.telIndex.read())
+			telId = np.uint64(telNode.telId.read())
+		except tables.exceptions.NoSuchNodeError as e:
+			# For the telescope groups only
+			continue
+		listTabEventId.append(tabEventId)
+		listTelId.append(telId)
+		listTelIndex.append(telIndex)
+	return create_event_index(listTabEventId, listTelId, listTelIndex)
+
+
+def write_event_index(hfile, eventIndex):
+	"""
+	Write the event index in the file (an existing index is replaced)
+	Parameters:
+		hfile : HDF5 file to be used
+		eventIndex : EventIndex to be written
+	"""
+	if EVENT_INDEX_NODE in hfile.root:
+		hfile.remove_node(hfile.root, EVENT_INDEX_NODE, recursive=True)
+	indexGroup = hfile.create_group(hfile.root, EVENT_INDEX_NODE, 'Index of the telescopes which have data for each event')
+	hfile.create_array(indexGroup, 'event_id', eventIndex.tabEventId, 'Id of the events')
+	hfile.create_array(indexGroup, 'offset', eventIndex.tabOffset, 'Offset of the first telescope of each event')
+	hfile.create_array(indexGroup, 'tel_id', eventIndex.tabTelId, 'Id of the telescopes')
+	hfile.create_array(indexGroup, 'tel_index', eventIndex.tabTelIndex, 'Index of the telescopes')
+	hfile.create_array(indexGroup, 'tel_row', eventIndex.tabTelRow, 'Row of the event in the tables of the telescope')
+
+
+def read_event_index(hfile):
+	"""
+	Read the event index of the file
+	Parameters:
+		hfile : HDF5 file to be used
+	Return:
+		EventIndex or None if the file has no event index
+	"""
+	try:
+		indexGroup = hfile.get_node(hfile.root, EVENT_INDEX_NODE)
+		return EventIndex(indexGroup.event_id.read(), indexGroup.offset.read(), indexGroup.tel_id.read(),
+						  indexGroup.tel_index.read(), indexGroup.tel_row.read())
+	except tables.exceptions.NoSuchNodeError as e:
+		return None
+
+
+def get_event_index(hfile, telGroupName, getTabEventId):
+	"""
+	Get the event index of the file, it is read if the file has one and built from the telescopes otherwise
+	Parameters:
+		hfile : HDF5 file to be used
+		telGroupName : name of the group which contains the telescopes groups ('/r1' or '/Tel')
+		getTabEventId : function which returns the table of event id of a telescope node
+	Return:
+		EventIndex
+	"""
+	eventIndex = read_event_index(hfile)
+	if eventIndex is None:
+		eventIndex = create_event_index_from_tel_nodes(hfile, telGroupName, getTabEventId)
+	return eventIndex
@@ -0,0 +1,115 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import queue
+import threading
+
+# Default number of decoded events waiting to be written
+PIPELINE_QUEUE_SIZE = 16
+# Time in seconds between two checks of the end of the pipeline when the queue is full
+PIPELINE_POLL_TIME = 0.1
+
+
+class PipelineError(object):
+	"""
+	Exception raised by the producer of a pipeline, to be raised again by the consumer
+	"""
+
+	def __init__(self, exception):
+		self.exception = exception
+
+
+class EventPipeline(object):
+	"""
+	Decode the events of a source in a separate thread while the caller writes them (producer/consumer)
+	The producer iterates over the source and gives each event to an extract function, which has to copy or
+	reference all the data needed by the consumer (the event sources may reuse the same container for all
+	the events). The extracted events are given to the consumer through a bounded queue, so at most
+	queueSize events are decoded in advance.
+	All the writes have to be done by the consumer (PyTables is not thread safe).
+	"""
+
+	def __init__(self, source, extract, queueSize=PIPELINE_QUEUE_SIZE):
+		"""
+		Constructor of the EventPipeline
+		Parameters:
+			source : iterable of events to be decoded in the producer thread
+			extract : function which returns the data of an event to be given to the consumer (called in the producer thread)
+			queueSize : maximum number of extracted events waiting in the queue (> 0)
+		"""
+		if queueSize <= 0:
+			raise ValueError("EventPipeline : queueSize must be positive, not {}".format(queueSize))
+		self.source = source
+		self.extract = extract
+		self.queueSize = queueSize
+
+	def _put(self, eventQueue, stopEvent, item):
+		"""
+		Put an item in the queue, waiting until there is some room or the consumer stops
+		Parameters:
+			eventQueue : queue of the pipeline
+			stopEvent : threading.Event set when the consumer stops
+			item : item to be put in the queue
+		Return:
+			True if the item was put in the queue, False if the consumer stopped
+		"""
+		while not stopEvent.is_set():
+			try:
+				eventQueue.put(item, timeout=PIPELINE_POLL_TIME)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def _produce(self, eventQueue, stopEvent):
+		"""
+		Decode and extract the events of the source (producer thread)
+		Parameters:
+			eventQueue : queue of the pipeline
+			stopEvent : threading.Event set when the consumer stops
+		"""
+		try:
+			for event in self.source:
+				if not self._put(eventQueue, stopEvent, self.extract(event)):
+					return
+		except BaseException as e:
+			self._put(eventQueue, stopEvent, PipelineError(e))
+			return
+		self._put(eventQueue, stopEvent, None)
+
+	def __iter__(self):
+		eventQueue = queue.Queue(maxsize=self.queueSize)
+		stopEvent = threading.Event()
+		producer = threading.Thread(target=self._produce, args=(eventQueue, stopEvent), name="EventPipeline",
+									daemon=True)
+		producer.start()
+		try:
+			while True:
+				item = eventQueue.get()
+				if item is None:
+					break
+				if isinstance(item, PipelineError):
+					raise item.exception
+				yield item
+		finally:
+			# Stop the producer if the consumer stops before the end of the source
+			stopEvent.set()
+			producer.join()
+
+
+def iter_extracted_events(source, extract, queueSize=PIPELINE_QUEUE_SIZE):
+	"""
+	Iterate over the extracted events of a source, decoded in a separate thread if queueSize > 0
+	Parameters:
+		source : iterable of events
+		extract : function which returns the data of an event to be used by the caller
+		queueSize : maximum number of events decoded in advance (0 to decode and extract the events in the caller thread)
+	Return:
+		iterator over the extracted events, in the order of the source
+	"""
+	if queueSize <= 0:
+		return map(extract, source)
+	return iter(EventPipeline(source, extract, queueSize))
@@ -0,0 +1,361 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import fnmatch
+import os
+
+import numpy as np
+import tables
+
+from .chunk_utils import get_table_block_size, STREAM_BLOCK_SIZE
+from .event_index import EVENT_INDEX_NODE, write_event_index, get_event_index, concatenate_event_index
+from .compression_policy import copy_node_policy
+from .r0_reader import read_r0_event_index
+
+# Nodes whose rows are appended when files are merged (r0, r1 and dl0 layouts), the other nodes (instrument,
+# monitoring and description of the telescopes, compression policy) are copied from the first file which has them
+MERGE_APPEND_PATTERNS = ["/r0/event/*", "/r0/monitoring/subarray/*", "/r0/monitoring/telescope/pointing/*",
+						 "/simulation/event/*", "/configuration/simulation/*",
+						 "/r1/Tel_*/trigger", "/r1/Tel_*/waveform*", "/r1/Tel_*/photo_electron_image",
+						 "/dl0/Tel_*/trigger", "/dl0/Tel_*/waveform", "/dl0/Tel_*/signal", "/dl0/Tel_*/pixel*",
+						 "/simulation/mc_event", "/simulation/run_config"]
+# Nodes which have to be the same in all the merged files
+MERGE_CHECK_PATTERNS = ["/instrument/*", "/configuration/instrument/*", "/r0/monitoring/telescope/information/*",
+						"/r1/Tel_*/nb*", "/r1/Tel_*/tel*", "/dl0/Tel_*/nb*", "/dl0/Tel_*/tel*"]
+# Tables with one row per telescope of the run, the rows of the telescopes which have no data in a file are blank (single
+# pass conversion), so the rows are merged (pattern of the table : column which is empty in the blank rows)
+MERGE_UNION_TABLES = {"/configuration/instrument/subarray/layout": "name",
+					  "/configuration/instrument/telescope/optics": "name"}
+# Columns which are rows of an other node of the telescope, they are shifted by the number of rows of this node in
+# the output file (pattern of the table : (column, name of the node in the same group))
+MERGE_OFFSET_COLUMNS = {"/dl0/Tel_*/signal": ("waveformoffset", "waveform")}
+# Number of rows of a vlarray copied at once
+MERGE_VLARRAY_BLOCK_SIZE = 65536
+
+
+def match_node_pattern(nodePath, listPattern):
+	"""
+	Say if the path of a node matches one of the patterns
+	Parameters:
+		nodePath : path of the node in the file
+		listPattern : list of fnmatch patterns
+	Return:
+		True if the node matches a pattern, False otherwise
+	"""
+	for pattern in listPattern:
+		if fnmatch.fnmatchcase(nodePath, pattern):
+			return True
+	return False
+
+
+def is_merge_appended_node(nodePath):
+	"""
+	Say if the rows of a node are appended when files are merged
+	Parameters:
+		nodePath : path of the node in the file
+	Return:
+		True if the rows of the node are appended, False if the node is copied from the first file which has it
+	"""
+	return match_node_pattern(nodePath, MERGE_APPEND_PATTERNS)
+
+
+def get_merge_offset_column(nodePath):
+	"""
+	Get the column of a table which gives rows of an other node
+	Parameters:
+		nodePath : path of the table in the file
+	Return:
+		(name of the column, name of the node in the same group) or None if the table has no such column
+	"""
+	for pattern, offsetColumn in MERGE_OFFSET_COLUMNS.items():
+		if fnmatch.fnmatchcase(nodePath, pattern):
+			return offsetColumn
+	return None
+
+
+def check_same_node(outNode, inNode):
+	"""
+	Check that a node of the input file has the same content as in the output file
+	Parameters:
+		outNode : node of the output file
+		inNode : node of the input file
+	"""
+	if not isinstance(inNode, tables.Leaf):
+		return
+	if type(outNode) is not type(inNode) or outNode.shape != inNode.shape \
+			or not np.array_equal(outNode.read(), inNode.read()):
+		raise ValueError("check_same_node : node {} of file {} differs from the merged files".format(
+			inNode._v_pathname, inNode._v_file.filename))
+
+
+def get_merge_union_column(nodePath):
+	"""
+	Get the column which says if a row of a table per telescope is blank
+	Parameters:
+		nodePath : path of the table in the file
+	Return:
+		name of the column, None if the rows of the table are not merged
+	"""
+	for pattern, blankColumn in MERGE_UNION_TABLES.items():
+		if fnmatch.fnmatchcase(nodePath, pattern):
+			return blankColumn
+	return None
+
+
+def merge_table_union(outTable, inTable, blankColumn):
+	"""
+	Merge the rows of a table per telescope of the input file in the same table of the output file
+	The blank rows of the output table are replaced by the rows of the input table, the rows which are filled in both
+	tables have to be the same
+	Parameters:
+		outTable : table of the output file
+		inTable : table of the input file
+		blankColumn : column which is empty in the blank rows
+	"""
+	if outTable.dtype != inTable.dtype or outTable.nrows != inTable.nrows:
+		raise ValueError("merge_table_union : node {} of file {} has not the same rows as in the merged files".format(
+			inTable._v_pathname, inTable._v_file.filename))
+	tabOutRow = outTable.read()
+	tabInRow = inTable.read()
+	isBlankOut = tabOutRow[blankColumn] == b""
+	isBlankIn = tabInRow[blankColumn] == b""
+	if np.any(~isBlankOut & ~isBlankIn & (tabOutRow != tabInRow)):
+		raise ValueError("merge_table_union : node {} of file {} differs from the merged files".format(
+			inTable._v_pathname, inTable._v_file.filename))
+	tabCoord = np.flatnonzero(isBlankOut & ~isBlankIn)
+	if tabCoord.shape[0] != 0:
+		outTable.modify_coordinates(tabCoord, tabInRow[tabCoord])
+
+
+def can_copy_raw_chunks(outLeaf, inLeaf):
+	"""
+	Say if the chunks of a leaf can be appended without being decompressed and compressed again
+	The leaves have to be chunked in the same way with the same filters, and the output leaf has to end on a chunk
+	Parameters:
+		outLeaf : leaf to be completed
+		inLeaf : leaf to be copied
+	Return:
+		True if the raw chunks can be copied
+	"""
+	# Direct chunk access is available since PyTables 3.8
+	if not hasattr(inLeaf, "read_chunk") or isinstance(inLeaf, tables.VLArray):
+		return False
+	if inLeaf.chunkshape is None or outLeaf.chunkshape is None:
+		return False
+	if tuple(outLeaf.chunkshape) != tuple(inLeaf.chunkshape) or outLeaf.dtype != inLeaf.dtype:
+		return False
+	# One chunk over the other dimensions
+	if tuple(inLeaf.chunkshape[1:]) != tuple(inLeaf.shape[1:]) or tuple(outLeaf.shape[1:]) != tuple(inLeaf.shape[1:]):
+		return False
+	if outLeaf.filters != inLeaf.filters:
+		return False
+	return outLeaf.nrows % int(inLeaf.chunkshape[0]) == 0
+
+
+def append_raw_chunks(outLeaf, inLeaf):
+	"""
+	Append the raw chunks of a leaf at the end of an other leaf (check first with can_copy_raw_chunks)
+	Parameters:
+		outLeaf : leaf to be completed
+		inLeaf : leaf to be copied
+	"""
+	firstRow = outLeaf.nrows
+	nbRow = inLeaf.nrows
+	nbRowPerChunk = int(inLeaf.chunkshape[0])
+	coordsOther = (0,)*(len(inLeaf.shape) - 1)
+	# The leaf is enlarged without writting data, the chunks are written after
+	outLeaf.truncate(firstRow + nbRow)
+	for start in range(0, nbRow, nbRowPerChunk):
+		chunkInfo = inLeaf.chunk_info((start,) + coordsOther)
+		if chunkInfo.size is None:
+			# Missing chunk : default values
+			continue
+		outLeaf.write_chunk((firstRow + start,) + coordsOther, inLeaf.read_chunk((start,) + coordsOther),
+							filter_mask=chunkInfo.filter_mask)
+
+
+def append_leaf_rows(outLeaf, inLeaf, blockSizeInBytes=STREAM_BLOCK_SIZE, offsetColumn=None, rowOffset=0):
+	"""
+	Append all the rows of a leaf at the end of an other leaf of the same type
+	The raw chunks are copied when it is possible, and the rows are copied by blocks otherwise. The chunks of a leaf have a
+	fixed position, so when the output leaf ends on a partial chunk none of the chunks of the input leaf can be copied
+	Parameters:
+		outLeaf : leaf to be completed (Table, EArray or VLArray)
+		inLeaf : leaf to be copied
+		blockSizeInBytes : expected size in bytes of the blocks of rows copied at once
+		offsetColumn : column of the table to be shifted by rowOffset (None if there is no column to be shifted)
+		rowOffset : shift of the column offsetColumn
+	"""
+	nbRow = inLeaf.nrows
+	if isinstance(inLeaf, tables.VLArray):
+		for start in range(0, nbRow, MERGE_VLARRAY_BLOCK_SIZE):
+			for row in inLeaf.read(start, min(start + MERGE_VLARRAY_BLOCK_SIZE, nbRow)):
+				outLeaf.append(row)
+		return
+	if (offsetColumn is None or rowOffset == 0) and can_copy_raw_chunks(outLeaf, inLeaf):
+		append_raw_chunks(outLeaf, inLeaf)
+		return
+	blockSize = get_table_block_size(inLeaf, blockSizeInBytes)
+	for start in range(0, nbRow, blockSize):
+		block = inLeaf.read(start, min(start + blockSize, nbRow))
+		if offsetColumn is not None and rowOffset != 0:
+			block[offsetColumn] += np.asarray(rowOffset, dtype=block.dtype[offsetColumn])
+		outLeaf.append(block)
+
+
+def copy_node_raw_chunks(outFile, inNode, newparent, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	"""
+	Copy a node (recursively) in an other file, the tables and extendable arrays are created empty and filled with
+	append_leaf_rows, so their compressed chunks are copied without being decompressed when it is possible
+	Parameters:
+		outFile : output file
+		inNode : node to be copied
+		newparent : group of the output file in which to copy the node
+		blockSizeInBytes : expected size in bytes of the blocks of rows copied at once (if the chunks cannot be copied)
+	Return:
+		copied node
+	"""
+	if isinstance(inNode, tables.Group):
+		outGroup = outFile.copy_node(inNode, newparent=newparent, recursive=False)
+		for childNode in inNode._f_iter_nodes():
+			copy_node_raw_chunks(outFile, childNode, outGroup, blockSizeInBytes)
+		return outGroup
+	if isinstance(inNode, (tables.Table, tables.EArray)):
+		outLeaf = outFile.copy_node(inNode, newparent=newparent, stop=0)
+		append_leaf_rows(outLeaf, inNode, blockSizeInBytes)
+		return outLeaf
+	return outFile.copy_node(inNode, newparent=newparent)
+
+
+def get_tel_group_name(hfile):
+	"""
+	Get the name of the group of the telescopes of a r1 or dl0 file
+	Parameters:
+		hfile : HDF5 file to be used
+	Return:
+		'/r1', '/dl0' or None if the file has no group per telescope (r0 file)
+	"""
+	for telGroupName in ["/r1", "/dl0"]:
+		if telGroupName in hfile:
+			return telGroupName
+	return None
+
+
+def get_merged_file_event_index(inFile, dicoNbRow):
+	"""
+	Get the event index of a r1 or dl0 file merged in an other file
+	Parameters:
+		inFile : merged file
+		dicoNbRow : number of rows of the leaves of the output file before the merge (path of the leaf : number of rows)
+	Return:
+		EventIndex of the events of inFile with their rows in the tables of the output file, None for a r0 file
+	"""
+	telGroupName = get_tel_group_name(inFile)
+	if telGroupName is None:
+		return None
+	eventIndex = get_event_index(inFile, telGroupName, lambda telNode: telNode.trigger.col("event_id"))
+	dicoTelRowOffset = dict()
+	for telNode in inFile.walk_nodes(telGroupName, 'Group'):
+		if "telId" in telNode:
+			dicoTelRowOffset[int(telNode.telId.read())] = dicoNbRow.get(telNode._v_pathname + "/trigger", 0)
+	tabTelRowOffset = np.array([dicoTelRowOffset.get(int(telId), 0) for telId in eventIndex.tabTelId], dtype=np.uint64)
+	eventIndex.tabTelRow = eventIndex.tabTelRow + tabTelRowOffset
+	return eventIndex
+
+
+def merge_file(outFile, inFile, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	"""
+	Merge a file at the end of an other one (r0, r1 or dl0 layout)
+	The rows of the events (trigger, waveforms, simulated showers) and of the pointings are appended (see append_leaf_rows
+	for the copy of the raw chunks, which needs output tables ending on a chunk), the nodes which
+	are not in the output file yet (new telescope for example) are copied and the instrument description has to be
+	the same in both files (except for the telescopes which have no data in one file, whose layout and optics are
+	taken from the file which has them). The event index is not merged, it has to be written with
+	write_merged_event_index once all the files are merged
+	Parameters:
+		outFile : output file (opened in append mode)
+		inFile : file to be merged
+		blockSizeInBytes : expected size in bytes of the blocks of rows copied at once
+	Return:
+		EventIndex of the events of inFile in the output file (r1 and dl0 files, None for a r0 file), to be given to
+		write_merged_event_index
+	"""
+	if outFile.title != inFile.title:
+		raise ValueError("merge_file : file {} is a '{}' file, not a '{}' file".format(inFile.filename, inFile.title,
+																						outFile.title))
+	# Number of rows of the nodes of the output file before the merge, to shift the rows given by the merged tables
+	dicoNbRow = {leaf._v_pathname: leaf.nrows for leaf in outFile.walk_nodes("/", "Leaf")}
+	for node in inFile.walk_nodes("/"):
+		nodePath = node._v_pathname
+		if nodePath == "/" or nodePath.split("/")[1] == EVENT_INDEX_NODE:
+			continue
+		isAppended = isinstance(node, tables.Leaf) and is_merge_appended_node(nodePath)
+		if nodePath in outFile:
+			if isAppended:
+				offsetColumn, rowOffset = None, 0
+				mergeOffsetColumn = get_merge_offset_column(nodePath)
+				if mergeOffsetColumn is not None:
+					offsetColumn = mergeOffsetColumn[0]
+					rowOffset = dicoNbRow.get(node._v_parent._v_pathname + "/" + mergeOffsetColumn[1], 0)
+				append_leaf_rows(outFile.get_node(nodePath), node, blockSizeInBytes, offsetColumn, rowOffset)
+			elif get_merge_union_column(nodePath) is not None:
+				merge_table_union(outFile.get_node(nodePath), node, get_merge_union_column(nodePath))
+			elif match_node_pattern(nodePath, MERGE_CHECK_PATTERNS):
+				check_same_node(outFile.get_node(nodePath), node)
+			continue
+		parentPath = node._v_parent._v_pathname
+		if isinstance(node, tables.Group):
+			outFile.create_group(parentPath, node._v_name, node._v_title, filters=node._v_filters)
+		elif isAppended:
+			# Empty copy of the leaf (same chunkshape), filled by chunks if the filters are the same
+			outLeaf = copy_node_policy(outFile, node, outFile.get_node(parentPath), stop=0)
+			append_leaf_rows(outLeaf, node, blockSizeInBytes)
+		else:
+			copy_node_policy(outFile, node, outFile.get_node(parentPath))
+	return get_merged_file_event_index(inFile, dicoNbRow)
+
+
+def write_merged_event_index(outFile, listEventIndex=None):
+	"""
+	Write the event index of a merged file
+	The events of a r0 file are in the order of the subarray trigger table and the rows of the telescopes follow the
+	order of the merged files. The index of a r1 or dl0 file is the concatenation of the index of the merged files (the
+	files of different runs can have the same event id, so the events cannot be found from their id only)
+	Parameters:
+		outFile : merged file
+		listEventIndex : list of the EventIndex given by merge_file for each merged file (r1 and dl0 files)
+	"""
+	if "r0" in outFile.root:
+		eventIndex = read_r0_event_index(outFile)
+	else:
+		if get_tel_group_name(outFile) is None:
+			return
+		eventIndex = concatenate_event_index([eventIndex for eventIndex in listEventIndex or [] if eventIndex is not None])
+	write_event_index(outFile, eventIndex)
+
+
+def merge_files(outputFileName, listInputFileName, blockSizeInBytes=STREAM_BLOCK_SIZE):
+	"""
+	Merge files of the same layout into a new file
+	Parameters:
+		outputFileName : name of the output file
+		listInputFileName : list of the files to be merged (in the order of their events in the output file)
+		blockSizeInBytes : expected size in bytes of the blocks of rows copied at once
+	"""
+	if len(listInputFileName) == 0:
+		raise ValueError("merge_files : no file to be merged")
+	with tables.open_file(listInputFileName[0], "r") as inFile:
+		title = inFile.title
+	try:
+		with tables.open_file(outputFileName, "w", title=title) as outFile:
+			listEventIndex = list()
+			for inputFileName in listInputFileName:
+				with tables.open_file(inputFileName, "r") as inFile:
+					listEventIndex.append(merge_file(outFile, inFile, blockSizeInBytes))
+			write_merged_event_index(outFile, listEventIndex)
+	except ValueError:
+		os.remove(outputFileName)
+		raise
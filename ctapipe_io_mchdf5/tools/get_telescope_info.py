@@ -46,6 +46,103 @@ TELINFO_TEL_CAMERA_GEOMETRY = TELINFO_TEL_CAMERA_NAME
 TELINFO_TEL_CAMERA_READOUT = TELINFO_TEL_CAMERA_NAME
 
 
+def get_telescope_position(subarray):
+	"""
+	Get the position of all the telescopes of the subarray
+	Parameters:
+	-----------
+		subarray : subarray description of the input file
+	Return:
+	-------
+		tuple of (positions on the X axis, positions on the Y axis, positions on the Z axis)
+	"""
+	posTelX = np.asarray(subarray.tel_coords.x, dtype=np.float32)
+	posTelY = np.asarray(subarray.tel_coords.y, dtype=np.float32)
+	posTelZ = np.asarray(subarray.tel_coords.z, dtype=np.float32)
+	return posTelX, posTelY, posTelZ
+
+
+def create_telescope_info(subarray, evt, tel_id, tabPosTel):
+	"""
+	Create the information of a telescope from the first event in which it has data
+	Parameters:
+	-----------
+		subarray : subarray description of the input file
+		evt : event in which the telescope has data
+		tel_id : id of the telescope
+		tabPosTel : tuple of the positions of the telescopes (X, Y, Z) given by get_telescope_position
+	Return:
+	-------
+		list of the informations of the telescope (ref_shape, nb_slice, ped, gain, telType, focalLen, tabPixelX, tabPixelY, nbMirror, etc)
+	"""
+	posTelX, posTelY, posTelZ = tabPosTel
+	ref_shape = subarray.tel[tel_id].camera.readout.reference_pulse_shape
+	nb_slice = evt.r0.tel[tel_id].waveform.shape[2]
+	nbGain = evt.r0.tel[tel_id].waveform.shape[0]
+	nbPixel = evt.r0.tel[tel_id].waveform.shape[1]
+	ped = evt.mc.tel[tel_id].pedestal
+	gain = evt.mc.tel[tel_id].dc_to_pe
+	cameraRotation = subarray.tel[tel_id].camera.geometry.pix_rotation.value
+	pixRotation = subarray.tel[tel_id].camera.geometry.cam_rotation.value
+
+	telInfo = subarray.tel[tel_id]
+	telType = np.uint64(get_camera_type_from_name(telInfo.camera.camera_name))
+	tel_name = telInfo.name
+	camera_name = telInfo.camera.camera_name
+	ref_pulse_time = telInfo.camera.readout.reference_pulse_sample_time.value
+
+	pix_area = telInfo.camera.geometry.pix_area.value
+
+	focalLen = np.float32(telInfo.optics.equivalent_focal_length.value)
+
+	tabPixelX = np.asarray(telInfo.camera.geometry.pix_x.value, dtype=np.float32)
+	tabPixelY = np.asarray(telInfo.camera.geometry.pix_y.value, dtype=np.float32)
+
+	nbMirror = np.uint64(telInfo.optics.num_mirrors)
+	nbMirrorTiles = np.uint64(telInfo.optics.num_mirror_tiles)
+	mirrorArea = np.uint64(telInfo.optics.mirror_area.value)
+
+	array_alt = np.float32(evt.pointing.array_altitude.value)
+	array_az = np.float32(evt.pointing.array_azimuth.value)
+	array_ra = np.float32(evt.pointing.array_ra.value)
+	array_dec = np.float32(evt.pointing.array_dec.value)
+
+	time_first_event = np.float64(evt.trigger.time.to_value('unix'))
+
+	telX = posTelX[int(tel_id - 1)]
+	telY = posTelY[int(tel_id - 1)]
+	telZ = posTelZ[int(tel_id - 1)]
+
+	return [ref_shape, nb_slice, ped, gain, telType, focalLen, tabPixelX, tabPixelY,
+			nbMirror, telX, telY, telZ, nbMirrorTiles, mirrorArea, nbGain, nbPixel, 0,
+			cameraRotation, pixRotation, tel_name, camera_name, pix_area,
+			ref_pulse_time, array_alt, array_az, array_ra, array_dec,
+			time_first_event]
+
+
+def update_telescope_info_from_event(telescope_info, subarray, evt, tabPosTel):
+	"""
+	Update the telescope information with the telescopes which have data in the given event
+	Parameters:
+	-----------
+		telescope_info : dictionnary of the telescope informations with telescope id as key (updated)
+		subarray : subarray description of the input file
+		evt : current event
+		tabPosTel : tuple of the positions of the telescopes (X, Y, Z) given by get_telescope_position
+	Return:
+	-------
+		list of the id of the telescopes seen for the first time in this event
+	"""
+	listNewTelId = list()
+	for tel_id in evt.r0.tels_with_data:
+		if not tel_id in telescope_info:
+			telescope_info[tel_id] = create_telescope_info(subarray, evt, tel_id, tabPosTel)
+			listNewTelId.append(tel_id)
+		else:
+			telescope_info[tel_id][TELINFO_NBEVENT] += 1
+	return listNewTelId
+
+
 def get_telescope_info_from_event(inputFileName, max_nb_tel):
 	"""
 	Get the telescope information from the event
@@ -60,63 +157,12 @@ def get_telescope_info_from_event(inputFileName, max_nb_tel):
 	telescope_info = dict()  # Key is tel id, value (ref_shape, slice, ped, gain, telType, focalLen, tabPixelX, tabPixelY, nbMirror)
 	nbEvent = 0
 	with event_source(inputFileName) as source:
-		dicoTelInfo = None
-		posTelX = None
-		posTelY = None
-		posTelZ = None
+		tabPosTel = None
 		for evt in source:
 			nbEvent += 1
-			if dicoTelInfo is None:
-				dicoTelInfo = source.subarray.tel
-				posTelX = np.asarray(source.subarray.tel_coords.x, dtype=np.float32)
-				posTelY = np.asarray(source.subarray.tel_coords.y, dtype=np.float32)
-				posTelZ = np.asarray(source.subarray.tel_coords.z, dtype=np.float32)
-			for tel_id in evt.r0.tels_with_data:
-				if not tel_id in telescope_info:
-					ref_shape = source.subarray.tel[tel_id].camera.readout.reference_pulse_shape
-					nb_slice = evt.r0.tel[tel_id].waveform.shape[2]
-					nbGain = evt.r0.tel[tel_id].waveform.shape[0]
-					nbPixel = evt.r0.tel[tel_id].waveform.shape[1]
-					ped = evt.mc.tel[tel_id].pedestal
-					gain = evt.mc.tel[tel_id].dc_to_pe
-					cameraRotation = source.subarray.tel[tel_id].camera.geometry.pix_rotation.value
-					pixRotation = source.subarray.tel[tel_id].camera.geometry.cam_rotation.value
-					
-					telInfo = dicoTelInfo[tel_id]
-					telType = np.uint64(get_camera_type_from_name(telInfo.camera.camera_name))
-					tel_name = telInfo.name
-					camera_name = telInfo.camera.camera_name
-					ref_pulse_time = telInfo.camera.readout.reference_pulse_sample_time.value
-
-					pix_area = telInfo.camera.geometry.pix_area.value
-
-					focalLen = np.float32(telInfo.optics.equivalent_focal_length.value)
-					
-					tabPixelX = np.asarray(telInfo.camera.geometry.pix_x.value, dtype=np.float32)
-					tabPixelY = np.asarray(telInfo.camera.geometry.pix_y.value, dtype=np.float32)
-					
-					nbMirror = np.uint64(telInfo.optics.num_mirrors)
-					nbMirrorTiles = np.uint64(telInfo.optics.num_mirror_tiles)
-					mirrorArea = np.uint64(telInfo.optics.mirror_area.value)
-
-					array_alt = np.float32(evt.pointing.array_altitude.value)
-					array_az = np.float32(evt.pointing.array_azimuth.value)
-					array_ra = np.float32(evt.pointing.array_ra.value)
-					array_dec = np.float32(evt.pointing.array_dec.value)
-
-					time_first_event = np.float64(evt.trigger.time.to_value('unix'))
-
-					telX = posTelX[int(tel_id - 1)]
-					telY = posTelY[int(tel_id - 1)]
-					telZ = posTelZ[int(tel_id - 1)]
-					
-					telescope_info[tel_id] = [ref_shape, nb_slice, ped, gain, telType, focalLen, tabPixelX, tabPixelY,
-											  nbMirror, telX, telY, telZ, nbMirrorTiles, mirrorArea, nbGain, nbPixel, 0,
-											  cameraRotation, pixRotation, tel_name, camera_name, pix_area,
-											  ref_pulse_time, array_alt, array_az, array_ra, array_dec,
-											  time_first_event]
-				else:
-					telescope_info[tel_id][TELINFO_NBEVENT] += 1
+			if tabPosTel is None:
+				tabPosTel = get_telescope_position(source.subarray)
+			update_telescope_info_from_event(telescope_info, source.subarray, evt, tabPosTel)
 	return telescope_info, nbEvent
 
 
@@ -0,0 +1,210 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+
+from .chunk_utils import get_table_block_size, append_table_block, STREAM_BLOCK_SIZE
+
+# Name of the array of the telescope node which gives the format of the orderHi/orderLo arrays
+ORDER_FORMAT_NODE = "orderFormat"
+# The pixel i is stored at the position order[i] (mchdf5_sigma_mean_sort and mchdf5_mean_sigma_sort before orderFormat)
+ORDER_FORMAT_SCATTER = 1
+# The position i stores the pixel order[i] (same convention as the injunction tables of mchdf5_multiple_sort, and the
+# order arrays of mchdf5_range_sort, mchdf5_injtab_sort and mchdf5_mean_sigma_sort_slice_pixel)
+ORDER_FORMAT_GATHER = 2
+
+
+def get_inverse_injunction_table(injunctionTable):
+	"""
+	Get the inverse permutation of an injunction table
+	Parameters:
+		injunctionTable : injunction table (permutation of the pixels)
+	Return:
+		inverse injunction table : tabInverse[injunctionTable[i]] = i
+	"""
+	injunctionTable = np.asarray(injunctionTable, dtype=np.intp)
+	tabInverse = np.empty(injunctionTable.shape[0], dtype=np.intp)
+	tabInverse[injunctionTable] = np.arange(injunctionTable.shape[0], dtype=np.intp)
+	return tabInverse
+
+
+def apply_injunction_table(waveform, injunctionTable, axis=-1, out=None):
+	"""
+	Apply an injunction table on a block of events (encode) : out[..., i, ...] = waveform[..., injunctionTable[i], ...]
+	Parameters:
+		waveform : block of waveforms
+		injunctionTable : injunction table to be used
+		axis : axis of the pixels in the waveform block
+		out : preallocated output block (same shape and dtype as waveform), None to allocate it
+	Return:
+		block of waveforms with permuted pixels
+	"""
+	# The indices are valid, mode='clip' avoids the buffering of out done by mode='raise'
+	return np.take(waveform, np.asarray(injunctionTable, dtype=np.intp), axis=axis, out=out, mode='clip')
+
+
+def apply_inverse_injunction_table(waveform, injunctionTable, axis=-1, out=None):
+	"""
+	Apply the inverse of an injunction table on a block of events (decode) : out[..., injunctionTable[i], ...] = waveform[..., i, ...]
+	Parameters:
+		waveform : block of waveforms
+		injunctionTable : injunction table to be inverted
+		axis : axis of the pixels in the waveform block
+		out : preallocated output block (same shape and dtype as waveform), None to allocate it
+	Return:
+		block of waveforms with the pixels in their original order
+	"""
+	return np.take(waveform, get_inverse_injunction_table(injunctionTable), axis=axis, out=out, mode='clip')
+
+
+def append_sorted_waveform(waveformOut, keyWaveform, waveformIn, injunctionTable, isStoreSlicePixel=True,
+						   blockSizeInBytes=STREAM_BLOCK_SIZE):
+	"""
+	Apply an injunction table on waveforms by blocks of events and append them in a table
+	Parameters:
+		waveformOut : table of the sorted signal
+		keyWaveform : name of the column of waveformOut
+		waveformIn : waveforms to be sorted (event, slice, pixel)
+		injunctionTable : injunction table to be used
+		isStoreSlicePixel : true to store data per slice and pixel, false for pixel and slice
+		blockSizeInBytes : size in bytes of the blocks of events sorted at once
+	"""
+	nbEvent = waveformIn.shape[0]
+	if nbEvent == 0:
+		return
+	nbRowPerBlock = get_table_block_size(waveformOut, blockSizeInBytes)
+	tabSortedBlock = np.empty((min(nbRowPerBlock, nbEvent),) + waveformIn.shape[1:], dtype=waveformIn.dtype)
+	for start in range(0, nbEvent, nbRowPerBlock):
+		waveformBlock = waveformIn[start:start + nbRowPerBlock]
+		tabSorted = apply_injunction_table(waveformBlock, injunctionTable, axis=2, out=tabSortedBlock[:waveformBlock.shape[0]])
+		if not isStoreSlicePixel:
+			tabSorted = tabSorted.swapaxes(1, 2)
+		append_table_block(waveformOut, keyWaveform, tabSorted)
+
+
+class InjunctionTableDecoder(object):
+	"""
+	Decoder of a channel sorted with injunction tables (out[..., i, ...] = waveform[..., injunctionTable[i], ...])
+	The events of a channel are sorted by groups of nbEventPerInjTab consecutive events, one injunction table per group
+	"""
+
+	def __init__(self, tabInjunction, nbEventPerInjTab=0):
+		"""
+		Constructor of the InjunctionTableDecoder
+		Parameters:
+			tabInjunction : injunction tables of the groups of events (nbGroup, nbPixel)
+			nbEventPerInjTab : number of events per injunction table (0 for one injunction table for all the events)
+		"""
+		tabInjunction = np.atleast_2d(tabInjunction)
+		self.nbEventPerInjTab = int(nbEventPerInjTab)
+		# The inverse tables are computed once, the decoding is a gather
+		self.tabDecode = np.stack([get_inverse_injunction_table(injunctionTable) for injunctionTable in tabInjunction])
+
+	def get_group(self, firstRow, nbRow):
+		"""
+		Get the group of events of some consecutive rows
+		Parameters:
+			firstRow : first row
+			nbRow : number of rows
+		Return:
+			index of the group of each row
+		"""
+		if self.nbEventPerInjTab <= 0 or self.tabDecode.shape[0] == 1:
+			return np.zeros(nbRow, dtype=np.intp)
+		tabGroup = np.arange(firstRow, firstRow + nbRow, dtype=np.intp) // self.nbEventPerInjTab
+		return np.minimum(tabGroup, self.tabDecode.shape[0] - 1, out=tabGroup)
+
+	def decode(self, waveform, firstRow, axis=1):
+		"""
+		Decode in place a block of consecutive events
+		Parameters:
+			waveform : block of waveforms of consecutive events (event first)
+			firstRow : row of the first event of the block in the channel
+			axis : axis of the pixels in the waveform block
+		"""
+		nbRow = waveform.shape[0]
+		if nbRow == 0:
+			return
+		tabGroup = self.get_group(firstRow, nbRow)
+		if tabGroup[0] == tabGroup[-1]:
+			waveform[...] = np.take(waveform, self.tabDecode[tabGroup[0]], axis=axis)
+		else:
+			shapeIndex = [1]*waveform.ndim
+			shapeIndex[0] = nbRow
+			shapeIndex[axis] = self.tabDecode.shape[1]
+			tabIndex = self.tabDecode[tabGroup].reshape(shapeIndex)
+			waveform[...] = np.take_along_axis(waveform, tabIndex, axis=axis)
+
+
+def write_order_format(hfile, telNode, orderFormat=ORDER_FORMAT_GATHER):
+	"""
+	Write the format of the orderHi/orderLo arrays of a telescope
+	Parameters:
+		hfile : HDF5 file to be used
+		telNode : telescope node
+		orderFormat : format of the order arrays (ORDER_FORMAT_GATHER or ORDER_FORMAT_SCATTER)
+	"""
+	hfile.create_array(telNode, ORDER_FORMAT_NODE, np.uint64(orderFormat), "Format of the pixels order of the channels")
+
+
+def read_order_format(telNode, defaultOrderFormat=None):
+	"""
+	Read the format of the orderHi/orderLo arrays of a telescope
+	The files written without orderFormat are ambiguous (both formats were written), so their format has to be given
+	Parameters:
+		telNode : telescope node
+		defaultOrderFormat : format of the files written without orderFormat (None to raise a ValueError for these files)
+	Return:
+		ORDER_FORMAT_GATHER or ORDER_FORMAT_SCATTER
+	"""
+	if ORDER_FORMAT_NODE in telNode:
+		orderFormat = int(telNode._f_get_child(ORDER_FORMAT_NODE).read())
+		if orderFormat not in (ORDER_FORMAT_SCATTER, ORDER_FORMAT_GATHER):
+			raise ValueError("read_order_format : unknown format {} of the pixels order in '{}'".format(orderFormat,
+																									  telNode._v_pathname))
+		return orderFormat
+	if defaultOrderFormat is None:
+		raise ValueError("read_order_format : '{}' has no {}, the format of its pixels order has to be given ({} for "
+						 "mchdf5_sigma_mean_sort and mchdf5_mean_sigma_sort, {} for mchdf5_range_sort, mchdf5_injtab_sort "
+						 "and mchdf5_mean_sigma_sort_slice_pixel)".format(telNode._v_pathname, ORDER_FORMAT_NODE,
+																		  ORDER_FORMAT_SCATTER, ORDER_FORMAT_GATHER))
+	return defaultOrderFormat
+
+
+def get_channel_decoder(telNode, tableName, defaultOrderFormat=None):
+	"""
+	Get the decoder of a sorted channel of a telescope
+	The injunction tables are read from the injunctionHi/injunctionLo tables (mchdf5_multiple_sort) or the orderHi/orderLo
+	arrays (other sort programs, whose format is given by orderFormat)
+	Parameters:
+		telNode : telescope node
+		tableName : name of the waveform table (waveformHi or waveformLo)
+		defaultOrderFormat : format of the order arrays of the files written without orderFormat (None to raise a
+							 ValueError for these files)
+	Return:
+		InjunctionTableDecoder of the channel, None if the channel is not sorted
+	"""
+	channelName = tableName[len("waveform"):]
+	nbPixel = int(telNode.nbPixel.read())
+	if "injunction" + channelName in telNode:
+		tabInjunction = telNode._f_get_child("injunction" + channelName).col("tabinj")
+		if "nbEventPerInjTab" in telNode:
+			nbEventPerInjTab = int(telNode.nbEventPerInjTab.read())
+		elif tabInjunction.shape[0] > 1:
+			raise ValueError("get_channel_decoder : unknown number of events per injunction table in '{}'".format(telNode._v_pathname))
+		else:
+			nbEventPerInjTab = 0
+	elif "order" + channelName in telNode:
+		tabInjunction = telNode._f_get_child("order" + channelName).read()
+		nbEventPerInjTab = 0
+		if tabInjunction.shape[-1] == nbPixel and read_order_format(telNode, defaultOrderFormat) == ORDER_FORMAT_SCATTER:
+			tabInjunction = get_inverse_injunction_table(tabInjunction)
+	else:
+		return None
+	if tabInjunction.shape[0] == 0 or tabInjunction.shape[-1] != nbPixel:
+		# The waveforms are not sorted (see mchdf5_injtab_sort)
+		return None
+	return InjunctionTableDecoder(tabInjunction, nbEventPerInjTab)
@@ -6,6 +6,7 @@
 
 import tables
 from .get_telescope_info import *
+from .compression_policy import get_node_filters
 
 
 class SubarrayLayout(tables.IsDescription):
@@ -190,7 +191,8 @@ def create_instrument_dataset(hfile, telInfo_from_evt):
 		telInfo_from_evt : information of telescopes
 	"""
 	# Group: configuration
-	hfile.create_group('/', 'configuration', 'Simulation, telescope and subarray configuration.')
+	hfile.create_group('/', 'configuration', 'Simulation, telescope and subarray configuration.',
+					   filters=get_node_filters(hfile, '/', 'configuration'))
 	# Group : configuration/instrument
 	hfile.create_group('/configuration', 'instrument', 'Instrument information of the run')
 	# Group : configuration/instrument/subarray
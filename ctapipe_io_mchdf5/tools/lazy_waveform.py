@@ -0,0 +1,73 @@
+'''
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+'''
+
+__all__ = ['TelescopeWaveformLoader', 'LazyWaveform', 'get_lazy_waveform']
+
+
+class TelescopeWaveformLoader(object):
+	'''
+	Loader of the raw and calibrated waveforms of a telescope for an event
+	The waveforms are read only once, on the first access of one of them
+	'''
+
+	def __init__(self, loadFunc, *args):
+		'''
+		Constructor of the TelescopeWaveformLoader
+		Parameters:
+		-----------
+			loadFunc : function which returns (r0 waveform, r1 waveform) of the telescope
+			args : arguments of loadFunc
+		'''
+		self.loadFunc = loadFunc
+		self.args = args
+		self.waveforms = None
+
+	def get_waveforms(self):
+		'''
+		Get the waveforms of the telescope (read on the first call)
+		Return:
+		-------
+			r0 waveform, r1 waveform
+		'''
+		if self.waveforms is None:
+			self.waveforms = self.loadFunc(*self.args)
+			self.loadFunc, self.args = None, None
+		return self.waveforms
+
+
+class LazyWaveform(object):
+	'''
+	Placeholder of a waveform which is not read yet
+	Attributes:
+	-----------
+		loader : TelescopeWaveformLoader of the telescope
+		level : 0 for the r0 waveform, 1 for the r1 waveform
+	'''
+
+	def __init__(self, loader, level):
+		self.loader = loader
+		self.level = level
+
+	def load(self):
+		return self.loader.get_waveforms()[self.level]
+
+
+def get_lazy_waveform(container, slotWaveform):
+	'''
+	Get the waveform of a container, it is read if the container still has a LazyWaveform
+	Parameters:
+	-----------
+		container : camera container
+		slotWaveform : descriptor of the waveform field of the base container
+	Return:
+	-------
+		waveform
+	'''
+	waveform = slotWaveform.__get__(container)
+	if isinstance(waveform, LazyWaveform):
+		waveform = waveform.load()
+		slotWaveform.__set__(container, waveform)
+	return waveform
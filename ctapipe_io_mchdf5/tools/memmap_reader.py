@@ -0,0 +1,106 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+
+
+def get_table_chunk_offsets(table):
+	"""
+	Get the offset in the file of the chunks of an uncompressed table
+	Parameters:
+		table : table to be used
+	Return:
+		list of the offset in bytes of each chunk in the file, None if the table cannot be mapped in memory (compressed
+		table, missing chunk, or PyTables < 3.8 which has no direct chunk access)
+	"""
+	if not hasattr(table, "chunk_info") or table.chunkshape is None:
+		return None
+	filters = table.filters
+	if filters.complevel != 0 or filters.fletcher32:
+		return None
+	nbRowPerChunk = int(table.chunkshape[0])
+	chunkSize = nbRowPerChunk*table.dtype.itemsize
+	coordsOther = (0,)*(len(table.shape) - 1)
+	listOffset = list()
+	for start in range(0, table.nrows, nbRowPerChunk):
+		chunkInfo = table.chunk_info((start,) + coordsOther)
+		if chunkInfo.offset is None or chunkInfo.filter_mask != 0 or chunkInfo.size != chunkSize:
+			return None
+		listOffset.append(int(chunkInfo.offset))
+	return listOffset
+
+
+def memmap_table(table):
+	"""
+	Map the rows of an uncompressed table in memory (read only, without copy)
+	The consecutive chunks of the table in the file are mapped at once, so a table written with a single chunk
+	(contiguous table) is mapped with one numpy.memmap
+	Parameters:
+		table : table to be mapped
+	Return:
+		list of (first row, numpy.memmap of the rows), None if the table cannot be mapped
+	"""
+	listOffset = get_table_chunk_offsets(table)
+	if listOffset is None:
+		return None
+	dtype = table.dtype
+	if table.byteorder in ("little", "big"):
+		dtype = dtype.newbyteorder("<" if table.byteorder == "little" else ">")
+	nbRowPerChunk = int(table.chunkshape[0])
+	chunkSize = nbRowPerChunk*dtype.itemsize
+	listSegment = list()
+	firstChunk = 0
+	for i in range(1, len(listOffset) + 1):
+		if i < len(listOffset) and listOffset[i] == listOffset[i - 1] + chunkSize:
+			continue
+		firstRow = firstChunk*nbRowPerChunk
+		nbRow = min(i*nbRowPerChunk, table.nrows) - firstRow
+		listSegment.append((firstRow, np.memmap(table._v_file.filename, dtype=dtype, mode="r",
+												offset=listOffset[firstChunk], shape=(nbRow,))))
+		firstChunk = i
+	return listSegment
+
+
+class TableMemmap(object):
+	"""
+	Blocks of rows of an uncompressed table mapped in memory
+	The table is mapped with one block if it is contiguous in the file, and with one block per chunk otherwise
+	Attributes:
+	-----------
+		blockSize : number of rows of a block
+		listBlock : mapped rows of each block (numpy.memmap or views on a numpy.memmap)
+	"""
+
+	def __init__(self, listSegment, nbRowPerChunk):
+		"""
+		Constructor of the TableMemmap
+		Parameters:
+			listSegment : list of (first row, numpy.memmap of the rows) given by memmap_table
+			nbRowPerChunk : number of rows of a chunk of the table
+		"""
+		if len(listSegment) == 1:
+			self.blockSize = max(1, listSegment[0][1].shape[0])
+			self.listBlock = [listSegment[0][1]]
+			return
+		self.blockSize = nbRowPerChunk
+		self.listBlock = list()
+		for firstRow, segment in listSegment:
+			for start in range(0, segment.shape[0], nbRowPerChunk):
+				self.listBlock.append(segment[start:start + nbRowPerChunk])
+
+
+def get_table_memmap(table):
+	"""
+	Get the blocks of rows of an uncompressed table mapped in memory
+	Parameters:
+		table : table to be mapped
+	Return:
+		TableMemmap of the table, None if the table cannot be mapped
+	"""
+	listSegment = memmap_table(table)
+	if listSegment is None or len(listSegment) == 0:
+		return None
+	return TableMemmap(listSegment, int(table.chunkshape[0]))
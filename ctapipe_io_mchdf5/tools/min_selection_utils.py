@@ -7,9 +7,12 @@
 import tables
 import numpy as np
 from .telescope_copy import copy_telescope_without_waveform
+from .chunk_utils import get_table_chunkshape
+from .compression_policy import get_node_filters
 
 
-def create_min_waveform_table(hfile, cam_tel_group, nameWaveformMinHi, nameMinHi, nbSlice, nbPixel, chunkshape=1):
+def create_min_waveform_table(hfile, cam_tel_group, nameWaveformMinHi, nameMinHi, nbSlice, nbPixel, chunkshape=None,
+							  expectedrows=None):
 	"""
 	Create the table to store the signal without the minimum value and it minimum in an other table
 	Parameters:
@@ -19,19 +22,24 @@ def create_min_waveform_table(hfile, cam_tel_group, nameWaveformMinHi, nameMinHi
 		nameMinHi : name of the table to store the minimum value of the waveform
 		nbSlice : number of slices of the signal
 		nbPixel : number of pixels of the camera
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None for an automatic chunkshape)
+		expectedrows : expected number of events in the waveform table (None if unknown)
 	"""
 	image_shape = (nbSlice, nbPixel)
 	columns_dict_waveformMinHi  = {nameWaveformMinHi: tables.UInt16Col(shape=image_shape)}
 	description_waveformMinHi = type('description columns_dict_waveformMinHi', (tables.IsDescription,), columns_dict_waveformMinHi)
-	hfile.create_table(cam_tel_group, nameWaveformMinHi, description_waveformMinHi, "Table of waveform of the signal without the minimum value", chunkshape=chunkshape)
+	hfile.create_table(cam_tel_group, nameWaveformMinHi, description_waveformMinHi, "Table of waveform of the signal without the minimum value",
+					   chunkshape=get_table_chunkshape(description_waveformMinHi, chunkshape=chunkshape, expectedrows=expectedrows),
+					   filters=get_node_filters(hfile, cam_tel_group, nameWaveformMinHi))
 	
 	columns_dict_minHi  = {nameMinHi: tables.UInt16Col(shape=nbPixel)}
 	description_waveformMinHi = type('description columns_dict_minHi', (tables.IsDescription,), columns_dict_minHi)
-	hfile.create_table(cam_tel_group, nameMinHi, description_waveformMinHi, "Table of the minimum values of the waveform of the signal", chunkshape=chunkshape)
+	hfile.create_table(cam_tel_group, nameMinHi, description_waveformMinHi, "Table of the minimum values of the waveform of the signal",
+					   chunkshape=get_table_chunkshape(description_waveformMinHi, chunkshape=chunkshape, expectedrows=expectedrows),
+					   filters=get_node_filters(hfile, cam_tel_group, nameMinHi))
 
 
-def create_telescope_min_selection_node(outFile, telNode, chunkshape=1):
+def create_telescope_min_selection_node(outFile, telNode, chunkshape=None):
 	"""
 	Create the telescope group and table
 	It is important not to add an other dataset with the type of the camera to simplify the serach of a telescope by telescope index in the file structure
@@ -39,21 +47,24 @@ def create_telescope_min_selection_node(outFile, telNode, chunkshape=1):
 	-----------
 		outFile : HDF5 file to be used
 		telNode : telescope node to be copied
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None for an automatic chunkshape)
 	"""
-	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape)
+	cam_tel_group = copy_telescope_without_waveform(outFile, telNode, chunkshape=chunkshape)
 	
 	nbPixel = np.uint64(telNode.nbPixel.read())
 	nbSlice = np.uint64(telNode.nbSlice.read())
+	nbEvent = telNode.waveformHi.nrows
 	
-	create_min_waveform_table(outFile, cam_tel_group, "waveformHi", "minHi", nbSlice, nbPixel, chunkshape=chunkshape)
+	create_min_waveform_table(outFile, cam_tel_group, "waveformHi", "minHi", nbSlice, nbPixel, chunkshape=chunkshape,
+							  expectedrows=nbEvent)
 	
 	nbGain = np.uint64(telNode.nbGain.read())
 	if nbGain > 1:
-		create_min_waveform_table(outFile, cam_tel_group, "waveformLo", "minLo", nbSlice, nbPixel, chunkshape=chunkshape)
+		create_min_waveform_table(outFile, cam_tel_group, "waveformLo", "minLo", nbSlice, nbPixel, chunkshape=chunkshape,
+								  expectedrows=nbEvent)
 
 
-def create_all_telescope_min_selected(outFile, inFile, nbEventPerMin, chunkshape=1):
+def create_all_telescope_min_selected(outFile, inFile, nbEventPerMin, chunkshape=None):
 	"""
 	Create all the telescope with the minimum selection
 	Parameters:
@@ -61,7 +72,7 @@ def create_all_telescope_min_selected(outFile, inFile, nbEventPerMin, chunkshape
 		outFile : output file
 		inFile : input file
 		nbEventPerMin : number of events to be used to compute one minimum
-		chunkshape : shape of the chunk to be used to store the data of waveform and minimum
+		chunkshape : shape of the chunk to be used to store the data of waveform and minimum (None for an automatic chunkshape)
 	"""
 	outFile.create_group("/", 'r1', 'Raw data waveform informations of the run')
 	for telNode in inFile.walk_nodes("/r1", "Group"):
@@ -0,0 +1,191 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+import tables
+
+from .compression_policy import read_compression_policy, write_compression_policy
+from .file_merge import copy_node_raw_chunks
+
+
+def get_telescope_names(hfile, telGroupName="/r1"):
+	"""
+	Get the name of the telescopes groups of a file
+	Parameters:
+		hfile : HDF5 file to be used
+		telGroupName : name of the group which contains the telescopes groups
+	Return:
+		list of the name of the telescopes groups (Tel_N)
+	"""
+	return [telNode._v_name for telNode in hfile.iter_nodes(telGroupName, "Group")]
+
+
+def process_telescope(outFile, inFile, telName, createTelescopeFunc, processTelescopeFunc, telGroupName="/r1",
+					  outTelGroupName=None):
+	"""
+	Create and fill a telescope of the output file
+	Parameters:
+		outFile : output file
+		inFile : input file
+		telName : name of the telescope group (Tel_N)
+		createTelescopeFunc : function(outFile, telNodeIn) which creates the telescope group in the output file
+		processTelescopeFunc : function(outFile, telNodeOut, telNodeIn) which fills the output telescope
+		telGroupName : name of the group which contains the telescopes groups
+		outTelGroupName : name of the group which contains the telescopes groups in the output file (None for telGroupName)
+	Return:
+		True if the telescope was processed, False otherwise
+	"""
+	telNodeIn = inFile.get_node(telGroupName, telName)
+	try:
+		createTelescopeFunc(outFile, telNodeIn)
+		telNodeOut = outFile.get_node(outTelGroupName or telGroupName, telName)
+		processTelescopeFunc(outFile, telNodeOut, telNodeIn)
+		return True
+	except tables.exceptions.NoSuchNodeError as e:
+		print("process_telescope : telescope", telName, "skipped :", e)
+		return False
+
+
+class TelescopeTask(object):
+	"""
+	Processing of a telescope of an input file in a temporary file, executed by the workers of iter_telescope_tasks
+	The functions and their arguments (functools.partial) have to be picklable.
+	Attributes:
+	-----------
+		inputFileName : name of the input file
+		tmpFileName : name of the temporary file
+		filters : filters of the temporary file
+		telName : name of the telescope group (Tel_N)
+		createTelescopeFunc : function(outFile, telNodeIn) which creates the telescope group in the output file
+		processTelescopeFunc : function(outFile, telNodeOut, telNodeIn) which fills the output telescope
+		telGroupName : name of the group which contains the telescopes groups
+		outTelGroupName : name of the group which contains the telescopes groups in the output file (None for telGroupName)
+		compressionPolicy : CompressionPolicy of the output file, written in the temporary file (None if there is no policy)
+	"""
+
+	def __init__(self, inputFileName, tmpFileName, filters, telName, createTelescopeFunc, processTelescopeFunc,
+				 telGroupName="/r1", outTelGroupName=None, compressionPolicy=None):
+		self.inputFileName = inputFileName
+		self.tmpFileName = tmpFileName
+		self.filters = filters
+		self.telName = telName
+		self.createTelescopeFunc = createTelescopeFunc
+		self.processTelescopeFunc = processTelescopeFunc
+		self.telGroupName = telGroupName
+		self.outTelGroupName = outTelGroupName or telGroupName
+		self.compressionPolicy = compressionPolicy
+
+	def __call__(self):
+		"""
+		Process the telescope in the temporary file
+		Return:
+			name of the temporary file, None if the telescope was not processed
+		"""
+		inFile = tables.open_file(self.inputFileName, "r")
+		tmpFile = tables.open_file(self.tmpFileName, "w", filters=self.filters)
+		try:
+			if self.compressionPolicy is not None:
+				write_compression_policy(tmpFile, self.compressionPolicy)
+			parentName, groupName = os.path.split(self.outTelGroupName.rstrip("/"))
+			tmpFile.create_group(parentName, groupName, createparents=True)
+			isProcessed = process_telescope(tmpFile, inFile, self.telName, self.createTelescopeFunc,
+											self.processTelescopeFunc, telGroupName=self.telGroupName,
+											outTelGroupName=self.outTelGroupName)
+		finally:
+			tmpFile.close()
+			inFile.close()
+		return self.tmpFileName if isProcessed else None
+
+	def merge(self, outFile):
+		"""
+		Copy the telescope of the temporary file in the output file and remove the temporary file
+		The output tables are new and have the filters and chunkshape of the temporary ones, so their compressed chunks
+		are copied without being decompressed (see copy_node_raw_chunks)
+		Parameters:
+			outFile : output file (the outTelGroupName group has to exist)
+		"""
+		with tables.open_file(self.tmpFileName, "r") as tmpFile:
+			copy_node_raw_chunks(outFile, tmpFile.get_node(self.outTelGroupName, self.telName),
+								 outFile.get_node(self.outTelGroupName))
+		os.remove(self.tmpFileName)
+
+
+def _run_telescope_task(task):
+	"""
+	Run a TelescopeTask (for Pool.imap)
+	Parameters:
+		task : TelescopeTask to be run
+	Return:
+		name of the temporary file, None if the telescope was not processed
+	"""
+	return task()
+
+
+def iter_telescope_tasks(listTask, nbProcess):
+	"""
+	Run TelescopeTask in a pool of processes
+	The results are given in the order of the tasks, so the merging of the telescopes does not depend on the number of
+	processes, and the telescopes are merged as soon as they are ready
+	Parameters:
+		listTask : iterable of TelescopeTask
+		nbProcess : number of processes to be used (the tasks are run by the current process if nbProcess <= 1)
+	Return:
+		generator of (task, name of the temporary file or None if the telescope was not processed)
+	"""
+	listTask = list(listTask)
+	if len(listTask) == 0:
+		return
+	if nbProcess <= 1:
+		for task in listTask:
+			yield task, task()
+		return
+	with Pool(max(1, min(nbProcess, len(listTask)))) as pool:
+		yield from zip(listTask, pool.imap(_run_telescope_task, listTask))
+
+
+def process_all_telescopes(outFile, inFile, createTelescopeFunc, processTelescopeFunc, nbProcess=1, telGroupName="/r1",
+						   outTelGroupName=None):
+	"""
+	Create and fill all the telescopes of the output file
+	The telescopes are independent, so with nbProcess > 1 they are processed by a pool of processes.
+	Each worker reads the input file and writes its telescope in a temporary file, which is merged in the output
+	file by the main process (in the order of the input telescopes).
+	The functions and their arguments (functools.partial) have to be picklable.
+	Parameters:
+		outFile : output file (the outTelGroupName group has to exist)
+		inFile : input file
+		createTelescopeFunc : function(outFile, telNodeIn) which creates the telescope group in the output file
+		processTelescopeFunc : function(outFile, telNodeOut, telNodeIn) which fills the output telescope
+		nbProcess : number of processes to be used
+		telGroupName : name of the group which contains the telescopes groups
+		outTelGroupName : name of the group which contains the telescopes groups in the output file (None for telGroupName)
+	"""
+	listTelName = get_telescope_names(inFile, telGroupName)
+	if nbProcess <= 1 or len(listTelName) <= 1:
+		for telName in listTelName:
+			process_telescope(outFile, inFile, telName, createTelescopeFunc, processTelescopeFunc, telGroupName=telGroupName,
+							  outTelGroupName=outTelGroupName)
+		return
+
+	# Temporary files next to the output file, to stay on the same file system
+	tmpDir = tempfile.mkdtemp(prefix="mchdf5_tmp_", dir=os.path.dirname(os.path.abspath(outFile.filename)))
+	try:
+		compressionPolicy = read_compression_policy(outFile)
+		listTask = [TelescopeTask(inFile.filename, os.path.join(tmpDir, telName + ".h5"), outFile.filters, telName,
+								  createTelescopeFunc, processTelescopeFunc, telGroupName, outTelGroupName,
+								  compressionPolicy=compressionPolicy)
+					for telName in listTelName]
+		for task, tmpFileName in iter_telescope_tasks(listTask, nbProcess):
+			if tmpFileName is None:
+				continue
+			task.merge(outFile)
+			print("process_all_telescopes : telescope", task.telName, "merged")
+	finally:
+		shutil.rmtree(tmpDir, ignore_errors=True)
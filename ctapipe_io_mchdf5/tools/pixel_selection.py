@@ -0,0 +1,291 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+
+# Maximum number of neighbours of a pixel (hexagonal pixels, the square pixels have 4 neighbours)
+MAX_NB_NEIGHBOUR = 6
+# A pixel is a neighbour if its distance is less than NEIGHBOUR_RADIUS times the distance of the closest pixel, as in
+# ctapipe : the 6 closest pixels of a hexagonal camera, and the 4 closest pixels of a square camera (the diagonal
+# pixels, at sqrt(2) times the distance of the closest pixel, are not neighbours)
+NEIGHBOUR_RADIUS = 1.4
+
+
+def get_neighbour_matrix(tabPixelX, tabPixelY, radius=NEIGHBOUR_RADIUS, maxNbNeighbour=MAX_NB_NEIGHBOUR, blockSize=1024):
+	"""
+	Get the neighbour matrix of a camera in a sparse (ELLPACK) form : the index of the neighbours of each pixel
+	The rows are padded with nbPixel, the index of a virtual pixel which is never selected
+	Parameters:
+		tabPixelX : x position of the pixels
+		tabPixelY : y position of the pixels
+		radius : a pixel is a neighbour if its distance is less than radius times the distance of the closest pixel
+		maxNbNeighbour : maximum number of neighbours of a pixel
+		blockSize : number of pixels processed at once (the distances of a block take blockSize*nbPixel floats)
+	Return:
+		index of the neighbours of each pixel (nbPixel, nbNeighbour), padded with nbPixel
+	"""
+	tabPos = np.stack((np.asarray(tabPixelX, dtype=np.float64), np.asarray(tabPixelY, dtype=np.float64)), axis=1)
+	nbPixel = tabPos.shape[0]
+	nbCandidate = min(maxNbNeighbour + 1, nbPixel)
+	tabNeighbour = np.full((nbPixel, max(nbCandidate - 1, 0)), nbPixel, dtype=np.intp)
+	for start in range(0, nbPixel, blockSize):
+		stop = min(start + blockSize, nbPixel)
+		tabDist = np.hypot(tabPos[start:stop, np.newaxis, 0] - tabPos[:, 0], tabPos[start:stop, np.newaxis, 1] - tabPos[:, 1])
+		tabDist[np.arange(stop - start), np.arange(start, stop)] = np.inf
+		tabCandidate = np.argpartition(tabDist, nbCandidate - 2, axis=1)[:, :nbCandidate - 1]
+		tabCandidateDist = np.take_along_axis(tabDist, tabCandidate, axis=1)
+		tabIsNeighbour = tabCandidateDist < radius*tabCandidateDist.min(axis=1, keepdims=True)
+		tabNeighbour[start:stop] = np.where(tabIsNeighbour, tabCandidate, nbPixel)
+	# Keep only the columns used by at least one pixel
+	nbNeighbour = int((tabNeighbour != nbPixel).sum(axis=1).max(initial=0))
+	tabNeighbour.sort(axis=1)
+	return np.ascontiguousarray(tabNeighbour[:, :nbNeighbour])
+
+
+def count_neighbours(tabMask, tabNeighbour):
+	"""
+	Count the selected neighbours of each pixel of a block of events (product of the masks with the neighbour matrix)
+	Parameters:
+		tabMask : mask of the selected pixels (nbEvent, nbPixel)
+		tabNeighbour : neighbour matrix of the camera (see get_neighbour_matrix)
+	Return:
+		number of selected neighbours of each pixel (nbEvent, nbPixel)
+	"""
+	tabMaskPadded = np.zeros((tabMask.shape[0], tabMask.shape[1] + 1), dtype=np.uint8)
+	tabMaskPadded[:, :-1] = tabMask
+	return tabMaskPadded[:, tabNeighbour].sum(axis=2, dtype=np.int32)
+
+
+def integrate_waveform_block(tabWaveform, tabPedestal, tabGain, isSlicePixel=True):
+	"""
+	Calibrate and integrate a block of waveforms : (sum of the slices - pedestal) * gain
+	Parameters:
+		tabWaveform : waveforms of a block of events (nbEvent, nbSlice, nbPixel) or (nbEvent, nbPixel, nbSlice)
+		tabPedestal : pedestal of the pixels, sum over the slices (nbPixel)
+		tabGain : gain of the pixels (nbPixel)
+		isSlicePixel : True if the waveforms are stored by (slice, pixel)
+	Return:
+		calibrated and integrated signal, float32 (nbEvent, nbPixel)
+	"""
+	tabSignal = tabWaveform.sum(axis=1 if isSlicePixel else 2, dtype=np.float32)
+	np.subtract(tabSignal, np.asarray(tabPedestal, dtype=np.float32), out=tabSignal)
+	np.multiply(tabSignal, np.asarray(tabGain, dtype=np.float32), out=tabSignal)
+	return tabSignal
+
+
+def tailcut_cleaning_block(tabImage, tabNeighbour, pictureThreshold, boundaryThreshold, keepIsolatedPixels=False,
+						   minNumberPictureNeighbours=0):
+	"""
+	Tailcut cleaning of a block of images (same selection as ctapipe.image.tailcuts_clean)
+	Parameters:
+		tabImage : calibrated and integrated images (nbEvent, nbPixel)
+		tabNeighbour : neighbour matrix of the camera (see get_neighbour_matrix)
+		pictureThreshold : threshold of the picture pixels
+		boundaryThreshold : threshold of the boundary pixels
+		keepIsolatedPixels : True to keep the picture pixels without neighbour in the picture or the boundary
+		minNumberPictureNeighbours : minimum number of picture neighbours of a picture pixel
+	Return:
+		mask of the selected pixels (nbEvent, nbPixel)
+	"""
+	tabAbovePicture = tabImage >= pictureThreshold
+	if keepIsolatedPixels or minNumberPictureNeighbours == 0:
+		tabInPicture = tabAbovePicture
+	else:
+		tabInPicture = tabAbovePicture & (count_neighbours(tabAbovePicture, tabNeighbour) >= minNumberPictureNeighbours)
+	tabAboveBoundary = tabImage >= boundaryThreshold
+	tabWithPictureNeighbour = count_neighbours(tabInPicture, tabNeighbour) > 0
+	if keepIsolatedPixels:
+		return (tabAboveBoundary & tabWithPictureNeighbour) | tabInPicture
+	tabWithBoundaryNeighbour = count_neighbours(tabAboveBoundary, tabNeighbour) > 0
+	return (tabAboveBoundary & tabWithPictureNeighbour) | (tabInPicture & tabWithBoundaryNeighbour)
+
+
+def dilation_block(tabImage, tabMask, tabNeighbour, nbRing, threshold):
+	"""
+	Dilate the selection of a block of images : add nbRing times the neighbours of the selected pixels above threshold
+	Parameters:
+		tabImage : calibrated and integrated images (nbEvent, nbPixel)
+		tabMask : mask of the pixels selected by the cleaning (nbEvent, nbPixel)
+		tabNeighbour : neighbour matrix of the camera (see get_neighbour_matrix)
+		nbRing : number of rings of pixels to be added around the selected pixels
+		threshold : minimum signal of the added pixels
+	Return:
+		mask of the selected pixels (nbEvent, nbPixel)
+	"""
+	tabMask = tabMask.copy()
+	tabAboveThreshold = tabImage >= threshold
+	for i in range(nbRing):
+		tabMask |= tabAboveThreshold & (count_neighbours(tabMask, tabNeighbour) > 0)
+	return tabMask
+
+
+def tailcut_dilation_block(tabImage, tabNeighbour, center, neighbours, minNumberPictureNeighbours, nbRing,
+						   dilationThreshold=None):
+	"""
+	Tailcut cleaning and dilation of a block of images
+	Parameters:
+		tabImage : calibrated and integrated images (nbEvent, nbPixel)
+		tabNeighbour : neighbour matrix of the camera (see get_neighbour_matrix)
+		center : picture threshold of the tailcut cleaning
+		neighbours : boundary threshold of the tailcut cleaning
+		minNumberPictureNeighbours : minimum number of picture neighbours of a picture pixel
+		nbRing : number of rings of the dilation
+		dilationThreshold : minimum signal of the pixels added by the dilation (default center/3)
+	Return:
+		mask of the selected pixels (nbEvent, nbPixel)
+	"""
+	# center/3 From Lenka presentation about Intelligent cleaning
+	if dilationThreshold is None:
+		dilationThreshold = center/3
+	tabMask = tailcut_cleaning_block(tabImage, tabNeighbour, center, neighbours, False, minNumberPictureNeighbours)
+	return dilation_block(tabImage, tabMask, tabNeighbour, nbRing, dilationThreshold)
+
+
+class TailcutDilationSelector(object):
+	"""
+	Pixel selection of the events of a telescope with a tailcut cleaning and a dilation, computed on blocks of events
+	"""
+
+	def __init__(self, tabNeighbour, tabPedestal, tabGain, center=4, neighbours=2, minNumberPictureNeighbours=2,
+				 nbRing=0, dilationThreshold=None):
+		"""
+		Constructor of the TailcutDilationSelector
+		Parameters:
+			tabNeighbour : neighbour matrix of the camera (see get_neighbour_matrix)
+			tabPedestal : pedestal of the pixels of the high gain, sum over the slices (nbPixel)
+			tabGain : gain of the pixels of the high gain (nbPixel)
+			center : picture threshold of the tailcut cleaning
+			neighbours : boundary threshold of the tailcut cleaning
+			minNumberPictureNeighbours : minimum number of picture neighbours of a picture pixel
+			nbRing : number of rings of the dilation
+			dilationThreshold : minimum signal of the pixels added by the dilation (default center/3)
+		"""
+		self.tabNeighbour = tabNeighbour
+		self.tabPedestal = np.asarray(tabPedestal, dtype=np.float32)
+		self.tabGain = np.asarray(tabGain, dtype=np.float32)
+		self.center = center
+		self.neighbours = neighbours
+		self.minNumberPictureNeighbours = minNumberPictureNeighbours
+		self.nbRing = nbRing
+		self.dilationThreshold = dilationThreshold
+
+	def select_signal(self, tabSignal):
+		"""
+		Select the pixels of a block of calibrated and integrated images
+		Parameters:
+			tabSignal : calibrated and integrated images (nbEvent, nbPixel)
+		Return:
+			mask of the selected pixels (nbEvent, nbPixel)
+		"""
+		return tailcut_dilation_block(tabSignal, self.tabNeighbour, self.center, self.neighbours,
+									  self.minNumberPictureNeighbours, self.nbRing, self.dilationThreshold)
+
+	def select_block(self, tabWaveform, isSlicePixel=True):
+		"""
+		Calibrate, integrate and select the pixels of a block of events
+		Parameters:
+			tabWaveform : high gain waveforms of a block of events (nbEvent, nbSlice, nbPixel) or (nbEvent, nbPixel, nbSlice)
+			isSlicePixel : True if the waveforms are stored by (slice, pixel)
+		Return:
+			calibrated and integrated signal (nbEvent, nbPixel), mask of the selected pixels (nbEvent, nbPixel)
+		"""
+		tabSignal = integrate_waveform_block(tabWaveform, self.tabPedestal, self.tabGain, isSlicePixel)
+		return tabSignal, self.select_signal(tabSignal)
+
+
+def get_camera_pixel_position(hfile, telGroupName="/r1"):
+	"""
+	Get the position of the pixels of the cameras of the telescopes of a file
+	The camera groups (/instrument/subarray/telescope/camera) are in the same order as the telescopes groups
+	Parameters:
+		hfile : HDF5 file to be used
+		telGroupName : name of the group which contains the telescopes groups
+	Return:
+		dictionnary of (x position, y position) of the pixels, indexed by name of the telescope group (Tel_N)
+	"""
+	dicoPixelPosition = dict()
+	listCamNode = list()
+	if "/instrument/subarray/telescope/camera" in hfile:
+		listCamNode = list(hfile.walk_nodes("/instrument/subarray/telescope/camera", "Group"))
+	for telNode, camNode in zip(hfile.walk_nodes(telGroupName, "Group"), listCamNode):
+		if "pix_x" in camNode and "pix_y" in camNode:
+			dicoPixelPosition[telNode._v_name] = (camNode.pix_x.read(), camNode.pix_y.read())
+	return dicoPixelPosition
+
+
+def get_telescope_calibration(telNode):
+	"""
+	Get the calibration of the high gain of a telescope
+	Parameters:
+		telNode : telescope node (pedestal and tabGain)
+	Return:
+		pedestal of the pixels, sum over the slices (nbPixel), gain of the pixels (nbPixel)
+	"""
+	tabPedestal = np.atleast_2d(telNode.pedestal.read()["pedestal"][0])
+	tabGain = np.atleast_2d(telNode.tabGain.read())
+	return tabPedestal[0], tabGain[0]
+
+
+def get_telescope_selector(telNode, tabPixelX, tabPixelY, center, neighbours, minNumberPictureNeighbours, nbRing):
+	"""
+	Create the TailcutDilationSelector of a telescope from its pedestal and gain
+	Parameters:
+		telNode : telescope node (nbSlice, pedestal and tabGain)
+		tabPixelX : x position of the pixels of the camera
+		tabPixelY : y position of the pixels of the camera
+		center : picture threshold of the tailcut cleaning
+		neighbours : boundary threshold of the tailcut cleaning
+		minNumberPictureNeighbours : minimum number of picture neighbours of a picture pixel
+		nbRing : number of rings of the dilation
+	Return:
+		TailcutDilationSelector of the telescope (the high gain is used for the selection)
+	"""
+	tabPedestal, tabGain = get_telescope_calibration(telNode)
+	return TailcutDilationSelector(get_neighbour_matrix(tabPixelX, tabPixelY), tabPedestal, tabGain, center, neighbours,
+								   minNumberPictureNeighbours, nbRing)
+
+
+def append_dl0_block(telNodeOut, tabWaveform, tabSignal, tabMask, isSlicePixel=True):
+	"""
+	Append the selected pixels of a block of events in the tables of a DL0-V2 telescope (see dl0_utils.create_dl0_table_tel)
+	The high gain is kept for all the pixels, so the events have no pixel in low gain mode
+	Parameters:
+		telNodeOut : output telescope node
+		tabWaveform : high gain waveforms of the block of events (nbEvent, nbSlice, nbPixel) or (nbEvent, nbPixel, nbSlice)
+		tabSignal : calibrated and integrated signal (nbEvent, nbPixel)
+		tabMask : mask of the selected pixels (nbEvent, nbPixel)
+		isSlicePixel : True if the waveforms are stored by (slice, pixel)
+	"""
+	nbEvent = tabMask.shape[0]
+	if nbEvent == 0:
+		return
+	if isSlicePixel:
+		tabWaveform = tabWaveform.swapaxes(1, 2)
+	tableWaveform = telNodeOut.waveform
+	tabNbSelected = tabMask.sum(axis=1)
+	tabOffset = np.zeros(nbEvent, dtype=np.uint64)
+	np.cumsum(tabNbSelected[:-1], out=tabOffset[1:])
+	tabOffset += np.uint64(tableWaveform.nrows)
+
+	tabEvent, tabPixel = np.nonzero(tabMask)
+	tabSelectedWaveform = np.zeros(tabEvent.shape[0], dtype=tableWaveform.dtype)
+	tabSelectedWaveform["waveform"] = tabWaveform[tabEvent, tabPixel]
+	tableWaveform.append(tabSelectedWaveform)
+
+	tabPixel = tabPixel.astype(np.uint16)
+	tabSplit = np.cumsum(tabNbSelected[:-1])
+	for tabPixelEvent in np.split(tabPixel, tabSplit):
+		telNodeOut.pixelWaveform.append(tabPixelEvent)
+	if "pixelLo" in telNodeOut:
+		tabNoPixel = np.zeros(0, dtype=np.uint16)
+		for i in range(nbEvent):
+			telNodeOut.pixelLo.append(tabNoPixel)
+
+	tableSignal = telNodeOut.signal
+	tabRowSignal = np.zeros(nbEvent, dtype=tableSignal.dtype)
+	tabRowSignal["signal"] = np.clip(np.rint(tabSignal), np.iinfo(np.int16).min, np.iinfo(np.int16).max)
+	tabRowSignal["waveformoffset"] = tabOffset
+	tableSignal.append(tabRowSignal)
@@ -7,45 +7,66 @@
 import tables
 
 from .simulation_utils import create_simulation_dataset
-from .instrument_utils import create_instrument_dataset
-from .r0_utils import create_r0_dataset
+from .instrument_utils import create_instrument_dataset, create_camera_table
+from .r0_utils import create_r0_dataset, create_tel_group_and_table, fill_monitoring_subarray
+from .compression_policy import write_compression_policy
 
 
-def open_output_file(fileName, compressionLevel=0):
+def open_output_file(fileName, compressionLevel=0, compressionPolicy=None):
 	"""
 	Open the output HDF5 file to be used
 	Parameters:
 		fileName : name of the file to be opened
 		compressionLevel : expected compression level (from 0 (no compression, default) to 9)
+		compressionPolicy : CompressionPolicy of the datasets, written in the file (None to use compressionLevel for all
+							the datasets)
 	"""
 	if compressionLevel == 0:
 		hfile = tables.open_file(fileName, mode="w")
-		hfile.title = "R0-V2"
-		return hfile
 	else:
 		zstdFilter = tables.Filters(complevel=compressionLevel, complib='blosc:zstd', shuffle=False, bitshuffle=False,
 									fletcher32=False)
 		hfile = tables.open_file(fileName, mode="w", filters=zstdFilter)
-		hfile.title = "R0-V2"
-		return hfile
-	
+	hfile.title = "R0-V2"
+	if compressionPolicy is not None:
+		write_compression_policy(hfile, compressionPolicy)
+	return hfile
 
-def create_file_structure(hfile, telInfo_from_evt, enableSimulation=True):
+
+def create_file_structure(hfile, telInfo_from_evt, enableSimulation=True, chunkshape=None, contiguous=False):
 	"""
 	Create the structure of the HDF5 file
 	Parameters:
 		hfile : HDF5 file to be used
 		telInfo_from_evt : information of telescopes
 		enableSimulation : True (default) enable the creation of the simulation structure, False disable this creation
+		chunkshape : number of rows per chunk of the event tables (None for an automatic chunkshape)
+		contiguous : True to store the waveforms of each telescope contiguously (one chunk with all the events of the
+					 telescope, the number of events of the telescopes has to be known)
 	Return:
 		table of mc_event or None if enableSimulation==False
 	"""
-	create_r0_dataset(hfile, telInfo_from_evt)
+	create_r0_dataset(hfile, telInfo_from_evt, chunkshape=chunkshape, contiguous=contiguous)
 	create_instrument_dataset(hfile, telInfo_from_evt)
 	if enableSimulation:
-		tableMcEvent = create_simulation_dataset(hfile)
+		tableMcEvent = create_simulation_dataset(hfile, chunkshape=chunkshape)
 		return tableMcEvent
 	else:
 		return None
 
 
+def add_telescope_in_file_structure(hfile, telId, telInfo, chunkshape=None):
+	"""
+	Create the tables of a telescope seen for the first time in the event stream (single pass conversion)
+	The file structure has to be created with create_file_structure before
+	Parameters:
+		hfile : HDF5 file to be used
+		telId : id of the telescope
+		telInfo : table of some informations related to the telescope
+		chunkshape : number of rows per chunk of the event tables (None for an automatic chunkshape)
+	"""
+	mon_subarray = hfile.root.r0.monitoring.subarray
+	if not 'pointing' in mon_subarray:
+		fill_monitoring_subarray(hfile, mon_subarray, {telId: telInfo})
+	create_tel_group_and_table(hfile, telId, telInfo, chunkshape=chunkshape)
+	create_camera_table(hfile, telInfo)
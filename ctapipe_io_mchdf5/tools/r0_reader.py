@@ -0,0 +1,183 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import tables
+import numpy as np
+
+from .event_index import create_event_index_from_trigger
+from .dl0_reader import read_vlarray_block
+from .waveform_reader import WaveformBlockReader, READER_BLOCK_SIZE, READER_MEMORY_BUDGET
+
+# Group of the waveform tables of the telescopes of the r0 layout (one table tel_XXX per telescope)
+R0_WAVEFORM_GROUP = "/r0/event/telescope/waveform"
+# Group of the monitoring of the telescopes of the r0 layout (information, pedestal, gain and pointing)
+R0_MONITORING_GROUP = "/r0/monitoring/telescope"
+# Number of rows of the tels_with_trigger vlarray read at once
+R0_TRIGGER_BLOCK_SIZE = 65536
+
+
+def get_r0_table_name(telId):
+	"""
+	Get the name of the tables of a telescope in the r0 layout
+	Parameters:
+		telId : id of the telescope
+	Return:
+		name of the tables of the telescope (tel_XXX)
+	"""
+	return 'tel_{0:0=3d}'.format(telId)
+
+
+class R0TelescopeMonitoring(object):
+	"""
+	Monitoring of a telescope of the r0 layout, read once for the whole run
+	Attributes:
+	-----------
+		telId : id of the telescope
+		telType : type of the camera of the telescope
+		telIndex : index of the telescope
+		nbPixel : number of pixels of the camera
+		nbGain : number of gains of the camera
+		nbSlice : number of slices of the waveforms
+		pedestal : pedestal of the first row of the pedestal table (nbGain, nbPixel), sum over the slices (None if unknown)
+		gain : gain of the telescope (nbGain, nbPixel) (None if unknown)
+	"""
+
+	def __init__(self, telId, telType, telIndex, nbPixel, nbGain, nbSlice, pedestal=None, gain=None):
+		self.telId = telId
+		self.telType = telType
+		self.telIndex = telIndex
+		self.nbPixel = nbPixel
+		self.nbGain = nbGain
+		self.nbSlice = nbSlice
+		self.pedestal = pedestal
+		self.gain = gain
+
+
+def read_r0_monitoring(hfile):
+	"""
+	Read the monitoring of all the telescopes of a r0 file
+	Parameters:
+		hfile : HDF5 file to be used
+	Return:
+		dictionnary of R0TelescopeMonitoring by telescope id
+	"""
+	dicoMonitoring = dict()
+	monitoringGroup = hfile.get_node(R0_MONITORING_GROUP)
+	for tableInfo in hfile.iter_nodes(monitoringGroup.information, "Table"):
+		if tableInfo.nrows == 0:
+			continue
+		rowInfo = tableInfo.read(0, 1)[0]
+		telId = int(rowInfo["tel_id"])
+		tableName = get_r0_table_name(telId)
+		pedestal, gain = None, None
+		if tableName in monitoringGroup.pedestal:
+			tablePedestal = monitoringGroup.pedestal._f_get_child(tableName)
+			if tablePedestal.nrows > 0:
+				pedestal = tablePedestal.read(0, 1, field="pedestal")[0]
+		if tableName in monitoringGroup.gain:
+			gain = monitoringGroup.gain._f_get_child(tableName).read()
+		dicoMonitoring[telId] = R0TelescopeMonitoring(telId, int(rowInfo["tel_type"]), int(rowInfo["tel_index"]),
+													  int(rowInfo["nb_pixel"]), int(rowInfo["nb_gain"]),
+													  int(rowInfo["nb_slice"]), pedestal, gain)
+	return dicoMonitoring
+
+
+def read_r0_event_index(hfile, dicoTelIndex=None, blockSize=R0_TRIGGER_BLOCK_SIZE):
+	"""
+	Read the event index of a r0 file from its subarray trigger table and its tels_with_trigger vlarray
+	Parameters:
+		hfile : HDF5 file to be used
+		dicoTelIndex : index of each telescope id (telId - 1 if None)
+		blockSize : number of rows of the tels_with_trigger vlarray read at once
+	Return:
+		EventIndex in the order of the trigger table, with the rows of the events in the waveform tables of the telescopes
+	"""
+	subarrayGroup = hfile.root.r0.event.subarray
+	tabEventId = subarrayGroup.trigger.col("event_id")
+	vlarrayTelWithTrigger = subarrayGroup.tels_with_trigger
+	listTabTelId, listTabNbTel = list(), list()
+	for start in range(0, vlarrayTelWithTrigger.nrows, blockSize):
+		tabTelId, tabOffset = read_vlarray_block(vlarrayTelWithTrigger, start, min(start + blockSize, vlarrayTelWithTrigger.nrows))
+		listTabTelId.append(tabTelId)
+		listTabNbTel.append(np.diff(tabOffset))
+	tabOffset = np.zeros(vlarrayTelWithTrigger.nrows + 1, dtype=np.uint64)
+	if len(listTabNbTel) != 0:
+		np.cumsum(np.concatenate(listTabNbTel), out=tabOffset[1:])
+	tabTelId = np.concatenate(listTabTelId) if len(listTabTelId) != 0 else np.zeros(0, dtype=np.uint64)
+	return create_event_index_from_trigger(tabEventId, tabTelId, tabOffset, dicoTelIndex)
+
+
+class R0WaveformBlockReader(WaveformBlockReader):
+	"""
+	Prefetching reader of the waveform tables of the telescopes of the r0 layout (/r0/event/telescope/waveform/tel_XXX)
+	The waveformHi and waveformLo columns of a telescope are in the same table, so the rows of a block are read once
+	for all the channels
+	"""
+
+	def __init__(self, hfile, telGroupName=R0_WAVEFORM_GROUP, blockSizeInBytes=READER_BLOCK_SIZE,
+				 memoryBudget=READER_MEMORY_BUDGET, memoryMap=False):
+		"""
+		Constructor of the R0WaveformBlockReader
+		Parameters:
+			hfile : HDF5 file to be read
+			telGroupName : name of the group which contains the waveform tables of the telescopes
+			blockSizeInBytes : expected size in bytes of a block of rows
+			memoryBudget : maximum size in bytes of the cached blocks
+			memoryMap : True to map the uncompressed tables in memory instead of reading them
+		"""
+		super().__init__(hfile, telGroupName, blockSizeInBytes=blockSizeInBytes, memoryBudget=memoryBudget,
+						 memoryMap=memoryMap)
+
+	def get_telescope_node(self, telId):
+		"""
+		Get the waveform table of a telescope (resolved once)
+		Parameters:
+			telId : id of the telescope
+		Return:
+			waveform table of the telescope
+		"""
+		try:
+			return self.dicoTelNode[telId]
+		except KeyError:
+			telNode = self.hfile.get_node(self.telGroupName, get_r0_table_name(telId))
+			self.dicoTelNode[telId] = telNode
+			return telNode
+
+	def get_table(self, telId, tableName):
+		return self.get_telescope_node(telId)
+
+	def has_table(self, telId, tableName):
+		return tableName in self.get_telescope_node(telId).colnames
+
+	def get_block(self, telId, tableName, blockIndex):
+		"""
+		Get a block of a channel (the block of all the channels is read if it is not in the cache)
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the channel (waveformHi or waveformLo)
+			blockIndex : index of the block in the table
+		Return:
+			block of the column tableName
+		"""
+		block = self.get_memmap_block(telId, tableName, blockIndex)
+		if block is not None:
+			return block
+		key = (telId, tableName, blockIndex)
+		try:
+			block = self.cacheBlock[key]
+			self.cacheBlock.move_to_end(key)
+			return block
+		except KeyError:
+			pass
+		table, blockSize = self.get_table_and_block_size(telId, tableName)
+		firstRow = blockIndex*blockSize
+		tabRow = table.read(firstRow, min(firstRow + blockSize, table.nrows))
+		for channelName in ["waveformHi", "waveformLo"]:
+			if channelName != tableName and channelName in table.colnames:
+				self.add_block((telId, channelName, blockIndex), tabRow[channelName])
+		block = tabRow[tableName]
+		self.add_block(key, block)
+		return block
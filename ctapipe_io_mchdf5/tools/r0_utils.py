@@ -9,6 +9,8 @@ try:
 	from .get_telescope_info import *
 except:
 	pass
+from .chunk_utils import get_table_chunkshape, CONTIGUOUS_CHUNK_SIZE
+from .compression_policy import get_node_filters
 
 
 class TriggerInfo(tables.IsDescription):
@@ -72,7 +74,8 @@ class TelescopeInformation(tables.IsDescription):
 	nb_slice = tables.UInt64Col()
 
 
-def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chunkshape=1):
+def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chunkshape=None, expectedrows=None,
+							  contiguous=False):
 	"""
 	Create the waveform tables into the given telescope node
 	Parameters:
@@ -81,7 +84,10 @@ def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chun
 		nb_gain : number of gains of the camera
 		image_shape : shape of the camera images (number of slices, number of pixels)
 		telId : id of the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		expectedrows : expected number of events of the telescope (None if unknown)
+		contiguous : True to store all the expectedrows events in one chunk (up to CONTIGUOUS_CHUNK_SIZE), which is
+					 contiguous in the file and can be mapped in memory when the file is not compressed
 	"""
 	if nb_gain > 1:
 		columns_dict_waveform = {'event_id': tables.UInt64Col(),
@@ -92,6 +98,11 @@ def create_event_tel_waveform(hfile, tel_node, nb_gain, image_shape, telId, chun
 								 "waveformHi": tables.UInt16Col(shape=image_shape)}
 
 	description_waveform = type('description columns_dict_waveform', (tables.IsDescription,), columns_dict_waveform)
+	if contiguous and expectedrows is not None:
+		chunkshape = get_table_chunkshape(description_waveform, expectedrows=expectedrows,
+										  targetChunkSize=CONTIGUOUS_CHUNK_SIZE)
+	else:
+		chunkshape = get_table_chunkshape(description_waveform, chunkshape=chunkshape, expectedrows=expectedrows)
 	hfile.create_table(tel_node, 'tel_{0:0=3d}'.format(telId), description_waveform,
 					   "Table of waveform of the high gain signal", chunkshape=chunkshape)
 
@@ -191,7 +202,7 @@ def create_mon_tel_info(hfile, telId, telInfo, nb_gain, nb_pixel, nb_slice):
 	tel_info_table_row.append()
 
 
-def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
+def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=None, expectedrows=None):
 	"""
 	Create the base of the telescope structure without waveform
 	Parameters:
@@ -200,7 +211,8 @@ def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
 		telId : id of the telescope
 		nb_pixel : number of pixel of the camera
 		tel_info : table of some informations related to the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		expectedrows : expected number of events of the telescope (None if unknown)
 	Return:
 	-------
 		Created camera group
@@ -219,6 +231,8 @@ def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
 										 "photo_electron_image": tables.Float32Col(shape=nb_pixel)}
 	description_photo_electron_image = type('description columns_dict_photo_electron_image', (tables.IsDescription,),
 											columns_dict_photo_electron_image)
+	chunkshape = get_table_chunkshape(description_photo_electron_image, chunkshape=chunkshape,
+									  expectedrows=expectedrows)
 	hfile.create_table(hfile.root.r0.event.telescope.photo_electron_image, 'tel_{0:0=3d}'.format(telId),
 					   description_photo_electron_image, "Table of real signal in the camera (for simulation only)",
 					   chunkshape=chunkshape)
@@ -226,7 +240,7 @@ def create_mon_tel_pointing(hfile, telId, nb_pixel, tel_info, chunkshape=1):
 	return cam_tel_table
 
 
-def create_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
+def create_tel_group_and_table(hfile, telId, telInfo, chunkshape=None, expectedrows=None, contiguous=False):
 	"""
 	Create the telescope group and table inside r0:
 	/r0/event/telescope/waveform
@@ -239,21 +253,23 @@ def create_tel_group_and_table(hfile, telId, telInfo, chunkshape=1):
 		hfile : HDF5 file to be used
 		telId : id of the telescope
 		telInfo : table of some informations related to the telescope
-		chunkshape : shape of the chunk to be used to store the data
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
+		expectedrows : expected number of events of the telescope (None if unknown)
+		contiguous : True to store the waveforms of the telescope in one chunk (see create_event_tel_waveform)
 	"""
 	nb_gain = np.uint64(telInfo[TELINFO_NBGAIN])
 	nb_pixel = np.uint64(telInfo[TELINFO_NBPIXEL])
 	nb_slice = np.uint64(telInfo[TELINFO_NBSLICE])
 	image_shape = (nb_slice, nb_pixel)
 
-	create_mon_tel_pointing(hfile, telId, nb_pixel, telInfo, chunkshape=chunkshape)
+	create_mon_tel_pointing(hfile, telId, nb_pixel, telInfo, chunkshape=chunkshape, expectedrows=expectedrows)
 
 	create_mon_tel_pedestal(hfile, telInfo, nb_gain, nb_pixel, telId)
 	create_mon_tel_gain(hfile, telInfo, telId)
 	create_mon_tel_info(hfile, telId, telInfo, nb_gain, nb_pixel, nb_slice)
 
 	create_event_tel_waveform(hfile, hfile.root.r0.event.telescope.waveform, nb_gain, image_shape, telId,
-							  chunkshape=chunkshape)
+							  chunkshape=chunkshape, expectedrows=expectedrows, contiguous=contiguous)
 
 
 def fill_monitoring_subarray(hfile, mon_subarray_pointing_group, telInfo_from_evt):
@@ -285,31 +301,38 @@ def fill_monitoring_subarray(hfile, mon_subarray_pointing_group, telInfo_from_ev
 	mon_subarray_pointing_table_row.append()
 
 
-def create_event_subarray_trigger(hfile, event_subarray_group):
+def create_event_subarray_trigger(hfile, event_subarray_group, chunkshape=None):
 	"""
 	Create the event subarray trigger table
 	Parameters:
 		hfile: HDF5 file to be used
 		event_subarray_group:
+		chunkshape : shape of the chunk to be used to store the data (None for an automatic chunkshape)
 	"""
-	hfile.create_table(event_subarray_group, 'trigger', EventSubarrayTrigger, 'Trigger information')
+	hfile.create_table(event_subarray_group, 'trigger', EventSubarrayTrigger, 'Trigger information',
+					   chunkshape=get_table_chunkshape(EventSubarrayTrigger, chunkshape=chunkshape))
 	hfile.create_vlarray(event_subarray_group, "tels_with_trigger", tables.UInt16Atom(shape=()),
 						 'Telescope that have triggered - tels_with_data')
 
 
-def create_r0_dataset(hfile, telInfo_from_evt):
+def create_r0_dataset(hfile, telInfo_from_evt, chunkshape=None, contiguous=False):
 	"""
 	Create the r0 dataset
 	Parameters:
 		hfile : HDF5 file to be used
 		telInfo_from_evt : information of telescopes
+		chunkshape : number of rows per chunk of the event tables (None for an automatic chunkshape)
+		contiguous : True to store the waveforms of each telescope in one chunk (see create_event_tel_waveform)
 	"""
 	# Group : r0
 	hfile.create_group("/", 'r0', 'Raw data waveform information of the run')
 
-	hfile.create_group('/r0', 'monitoring', 'Telescope monitoring')
+	# The tables inherit the filters of the compression policy of their group
+	hfile.create_group('/r0', 'monitoring', 'Telescope monitoring', filters=get_node_filters(hfile, '/r0', 'monitoring'))
 	mon_subarray = hfile.create_group('/r0/monitoring', 'subarray', 'Subarrays')
-	fill_monitoring_subarray(hfile, mon_subarray, telInfo_from_evt)
+	# On single pass conversion the telescopes are not known yet, the pointing is filled with the first telescope
+	if len(telInfo_from_evt) != 0:
+		fill_monitoring_subarray(hfile, mon_subarray, telInfo_from_evt)
 
 	hfile.create_group('/r0/monitoring', 'telescope', 'Telescopes')
 	hfile.create_group('/r0/monitoring/telescope', 'pointing', 'Pointing of each telescope')
@@ -319,17 +342,20 @@ def create_r0_dataset(hfile, telInfo_from_evt):
 
 	hfile.create_group('/r0', 'event', 'R0 events')
 	hfile.create_group('/r0/event', 'telescope', 'R0 telescope events')
-	hfile.create_group('/r0/event/telescope', 'waveform', 'R0 waveform events')
-	hfile.create_group('/r0/event/telescope', 'photo_electron_image', 'ph.e image without noise')
+	hfile.create_group('/r0/event/telescope', 'waveform', 'R0 waveform events',
+					   filters=get_node_filters(hfile, '/r0/event/telescope', 'waveform'))
+	hfile.create_group('/r0/event/telescope', 'photo_electron_image', 'ph.e image without noise',
+					   filters=get_node_filters(hfile, '/r0/event/telescope', 'photo_electron_image'))
 
 	event_subarray = hfile.create_group('/r0/event', 'subarray', 'R0 subarray events')
-	create_event_subarray_trigger(hfile, event_subarray)
+	create_event_subarray_trigger(hfile, event_subarray, chunkshape=chunkshape)
 
 	hfile.create_group('/r0', 'service', 'Service')
 
 	# The group in the r0 group will be completed on the fly with the information collected in telInfo_from_evt
 	for telId, telInfo in telInfo_from_evt.items():
-		create_tel_group_and_table(hfile, telId, telInfo)
+		create_tel_group_and_table(hfile, telId, telInfo, chunkshape=chunkshape, 
+								   expectedrows=telInfo[TELINFO_NBEVENT] + 1, contiguous=contiguous)
 
 
 def append_photo_electron_image_in_telescope(tel_pe_table, pe_image, eventId):
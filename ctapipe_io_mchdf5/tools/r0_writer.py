@@ -0,0 +1,249 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+
+from .chunk_utils import get_table_block_size
+from .event_index import create_event_index, write_event_index
+
+# Size in bytes of the blocks of rows accumulated in memory before being written in a table (the number of rows of a
+# block is a multiple of the chunkshape of the table, so each block writes complete chunks)
+WRITER_BLOCK_SIZE = 4*1024*1024
+
+
+class TelescopeWriter(object):
+	"""
+	Buffered writer of the waveform and photo electron image tables of a telescope
+	The events are accumulated in preallocated numpy structured arrays and written with one Table.append per block
+	"""
+
+	def __init__(self, tel_wf_table, tel_pe_table, blockSize=None):
+		"""
+		Constructor of the TelescopeWriter
+		Parameters:
+			tel_wf_table : telescope waveform table to be filled
+			tel_pe_table : telescope photo electron image table to be filled
+			blockSize : number of events to be accumulated before a write (None for blocks of about WRITER_BLOCK_SIZE bytes)
+		"""
+		self.tel_wf_table = tel_wf_table
+		self.tel_pe_table = tel_pe_table
+		if blockSize is None:
+			blockSize = get_table_block_size(tel_wf_table, WRITER_BLOCK_SIZE)
+		self.blockSize = blockSize
+		self.nbEventInBuffer = 0
+		# Id of all the events written by the writer, to build the event index of the file
+		self.listEventId = list()
+
+		self.bufferWaveform = np.zeros(blockSize, dtype=tel_wf_table.dtype)
+		self.bufferPeImage = np.zeros(blockSize, dtype=tel_pe_table.dtype)
+		# Views on the columns of the buffers, to avoid a field lookup on each event
+		self.tabWfEventId = self.bufferWaveform['event_id']
+		self.tabWaveformHi = self.bufferWaveform['waveformHi']
+		self.tabWaveformLo = None
+		if 'waveformLo' in tel_wf_table.colnames:
+			self.tabWaveformLo = self.bufferWaveform['waveformLo']
+		self.tabPeEventId = self.bufferPeImage['event_id']
+		self.tabPeImage = self.bufferPeImage['photo_electron_image']
+
+	def append(self, waveform, pe_image, eventId):
+		"""
+		Append the waveform (to be transposed) and the photo electron image of an event
+		Parameters:
+			waveform : waveform signal to be used (gain, pixel, slice)
+			pe_image : photo electron image of the event (None if there is no simulation)
+			eventId : id of the corresponding event
+		"""
+		i = self.nbEventInBuffer
+		self.listEventId.append(eventId)
+		self.tabWfEventId[i] = eventId
+		self.tabWaveformHi[i] = waveform[0].swapaxes(0, 1)
+		if self.tabWaveformLo is not None and waveform.shape[0] > 1:
+			self.tabWaveformLo[i] = waveform[1].swapaxes(0, 1)
+
+		self.tabPeEventId[i] = eventId
+		if pe_image is not None:
+			self.tabPeImage[i] = pe_image
+		else:
+			self.tabPeImage[i] = 0.0
+
+		self.nbEventInBuffer += 1
+		if self.nbEventInBuffer == self.blockSize:
+			self.flush_buffer()
+
+	def flush_buffer(self):
+		"""
+		Write the accumulated events in the tables
+		"""
+		if self.nbEventInBuffer == 0:
+			return
+		self.tel_wf_table.append(self.bufferWaveform[:self.nbEventInBuffer])
+		self.tel_pe_table.append(self.bufferPeImage[:self.nbEventInBuffer])
+		self.nbEventInBuffer = 0
+
+	def flush(self):
+		"""
+		Write the accumulated events and flush the tables
+		"""
+		self.flush_buffer()
+		self.tel_wf_table.flush()
+		self.tel_pe_table.flush()
+
+
+class R0EventData(object):
+	"""
+	Data of an event to be written by the R0EventWriter, extracted from the event container
+	The event sources may reuse the same container for all the events, so the scalar values are copied and the
+	waveforms are referenced (the sources give a new waveform array for each event)
+	Attributes:
+	-----------
+		eventId : id of the event
+		obsId : id of the observation
+		time : trigger time of the event (unix time)
+		eventType : type of the event
+		tabTelId : list of the id of the telescopes which have data
+		listWaveform : waveform of each telescope of tabTelId (gain, pixel, slice)
+		listPeImage : photo electron image of each telescope of tabTelId (None if there is no simulation)
+	"""
+
+	def __init__(self, eventId, obsId, time, eventType, tabTelId, listWaveform, listPeImage):
+		self.eventId = eventId
+		self.obsId = obsId
+		self.time = time
+		self.eventType = eventType
+		self.tabTelId = tabTelId
+		self.listWaveform = listWaveform
+		self.listPeImage = listPeImage
+
+
+def extract_r0_event_data(event, isSimulationMode):
+	"""
+	Extract the data to be written in the r0 tables from an event
+	Parameters:
+		event : current event
+		isSimulationMode : true on simulation mode
+	Return:
+		R0EventData of the event
+	"""
+	tab_tel_with_data = list(event.r0.tels_with_data)
+	if isSimulationMode:
+		time = np.float64(event.trigger.time.to_value('unix'))
+	else:
+		#Das ist a grosse bidouille for real data
+		time = np.float64(event.r0.tel[tab_tel_with_data[0]].trigger_time) - 37.0
+	dicoTel = event.r0.tel
+	listWaveform = [dicoTel[telId].waveform for telId in tab_tel_with_data]
+	if isSimulationMode:
+		listPeImage = [event.mc.tel[telId].true_image for telId in tab_tel_with_data]
+	else:
+		listPeImage = [None]*len(tab_tel_with_data)
+	return R0EventData(event.index.event_id, event.index.obs_id, time, event.trigger.event_type.value,
+					   tab_tel_with_data, listWaveform, listPeImage)
+
+
+class R0EventWriter(object):
+	"""
+	Buffered writer of the r0 events (subarray trigger and telescopes data)
+	The nodes of the telescopes are resolved once, the first time a telescope has data
+	"""
+
+	def __init__(self, hfile, isSimulationMode, blockSize=None):
+		"""
+		Constructor of the R0EventWriter
+		Parameters:
+			hfile : HDF5 file to be used (its r0 dataset has to be created)
+			isSimulationMode : true on simulation mode
+			blockSize : number of events to be accumulated before a write (None for blocks of about WRITER_BLOCK_SIZE bytes)
+		"""
+		self.hfile = hfile
+		self.isSimulationMode = isSimulationMode
+		self.blockSize = blockSize
+		self.dicoTelWriter = dict()
+
+		self.tableTrigger = hfile.root.r0.event.subarray.trigger
+		self.vlarrayTelWithTrigger = hfile.root.r0.event.subarray.tels_with_trigger
+		blockSizeTrigger = blockSize
+		if blockSizeTrigger is None:
+			blockSizeTrigger = get_table_block_size(self.tableTrigger, WRITER_BLOCK_SIZE)
+		self.blockSizeTrigger = blockSizeTrigger
+		self.bufferTrigger = np.zeros(blockSizeTrigger, dtype=self.tableTrigger.dtype)
+		self.nbEventInBuffer = 0
+
+	def get_telescope_writer(self, telId):
+		"""
+		Get the writer of a telescope (created on the first call)
+		Parameters:
+			telId : id of the telescope
+		Return:
+			TelescopeWriter of the telescope
+		"""
+		try:
+			return self.dicoTelWriter[telId]
+		except KeyError:
+			tel_wf_table = self.hfile.get_node("/r0/event/telescope/waveform", 'tel_{0:0=3d}'.format(telId))
+			tel_pe_table = self.hfile.get_node('/r0/event/telescope/photo_electron_image', 'tel_{0:0=3d}'.format(telId))
+			telWriter = TelescopeWriter(tel_wf_table, tel_pe_table, self.blockSize)
+			self.dicoTelWriter[telId] = telWriter
+			return telWriter
+
+	def append_event(self, event):
+		"""
+		Append data from event in telescopes
+		Parameters :
+			event : current event
+		"""
+		self.append_event_data(extract_r0_event_data(event, self.isSimulationMode))
+
+	def append_event_data(self, eventData):
+		"""
+		Append the data extracted from an event in telescopes
+		Parameters :
+			eventData : R0EventData of the event
+		"""
+		self.vlarrayTelWithTrigger.append(eventData.tabTelId)
+
+		rowTrigger = self.bufferTrigger[self.nbEventInBuffer]
+		rowTrigger['event_id'] = eventData.eventId
+		rowTrigger['time'] = eventData.time
+		rowTrigger['event_type'] = eventData.eventType
+		rowTrigger['obs_id'] = eventData.obsId
+		self.nbEventInBuffer += 1
+		if self.nbEventInBuffer == self.blockSizeTrigger:
+			self.flush_buffer()
+
+		for telId, waveform, photo_electron_image in zip(eventData.tabTelId, eventData.listWaveform,
+														  eventData.listPeImage):
+			self.get_telescope_writer(telId).append(waveform, photo_electron_image, eventData.eventId)
+
+	def flush_buffer(self):
+		"""
+		Write the accumulated trigger informations in the trigger table
+		"""
+		if self.nbEventInBuffer == 0:
+			return
+		self.tableTrigger.append(self.bufferTrigger[:self.nbEventInBuffer])
+		self.nbEventInBuffer = 0
+
+	def get_event_index(self):
+		"""
+		Get the event index of the events written so far
+		Return:
+			EventIndex of the file
+		"""
+		listTelId = list(self.dicoTelWriter.keys())
+		listTabEventId = [self.dicoTelWriter[telId].listEventId for telId in listTelId]
+		listTelIndex = [telId - 1 for telId in listTelId]
+		return create_event_index(listTabEventId, listTelId, listTelIndex)
+
+	def flush(self):
+		"""
+		Write all the accumulated events, flush the tables and write the event index of the file
+		"""
+		self.flush_buffer()
+		self.tableTrigger.flush()
+		self.vlarrayTelWithTrigger.flush()
+		for telWriter in self.dicoTelWriter.values():
+			telWriter.flush()
+		write_event_index(self.hfile, self.get_event_index())
@@ -0,0 +1,215 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+import numpy as np
+
+# Number of events calibrated at once by the CalibratedWaveformReader
+CALIBRATION_BLOCK_SIZE = 16
+
+
+class R1Calibrator(object):
+	"""
+	Calibration of the waveforms of a telescope : (waveform - pedestal / nbSlice) * gain
+	The computation is done in float32 on blocks of events (..., nbGain, nbPixel, nbSlice) with a reused output buffer
+	"""
+
+	def __init__(self, pedestal, gain, nbSlice):
+		"""
+		Constructor of the R1Calibrator
+		Parameters:
+			pedestal : pedestal of the telescope (nbGain, nbPixel), sum over the slices
+			gain : gain of the telescope (nbGain, nbPixel)
+			nbSlice : number of slices of the waveforms
+		"""
+		self.tabPedestal = (np.asarray(pedestal, dtype=np.float32) / np.float32(nbSlice))[..., np.newaxis]
+		self.tabGain = np.asarray(gain, dtype=np.float32)[..., np.newaxis]
+		self.bufferOut = None
+
+	def get_buffer(self, shape):
+		"""
+		Get the output buffer of the calibrator (reallocated only if it is too small)
+		Parameters:
+			shape : shape of the calibrated block
+		Return:
+			float32 buffer of the given shape (view on the buffer of the calibrator)
+		"""
+		shape = tuple(shape)
+		if self.bufferOut is None or self.bufferOut.ndim != len(shape) or self.bufferOut.shape[1:] != shape[1:] \
+				or self.bufferOut.shape[0] < shape[0]:
+			self.bufferOut = np.empty(shape, dtype=np.float32)
+		return self.bufferOut[:shape[0]]
+
+	def calibrate(self, waveform, out=None, inplace=False):
+		"""
+		Calibrate a waveform or a block of waveforms
+		Parameters:
+			waveform : waveforms to be calibrated (..., nbGain, nbPixel, nbSlice)
+			out : float32 array to be filled (the buffer of the calibrator is used if None)
+			inplace : True to calibrate the float32 waveform in place
+		Return:
+			calibrated waveforms, float32 (..., nbGain, nbPixel, nbSlice)
+		"""
+		if inplace:
+			if waveform.dtype != np.float32:
+				raise ValueError("R1Calibrator : in place calibration needs float32 waveforms, not {}".format(waveform.dtype))
+			out = waveform
+		elif out is None:
+			out = self.get_buffer(waveform.shape)
+		# A camera with only the high gain uses the first gain of the calibration
+		nbGain = waveform.shape[-3]
+		np.subtract(waveform, self.tabPedestal[:nbGain], out=out)
+		np.multiply(out, self.tabGain[:nbGain], out=out)
+		return out
+
+
+class _CalibratedBlock(object):
+	"""
+	Block of consecutive events of a telescope kept by the CalibratedWaveformReader
+	Attributes:
+	-----------
+		firstRow : first row of the block in the telescope tables
+		nbRow : number of valid rows of the block
+		tabR0 : preallocated raw waveforms (blockSize, nbGain, nbPixel, nbSlice)
+		tabR1 : preallocated calibrated waveforms (blockSize, nbGain, nbPixel, nbSlice), None without calibrator
+		calibrator : R1Calibrator of the telescope (or None)
+	"""
+
+	def __init__(self, tabR0, tabR1, calibrator):
+		self.firstRow = 0
+		self.nbRow = 0
+		self.tabR0 = tabR0
+		self.tabR1 = tabR1
+		self.calibrator = calibrator
+
+
+class CalibratedWaveformReader(object):
+	"""
+	Reader of the raw and calibrated waveforms (nbGain, nbPixel, nbSlice) of the telescopes of a r1 file
+	The waveforms of blocks of consecutive events of each telescope are gathered in preallocated buffers
+	and calibrated at once. The returned waveforms are copied from these buffers, unless copyWaveform is False : they are
+	then views on the buffers, overwritten when the next block of the telescope is read.
+	The pixels of the sorted channels (see set_decoder) are put back in their original order after the reading.
+	"""
+
+	def __init__(self, waveformReader, isSlicePixel=True, blockSize=CALIBRATION_BLOCK_SIZE, copyWaveform=True):
+		"""
+		Constructor of the CalibratedWaveformReader
+		Parameters:
+			waveformReader : WaveformBlockReader used to read the waveform tables
+			isSlicePixel : True if the waveforms are stored by (slice, pixel), False for (pixel, slice)
+			blockSize : number of events calibrated at once
+			copyWaveform : True to return copies of the waveforms, False to return views on the buffers (no copy, but the
+						   waveforms of an event are overwritten by the next block of the telescope)
+		"""
+		self.waveformReader = waveformReader
+		self.isSlicePixel = isSlicePixel
+		self.blockSize = max(1, blockSize)
+		self.copyWaveform = copyWaveform
+		self.dicoCalibrator = dict()
+		self.dicoDecoder = dict()
+		self.dicoTelBlock = dict()
+
+	def set_calibrator(self, telId, calibrator):
+		"""
+		Set the calibrator of a telescope (the waveforms of a telescope without calibrator are not calibrated)
+		Parameters:
+			telId : id of the telescope
+			calibrator : R1Calibrator of the telescope
+		"""
+		self.dicoCalibrator[telId] = calibrator
+		self.dicoTelBlock.pop(telId, None)
+
+	def set_decoder(self, telId, gain, decoder):
+		"""
+		Set the decoder of a sorted channel of a telescope (the pixels are put back in their original order before the calibration)
+		Parameters:
+			telId : id of the telescope
+			gain : index of the gain of the channel (0 : waveformHi, 1 : waveformLo)
+			decoder : InjunctionTableDecoder of the channel (None if the channel is not sorted)
+		"""
+		if decoder is None:
+			self.dicoDecoder.pop((telId, gain), None)
+		else:
+			self.dicoDecoder[(telId, gain)] = decoder
+		self.dicoTelBlock.pop(telId, None)
+
+	def has_calibrator(self, telId):
+		"""
+		Say if a telescope has a calibrator
+		Parameters:
+			telId : id of the telescope
+		Return:
+			True if the waveforms of the telescope are calibrated
+		"""
+		return telId in self.dicoCalibrator
+
+	def _get_tel_block(self, telId):
+		"""
+		Get the block of a telescope (allocated on the first call)
+		Parameters:
+			telId : id of the telescope
+		Return:
+			_CalibratedBlock
+		"""
+		try:
+			return self.dicoTelBlock[telId]
+		except KeyError:
+			pass
+		table, _ = self.waveformReader.get_table_and_block_size(telId, "waveformHi")
+		nbGain = 2 if self.waveformReader.has_table(telId, "waveformLo") else 1
+		shapeEntry = table.coldescrs["waveformHi"].shape
+		nbSlice, nbPixel = shapeEntry if self.isSlicePixel else shapeEntry[::-1]
+		shapeBlock = (self.blockSize, nbGain, nbPixel, nbSlice)
+		calibrator = self.dicoCalibrator.get(telId)
+		tabR0 = np.empty(shapeBlock, dtype=table.coldtypes["waveformHi"].base)
+		tabR1 = np.empty(shapeBlock, dtype=np.float32) if calibrator is not None else None
+		telBlock = _CalibratedBlock(tabR0, tabR1, calibrator)
+		self.dicoTelBlock[telId] = telBlock
+		return telBlock
+
+	def _load_block(self, telId, telBlock, row):
+		"""
+		Read and calibrate the block of a telescope which starts at a given row
+		Parameters:
+			telId : id of the telescope
+			telBlock : _CalibratedBlock to be filled
+			row : first row of the block
+		"""
+		tabR0 = telBlock.tabR0
+		table, _ = self.waveformReader.get_table_and_block_size(telId, "waveformHi")
+		nbRow = max(0, min(self.blockSize, table.nrows - row))
+		for gain, tableName in enumerate(["waveformHi", "waveformLo"][:tabR0.shape[1]]):
+			channel = tabR0[:nbRow, gain]
+			if self.isSlicePixel:
+				channel = channel.swapaxes(1, 2)
+			self.waveformReader.read_rows(telId, tableName, row, row + nbRow, out=channel)
+			decoder = self.dicoDecoder.get((telId, gain))
+			if decoder is not None:
+				decoder.decode(tabR0[:nbRow, gain], row, axis=1)
+		if telBlock.calibrator is not None:
+			telBlock.calibrator.calibrate(tabR0[:nbRow], out=telBlock.tabR1[:nbRow])
+		telBlock.firstRow = row
+		telBlock.nbRow = nbRow
+
+	def get_waveform(self, telId, row):
+		"""
+		Get the raw and calibrated waveforms of an event
+		Parameters:
+			telId : id of the telescope
+			row : row of the event in the telescope tables
+		Return:
+			raw waveform (nbGain, nbPixel, nbSlice), calibrated waveform float32 (nbGain, nbPixel, nbSlice) or None
+		"""
+		telBlock = self._get_tel_block(telId)
+		rowInBlock = row - telBlock.firstRow
+		if rowInBlock < 0 or rowInBlock >= telBlock.nbRow:
+			self._load_block(telId, telBlock, row)
+			rowInBlock = 0
+		tabR0 = telBlock.tabR0[rowInBlock]
+		tabR1 = telBlock.tabR1[rowInBlock] if telBlock.tabR1 is not None else None
+		if self.copyWaveform:
+			return tabR0.copy(), tabR1.copy() if tabR1 is not None else None
+		return tabR0, tabR1
@@ -9,6 +9,9 @@ import numpy as np
 
 from ctapipe.io import event_source
 
+from .chunk_utils import get_table_chunkshape
+from .compression_policy import get_node_filters
+
 
 class RunConfigEvent(tables.IsDescription):
     """
@@ -152,26 +155,30 @@ class MCEvent(tables.IsDescription):
     obs_id = tables.UInt64Col()
 
 
-def create_simulation_dataset(hfile):
+def create_simulation_dataset(hfile, chunkshape=None):
     """
     Create the simulation dataset
     Parameters:
         hfile : HDF5 file to be used
+        chunkshape : number of rows per chunk of the shower table (None for an automatic chunkshape)
     Return:
         table of the mc_event
     """
-    hfile.create_group('/', 'simulation', 'Simulation information of the run')
+    hfile.create_group('/', 'simulation', 'Simulation information of the run',
+                       filters=get_node_filters(hfile, '/', 'simulation'))
     service_group = hfile.create_group('/simulation', 'service', 'Service simulation')
     hfile.create_table(service_group, 'shower_distribution', ShowerDistribution, 'Distribution of the simulated events')
 
     # configuration group already created in `instrument_utils.py`
     config_sim_group = hfile.create_group('/configuration', 'simulation',
-                                          'Configuration simulation information of the run')
+                                          'Configuration simulation information of the run',
+                                          filters=get_node_filters(hfile, '/configuration', 'simulation'))
     hfile.create_table(config_sim_group, 'run', RunConfigEvent, "Configuration of the simulated events", expectedrows=1)
 
     hfile.create_group('/simulation', 'event', 'Event simulation')
     sim_event_subarray_group = hfile.create_group('/simulation/event', 'subarray', 'Subarray shower')
-    table_mc_event = hfile.create_table(sim_event_subarray_group, 'shower', MCEvent, "All simulated Corsika events")
+    table_mc_event = hfile.create_table(sim_event_subarray_group, 'shower', MCEvent, "All simulated Corsika events",
+                                        chunkshape=get_table_chunkshape(MCEvent, chunkshape=chunkshape))
     return table_mc_event
 
 
@@ -184,78 +191,122 @@ def fill_simulation_header_info(hfile, inputFileName):
     """
     with event_source(inputFileName) as source:
         evt = next(iter(source))
+        fill_simulation_header_info_from_event(hfile, evt)
 
-        tableSimulationConfig = hfile.root.configuration.simulation.run
-        tabSimConf = tableSimulationConfig.row
 
-        mcHeader = evt.mcheader
-        tabSimConf["atmosphere"] = np.uint64(mcHeader.atmosphere)
-        tabSimConf["core_pos_mode"] = np.uint64(mcHeader.core_pos_mode)
-        tabSimConf["corsika_bunchsize"] = np.float32(mcHeader.corsika_bunchsize)
-        tabSimConf["corsika_high_E_detail"] = np.int32(mcHeader.corsika_high_E_detail)
-        tabSimConf["corsika_high_E_model"] = np.int32(mcHeader.corsika_high_E_model)
-        tabSimConf["corsika_iact_options"] = np.int32(mcHeader.corsika_iact_options)
-        tabSimConf["corsika_low_E_detail"] = np.int32(mcHeader.corsika_low_E_detail)
-        tabSimConf["corsika_low_E_model"] = np.int32(mcHeader.corsika_low_E_model)
-        tabSimConf["corsika_version"] = np.int32(mcHeader.corsika_version)
-        tabSimConf["corsika_wlen_max"] = np.float32(mcHeader.corsika_wlen_max)
-        tabSimConf["corsika_wlen_min"] = np.float32(mcHeader.corsika_wlen_min)
-        tabSimConf["detector_prog_id"] = np.uint64(mcHeader.detector_prog_id)
-        tabSimConf["detector_prog_start"] = np.int32(mcHeader.detector_prog_start)
-        tabSimConf["diffuse"] = np.int32(mcHeader.diffuse)
-        tabSimConf["energy_range_max"] = np.float32(mcHeader.energy_range_max)
-        tabSimConf["energy_range_min"] = np.float32(mcHeader.energy_range_min)
-        tabSimConf["injection_height"] = np.float32(mcHeader.injection_height)
-        tabSimConf["max_alt"] = np.float32(mcHeader.max_alt)
-        tabSimConf["max_az"] = np.float32(mcHeader.max_az)
-        tabSimConf["max_scatter_range"] = np.float32(mcHeader.max_scatter_range)
-        tabSimConf["max_viewcone_radius"] = np.float32(mcHeader.max_viewcone_radius)
-        tabSimConf["min_alt"] = np.float32(mcHeader.min_alt)
-        tabSimConf["min_az"] = np.float32(mcHeader.min_az)
-        tabSimConf["min_scatter_range"] = np.float32(mcHeader.min_scatter_range)
-        tabSimConf["min_viewcone_radius"] = np.float32(mcHeader.min_viewcone_radius)
-        tabSimConf["num_showers"] = np.uint64(mcHeader.num_showers)
-        tabSimConf["obs_id"] = np.uint64(evt.index.obs_id)
-        tabSimConf["prod_site_B_declination"] = np.float32(mcHeader.prod_site_B_declination)
-        tabSimConf["prod_site_B_inclination"] = np.float32(mcHeader.prod_site_B_inclination)
-        tabSimConf["prod_site_B_total"] = np.float32(mcHeader.prod_site_B_total)
-        tabSimConf["prod_site_alt"] = np.float32(mcHeader.prod_site_alt)
-        tabSimConf["run_array_direction"] = np.float32(mcHeader.run_array_direction)
-        tabSimConf["shower_prog_id"] = np.uint64(mcHeader.shower_prog_id)
-        tabSimConf["shower_prog_start"] = np.int32(mcHeader.shower_prog_start)
-        tabSimConf["shower_reuse"] = np.uint64(mcHeader.shower_reuse)
-        tabSimConf["simtel_version"] = np.int32(mcHeader.simtel_version)
-        tabSimConf["spectral_index"] = np.float32(mcHeader.spectral_index)
-        tabSimConf.append()
+def fill_simulation_header_info_from_event(hfile, evt):
+    """
+    Fill the simulation information in the simulation header (/simulation/run_config) from an event already decoded
+    (avoid to open the input file once again)
+    Parameters:
+        hfile : HDF5 file to be used
+        evt : first event of the input file
+    """
+    fill_simulation_header_info_from_header(hfile, evt.mcheader, evt.index.obs_id)
 
 
-def append_corsika_event(tableMcCorsikaEvent, event):
+def fill_simulation_header_info_from_header(hfile, mcHeader, obsId):
     """
-    Append the Monte Carlo information in the table of Corsika events
+    Fill the simulation information in the simulation header (/simulation/run_config) from the simulation header
+    of an event (can be extracted from the event by an other thread)
+    Parameters:
+        hfile : HDF5 file to be used
+        mcHeader : simulation header of the first event of the input file
+        obsId : id of the observation
+    """
+    tableSimulationConfig = hfile.root.configuration.simulation.run
+    tabSimConf = tableSimulationConfig.row
+
+    tabSimConf["atmosphere"] = np.uint64(mcHeader.atmosphere)
+    tabSimConf["core_pos_mode"] = np.uint64(mcHeader.core_pos_mode)
+    tabSimConf["corsika_bunchsize"] = np.float32(mcHeader.corsika_bunchsize)
+    tabSimConf["corsika_high_E_detail"] = np.int32(mcHeader.corsika_high_E_detail)
+    tabSimConf["corsika_high_E_model"] = np.int32(mcHeader.corsika_high_E_model)
+    tabSimConf["corsika_iact_options"] = np.int32(mcHeader.corsika_iact_options)
+    tabSimConf["corsika_low_E_detail"] = np.int32(mcHeader.corsika_low_E_detail)
+    tabSimConf["corsika_low_E_model"] = np.int32(mcHeader.corsika_low_E_model)
+    tabSimConf["corsika_version"] = np.int32(mcHeader.corsika_version)
+    tabSimConf["corsika_wlen_max"] = np.float32(mcHeader.corsika_wlen_max)
+    tabSimConf["corsika_wlen_min"] = np.float32(mcHeader.corsika_wlen_min)
+    tabSimConf["detector_prog_id"] = np.uint64(mcHeader.detector_prog_id)
+    tabSimConf["detector_prog_start"] = np.int32(mcHeader.detector_prog_start)
+    tabSimConf["diffuse"] = np.int32(mcHeader.diffuse)
+    tabSimConf["energy_range_max"] = np.float32(mcHeader.energy_range_max)
+    tabSimConf["energy_range_min"] = np.float32(mcHeader.energy_range_min)
+    tabSimConf["injection_height"] = np.float32(mcHeader.injection_height)
+    tabSimConf["max_alt"] = np.float32(mcHeader.max_alt)
+    tabSimConf["max_az"] = np.float32(mcHeader.max_az)
+    tabSimConf["max_scatter_range"] = np.float32(mcHeader.max_scatter_range)
+    tabSimConf["max_viewcone_radius"] = np.float32(mcHeader.max_viewcone_radius)
+    tabSimConf["min_alt"] = np.float32(mcHeader.min_alt)
+    tabSimConf["min_az"] = np.float32(mcHeader.min_az)
+    tabSimConf["min_scatter_range"] = np.float32(mcHeader.min_scatter_range)
+    tabSimConf["min_viewcone_radius"] = np.float32(mcHeader.min_viewcone_radius)
+    tabSimConf["num_showers"] = np.uint64(mcHeader.num_showers)
+    tabSimConf["obs_id"] = np.uint64(obsId)
+    tabSimConf["prod_site_B_declination"] = np.float32(mcHeader.prod_site_B_declination)
+    tabSimConf["prod_site_B_inclination"] = np.float32(mcHeader.prod_site_B_inclination)
+    tabSimConf["prod_site_B_total"] = np.float32(mcHeader.prod_site_B_total)
+    tabSimConf["prod_site_alt"] = np.float32(mcHeader.prod_site_alt)
+    tabSimConf["run_array_direction"] = np.float32(mcHeader.run_array_direction)
+    tabSimConf["shower_prog_id"] = np.uint64(mcHeader.shower_prog_id)
+    tabSimConf["shower_prog_start"] = np.int32(mcHeader.shower_prog_start)
+    tabSimConf["shower_reuse"] = np.uint64(mcHeader.shower_reuse)
+    tabSimConf["simtel_version"] = np.int32(mcHeader.simtel_version)
+    tabSimConf["spectral_index"] = np.float32(mcHeader.spectral_index)
+    tabSimConf.append()
+
+
+def get_corsika_event_row(event):
+    """
+    Get the Monte Carlo information of an event to be written in the table of Corsika events
     Parameter :
-        tableMcCorsikaEvent : table of Corsika events to be completed
         event : Monte Carlo event to be used
+    Return :
+        dictionnary of the values of the columns of the table of Corsika events
     """
-    tabMcEvent = tableMcCorsikaEvent.row
-    tabMcEvent['event_id'] = np.uint64(event.index.event_id)
-    tabMcEvent['true_az'] = np.float32(event.mc.az)
-    tabMcEvent['true_alt'] = np.float32(event.mc.alt)
+    dicoMcEvent = dict()
+    dicoMcEvent['event_id'] = np.uint64(event.index.event_id)
+    dicoMcEvent['true_az'] = np.float32(event.mc.az)
+    dicoMcEvent['true_alt'] = np.float32(event.mc.alt)
 
-    tabMcEvent['true_core_x'] = np.float32(event.mc.core_x)
-    tabMcEvent['true_core_y'] = np.float32(event.mc.core_y)
+    dicoMcEvent['true_core_x'] = np.float32(event.mc.core_x)
+    dicoMcEvent['true_core_y'] = np.float32(event.mc.core_y)
 
-    tabMcEvent['true_energy'] = np.float32(event.mc.energy)
-    tabMcEvent['true_h_first_int'] = np.float32(event.mc.h_first_int)
-    tabMcEvent['true_shower_primary_id'] = np.uint8(event.mc.shower_primary_id)
+    dicoMcEvent['true_energy'] = np.float32(event.mc.energy)
+    dicoMcEvent['true_h_first_int'] = np.float32(event.mc.h_first_int)
+    dicoMcEvent['true_shower_primary_id'] = np.uint8(event.mc.shower_primary_id)
 
-    tabMcEvent['true_x_max'] = np.float32(event.mc.x_max)
+    dicoMcEvent['true_x_max'] = np.float32(event.mc.x_max)
 
-    tabMcEvent['obs_id'] = np.uint64(event.index.obs_id)
+    dicoMcEvent['obs_id'] = np.uint64(event.index.obs_id)
 
     # I don't know where to find the following informations but they exist in C version
-    # tabMcEvent['depthStart'] = np.float32(0.0)
-    # tabMcEvent['hmax'] = np.float32(0.0)
-    # tabMcEvent['emax'] = np.float32(0.0)
-    # tabMcEvent['cmax'] = np.float32(0.0)
+    # dicoMcEvent['depthStart'] = np.float32(0.0)
+    # dicoMcEvent['hmax'] = np.float32(0.0)
+    # dicoMcEvent['emax'] = np.float32(0.0)
+    # dicoMcEvent['cmax'] = np.float32(0.0)
+    return dicoMcEvent
 
+
+def append_corsika_row(tableMcCorsikaEvent, dicoMcEvent):
+    """
+    Append a row in the table of Corsika events
+    Parameter :
+        tableMcCorsikaEvent : table of Corsika events to be completed
+        dicoMcEvent : values of the columns given by get_corsika_event_row
+    """
+    tabMcEvent = tableMcCorsikaEvent.row
+    for name, value in dicoMcEvent.items():
+        tabMcEvent[name] = value
     tabMcEvent.append()
+
+
+def append_corsika_event(tableMcCorsikaEvent, event):
+    """
+    Append the Monte Carlo information in the table of Corsika events
+    Parameter :
+        tableMcCorsikaEvent : table of Corsika events to be completed
+        event : Monte Carlo event to be used
+    """
+    append_corsika_row(tableMcCorsikaEvent, get_corsika_event_row(event))
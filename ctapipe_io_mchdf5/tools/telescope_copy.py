@@ -6,8 +6,10 @@
 
 import tables
 
+from .compression_policy import copy_node_policy
 
-def copy_telescope_without_waveform(outFile, telNode, r1NodeName="r1", chunkshape=1):
+
+def copy_telescope_without_waveform(outFile, telNode, r1NodeName="r1", chunkshape=None):
 	"""
 	Copy the telescope node but not the waveform ones
 	Parameters:
@@ -26,31 +28,31 @@ def copy_telescope_without_waveform(outFile, telNode, r1NodeName="r1", chunkshap
 
 	cam_tel_group = outFile.create_group("/"+r1NodeName, telGroupName, 'Data of telescopes '+telGroupName)
 
-	outFile.copy_node(nbPixel, newparent=cam_tel_group, recursive=True)
-	outFile.copy_node(telNode.nbSlice, newparent=cam_tel_group, recursive=True)
-	outFile.copy_node(telNode.nbGain, newparent=cam_tel_group, recursive=True)
-	outFile.copy_node(telNode.telIndex, newparent=cam_tel_group, recursive=True)
-	outFile.copy_node(telNode.telType, newparent=cam_tel_group, recursive=True)
-	outFile.copy_node(telNode.telId, newparent=cam_tel_group, recursive=True)
+	copy_node_policy(outFile, nbPixel, cam_tel_group)
+	copy_node_policy(outFile, telNode.nbSlice, cam_tel_group)
+	copy_node_policy(outFile, telNode.nbGain, cam_tel_group)
+	copy_node_policy(outFile, telNode.telIndex, cam_tel_group)
+	copy_node_policy(outFile, telNode.telType, cam_tel_group)
+	copy_node_policy(outFile, telNode.telId, cam_tel_group)
 	try:
-		outFile.copy_node(telNode.tabRefShape, newparent=cam_tel_group, recursive=True)
+		copy_node_policy(outFile, telNode.tabRefShape, cam_tel_group)
 	except tables.exceptions.NoSuchNodeError as e:
 		pass
 	try:
-		outFile.copy_node(telNode.tabGain, newparent=cam_tel_group, recursive=True)
+		copy_node_policy(outFile, telNode.tabGain, cam_tel_group)
 	except tables.exceptions.NoSuchNodeError as e:
 		pass
 
-	outFile.copy_node(telNode.trigger, newparent=cam_tel_group, recursive=True)
-	outFile.copy_node(telNode.pedestal, newparent=cam_tel_group, recursive=True)
+	copy_node_policy(outFile, telNode.trigger, cam_tel_group)
+	copy_node_policy(outFile, telNode.pedestal, cam_tel_group)
 	try:
-		outFile.copy_node(telNode.photo_electron_image, newparent=cam_tel_group, recursive=True)
+		copy_node_policy(outFile, telNode.photo_electron_image, cam_tel_group)
 	except tables.exceptions.NoSuchNodeError as e:
 		pass
 	return cam_tel_group
 
 
-def copy_all_tel_without_waveform(outFile, inFile, r1NodeName="r1", docR1Node="Raw data waveform informations of the run", chunkshape=1):
+def copy_all_tel_without_waveform(outFile, inFile, r1NodeName="r1", docR1Node="Raw data waveform informations of the run", chunkshape=None):
 	"""
 	Create all the telescopes without the waveform
 	Parameters:
@@ -0,0 +1,229 @@
+"""
+	Auteur : Pierre Aubert
+	Mail : aubertp7@gmail.com
+	Licence : CeCILL-C
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .chunk_utils import get_table_block_size
+from .memmap_reader import get_table_memmap
+
+# Size in bytes of the blocks of rows read at once in a waveform table
+READER_BLOCK_SIZE = 16*1024*1024
+# Maximum size in bytes of the blocks kept in memory by the reader
+READER_MEMORY_BUDGET = 512*1024*1024
+
+
+class WaveformBlockReader(object):
+	"""
+	Prefetching reader of the waveform tables of the telescopes (/r1/Tel_N/waveformHi, waveformLo)
+	The rows are read by blocks of contiguous rows and the per event entries are served from memory.
+	The blocks are kept in a LRU cache limited by a memory budget.
+	The returned waveforms are views on the cached blocks and must not be modified.
+	With memoryMap, the uncompressed tables are mapped in memory (numpy.memmap) instead of being read, the blocks are
+	read only views on the file (served by the page cache) and the compressed tables are read by blocks
+	"""
+
+	def __init__(self, hfile, telGroupName="/r1", blockSizeInBytes=READER_BLOCK_SIZE,
+				 memoryBudget=READER_MEMORY_BUDGET, memoryMap=False):
+		"""
+		Constructor of the WaveformBlockReader
+		Parameters:
+			hfile : HDF5 file to be read
+			telGroupName : name of the group which contains the telescopes groups
+			blockSizeInBytes : expected size in bytes of a block of rows
+			memoryBudget : maximum size in bytes of the cached blocks
+			memoryMap : True to map the uncompressed tables in memory instead of reading them
+		"""
+		self.hfile = hfile
+		self.telGroupName = telGroupName
+		self.blockSizeInBytes = blockSizeInBytes
+		self.memoryBudget = memoryBudget
+		self.memoryMap = memoryMap
+		self.dicoTelNode = dict()
+		self.dicoTableBlockSize = dict()
+		# key : (telId, tableName), value : TableMemmap of the table (None if the table cannot be mapped)
+		self.dicoTableMemmap = dict()
+		# key : (telId, tableName, blockIndex), value : block of the column tableName
+		self.cacheBlock = OrderedDict()
+		self.cacheSize = 0
+
+	def get_telescope_node(self, telId):
+		"""
+		Get the node of a telescope (resolved once)
+		Parameters:
+			telId : id of the telescope
+		Return:
+			group of the telescope
+		"""
+		try:
+			return self.dicoTelNode[telId]
+		except KeyError:
+			telNode = self.hfile.get_node(self.telGroupName, 'Tel_' + str(telId))
+			self.dicoTelNode[telId] = telNode
+			return telNode
+
+	def get_table(self, telId, tableName):
+		"""
+		Get a waveform table of a telescope
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+		Return:
+			table which contains the column tableName
+		"""
+		return self.get_telescope_node(telId)._f_get_child(tableName)
+
+	def has_table(self, telId, tableName):
+		"""
+		Say if a telescope has a waveform table
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+		Return:
+			True if the telescope has the table
+		"""
+		return tableName in self.get_telescope_node(telId)
+
+	def get_table_and_block_size(self, telId, tableName):
+		"""
+		Get a waveform table of a telescope and the number of rows of its blocks
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+		Return:
+			table, number of rows of a block
+		"""
+		try:
+			return self.dicoTableBlockSize[(telId, tableName)]
+		except KeyError:
+			table = self.get_table(telId, tableName)
+			tableMemmap = self.get_table_memmap(telId, tableName)
+			if tableMemmap is not None:
+				tableBlockSize = (table, tableMemmap.blockSize)
+			else:
+				tableBlockSize = (table, get_table_block_size(table, self.blockSizeInBytes))
+			self.dicoTableBlockSize[(telId, tableName)] = tableBlockSize
+			return tableBlockSize
+
+	def get_table_memmap(self, telId, tableName):
+		"""
+		Get the mapping in memory of a waveform table (resolved once)
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+		Return:
+			TableMemmap of the table, None if memoryMap is False or if the table cannot be mapped (compressed table)
+		"""
+		if not self.memoryMap:
+			return None
+		try:
+			return self.dicoTableMemmap[(telId, tableName)]
+		except KeyError:
+			tableMemmap = get_table_memmap(self.get_table(telId, tableName))
+			self.dicoTableMemmap[(telId, tableName)] = tableMemmap
+			return tableMemmap
+
+	def get_memmap_block(self, telId, tableName, blockIndex):
+		"""
+		Get a block of a table mapped in memory
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+			blockIndex : index of the block in the table
+		Return:
+			view on the column tableName of the mapped block, None if the table is not mapped in memory
+		"""
+		tableMemmap = self.get_table_memmap(telId, tableName)
+		if tableMemmap is None:
+			return None
+		return tableMemmap.listBlock[blockIndex][tableName]
+
+	def get_block(self, telId, tableName, blockIndex):
+		"""
+		Get a block of a table (read it if it is not in the cache)
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+			blockIndex : index of the block in the table
+		Return:
+			block of the column tableName
+		"""
+		block = self.get_memmap_block(telId, tableName, blockIndex)
+		if block is not None:
+			return block
+		key = (telId, tableName, blockIndex)
+		try:
+			block = self.cacheBlock[key]
+			self.cacheBlock.move_to_end(key)
+			return block
+		except KeyError:
+			pass
+		table, blockSize = self.get_table_and_block_size(telId, tableName)
+		firstRow = blockIndex*blockSize
+		block = table.read(firstRow, min(firstRow + blockSize, table.nrows), field=tableName)
+		self.add_block(key, block)
+		return block
+
+	def add_block(self, key, block):
+		"""
+		Add a block in the cache and remove the oldest blocks which exceed the memory budget
+		Parameters:
+			key : (telId, tableName, blockIndex) of the block
+			block : block of the column tableName
+		"""
+		self.cacheBlock[key] = block
+		self.cacheSize += block.nbytes
+		# Keep at least the last block, even if it is bigger than the budget
+		while self.cacheSize > self.memoryBudget and len(self.cacheBlock) > 1:
+			_, oldBlock = self.cacheBlock.popitem(last=False)
+			self.cacheSize -= oldBlock.nbytes
+
+	def get_waveform(self, telId, row, tableName="waveformHi"):
+		"""
+		Get the waveform of an event
+		Parameters:
+			telId : id of the telescope
+			row : row of the event in the telescope tables
+			tableName : name of the table (waveformHi or waveformLo)
+		Return:
+			waveform of the event (view on the cached block)
+		"""
+		_, blockSize = self.get_table_and_block_size(telId, tableName)
+		blockIndex, rowInBlock = divmod(row, blockSize)
+		return self.get_block(telId, tableName, blockIndex)[rowInBlock]
+
+	def read_rows(self, telId, tableName, start, stop, out=None):
+		"""
+		Get the waveforms of consecutive rows (copied from the cached blocks)
+		Parameters:
+			telId : id of the telescope
+			tableName : name of the table (waveformHi or waveformLo)
+			start : first row to be read
+			stop : last row (excluded)
+			out : array to be filled (allocated if None)
+		Return:
+			waveforms of the rows
+		"""
+		table, blockSize = self.get_table_and_block_size(telId, tableName)
+		stop = min(stop, table.nrows)
+		if out is None:
+			out = np.empty((max(0, stop - start),) + table.coldescrs[tableName].shape, dtype=table.coldtypes[tableName].base)
+		row = start
+		while row < stop:
+			blockIndex, rowInBlock = divmod(row, blockSize)
+			block = self.get_block(telId, tableName, blockIndex)
+			nbRow = min(block.shape[0] - rowInBlock, stop - row)
+			out[row - start:row - start + nbRow] = block[rowInBlock:rowInBlock + nbRow]
+			row += nbRow
+		return out
+
+	def clear(self):
+		"""
+		Remove all the blocks of the cache
+		"""
+		self.cacheBlock.clear()
+		self.cacheSize = 0
@@ -11,6 +11,9 @@ entry_points = {}
 entry_points['console_scripts'] = ['mchdf5_simtel2r0 = ctapipe_io_mchdf5.converter.mchdf5_simtel2r0:main',
 					'mchdf5_tailcut_dilation_dl0v1 = ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v1:main',
 					'mchdf5_tailcut_dilation_dl0v2 = ctapipe_io_mchdf5.converter.mchdf5_tailcut_dilation_dl0v2:main',
+					'mchdf5_dl0_production = ctapipe_io_mchdf5.converter.mchdf5_dl0_production:main',
+					'mchdf5_dl0_scan = ctapipe_io_mchdf5.converter.mchdf5_dl0_scan:main',
+					'mchdf5_compression_benchmark = ctapipe_io_mchdf5.programs.mchdf5_compression_benchmark:main',
 					'test_mchdf5v2minselection = ctapipe_io_mchdf5.programs.mchdf5_min_selection:main',
 					'test_mchdf5v2sliceselection = ctapipe_io_mchdf5.programs.mchdf5_slice_selection:main',
 					'test_mchdf5v2extractsignaltensor = ctapipe_io_mchdf5.programs.mchdf5_extract_signal_tensor:main',
@@ -21,7 +24,9 @@ entry_points['console_scripts'] = ['mchdf5_simtel2r0 = ctapipe_io_mchdf5.convert
 					'test_mchdf5v2sigmameansort = ctapipe_io_mchdf5.programs.mchdf5_sigma_mean_sort:main',
 					'test_mchdf5v2multiplesort = ctapipe_io_mchdf5.programs.mchdf5_multiple_sort:main',
 					'test_mchdf5v2storebypixelorslice = ctapipe_io_mchdf5.programs.mchdf5_store_by_pixel_or_slice:main',
-					'test_mchdf5v2injtabsort = ctapipe_io_mchdf5.programs.mchdf5_injtab_sort:main'
+					'test_mchdf5v2injtabsort = ctapipe_io_mchdf5.programs.mchdf5_injtab_sort:main',
+					'mchdf5_event_index = ctapipe_io_mchdf5.programs.mchdf5_event_index:main',
+					'mchdf5_merge = ctapipe_io_mchdf5.programs.mchdf5_merge:main'
 					]
 
 setup(
@@ -44,7 +49,7 @@ setup(
 			'tests/resources/*'
 		],
 	},
-	tests_require=['pytest'],
+	tests_require=['pytest', 'pytest-benchmark'],
 	author='Pierre Aubert',
 	author_email='pierre.aubert@lapp.in2p3.fr',
 	license='Cecil-C',